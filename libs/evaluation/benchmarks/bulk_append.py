@@ -0,0 +1,119 @@
+"""
+Scripts for benchmarking the insertion of large data tables via evaluation.utils.db.bulk_append()
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import datetime
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sql
+
+from evaluation.utils import db
+
+
+def synthetic_data_ec(n_rows=100000, n_exp_sfc=10, seed=0):
+    """
+    Create synthetic electrochemical data as inserted into data_ec by evaluation.insert.ec_tdms.insert_ec_tdms()
+    :param n_rows: int
+        total number of datapoints
+    :param n_exp_sfc: int
+        number of experiments the datapoints are distributed to
+    :param seed: int
+        seed of the random number generator
+    :return: pd.DataFrame indexed by id_exp_sfc, id_data_ec
+    """
+    rng = np.random.default_rng(seed)
+    id_exp_sfc = np.repeat(np.arange(1, n_exp_sfc + 1), int(np.ceil(n_rows / n_exp_sfc)))[
+        :n_rows
+    ]
+    id_data_ec = np.arange(n_rows) - np.searchsorted(id_exp_sfc, id_exp_sfc)
+    t__s = id_data_ec * 0.01
+    return pd.DataFrame(
+        {
+            "id_exp_sfc": id_exp_sfc,
+            "id_data_ec": id_data_ec,
+            "t__s": t__s,
+            "I__A": rng.normal(0, 1e-3, n_rows),
+            "E_WE_raw__VvsRE": rng.uniform(0, 1.5, n_rows),
+            "Delta_E_WE_uncomp__V": np.where(
+                rng.uniform(size=n_rows) < 0.1, np.nan, rng.normal(0, 1e-3, n_rows)
+            ),
+            "Timestamp": (
+                pd.Timestamp("2023-01-01 08:00:00")
+                + pd.to_timedelta(id_exp_sfc * 3600 + t__s, unit="s")
+            ).tz_localize("UTC"),
+        }
+    ).set_index(["id_exp_sfc", "id_data_ec"])
+
+
+def benchmark_bulk_append(n_rows=100000, methods=None):
+    """
+    Compare runtime of df.to_sql(chunksize=1000) as used formerly by the inserters
+    and evaluation.utils.db.bulk_append() by inserting n_rows into data_ec of a temporary SQLite database.
+    :param n_rows: int
+        number of rows to be inserted
+    :param methods: list of str or None
+        insert methods to be compared, one of ['to_sql', 'bulk_append']
+    :return: pd.DataFrame with runtime in s and inserted rows per s of each method
+        and whether the data in the database is identical for all methods
+    """
+    if methods is None:
+        methods = ["to_sql", "bulk_append"]
+    df = synthetic_data_ec(n_rows=n_rows)
+
+    results = []
+    data_db_reference = None
+    with tempfile.TemporaryDirectory() as dir_temp:
+        for method in methods:
+            engine = sql.create_engine(
+                "sqlite+pysqlite:///" + os.path.join(dir_temp, method + ".db")
+            )
+            with engine.begin() as conn:
+                conn.execute(
+                    sql.text(
+                        """CREATE TABLE data_ec (
+                                id_exp_sfc INTEGER,
+                                id_data_ec INTEGER,
+                                t__s DOUBLE,
+                                I__A DOUBLE,
+                                E_WE_raw__VvsRE DOUBLE,
+                                Delta_E_WE_uncomp__V DOUBLE,
+                                Timestamp DATETIME,
+                                PRIMARY KEY (id_exp_sfc, id_data_ec)
+                           );"""
+                    )
+                )
+            t_start = datetime.datetime.now()
+            if method == "to_sql":
+                with engine.begin() as conn:
+                    df.to_sql("data_ec", con=conn, if_exists="append", chunksize=1000)
+            elif method == "bulk_append":
+                db.bulk_append("data_ec", df, engine)
+            else:
+                raise NotImplementedError("Method not implemented")
+            t_end = datetime.datetime.now()
+
+            with engine.begin() as conn:
+                data_db = pd.read_sql(
+                    "SELECT * FROM data_ec ORDER BY id_exp_sfc, id_data_ec", con=conn
+                )
+            engine.dispose()
+            if data_db_reference is None:
+                data_db_reference = data_db
+            runtime__s = (t_end - t_start).total_seconds()
+            results.append(
+                {
+                    "method": method,
+                    "n_rows": n_rows,
+                    "runtime__s": runtime__s,
+                    "rows_per_s": n_rows / runtime__s,
+                    "identical_result": len(data_db.index) == n_rows
+                    and data_db.equals(data_db_reference),
+                }
+            )
+            print(results[-1])
+    return pd.DataFrame(results).set_index("method")
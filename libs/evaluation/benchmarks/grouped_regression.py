@@ -0,0 +1,112 @@
+"""
+Scripts for benchmarking the closed form linear fit of many groups via evaluation.processing.grouped_regression
+against one scipy.optimize.curve_fit per group via plot.datasetAccessor.fit()
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import contextlib
+import datetime
+import io
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from evaluation.processing import grouped_regression
+
+
+def synthetic_data_istd(n_groups=100, n_points_per_group=200, share_outliers=0.02, seed=0):
+    """
+    Create synthetic internal standard counts of EC batches with a linear drift and spikes (bubbles in ICPMS flow),
+    as fitted by evaluation.processing.icpms_update_exp.update_counts_internalstandard_fitted()
+    :param n_groups: int
+        number of EC batches
+    :param n_points_per_group: int
+        number of datapoints per EC batch
+    :param share_outliers: float
+        share of datapoints with spikes
+    :param seed: int
+        seed of the random number generator
+    :return: exp_icpms_ML, data_icpms_ML
+        exp_icpms_ML: pd.DataFrame indexed by id_exp_icpms, id_ML_datesafe_overlapsafe
+        data_icpms_ML: pd.DataFrame indexed by id_exp_icpms, id_ML_datesafe_overlapsafe, id_data_icpms
+    """
+    rng = np.random.default_rng(seed)
+    id_group = np.repeat(np.arange(n_groups), n_points_per_group)
+    t__s = id_group * n_points_per_group * 1.5 + np.tile(np.arange(n_points_per_group) * 1.0, n_groups)
+    slope = rng.normal(0, 0.1, n_groups)
+    intercept = rng.uniform(1e4, 1e5, n_groups)
+    counts = slope[id_group] * t__s + intercept[id_group]
+    counts = counts * rng.normal(1, 0.01, len(counts))
+    counts = counts * np.where(rng.uniform(size=len(counts)) < share_outliers, 1.5, 1)
+    data_icpms_ML = pd.DataFrame(
+        {
+            "id_exp_icpms": 1 + id_group // 10,
+            "id_ML_datesafe_overlapsafe": id_group % 10,
+            "id_data_icpms": np.arange(len(id_group)),
+            "t__s": t__s,
+            "counts_internalstandard": counts,
+        }
+    ).set_index(["id_exp_icpms", "id_ML_datesafe_overlapsafe", "id_data_icpms"])
+    exp_icpms_ML = pd.DataFrame(
+        index=data_icpms_ML.index.droplevel("id_data_icpms").unique()
+    )
+    return exp_icpms_ML, data_icpms_ML
+
+
+def benchmark_grouped_regression(n_groups_list=None, confidence_intervals=None, **kwargs_synthetic_data_istd):
+    """
+    Compare runtime and fit parameters of grouped_regression.fit_linear_dataset() and
+    grouped_regression.fit_linear_dataset_curve_fit() on synthetic data of increasing number of EC batches.
+    :param n_groups_list: list of int or None
+        number of EC batches to be benchmarked
+    :param confidence_intervals: list of float or None
+        confidence intervals to be benchmarked, see plot.datasetAccessor.fit()
+    :param kwargs_synthetic_data_istd:
+        keyword arguments of evaluation.benchmarks.grouped_regression.synthetic_data_istd()
+    :return: pd.DataFrame with runtime in s of each method and maximum relative deviation of the fit parameters
+    """
+    if n_groups_list is None:
+        n_groups_list = [10, 100, 1000]
+    if confidence_intervals is None:
+        confidence_intervals = [1, 0.95]
+    fit_methods = {
+        "curve_fit": grouped_regression.fit_linear_dataset_curve_fit,
+        "closed_form_grouped": grouped_regression.fit_linear_dataset,
+    }
+
+    results = []
+    for n_groups in n_groups_list:
+        exp_icpms_ML, data_icpms_ML = synthetic_data_istd(n_groups=n_groups, **kwargs_synthetic_data_istd)
+        for confidence_interval in confidence_intervals:
+            fits_reference = None
+            for fit_method, fit in fit_methods.items():
+                exp = exp_icpms_ML.copy()
+                t_start = datetime.datetime.now()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    exp, data = fit(
+                        exp,
+                        data_icpms_ML.copy(),
+                        x_col="t__s",
+                        y_col="counts_internalstandard",
+                        y_col_fitted="counts_internalstandard_fitted",
+                        confidence_interval=confidence_interval,
+                    )
+                t_end = datetime.datetime.now()
+                fits = exp.loc[:, ["linear_fit_m", "linear_fit_b", "linear_fit_m_sd", "linear_fit_b_sd"]].astype(float)
+                if fits_reference is None:
+                    fits_reference = fits
+                results.append(
+                    {
+                        "n_groups": n_groups,
+                        "n_datapoints": len(data_icpms_ML.index),
+                        "confidence_interval": confidence_interval,
+                        "fit_method": fit_method,
+                        "runtime__s": (t_end - t_start).total_seconds(),
+                        "max_rel_deviation": ((fits - fits_reference) / fits_reference).abs().max().max(),
+                    }
+                )
+                print(results[-1])
+        plt.close("all")
+    return pd.DataFrame(results).set_index(["n_groups", "confidence_interval", "fit_method"])
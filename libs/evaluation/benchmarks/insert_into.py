@@ -0,0 +1,89 @@
+"""
+Scripts for benchmarking the insertion of rows with auto increment index via evaluation.utils.db.insert_into()
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import datetime
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sql
+
+from evaluation.utils import db
+
+
+def benchmark_insert_into(n_rows=10000, methods=None):
+    """
+    Compare runtime of the methods of evaluation.utils.db.insert_into() by inserting n_rows into a table with auto
+    increment primary key of a temporary SQLite database.
+    :param n_rows: int
+        number of rows to be inserted
+    :param methods: list of str or None
+        insert methods to be compared
+    :return: pd.DataFrame with runtime in s and inserted rows per s of each method
+        and whether the returned auto increment indices match the indices in the database
+    """
+    if methods is None:
+        methods = ["row", "bulk"]
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "name_gas": rng.choice(["Ar", "O2", "H2", "N2"], n_rows),
+            "flow_rate__ml_min": rng.uniform(0, 100, n_rows),
+            "comment": "benchmark",
+        }
+    )
+
+    results = []
+    with tempfile.TemporaryDirectory() as dir_temp:
+        engine = sql.create_engine(
+            "sqlite+pysqlite:///" + os.path.join(dir_temp, "benchmark.db")
+        )
+        with engine.begin() as conn:
+            conn.execute(
+                sql.text(
+                    """CREATE TABLE benchmark_insert_into (
+                            id_benchmark INTEGER PRIMARY KEY AUTOINCREMENT,
+                            name_gas VARCHAR(45),
+                            flow_rate__ml_min DOUBLE,
+                            comment VARCHAR(45)
+                       );"""
+                )
+            )
+        for method in methods:
+            t_start = datetime.datetime.now()
+            with engine.begin() as conn:
+                df_inserted = db.insert_into(
+                    conn, "benchmark_insert_into", df.copy(), method=method
+                )
+            t_end = datetime.datetime.now()
+
+            with engine.begin() as conn:
+                df_db = pd.read_sql(
+                    "SELECT * FROM benchmark_insert_into ORDER BY id_benchmark DESC LIMIT %s"
+                    % n_rows,
+                    con=conn,
+                ).sort_values("id_benchmark")
+            runtime__s = (t_end - t_start).total_seconds()
+            results.append(
+                {
+                    "method": method,
+                    "n_rows": n_rows,
+                    "runtime__s": runtime__s,
+                    "rows_per_s": n_rows / runtime__s,
+                    "correct_primary_key": (
+                        df_inserted.inserted_primary_key.astype(int).to_numpy()
+                        == df_db.id_benchmark.to_numpy()
+                    ).all()
+                    and (
+                        df_inserted.flow_rate__ml_min.to_numpy()
+                        == df_db.flow_rate__ml_min.to_numpy()
+                    ).all(),
+                }
+            )
+            print(results[-1])
+        engine.dispose()
+    return pd.DataFrame(results).set_index("method")
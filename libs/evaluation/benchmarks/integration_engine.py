@@ -0,0 +1,102 @@
+"""
+Scripts for benchmarking the auto integration of many experiments via
+evaluation.processing.integration_engine.integrate_dataset() on synthetic peaks
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from evaluation.processing import integration_engine
+
+
+def synthetic_peaks(n_exp=100, n_points=2000, noise=0.01, seed=0):
+    """
+    Create synthetic dissolution peaks of ICP-MS experiments with a baseline offset and gaussian noise
+    :param n_exp: int
+        number of experiments
+    :param n_points: int
+        number of datapoints per experiment, time steps of 1 s
+    :param noise: float
+        standard deviation of the noise
+    :param seed: int
+        seed of the random number generator
+    :return: exp, data
+        exp: pd.DataFrame indexed by id_exp_icpms
+        data: pd.DataFrame indexed by id_exp_icpms, id_data_icpms
+    """
+    rng = np.random.default_rng(seed)
+    t__s = np.arange(n_points, dtype=float)
+    data = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "id_exp_icpms": id_exp,
+                    "id_data_icpms": np.arange(n_points),
+                    "t__s": t__s,
+                    "dm_dt__ng_s": rng.uniform(0.5, 2)
+                    * np.exp(-(((t__s - rng.uniform(0.3, 0.6) * n_points) / rng.uniform(10, 50)) ** 2))
+                    + rng.uniform(0, 0.05)
+                    + rng.normal(0, noise, n_points),
+                    "t__timestamp": pd.Timestamp("2023-01-01") + pd.to_timedelta(t__s, unit="s"),
+                }
+            )
+            for id_exp in range(1, n_exp + 1)
+        ]
+    ).set_index(["id_exp_icpms", "id_data_icpms"])
+    exp = pd.DataFrame(index=data.index.droplevel("id_data_icpms").unique())
+    return exp, data
+
+
+def benchmark_integrate_dataset(n_exp_list=None, n_processes_list=None, **kwargs_synthetic_peaks):
+    """
+    Measure runtime of integration_engine.integrate_dataset() for increasing number of experiments,
+    serial and in a process pool
+    :param n_exp_list: list of int or None
+        number of experiments to be benchmarked
+    :param n_processes_list: list of int or None
+        number of processes to be benchmarked
+    :param kwargs_synthetic_peaks:
+        keyword arguments of evaluation.benchmarks.integration_engine.synthetic_peaks()
+    :return: pd.DataFrame with runtime in s, integrations per second and maximum deviation of the integrated area
+        to the serial integration
+    """
+    if n_exp_list is None:
+        n_exp_list = [10, 100, 1000]
+    if n_processes_list is None:
+        n_processes_list = [1, 4]
+
+    results = []
+    for n_exp in n_exp_list:
+        exp, data = synthetic_peaks(n_exp=n_exp, **kwargs_synthetic_peaks)
+        area_reference = None
+        for n_processes in n_processes_list:
+            t_start = datetime.datetime.now()
+            df_ana_integration = integration_engine.integrate_dataset(
+                exp,
+                data,
+                x_col="t__s",
+                y_col="dm_dt__ng_s",
+                name_id_data="id_data_icpms",
+                name_timestamp="t__timestamp",
+                n_processes=n_processes,
+            )
+            t_end = datetime.datetime.now()
+            if area_reference is None:
+                area_reference = df_ana_integration.area_integrated_simps
+            results.append(
+                {
+                    "n_exp": n_exp,
+                    "n_processes": n_processes,
+                    "runtime__s": (t_end - t_start).total_seconds(),
+                    "integrations_per_s": n_exp / (t_end - t_start).total_seconds(),
+                    "max_abs_deviation_area": (df_ana_integration.area_integrated_simps - area_reference)
+                    .abs()
+                    .max(),
+                }
+            )
+            print(results[-1])
+    return pd.DataFrame(results).set_index(["n_exp", "n_processes"])
@@ -0,0 +1,193 @@
+"""
+Scripts for benchmarking the lognormal peak fitting of sfc icpms dissolution curves via
+evaluation.processing.Fit_SFC_ICP_MS_Dissolution.fit_data_batch() on synthetic multi-peak curves
+and the evaluation of evaluation.processing.Fit_SFC_ICP_MS_Dissolution.multi_lognormal_fit()
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import contextlib
+import datetime
+import io
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from evaluation.processing import Fit_SFC_ICP_MS_Dissolution
+
+
+def synthetic_dissolution_curve(n_peaks=3, n_points=600, noise=0.02, background=True, seed=0):
+    """
+    Create a synthetic dissolution curve as sum of lognormal peaks, optionally on a broad lognormal background,
+    with gaussian noise relative to the maximum signal
+    :param n_peaks: int
+        number of peaks
+    :param n_points: int
+        number of datapoints, time steps of 1 s
+    :param noise: float
+        standard deviation of the noise relative to the maximum of the curve
+    :param background: bool
+        whether to add a broad lognormal background
+    :param seed: int
+        seed of the random number generator
+    :return: time, icpms_data, params
+        time: pd.Series of time in s
+        icpms_data: pd.Series of the dissolution rate
+        params: list of [area, ln_std, xc] of all peaks and the background, see Fit_SFC_ICP_MS_Dissolution.lognormal()
+    """
+    rng = np.random.default_rng(seed)
+    time = pd.Series(np.arange(1, n_points + 1, dtype=float), name="t__s")
+    xc = np.sort(rng.uniform(0.15, 0.85, n_peaks)) * n_points
+    params = np.column_stack(
+        (
+            rng.uniform(0.5, 2, n_peaks),
+            rng.uniform(0.02, 0.06, n_peaks),
+            xc,
+        )
+    )
+    if background:
+        params = np.vstack((params, [[n_peaks, 0.4, 0.6 * n_points]]))
+    params = params.flatten().tolist()
+    icpms_data = Fit_SFC_ICP_MS_Dissolution.multi_lognormal_fit(time.to_numpy(), *params)
+    icpms_data = icpms_data + rng.normal(0, noise * icpms_data.max(), n_points)
+    return time, pd.Series(icpms_data, name="dm_dt__ng_s"), params
+
+
+def benchmark_lognormal_fitting(n_fits=8, configurations=None, **kwargs_synthetic_dissolution_curve):
+    """
+    Measure fits per second and fit quality of Fit_SFC_ICP_MS_Dissolution.fit_data_batch() for different
+    configurations on n_fits synthetic dissolution curves.
+    :param n_fits: int
+        number of synthetic curves fitted per configuration
+    :param configurations: dict or None
+        name of the configuration: keyword arguments of Fit_SFC_ICP_MS_Dissolution.fit_data_batch(),
+        if None finite difference vs. analytic Jacobian, multiple starts, and process pool are compared
+    :param kwargs_synthetic_dissolution_curve:
+        keyword arguments of evaluation.benchmarks.lognormal_fitting.synthetic_dissolution_curve()
+    :return: pd.DataFrame with fits per second, share of successful fits, mean corrected R²,
+        mean relative deviation of the total fitted area to the synthetic area and
+        mean relative deviation of the total fitted area to the first configuration (finite differences by default),
+        showing whether a configuration converges to different local minima
+    """
+    if configurations is None:
+        configurations = {
+            "finite_difference": dict(analytic_jacobian=False),
+            "analytic_jacobian": dict(analytic_jacobian=True),
+            "multistart": dict(analytic_jacobian=True, n_starts=4),
+            "multistart_process_pool": dict(analytic_jacobian=True, n_starts=4, n_processes=4),
+        }
+    curves = [synthetic_dissolution_curve(seed=seed, **kwargs_synthetic_dissolution_curve) for seed in range(n_fits)]
+    kwargs_fits = [
+        dict(time=time, icpms_data=icpms_data, id_fit=id_fit)
+        for id_fit, (time, icpms_data, params) in enumerate(curves)
+    ]
+    area_true = np.array([np.sum(params[::3]) for time, icpms_data, params in curves])
+
+    area_reference = None
+    successful_reference = None
+    results = []
+    for name_configuration, kwargs_fit_data_batch in configurations.items():
+        t_start = datetime.datetime.now()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fit_outputs = Fit_SFC_ICP_MS_Dissolution.fit_data_batch(
+                kwargs_fits,
+                correlate_with_potential=False,
+                display_plot=False,
+                **kwargs_fit_data_batch,
+            )
+        t_end = datetime.datetime.now()
+        overview = pd.concat([fit_output[0] for fit_output in fit_outputs])
+        peaks = pd.concat([fit_output[1] for fit_output in fit_outputs])
+        successful = overview.fit_successful.to_numpy(dtype=bool)
+        area_fit = (
+            peaks.loc[peaks.index.get_level_values("fit_type") != "single", "area__ng_cm2"]
+            .groupby(level="id_fit")
+            .sum()
+            .reindex(overview.index)
+            .to_numpy()
+        )
+        if area_reference is None:
+            area_reference, successful_reference = area_fit, successful
+        successful_both = successful & successful_reference
+        results.append(
+            {
+                "configuration": name_configuration,
+                "n_fits": n_fits,
+                "fits_per_s": n_fits / (t_end - t_start).total_seconds(),
+                "share_successful": successful.mean(),
+                "mean_R2adj": overview.loc[successful, "R2adj"].astype(float).mean(),
+                "mean_rel_deviation_area": np.mean(
+                    np.abs(area_fit[successful] - area_true[successful]) / area_true[successful]
+                ),
+                "mean_rel_deviation_area_reference": np.mean(
+                    np.abs(area_fit[successful_both] - area_reference[successful_both])
+                    / area_reference[successful_both]
+                ),
+            }
+        )
+        print(results[-1])
+        plt.close("all")
+    return pd.DataFrame(results).set_index("configuration")
+
+
+def benchmark_multi_lognormal_evaluation(n_peaks_list=None, n_points=2000, n_evaluations=200):
+    """
+    Compare runtime of Fit_SFC_ICP_MS_Dissolution.multi_lognormal_fit() evaluated peak by peak (previous
+    implementation), broadcasted with numpy, broadcasted with precomputed log(xdat) and by the numba kernel
+    (if numba is installed).
+    :param n_peaks_list: list of int or None
+        number of lognormal peaks to be benchmarked
+    :param n_points: int
+        number of datapoints
+    :param n_evaluations: int
+        number of evaluations per method, as performed by curve_fit
+    :return: pd.DataFrame with runtime per evaluation in s and maximum deviation to the peak by peak evaluation
+    """
+    if n_peaks_list is None:
+        n_peaks_list = [1, 5, 15]
+    use_numba = Fit_SFC_ICP_MS_Dissolution.USE_NUMBA
+
+    def multi_lognormal_loop(xdat, *params):
+        y = np.zeros(xdat.shape)
+        for area, ln_std, xc in Fit_SFC_ICP_MS_Dissolution.grouper(params, 3, 0):
+            y += Fit_SFC_ICP_MS_Dissolution.lognormal(xdat, area, ln_std, xc)
+        return y
+
+    results = []
+    for n_peaks in n_peaks_list:
+        time, icpms_data, params = synthetic_dissolution_curve(n_peaks=n_peaks, n_points=n_points, background=False)
+        xdat, fit_function, jacobian = Fit_SFC_ICP_MS_Dissolution.multi_lognormal_model(time)
+        methods = {
+            "peak_by_peak": (multi_lognormal_loop, False),
+            "numpy_broadcast": (Fit_SFC_ICP_MS_Dissolution.multi_lognormal_fit, False),
+            "numpy_broadcast_cached_log": (fit_function, False),
+        }
+        if Fit_SFC_ICP_MS_Dissolution.NUMBA_AVAILABLE:
+            methods["numba_cached_log"] = (fit_function, True)
+
+        y_reference = None
+        for method, (function, numba_kernel) in methods.items():
+            Fit_SFC_ICP_MS_Dissolution.USE_NUMBA = numba_kernel
+            try:
+                # first evaluation compiles the numba kernel
+                y = function(xdat, *params)
+                t_start = datetime.datetime.now()
+                for i in range(n_evaluations):
+                    function(xdat, *params)
+                t_end = datetime.datetime.now()
+            finally:
+                Fit_SFC_ICP_MS_Dissolution.USE_NUMBA = use_numba
+            if y_reference is None:
+                y_reference = y
+            results.append(
+                {
+                    "n_peaks": n_peaks,
+                    "n_points": n_points,
+                    "method": method,
+                    "runtime_per_evaluation__s": (t_end - t_start).total_seconds() / n_evaluations,
+                    "max_abs_deviation": np.abs(y - y_reference).max(),
+                }
+            )
+            print(results[-1])
+    return pd.DataFrame(results).set_index(["n_peaks", "method"])
@@ -0,0 +1,125 @@
+"""
+Scripts for benchmarking the translation of queries from MySQL to SQLite syntax
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import datetime
+import re
+from pathlib import Path
+
+import pandas as pd
+
+from evaluation.utils import db  # noqa: F401, imported before db_config to resolve their circular import
+from evaluation.utils import db_config, mysql_to_sqlite
+
+PATH_MYSQL_INIT = Path(__file__).parents[3] / "database" / "mysql_init.sql"
+
+
+def query_corpus(path_to_sql_dump=PATH_MYSQL_INIT):
+    """
+    Build a corpus of MySQL queries from a MySQL dump: the select statement of each view and of each trigger body
+    (contains comments), and a select from each view as written in evaluation scripts
+    (database name, parameters, comment).
+    :param path_to_sql_dump: str or pathlib.Path
+        path to the MySQL dump
+    :return: pd.Series of queries indexed by name
+    """
+    with open(path_to_sql_dump, encoding="utf-8") as file:
+        sql_dump = file.read()
+
+    queries = {}
+    for name_view, statement in re.findall(
+        r"/\*!50001 VIEW `(\w+)` AS (select .*?) \*/;", sql_dump, flags=re.DOTALL
+    ):
+        queries["view " + name_view] = statement
+        queries["select " + name_view] = (
+            "SELECT *\n"
+            "FROM hte_data." + name_view + "\n"
+            "WHERE id_exp_sfc IN (%s, %s) # select by id_exp_sfc\n"
+            ";"
+        )
+    for name_trigger, statement in re.findall(
+        r"TRIGGER `(\w+)` .*? BEGIN(.*?)END \*/;;", sql_dump, flags=re.DOTALL
+    ):
+        queries["trigger " + name_trigger] = statement
+    return pd.Series(queries, name="query")
+
+
+def synthetic_query(n_columns=1000):
+    """
+    Create a long MySQL query with a time interval, timestampdiff, function and comment in each column,
+    as a worst case for the translation.
+    :param n_columns: int
+        number of selected columns
+    :return: str
+    """
+    return (
+        "select `d`.`id_exp_sfc` AS `id_exp_sfc` # index column\n"
+        + "".join(
+            [
+                ",(`e`.`t_start__timestamp` + interval `d`.`t%s__s` second) AS `t%s`,"
+                "timestampdiff(SECOND,`e`.`t_start__timestamp`,`d`.`Timestamp%s`) AS `dt%s`,"
+                "if((`d`.`I%s__A` is null),0,`d`.`I%s__A`) AS `I%s__A` # column %s\n" % ((i,) * 8)
+                for i in range(n_columns)
+            ]
+        )
+        + "from (hte_data.data_ec d join hte_data.exp_ec e) where d.id_exp_sfc IN (%s, %s);"
+    )
+
+
+def benchmark_translate_mysql2sqlite(
+    n_repeat=100, n_columns_synthetic_list=None, path_to_sql_dump=PATH_MYSQL_INIT
+):
+    """
+    Compare runtime and result of the translation of the query corpus by subsequent passes of each translation,
+    by the single pass tokenizer and by the cached single pass tokenizer. Additionally, long synthetic queries are
+    translated once to compare the scaling with query length.
+    :param n_repeat: int
+        number of times the corpus is translated
+    :param n_columns_synthetic_list: list of int or None
+        number of columns of the synthetic queries, see evaluation.benchmarks.mysql_to_sqlite.synthetic_query()
+    :param path_to_sql_dump: str or pathlib.Path
+        path to the MySQL dump used to build the corpus, see evaluation.benchmarks.mysql_to_sqlite.query_corpus()
+    :return: pd.DataFrame with runtime in s of each method and whether all results are identical to 'passes'
+    """
+    if n_columns_synthetic_list is None:
+        n_columns_synthetic_list = [100, 1000, 3000]
+    corpora = {"mysql_init.sql": (query_corpus(path_to_sql_dump), n_repeat)}
+    for n_columns in n_columns_synthetic_list:
+        corpora["synthetic " + str(n_columns) + " columns"] = (
+            pd.Series({"synthetic": synthetic_query(n_columns)}, name="query"),
+            1,
+        )
+    translate_methods = {
+        "passes": lambda query: db_config.translate_mysql2sqlite(query, method="passes"),
+        "tokenizer": mysql_to_sqlite.translate.__wrapped__,
+        "tokenizer_cached": lambda query: db_config.translate_mysql2sqlite(query, method="tokenizer"),
+    }
+
+    results = []
+    for name_corpus, (corpus, n_repeat_corpus) in corpora.items():
+        mysql_to_sqlite.translate.cache_clear()
+        translated_reference = None
+        for method, translate in translate_methods.items():
+            t_start = datetime.datetime.now()
+            for _ in range(n_repeat_corpus):
+                translated = corpus.apply(translate)
+            t_end = datetime.datetime.now()
+            if translated_reference is None:
+                translated_reference = translated
+            results.append(
+                {
+                    "corpus": name_corpus,
+                    "method": method,
+                    "n_queries": len(corpus.index),
+                    "n_characters": corpus.str.len().sum(),
+                    "runtime__s": (t_end - t_start).total_seconds() / n_repeat_corpus,
+                    "identical_result": translated.equals(translated_reference),
+                    "queries_not_identical": translated.index[
+                        translated != translated_reference
+                    ].tolist(),
+                }
+            )
+            print(results[-1])
+    return pd.DataFrame(results).set_index(["corpus", "method"])
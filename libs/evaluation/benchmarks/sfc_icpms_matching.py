@@ -0,0 +1,151 @@
+"""
+Scripts for benchmarking the matching of sfc experiments to icpms datapoints
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from evaluation.utils import db
+
+
+def synthetic_data_icpms(
+    n_exp_icpms=2,
+    n_exp_sfc_per_exp_icpms=1000,
+    n_datapoints_per_exp_sfc=20,
+    n_isotopes=3,
+    t_datapoint__s=0.5,
+    seed=0,
+):
+    """
+    Create synthetic icpms data and matching sfc experiments as returned by
+    evaluation.utils.db.match_exp_sfc_exp_icpms(), imitating a long stability protocol with many ec techniques.
+    :param n_exp_icpms: int
+        number of icpms experiments
+    :param n_exp_sfc_per_exp_icpms: int
+        number of subsequent ec experiments during each icpms experiment
+    :param n_datapoints_per_exp_sfc: int
+        number of icpms datapoints measured during each ec experiment
+    :param n_isotopes: int
+        number of measured analyte - internal standard isotope pairs
+    :param t_datapoint__s: float
+        time between two icpms datapoints in s
+    :param seed: int
+        seed of the random number generator
+    :return: data_icpms, match_ec_icpms
+        data_icpms indexed by id_exp_icpms, id_data_icpms as required by
+        evaluation.utils.db.assign_id_exp_sfc_to_data_icpms()
+    """
+    rng = np.random.default_rng(seed)
+    n_datapoints = n_exp_sfc_per_exp_icpms * n_datapoints_per_exp_sfc
+    t_start = pd.Timestamp("2023-01-01 08:00:00")
+
+    data_icpms, match_ec_icpms = [], []
+    for id_exp_icpms in range(1, n_exp_icpms + 1):
+        t_start_exp_icpms = t_start + pd.Timedelta(days=id_exp_icpms)
+        for id_isotope in range(n_isotopes):
+            # isotopes are measured one after another, thus timestamps differ slightly
+            t__s = (
+                np.arange(n_datapoints) * t_datapoint__s
+                + id_isotope * t_datapoint__s / n_isotopes
+                + rng.uniform(0, 0.01, n_datapoints)
+            )
+            data_icpms.append(
+                pd.DataFrame(
+                    {
+                        "id_exp_icpms": id_exp_icpms,
+                        "id_data_icpms": np.arange(1, n_datapoints + 1),
+                        "name_isotope_analyte": "Ir" + str(191 + id_isotope),
+                        "t_delaycorrected__timestamp_sfc_pc": t_start_exp_icpms
+                        + pd.to_timedelta(t__s, unit="s"),
+                    }
+                )
+            )
+
+        t_duration_exp_sfc__s = n_datapoints_per_exp_sfc * t_datapoint__s
+        t_start_exp_sfc__s = (
+            np.arange(n_exp_sfc_per_exp_icpms) * t_duration_exp_sfc__s
+            + rng.uniform(0, t_datapoint__s, n_exp_sfc_per_exp_icpms)
+        )
+        match_ec_icpms.append(
+            pd.DataFrame(
+                {
+                    "id_exp_sfc": (id_exp_icpms - 1) * n_exp_sfc_per_exp_icpms
+                    + np.arange(1, n_exp_sfc_per_exp_icpms + 1),
+                    "t_start__timestamp": t_start_exp_icpms
+                    + pd.to_timedelta(t_start_exp_sfc__s, unit="s"),
+                    "t_end__timestamp": t_start_exp_icpms
+                    + pd.to_timedelta(t_start_exp_sfc__s + t_duration_exp_sfc__s, unit="s"),
+                    "id_exp_icpms": id_exp_icpms,
+                }
+            )
+        )
+    data_icpms = (
+        pd.concat(data_icpms)
+        .set_index(["id_exp_icpms", "id_data_icpms"])
+        .sort_index()
+    )
+    match_ec_icpms = pd.concat(match_ec_icpms).reset_index(drop=True)
+    return data_icpms, match_ec_icpms
+
+
+def benchmark_matching_engine(
+    n_exp_sfc_per_exp_icpms_list=None,
+    matching_engines=None,
+    t_start_shift__s=0,
+    t_end_shift__s=0,
+    **kwargs_synthetic_data_icpms
+):
+    """
+    Compare runtime and result of the matching engines of evaluation.utils.db.assign_id_exp_sfc_to_data_icpms()
+    on synthetic data of increasing number of ec experiments.
+    :param n_exp_sfc_per_exp_icpms_list: list of int or None
+        number of ec experiments per icpms experiment to be benchmarked
+    :param matching_engines: list of str or None
+        matching engines to be compared, the first one is used as reference for the result
+    :param t_start_shift__s: float
+        see evaluation.utils.db.assign_id_exp_sfc_to_data_icpms()
+    :param t_end_shift__s: float
+        see evaluation.utils.db.assign_id_exp_sfc_to_data_icpms()
+    :param kwargs_synthetic_data_icpms:
+        keyword arguments of evaluation.benchmarks.sfc_icpms_matching.synthetic_data_icpms()
+    :return: pd.DataFrame with runtime in s of each matching engine and whether the result is identical to reference
+    """
+    if n_exp_sfc_per_exp_icpms_list is None:
+        n_exp_sfc_per_exp_icpms_list = [10, 100, 1000]
+    if matching_engines is None:
+        matching_engines = ["loop", "searchsorted"]
+
+    results = []
+    for n_exp_sfc_per_exp_icpms in n_exp_sfc_per_exp_icpms_list:
+        data_icpms, match_ec_icpms = synthetic_data_icpms(
+            n_exp_sfc_per_exp_icpms=n_exp_sfc_per_exp_icpms,
+            **kwargs_synthetic_data_icpms
+        )
+        id_exp_sfc_reference = None
+        for matching_engine in matching_engines:
+            t_start = datetime.datetime.now()
+            id_exp_sfc = db.assign_id_exp_sfc_to_data_icpms(
+                data_icpms.copy(),
+                match_ec_icpms,
+                t_start_shift__s=t_start_shift__s,
+                t_end_shift__s=t_end_shift__s,
+                matching_engine=matching_engine,
+            ).id_exp_sfc
+            t_end = datetime.datetime.now()
+            if id_exp_sfc_reference is None:
+                id_exp_sfc_reference = id_exp_sfc
+            results.append(
+                {
+                    "n_exp_sfc": len(match_ec_icpms.index),
+                    "n_datapoints": len(data_icpms.index),
+                    "matching_engine": matching_engine,
+                    "runtime__s": (t_end - t_start).total_seconds(),
+                    "identical_result": id_exp_sfc.equals(id_exp_sfc_reference),
+                }
+            )
+            print(results[-1])
+    return pd.DataFrame(results).set_index(["n_exp_sfc", "matching_engine"])
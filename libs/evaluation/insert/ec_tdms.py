@@ -5,7 +5,7 @@ Created in 2023
 """
 
 from nptdms import TdmsFile  # to read out tdms files
-import arrow
+import dateutil.tz
 import pandas as pd
 import numpy as np
 
@@ -16,9 +16,10 @@ import warnings
 import sys
 import datetime
 import copy
+import collections
 
 # git-synced modules
-from evaluation.utils import user_input
+from evaluation.utils import user_input, tools
 from evaluation.utils import db
 
 # constraints
@@ -180,6 +181,24 @@ constraints = {
 }
 
 
+# rename tdms channels to database columns
+tdms_columns = {
+    "Time (s)": "t__s",
+    "Current (A)": "I__A",
+    "Potential WE (V)": "E_WE_raw__VvsRE",
+    "Potential WE uncomp (V)": "Delta_E_WE_uncomp__V",
+    "Potential Signal (V)": "E_Signal__VvsRE",
+    "Frequency (Hz)": "f__Hz",
+    "Z real": "Z_real__ohm",
+    "-Z img": "minusZ_img__ohm",
+    "Vdc": "E_dc__VvsRE",
+    "Idc": "I_dc__A",
+    #'Timestamp': 'Timestamp',
+}
+# maximum number of datapoints read from a tdms file at once
+TDMS_MAX_ROWS_CHUNK = 100000
+
+
 def read_tdms(file_path):
     """
     :param file_path: path of file including file extension (.tdms) which should be read data_ec, using pathlib
@@ -187,55 +206,70 @@ def read_tdms(file_path):
     :return: data from tdms file, merged in one DataFrame
     :rtype: pd.DataFrame
     """
+    t_0_file = datetime.datetime.now()
+    tdms_init, tdms_techniques = read_tdms_techniques(file_path)
+
+    # merge all into one pd DataFrame for EIS and for EC, concatenated once
+    data_ec_list, data_eis_list = [], []
+    for name_technique, df in iter_tdms(
+        file_path, n_skip=tdms_techniques.n_skip, max_rows=None
+    ):
+        if tdms_techniques.loc[name_technique, "is_eis"]:
+            data_eis_list.append(df)
+        else:
+            data_ec_list.append(df)
+    data_ec = pd.concat(data_ec_list) if len(data_ec_list) > 0 else pd.DataFrame()
+    data_eis = pd.concat(data_eis_list) if len(data_eis_list) > 0 else pd.DataFrame()
+
+    t_1_file = datetime.datetime.now()
+    print("tdms reading time: ", t_1_file - t_0_file, " s")
+    print()
+    return tdms_init, data_ec, data_eis
+
+
+def read_tdms_techniques(file_path, n_skip=None):
+    """
+    Read the properties of a tdms file and the first datapoint of each technique (tdms group) without reading all
+    data. If the first datapoint of a technique indicates a corrupted file, the user is asked for the number of lines
+    to skip.
+    :param file_path: path of file including file extension (.tdms), using pathlib
+    :type file_path: str | pathlib.WindowsPath
+    :param n_skip: dict or pd.Series or None, optional, Default None
+        number of lines to skip for each technique (data_ec_tablename) as returned by a previous call,
+        if given the user is not asked (required when running in a worker process)
+    :return: tdms_init, tdms_techniques
+        tdms_init: properties of the tdms file
+        tdms_techniques: pd.DataFrame indexed by data_ec_tablename with the columns
+            is_eis (bool), n_rows (number of datapoints), n_skip (number of lines to skip),
+            t__s and Timestamp (first datapoint after skipped lines, if available)
+    """
     if type(file_path) != WindowsPath:  # @Deniz would it be LinuxPath under linux?!
         file_path = Path(file_path)
-    # handle tdms file
-    t_0_file = datetime.datetime.now()
     print("\x1b[32m", "Opening ", file_path, "\x1b[0m")
+    tdms_techniques = []
     with TdmsFile.open(file_path) as tdms_file:
-        data_ec = pd.DataFrame()  # initialize data_ec
-        data_eis = pd.DataFrame()  # initialize data_ec
         tdms_init = tdms_file.properties
 
         for group in tdms_file.groups():
-            df = group.as_dataframe()  # transform tdms datasheet to pandas DataFrame
-            if (
-                len(df.index) == 0
-            ):  #  stopping execution before first datapoint is measured will create empty table
+            n_rows = max([len(channel) for channel in group.channels()], default=0)
+            if n_rows == 0:
+                #  stopping execution before first datapoint is measured will create empty table
                 continue  # skip empty tables
-            df.loc[:, "data_ec_tablename"] = group.name  # attach column for measurement name
-            # (necessary if all data should be returned in one DataFrame)
-
-            df = df.reset_index().set_index(["data_ec_tablename", "index"])  # adjust index accordingly
-
-            # apply Berlin timezone to timestammp columns (tdms just stores utc timestamps (London))
-            for col in [
-                index for index, value in df.dtypes.items() if value == "datetime64[ns]"
-            ]:
-                df.loc[:, col] = df.loc[:, col].apply(
-                    lambda x: arrow.get(x).to("local").datetime
-                )  # df.loc[:, col].dt.tz_localize(tz='Europe/London').dt.tz_convert(tz='Europe/Berlin')
-
-            # rename columns
-            df = df.rename(
-                columns={
-                    "Time (s)": "t__s",
-                    "Current (A)": "I__A",
-                    "Potential WE (V)": "E_WE_raw__VvsRE",
-                    "Potential WE uncomp (V)": "Delta_E_WE_uncomp__V",
-                    "Potential Signal (V)": "E_Signal__VvsRE",
-                    "Frequency (Hz)": "f__Hz",
-                    "Z real": "Z_real__ohm",
-                    "-Z img": "minusZ_img__ohm",
-                    "Vdc": "E_dc__VvsRE",
-                    "Idc": "I_dc__A",
-                    #'Timestamp': 'Timestamp',
-                }
-            )
+            technique = {
+                "data_ec_tablename": group.name,
+                "is_eis": "EIS" in group.name,
+                "n_rows": n_rows,
+                "n_skip": 0,
+            }
+            df = _read_tdms_group(group, offset=0, length=20)
 
             # Considering line skip for corrupted tdms files. here primitive cutting of first n lines as given by user
-            if "EIS" not in group.name:
-                if df.loc[:, "t__s"].iloc[0] > 10:
+            if not technique["is_eis"]:
+                if n_skip is not None:
+                    technique["n_skip"] = (
+                        int(n_skip[group.name]) if group.name in n_skip else 0
+                    )
+                elif df.loc[:, "t__s"].iloc[0] > 10:
                     print(
                         "\x1b[31m",
                         "Tdms file technique "
@@ -246,22 +280,90 @@ def read_tdms(file_path):
                         "\n\n",
                     )
                     display(df.t__s.iloc[:20])
-                    df = df.iloc[
-                        user_input.user_input(
-                            text="How many lines to skip?",
-                            dtype="int",
-                        ):
-                    ]
-            # merge all into one pd DataFrame for EIS and for EC
-            if "EIS" in group.name:
-                data_eis = pd.concat([data_eis, df])
-            else:
-                data_ec = pd.concat([data_ec, df])
-
-        t_1_file = datetime.datetime.now()
-        print("tdms reading time: ", t_1_file - t_0_file, " s")
-        print()
-        return tdms_init, data_ec, data_eis
+                    technique["n_skip"] = user_input.user_input(
+                        text="How many lines to skip?",
+                        dtype="int",
+                    )
+                if technique["n_skip"] < n_rows:
+                    first_datapoint = _read_tdms_group(
+                        group, offset=technique["n_skip"], length=1
+                    ).iloc[0]
+                    technique.update(
+                        {
+                            col: first_datapoint[col]
+                            for col in ["t__s", "Timestamp"]
+                            if col in first_datapoint.index
+                        }
+                    )
+            tdms_techniques.append(technique)
+
+    return tdms_init, pd.DataFrame(
+        tdms_techniques,
+        columns=["data_ec_tablename", "is_eis", "n_rows", "n_skip", "t__s", "Timestamp"],
+    ).set_index("data_ec_tablename")
+
+
+def iter_tdms(file_path, n_skip=None, max_rows=TDMS_MAX_ROWS_CHUNK):
+    """
+    Read the data of a tdms file technique by technique (tdms group) and in chunks of at most max_rows datapoints,
+    to keep memory bounded for long measurements.
+    :param file_path: path of file including file extension (.tdms), using pathlib
+    :type file_path: str | pathlib.WindowsPath
+    :param n_skip: dict or pd.Series or None, optional, Default None
+        number of lines to skip for each technique (data_ec_tablename), see read_tdms_techniques()
+    :param max_rows: int or None, optional, Default TDMS_MAX_ROWS_CHUNK
+        maximum number of datapoints per yielded DataFrame, if None each technique is yielded as a whole
+    :return: generator of (data_ec_tablename, pd.DataFrame)
+        DataFrame indexed by data_ec_tablename and index (number of the datapoint within the technique)
+    """
+    if type(file_path) != WindowsPath:
+        file_path = Path(file_path)
+    if n_skip is None:
+        n_skip = {}
+    with TdmsFile.open(file_path) as tdms_file:
+        for group in tdms_file.groups():
+            n_rows = max([len(channel) for channel in group.channels()], default=0)
+            if n_rows == 0:
+                continue  # skip empty tables
+            n_skip_group = int(n_skip[group.name]) if group.name in n_skip else 0
+            n_rows_chunk = n_rows if max_rows is None else max_rows
+            for offset in range(n_skip_group, n_rows, max(n_rows_chunk, 1)):
+                yield group.name, _read_tdms_group(group, offset=offset, length=n_rows_chunk)
+
+
+def _read_tdms_group(group, offset=0, length=None):
+    """
+    Read part of the data of a tdms group into a DataFrame. Timestamps are converted from utc to local time.
+    :param group: nptdms.TdmsGroup
+        tdms group of a technique
+    :param offset: int
+        number of the first datapoint to be read
+    :param length: int or None
+        number of datapoints to be read, if None all remaining datapoints
+    :return: pd.DataFrame indexed by data_ec_tablename and index
+    """
+    df = pd.DataFrame(
+        {
+            channel.name: pd.Series(channel.read_data(offset=offset, length=length))
+            for channel in group.channels()
+        }
+    )
+    df.index = df.index + offset
+    df.index.name = "index"
+
+    # apply local timezone to timestamp columns (tdms just stores utc timestamps (London))
+    for col in [index for index, value in df.dtypes.items() if value.kind == "M"]:
+        df[col] = (
+            df.loc[:, col]
+            .astype("datetime64[ns]")
+            .dt.tz_localize(tz="UTC")
+            .dt.tz_convert(tz=dateutil.tz.tzlocal())
+        )
+
+    df.loc[:, "data_ec_tablename"] = group.name  # attach column for measurement name
+    # (necessary if all data should be returned in one DataFrame)
+    df = df.reset_index().set_index(["data_ec_tablename", "index"])  # adjust index accordingly
+    return df.rename(columns=tdms_columns)
 
 
 def read_infotxt(file_path):
@@ -424,12 +526,164 @@ def read_infotxt(file_path):
     return exp_ec_list.reset_index(drop=True)
 
 
-def insert_ec_tdms(path_to_files, manual_info):
+def read_ec_tdms_file(tdms_file, n_skip=None, read_data=False):
+    """
+    Read a tdms file and its info file and prepare the list of executed ec experiments for insertion into database.
+    Does not require a database connection, thus can be executed in a worker process.
+    :param tdms_file: path of tdms file
+    :type tdms_file: pathlib.Path
+    :param n_skip: dict or pd.Series or None, optional, Default None
+        number of lines to skip for each technique, see read_tdms_techniques()
+    :param read_data: bool, optional, Default False
+        whether to read all data of the tdms file, else data is streamed via iter_tdms() during insertion
+    :return: dict or None if no info file is found
+        with the keys exp_ec_list, tdms_techniques, data (list of (data_ec_tablename, pd.DataFrame) or None),
+        t_read__s (time to read and prepare the file)
+    """
+    t_0_file = datetime.datetime.now()
+    info_file = tdms_file.parent / ("Info_" + tdms_file.with_suffix(".txt").name)
+    if not info_file.is_file():
+        warnings.warn(
+            "\n No info file found for " + tdms_file.name + " \n File is skipped!"
+        )
+        return None
+
+    # reading of info and corresponding tdms file
+    exp_ec_list = read_infotxt(info_file)
+    # only the first datapoint of each technique is read here,
+    # data is streamed chunk by chunk to the database if not read_data
+    tdms_init, tdms_techniques = read_tdms_techniques(tdms_file, n_skip=n_skip)
+    tdms_techniques_ec = tdms_techniques.loc[
+        ~tdms_techniques.is_eis.astype(bool)
+        & (tdms_techniques.n_skip < tdms_techniques.n_rows),
+        :,
+    ]
+
+    exp_ec_list.loc[:, "rawdata_computer"] = tdms_init[
+        "computer"
+    ]  # if 'computer' in tdms_init.keys() else 'unknown'
+
+    # exp_ec from data_ec (from eis there are no timestamps available yet)
+    if (
+        not tdms_techniques_ec.empty
+    ):  # only eis data --> data_ec is empty will throw error
+        t_start_timestamps = pd.Series(
+            pd.to_datetime(tdms_techniques_ec.loc[:, "Timestamp"])
+            - pd.to_timedelta(
+                tdms_techniques_ec.loc[:, "t__s"].astype(float),
+                unit="seconds",
+            ),
+            name="t_start__timestamp",
+        )
+        exp_ec_list = exp_ec_list.join(t_start_timestamps, on="data_ec_tablename")
+    else:
+        exp_ec_list.loc[:, "t_start__timestamp"] = np.nan
+
+    # calculate dummy timestamp for eis
+    # won't disturb ICP-MS data matching, as t_end__timestamp is still undefined thus WHERE statement will remove geis/peis lines
+    date = info_file.name.split("_")[1]
+    timestamp = date[:4] + "-" + date[4:6] + "-" + date[6:] + " 00:00:00."
+    exp_ec_list.loc[
+        exp_ec_list.loc[:, "t_start__timestamp"].isna(),
+        "t_start__timestamp",
+    ] = [
+        timestamp
+        + "000"[len(str(row["id_ML"])) :]
+        + str(row["id_ML"])
+        + "000"[len(str(row["id_ML_technique"])) :]
+        + str(row["id_ML_technique"])
+        for index, row in exp_ec_list.loc[
+            exp_ec_list.loc[:, "t_start__timestamp"].isna(), :
+        ].iterrows()
+    ]
+
+    # Check if data is available for teh experiment otherwise assume the technique wasnt executed
+    executed_techniques = tdms_techniques.index[
+        tdms_techniques.n_skip < tdms_techniques.n_rows
+    ]
+    exp_ec_list.loc[:, "executed"] = (
+        exp_ec_list.loc[:, "data_ec_tablename"].isin(executed_techniques).to_numpy()
+    )
+
+    # Remove unexecuted techniques
+    exp_ec_list = exp_ec_list.loc[(exp_ec_list.loc[:, "executed"] == 1), :]
+
+    data = (
+        list(iter_tdms(tdms_file, n_skip=tdms_techniques.n_skip))
+        if read_data and not exp_ec_list.empty
+        else None
+    )
+    return {
+        "exp_ec_list": exp_ec_list,
+        "tdms_techniques": tdms_techniques,
+        "data": data,
+        "t_read__s": (datetime.datetime.now() - t_0_file).total_seconds(),
+    }
+
+
+def _iter_read_ec_tdms_files(tdms_files, n_processes=1):
+    """
+    Read tdms files via read_ec_tdms_file() either sequentially (data is not read) or in a pool of worker processes
+    (see evaluation.utils.tools.process_pool_executor(), sequentially if not available).
+    In the latter case, the number of lines to skip of corrupted files is asked for all files upfront, so that workers
+    never wait for user input and at most 2*n_processes files are read ahead of the consumer. Only data of files with
+    at most TDMS_MAX_ROWS_CHUNK datapoints is read by the workers, data of larger files is streamed via iter_tdms()
+    during insertion, to keep memory bounded.
+    :param tdms_files: list of pathlib.Path
+        tdms files to be read
+    :param n_processes: int, optional, Default 1
+        number of worker processes
+    :return: generator of (tdms_file, result of read_ec_tdms_file()), in order of tdms_files
+    """
+    executor = tools.process_pool_executor(n_processes) if n_processes > 1 else None
+    if executor is None:
+        for tdms_file in tdms_files:
+            yield tdms_file, read_ec_tdms_file(tdms_file)
+        return
+
+    # resolve prompts upfront
+    tdms_techniques_files = {
+        tdms_file: read_tdms_techniques(tdms_file)[1] for tdms_file in tdms_files
+    }
+    with executor:
+        futures = collections.deque()
+        for tdms_file in tdms_files:
+            futures.append(
+                (
+                    tdms_file,
+                    executor.submit(
+                        read_ec_tdms_file,
+                        tdms_file,
+                        n_skip=tdms_techniques_files[tdms_file].n_skip,
+                        read_data=(
+                            tdms_techniques_files[tdms_file].n_rows
+                            - tdms_techniques_files[tdms_file].n_skip
+                        ).clip(lower=0).sum()
+                        <= TDMS_MAX_ROWS_CHUNK,
+                    ),
+                )
+            )
+            if len(futures) >= 2 * n_processes:
+                tdms_file_done, future = futures.popleft()
+                yield tdms_file_done, future.result()
+        while len(futures) > 0:
+            tdms_file_done, future = futures.popleft()
+            yield tdms_file_done, future.result()
+
+
+def insert_ec_tdms(path_to_files, manual_info, n_processes=1):
     """
     Inserts all tdms file in the given folder to MySQL database
     :param path_to_files: one tdms file or folder containing tdms files
     :type path_to_files: Pathlib.WindowsPath()
-    :return:
+    :param manual_info: dict
+        preset of manually added information, missing information is asked from the user
+    :param n_processes: int, optional, Default 1
+        number of worker processes reading the tdms files in parallel, while the results are inserted into
+        database one file after another in the order of the files. If 1, files are read sequentially and data is
+        streamed chunk by chunk into database.
+    :return: pd.DataFrame
+        reading and writing time and number of inserted datapoints for each file
     """
     print("You are using Version 20220124.")
 
@@ -466,644 +720,612 @@ def insert_ec_tdms(path_to_files, manual_info):
     else:
         print("Found", len(tdms_files), "files to be analysed")
 
-    for tdms_file in tdms_files:
+    timing_files = []
+    for tdms_file, tdms_file_read in _iter_read_ec_tdms_files(
+        tdms_files, n_processes=n_processes
+    ):
         print()
         engine = db.connect(user="hte_inserter_ec", echo=False)
-        if tdms_file.is_file():
-            info_file = tdms_file.parent / (
-                "Info_" + tdms_file.with_suffix(".txt").name
-            )
-            if not info_file.is_file():
-                warnings.warn(
-                    "\n No info file found for "
-                    + tdms_file.name
-                    + " \n File is skipped!"
-                )
-            else:
-
-                # reading of info and corresponding tdms file
-                exp_ec_list = read_infotxt(info_file)
-                tdms_init, data_ec, data_eis = read_tdms(tdms_file)
-
-                with engine.begin() as conn:  # connect to sql after file reading to avoid lost connection error
-                    exp_ec_list.loc[:, "rawdata_computer"] = tdms_init[
-                        "computer"
-                    ]  # if 'computer' in tdms_init.keys() else 'unknown'
-
-                    # exp_ec from data_ec (from eis there are no timestamps available yet)
-                    if (
-                        not data_ec.empty
-                    ):  # only eis data --> data_ec is empty will throw error
-                        t_start_timestamps = pd.Series(
-                            data_ec.groupby(level=0).first().loc[:, "Timestamp"]
-                            - pd.to_timedelta(
-                                data_ec.groupby(level=0).first().loc[:, "t__s"],
-                                unit="seconds",
-                            ),
-                            name="t_start__timestamp",
-                        )
-                        exp_ec_list = exp_ec_list.join(
-                            t_start_timestamps, on="data_ec_tablename"
-                        )
-                        # display(data_ec.Timestamp)
-                        # display(exp_ec_list.t_start__timestamp)
+        if tdms_file_read is not None:  # else no info file found, file is skipped
+            t_0_write = datetime.datetime.now()
+            exp_ec_list = tdms_file_read["exp_ec_list"]
+            tdms_techniques = tdms_file_read["tdms_techniques"]
 
-                    else:
-                        exp_ec_list.loc[:, "t_start__timestamp"] = np.nan
-
-                    # calculate dummy timestamp for eis
-                    # won't disturb ICP-MS data matching, as t_end__timestamp is still undefined thus WHERE statement will remove geis/peis lines
-                    date = info_file.name.split("_")[1]
-                    timestamp = (
-                        date[:4] + "-" + date[4:6] + "-" + date[6:] + " 00:00:00."
+            with engine.begin() as conn:  # connect to sql after file reading to avoid lost connection error
+                if exp_ec_list.empty:
+                    warnings.warn(
+                        "\nFile "
+                        + tdms_file.name
+                        + " does not contain any data. I suspect there are only unexecuted techniques in this ML."
                     )
-                    exp_ec_list.loc[
-                        exp_ec_list.loc[:, "t_start__timestamp"].isna(),
-                        "t_start__timestamp",
-                    ] = [
-                        timestamp
-                        + "000"[len(str(row["id_ML"])) :]
-                        + str(row["id_ML"])
-                        + "000"[len(str(row["id_ML_technique"])) :]
-                        + str(row["id_ML_technique"])
-                        for index, row in exp_ec_list.loc[
-                            exp_ec_list.loc[:, "t_start__timestamp"].isna(), :
-                        ].iterrows()
-                    ]
+                    continue
 
-                    # Check if data is available for teh experiment otherwise assume the technique wasnt executed
-                    executed_ec_techniques = (
-                        data_ec.reset_index().loc[:, "data_ec_tablename"].unique()
-                        if not data_ec.empty
-                        else []
-                    )
-                    executed_eis_techniques = (
-                        data_eis.reset_index().loc[:, "data_ec_tablename"].unique()
-                        if not data_eis.empty
-                        else []
+                # Skip techniques already inserted, single query for all techniques of the file
+                is_inserted = db.keys_exist(
+                    "exp_sfc",
+                    exp_ec_list.loc[
+                        :, ["rawdata_computer", "rawdata_path", "id_ML_technique"]
+                    ],
+                    con=conn,
+                )
+                if is_inserted.all():
+                    warnings.warn(
+                        "\nFile "
+                        + tdms_file.name
+                        + " is already added to db and will be skipped."
                     )
-                    exp_ec_list.loc[:, "executed"] = (
-                        exp_ec_list.loc[:, "data_ec_tablename"]
-                        .isin(
-                            np.append(executed_ec_techniques, executed_eis_techniques)
-                        )
-                        .to_numpy()
+                    continue
+                elif is_inserted.any():
+                    print(
+                        "\x1b[33m",
+                        "Techniques",
+                        ", ".join(exp_ec_list.loc[is_inserted, "data_ec_tablename"]),
+                        "are already inserted into database and will be skipped.",
+                        "\x1b[0m",
                     )
+                    exp_ec_list = exp_ec_list.loc[~is_inserted, :].reset_index(drop=True)
 
-                    # Remove unexecuted techniques
-                    exp_ec_list = exp_ec_list.loc[
-                        (exp_ec_list.loc[:, "executed"] == 1), :
-                    ]
-                    if exp_ec_list.empty:
-                        warnings.warn(
-                            "\nFile "
-                            + tdms_file.name
-                            + " does not contain any data. I suspect there are only unexecuted techniques in this ML."
-                        )
-                        continue
-
-                    exp_ec_list, manual_info = user_input.manually_add(
-                        parameters=[
-                            {
-                                "name": "name_user",
-                                "fk_table_name": "users",
-                                "dtype": "fk",
-                            },
-                            {
-                                "name": "id_sample",
-                                "fk_table_name": "samples",
-                                "dtype": "fk",
-                            },
-                        ],
-                        preset=manual_info,
-                        write_to=exp_ec_list,
-                        conn=conn,
-                        engine=engine,
-                    )
+                exp_ec_list, manual_info = user_input.manually_add(
+                    parameters=[
+                        {
+                            "name": "name_user",
+                            "fk_table_name": "users",
+                            "dtype": "fk",
+                        },
+                        {
+                            "name": "id_sample",
+                            "fk_table_name": "samples",
+                            "dtype": "fk",
+                        },
+                    ],
+                    preset=manual_info,
+                    write_to=exp_ec_list,
+                    conn=conn,
+                    engine=engine,
+                )
 
-                    exp_ec_list, manual_info = user_input.manually_add(
-                        parameters=[
-                            {
-                                "name": "id_spot",
-                                "fk_table_name": "spots",
-                                "dtype": "fk",
-                                "fk_table_cond": "id_sample="
-                                + str(manual_info["id_sample"]),
-                            },
-                            {
-                                "name": "name_setup_sfc",
-                                "fk_table_name": "setups_sfc",
-                                "dtype": "fk",
-                            },
-                            {
-                                "name": "name_RE",
-                                "fk_table_name": "reference_electrodes",
-                                "dtype": "fk",
-                            },
-                            {
-                                "name": "name_CE",
-                                "fk_table_name": "counter_electrodes",
-                                "dtype": "fk",
-                            },
-                            {"name": "E_RE__VvsRHE", "dtype": "float"},
-                            {"name": "force__N", "dtype": "float"},
-                            {
-                                "name": "T_stage__degC",
-                                "dtype": "float",
-                                "optional": True,
-                            },
-                            {"name": "comment", "dtype": "str", "optional": True},
-                        ],
-                        preset=manual_info,
-                        write_to=exp_ec_list,
-                        conn=conn,
-                        engine=engine,
-                    )
+                exp_ec_list, manual_info = user_input.manually_add(
+                    parameters=[
+                        {
+                            "name": "id_spot",
+                            "fk_table_name": "spots",
+                            "dtype": "fk",
+                            "fk_table_cond": "id_sample="
+                            + str(manual_info["id_sample"]),
+                        },
+                        {
+                            "name": "name_setup_sfc",
+                            "fk_table_name": "setups_sfc",
+                            "dtype": "fk",
+                        },
+                        {
+                            "name": "name_RE",
+                            "fk_table_name": "reference_electrodes",
+                            "dtype": "fk",
+                        },
+                        {
+                            "name": "name_CE",
+                            "fk_table_name": "counter_electrodes",
+                            "dtype": "fk",
+                        },
+                        {"name": "E_RE__VvsRHE", "dtype": "float"},
+                        {"name": "force__N", "dtype": "float"},
+                        {
+                            "name": "T_stage__degC",
+                            "dtype": "float",
+                            "optional": True,
+                        },
+                        {"name": "comment", "dtype": "str", "optional": True},
+                    ],
+                    preset=manual_info,
+                    write_to=exp_ec_list,
+                    conn=conn,
+                    engine=engine,
+                )
 
-                    flow_cell_assemblies_list = pd.DataFrame()
-                    enum_table = pd.Series(
-                        conn.execute(
-                            sql.text(
-                                'SELECT SUBSTRING(COLUMN_TYPE,5) FROM information_schema.COLUMNS WHERE TABLE_NAME="'
-                                + "flow_cell_assemblies"
-                                + '" AND COLUMN_NAME="'
-                                + "location"
-                                + '";'
-                            )
+                flow_cell_assemblies_list = pd.DataFrame()
+                enum_table = pd.Series(
+                    conn.execute(
+                        sql.text(
+                            'SELECT SUBSTRING(COLUMN_TYPE,5) FROM information_schema.COLUMNS WHERE TABLE_NAME="'
+                            + "flow_cell_assemblies"
+                            + '" AND COLUMN_NAME="'
+                            + "location"
+                            + '";'
                         )
-                        .first()[0]
-                        .strip("()' ")
-                        .split("','")
                     )
-                    for index, value in enum_table.iteritems():  # 'top, bottom
-                        key = "flow_cell" + "_" + value
-                        if key not in manual_info.keys():
-                            manual_info[key] = user_input.user_input(
-                                text="Does setup include " + key + "? \n",
-                                dtype="bool",
-                                optional=False,
-                            )
-                            manual_info[key] = {} if manual_info[key] != 0 else False
-                        if manual_info[key] != False:  # either True or dict
-                            flow_cell_assemblies = exp_ec_list.drop(
-                                columns=exp_ec_list.columns
-                            )
-                            flow_cell_assemblies.loc[:, "location"] = value
-                            flow_cell_assemblies = (
-                                flow_cell_assemblies.reset_index().set_index(
-                                    ["index", "location"]
-                                )
-                            )
-                            (
-                                flow_cell_assemblies,
-                                manual_info[key],
-                            ) = user_input.manually_add(
-                                parameters=[
-                                    {
-                                        "name": "name_flow_cell",
-                                        "fk_table_name": "flow_cells",
-                                        "dtype": "fk",
-                                    },
-                                    {
-                                        "name": "id_sealing",
-                                        "fk_table_name": "sealings",
-                                        "dtype": "fk",
-                                        "optional": True,
-                                    },
-                                    {
-                                        "name": "id_PTL",
-                                        "fk_table_name": "porous_transport_layers",
-                                        "dtype": "fk",
-                                        "optional": True,
-                                    },
-                                ],
-                                preset=manual_info[key],
-                                write_to=flow_cell_assemblies,
-                                conn=conn,
-                                engine=engine,
-                            )
-                            flow_cell_assemblies_list = pd.concat(
-                                [flow_cell_assemblies_list, flow_cell_assemblies]
-                            )
-                            # print(manual_info[key])
-
-                    electrolyte_flow_list = pd.DataFrame()
-                    enum_table = pd.Series(
-                        conn.execute(
-                            sql.text(
-                                'SELECT SUBSTRING(COLUMN_TYPE,5) FROM information_schema.COLUMNS WHERE TABLE_NAME="'
-                                + "flow_electrolyte"
-                                + '" AND COLUMN_NAME="'
-                                + "location"
-                                + '";'
-                            )
+                    .first()[0]
+                    .strip("()' ")
+                    .split("','")
+                )
+                for index, value in enum_table.iteritems():  # 'top, bottom
+                    key = "flow_cell" + "_" + value
+                    if key not in manual_info.keys():
+                        manual_info[key] = user_input.user_input(
+                            text="Does setup include " + key + "? \n",
+                            dtype="bool",
+                            optional=False,
                         )
-                        .first()[0]
-                        .strip("()' ")
-                        .split("','")
-                    )
-                    for index, value in enum_table.iteritems():  #'top, bottom
-                        key = "electrolyte" + "_" + value
-                        if key not in manual_info.keys():
-                            manual_info[key] = user_input.user_input(
-                                text="Does setup include " + key + "? \n",
-                                dtype="bool",
-                                optional=False,
-                            )
-                            manual_info[key] = {} if manual_info[key] != 0 else False
-                        if manual_info[key] != False:  # either True or dict
-                            electrolyte_flow = exp_ec_list.drop(
-                                columns=exp_ec_list.columns
-                            )
-                            electrolyte_flow.loc[:, "location"] = value
-                            electrolyte_flow = electrolyte_flow.reset_index().set_index(
+                        manual_info[key] = {} if manual_info[key] != 0 else False
+                    if manual_info[key] != False:  # either True or dict
+                        flow_cell_assemblies = exp_ec_list.drop(
+                            columns=exp_ec_list.columns
+                        )
+                        flow_cell_assemblies.loc[:, "location"] = value
+                        flow_cell_assemblies = (
+                            flow_cell_assemblies.reset_index().set_index(
                                 ["index", "location"]
                             )
-                            (
-                                electrolyte_flow,
-                                manual_info[key],
-                            ) = user_input.manually_add(
-                                parameters=[
-                                    {
-                                        "name": "id_pump_in",
-                                        "fk_name": "id_pump",
-                                        "fk_table_name": "peristaltic_pumps",
-                                        "dtype": "fk",
-                                    },
-                                    {
-                                        "name": "id_tubing_in",
-                                        "fk_name": "id_tubing",
-                                        "fk_table_name": "peristaltic_tubings",
-                                        "dtype": "fk",
-                                    },
-                                    {
-                                        "name": "pump_rate_in__rpm",
-                                        "dtype": "float",
-                                        "optional": True,
-                                    },
-                                    {
-                                        "name": "id_pump_out",
-                                        "fk_name": "id_pump",
-                                        "fk_table_name": "peristaltic_pumps",
-                                        "dtype": "fk",
-                                    },
-                                    {
-                                        "name": "id_tubing_out",
-                                        "fk_name": "id_tubing",
-                                        "fk_table_name": "peristaltic_tubings",
-                                        "dtype": "fk",
-                                    },
-                                    {
-                                        "name": "pump_rate_out__rpm",
-                                        "dtype": "float",
-                                        "optional": True,
-                                    },
-                                    {
-                                        "name": "flow_rate_real__mul_min",
-                                        "dtype": "float",
-                                        "optional": True,
-                                    },
-                                    {
-                                        "name": "name_electrolyte",
-                                        "fk_table_name": "electrolytes",
-                                        "dtype": "fk",
-                                    },
-                                    {"name": "c_electrolyte__mol_L", "dtype": "float"},
-                                ],
-                                preset=manual_info[key],
-                                write_to=electrolyte_flow,
-                                conn=conn,
-                                engine=engine,
-                            )
-                            electrolyte_flow_list = pd.concat(
-                                [electrolyte_flow_list, electrolyte_flow]
-                            )
-                            # print(manual_info[key])
-
-                    gas_flow_list = pd.DataFrame()
-                    enum_table_location = pd.Series(
-                        conn.execute(
-                            sql.text(
-                                'SELECT SUBSTRING(COLUMN_TYPE,5) FROM information_schema.COLUMNS WHERE TABLE_NAME="'
-                                + "flow_gas"
-                                + '" AND COLUMN_NAME="'
-                                + "location"
-                                + '";'
-                            )
                         )
-                        .first()[0]
-                        .strip("()' ")
-                        .split("','"),
-                        name="location",
+                        (
+                            flow_cell_assemblies,
+                            manual_info[key],
+                        ) = user_input.manually_add(
+                            parameters=[
+                                {
+                                    "name": "name_flow_cell",
+                                    "fk_table_name": "flow_cells",
+                                    "dtype": "fk",
+                                },
+                                {
+                                    "name": "id_sealing",
+                                    "fk_table_name": "sealings",
+                                    "dtype": "fk",
+                                    "optional": True,
+                                },
+                                {
+                                    "name": "id_PTL",
+                                    "fk_table_name": "porous_transport_layers",
+                                    "dtype": "fk",
+                                    "optional": True,
+                                },
+                            ],
+                            preset=manual_info[key],
+                            write_to=flow_cell_assemblies,
+                            conn=conn,
+                            engine=engine,
+                        )
+                        flow_cell_assemblies_list = pd.concat(
+                            [flow_cell_assemblies_list, flow_cell_assemblies]
+                        )
+                        # print(manual_info[key])
+
+                electrolyte_flow_list = pd.DataFrame()
+                enum_table = pd.Series(
+                    conn.execute(
+                        sql.text(
+                            'SELECT SUBSTRING(COLUMN_TYPE,5) FROM information_schema.COLUMNS WHERE TABLE_NAME="'
+                            + "flow_electrolyte"
+                            + '" AND COLUMN_NAME="'
+                            + "location"
+                            + '";'
+                        )
                     )
-                    enum_table_function = pd.Series(
-                        conn.execute(
-                            sql.text(
-                                'SELECT SUBSTRING(COLUMN_TYPE,5) FROM information_schema.COLUMNS WHERE TABLE_NAME="'
-                                + "flow_gas"
-                                + '" AND COLUMN_NAME="'
-                                + "function"
-                                + '";'
-                            )
+                    .first()[0]
+                    .strip("()' ")
+                    .split("','")
+                )
+                for index, value in enum_table.iteritems():  #'top, bottom
+                    key = "electrolyte" + "_" + value
+                    if key not in manual_info.keys():
+                        manual_info[key] = user_input.user_input(
+                            text="Does setup include " + key + "? \n",
+                            dtype="bool",
+                            optional=False,
+                        )
+                        manual_info[key] = {} if manual_info[key] != 0 else False
+                    if manual_info[key] != False:  # either True or dict
+                        electrolyte_flow = exp_ec_list.drop(
+                            columns=exp_ec_list.columns
+                        )
+                        electrolyte_flow.loc[:, "location"] = value
+                        electrolyte_flow = electrolyte_flow.reset_index().set_index(
+                            ["index", "location"]
+                        )
+                        (
+                            electrolyte_flow,
+                            manual_info[key],
+                        ) = user_input.manually_add(
+                            parameters=[
+                                {
+                                    "name": "id_pump_in",
+                                    "fk_name": "id_pump",
+                                    "fk_table_name": "peristaltic_pumps",
+                                    "dtype": "fk",
+                                },
+                                {
+                                    "name": "id_tubing_in",
+                                    "fk_name": "id_tubing",
+                                    "fk_table_name": "peristaltic_tubings",
+                                    "dtype": "fk",
+                                },
+                                {
+                                    "name": "pump_rate_in__rpm",
+                                    "dtype": "float",
+                                    "optional": True,
+                                },
+                                {
+                                    "name": "id_pump_out",
+                                    "fk_name": "id_pump",
+                                    "fk_table_name": "peristaltic_pumps",
+                                    "dtype": "fk",
+                                },
+                                {
+                                    "name": "id_tubing_out",
+                                    "fk_name": "id_tubing",
+                                    "fk_table_name": "peristaltic_tubings",
+                                    "dtype": "fk",
+                                },
+                                {
+                                    "name": "pump_rate_out__rpm",
+                                    "dtype": "float",
+                                    "optional": True,
+                                },
+                                {
+                                    "name": "flow_rate_real__mul_min",
+                                    "dtype": "float",
+                                    "optional": True,
+                                },
+                                {
+                                    "name": "name_electrolyte",
+                                    "fk_table_name": "electrolytes",
+                                    "dtype": "fk",
+                                },
+                                {"name": "c_electrolyte__mol_L", "dtype": "float"},
+                            ],
+                            preset=manual_info[key],
+                            write_to=electrolyte_flow,
+                            conn=conn,
+                            engine=engine,
+                        )
+                        electrolyte_flow_list = pd.concat(
+                            [electrolyte_flow_list, electrolyte_flow]
+                        )
+                        # print(manual_info[key])
+
+                gas_flow_list = pd.DataFrame()
+                enum_table_location = pd.Series(
+                    conn.execute(
+                        sql.text(
+                            'SELECT SUBSTRING(COLUMN_TYPE,5) FROM information_schema.COLUMNS WHERE TABLE_NAME="'
+                            + "flow_gas"
+                            + '" AND COLUMN_NAME="'
+                            + "location"
+                            + '";'
                         )
-                        .first()[0]
-                        .strip("()' ")
-                        .split("','"),
-                        name="function",
                     )
-                    enum_table = pd.merge(
-                        enum_table_location, enum_table_function, how="cross"
+                    .first()[0]
+                    .strip("()' ")
+                    .split("','"),
+                    name="location",
+                )
+                enum_table_function = pd.Series(
+                    conn.execute(
+                        sql.text(
+                            'SELECT SUBSTRING(COLUMN_TYPE,5) FROM information_schema.COLUMNS WHERE TABLE_NAME="'
+                            + "flow_gas"
+                            + '" AND COLUMN_NAME="'
+                            + "function"
+                            + '";'
+                        )
                     )
+                    .first()[0]
+                    .strip("()' ")
+                    .split("','"),
+                    name="function",
+                )
+                enum_table = pd.merge(
+                    enum_table_location, enum_table_function, how="cross"
+                )
 
-                    for index, row in enum_table.iterrows():
-                        key = "gas" + "_" + row["location"] + "_" + row["function"]
-                        if key not in manual_info.keys():
-                            manual_info[key] = user_input.user_input(
-                                text="Does setup include " + key + "? \n",
-                                dtype="bool",
-                                optional=False,
-                            )
-                            manual_info[key] = {} if manual_info[key] != 0 else False
-                        if manual_info[key] != False:  # either True or dict
-                            gas_flow = exp_ec_list.drop(columns=exp_ec_list.columns)
-                            gas_flow.loc[:, "location"] = row["location"]
-                            gas_flow.loc[:, "function"] = row["function"]
-                            gas_flow = gas_flow.reset_index().set_index(
-                                ["index", "location", "function"]
-                            )
-                            gas_flow, manual_info[key] = user_input.manually_add(
-                                parameters=[
-                                    {
-                                        "name": "name_gas",
-                                        "fk_table_name": "gases",
-                                        "dtype": "fk",
-                                    },
-                                    {
-                                        "name": "flow_rate__ml_min",
-                                        "dtype": "float",
-                                        "optional": True,
-                                    },
-                                ],
-                                preset=manual_info[key],
-                                write_to=gas_flow,
-                                conn=conn,
-                                engine=engine,
-                            )
-                            gas_flow_list = pd.concat([gas_flow_list, gas_flow])
-                    # print('Summary of manual set: \n', manual_info)
-
-                    if "use_for_whole_dataset" not in manual_info.keys():
-                        pretty_summary_print(manual_info)
-                        manual_info["use_for_whole_dataset"] = user_input.user_input(
-                            text="Use this infos for the whole dataset?\n",
+                for index, row in enum_table.iterrows():
+                    key = "gas" + "_" + row["location"] + "_" + row["function"]
+                    if key not in manual_info.keys():
+                        manual_info[key] = user_input.user_input(
+                            text="Does setup include " + key + "? \n",
                             dtype="bool",
                             optional=False,
                         )
-                    if not manual_info["use_for_whole_dataset"]:
-                        manual_info_initial["use_for_whole_dataset"] = manual_info[
-                            "use_for_whole_dataset"
-                        ]
-                        manual_info = copy.copy(manual_info_initial)  # {}
+                        manual_info[key] = {} if manual_info[key] != 0 else False
+                    if manual_info[key] != False:  # either True or dict
+                        gas_flow = exp_ec_list.drop(columns=exp_ec_list.columns)
+                        gas_flow.loc[:, "location"] = row["location"]
+                        gas_flow.loc[:, "function"] = row["function"]
+                        gas_flow = gas_flow.reset_index().set_index(
+                            ["index", "location", "function"]
+                        )
+                        gas_flow, manual_info[key] = user_input.manually_add(
+                            parameters=[
+                                {
+                                    "name": "name_gas",
+                                    "fk_table_name": "gases",
+                                    "dtype": "fk",
+                                },
+                                {
+                                    "name": "flow_rate__ml_min",
+                                    "dtype": "float",
+                                    "optional": True,
+                                },
+                            ],
+                            preset=manual_info[key],
+                            write_to=gas_flow,
+                            conn=conn,
+                            engine=engine,
+                        )
+                        gas_flow_list = pd.concat([gas_flow_list, gas_flow])
+                # print('Summary of manual set: \n', manual_info)
+
+                if "use_for_whole_dataset" not in manual_info.keys():
+                    pretty_summary_print(manual_info)
+                    manual_info["use_for_whole_dataset"] = user_input.user_input(
+                        text="Use this infos for the whole dataset?\n",
+                        dtype="bool",
+                        optional=False,
+                    )
+                if not manual_info["use_for_whole_dataset"]:
+                    manual_info_initial["use_for_whole_dataset"] = manual_info[
+                        "use_for_whole_dataset"
+                    ]
+                    manual_info = copy.copy(manual_info_initial)  # {}
 
-                # print(manual_info)
+            # print(manual_info)
 
-                # write into db #.connect()
-                with engine.begin() as conn:  # new connection once all files are read
+            # write into db #.connect()
+            with engine.begin() as conn:  # new connection once all files are read
 
-                    # Reset exp_ec Auto increment
-                    db.call_procedure(
-                        engine, "Reset_Autoincrement", ["exp_sfc", "id_exp_sfc"]
+                # Reset exp_ec Auto increment
+                db.call_procedure(
+                    engine, "Reset_Autoincrement", ["exp_sfc", "id_exp_sfc"]
+                )
+                # Lock Tables to avoid simultaneous insertions from multiple PC
+                # conn.execute(sql.text("LOCK TABLES exp_ec WRITE, exp_ec_cv WRITE, exp_ec_geis WRITE,
+                # exp_ec_ghold WRITE, exp_ec_peis WRITE, exp_ec_phold WRITE, exp_ec_ramp WRITE, data_ec WRITE,
+                # data_eis WRITE, flow_cell_assemblies WRITE, flow_electrolyte WRITE, flow_gas WRITE;"))
+                # Lock tables to avoid simultaneous insertion
+
+                if any(
+                    exp_ec_list.loc[:, "id_ML_technique"]
+                    != exp_ec_list.sort_values(by=["id_ML_technique"])
+                    .reset_index()
+                    .loc[:, "id_ML_technique"]
+                ):  # Check if order is still alright otherwise need to be implemented .sort_values(by=['id_ML_technique'])
+                    warnings.warn(
+                        "\n Error, exp_ec_list not sorted according id_ML_technique!"
                     )
-                    # Lock Tables to avoid simultaneous insertions from multiple PC
-                    # conn.execute(sql.text("LOCK TABLES exp_ec WRITE, exp_ec_cv WRITE, exp_ec_geis WRITE,
-                    # exp_ec_ghold WRITE, exp_ec_peis WRITE, exp_ec_phold WRITE, exp_ec_ramp WRITE, data_ec WRITE,
-                    # data_eis WRITE, flow_cell_assemblies WRITE, flow_electrolyte WRITE, flow_gas WRITE;"))
-                    # Lock tables to avoid simultaneous insertion
-
-                    if any(
-                        exp_ec_list.loc[:, "id_ML_technique"]
-                        != exp_ec_list.sort_values(by=["id_ML_technique"])
-                        .reset_index()
-                        .loc[:, "id_ML_technique"]
-                    ):  # Check if order is still alright otherwise need to be implemented .sort_values(by=['id_ML_technique'])
-                        warnings.warn(
-                            "\n Error, exp_ec_list not sorted according id_ML_technique!"
-                        )
-                        sys.exit()
-
-                    exp_sfc_list_to_sql = exp_ec_list.drop(
-                        columns=[
-                            "exp_ec_technique_table",
-                            "data_ec_tablename",
-                            "executed",
-                        ]
-                    ).rename(columns={"name_setup_ec": "name_setup_sfc"})
-                    exp_sfc_list_to_sql.loc[
-                        :, "id_exp_sfc"
-                    ] = 0  # must be set to 0 to invoke auto_increment
-                    exp_sfc_list_to_sql = exp_sfc_list_to_sql.set_index("id_exp_sfc")
-                    exp_sfc_list_to_sql = exp_sfc_list_to_sql.loc[
-                        :,
-                        [
-                            "name_user",
-                            "name_setup_sfc",
-                            "t_start__timestamp",
-                            "rawdata_path",
-                            "rawdata_computer",
-                            "id_ML",
-                            "id_ML_technique",
-                            "id_sample",
-                            "id_spot",
-                            "force__N",
-                            "T_stage__degC",
-                            "labview_sfc_version",
-                            "comment",
-                        ],
-                    ]
-
-                    # print(exp_sfc_list_to_sql)
+                    sys.exit()
 
-                    # print(exp_sfc_list_to_sql)#.loc[:, 't_start__timestamp'])
-                    try:
-                        exp_sfc_list_to_sql.to_sql(
-                            "exp_sfc", con=conn, if_exists="append"
-                        )
-                    except sql.exc.IntegrityError as error:
-                        print(str(error.orig), type(error.orig))
-                        if "Duplicate entry" in str(error.orig) and "UNIQUE" in str(
-                            error.orig
-                        ):
-                            warnings.warn(
-                                "\nFile "
-                                + tdms_file.name
-                                + " is already added to db and will be skipped. \n"
-                                  "If this is not intended check uniqueness of couples: \n "
-                                  "1) rawdata_computer - rawdata_path - id_ML_technique \n "
-                                  "2) timestamp - name_setup_ec"
-                            )
-                            conn.execute(sql.text("UNLOCK TABLES"))
-                            continue
-                        else:
-                            warnings.warn(error.orig)
-                            sys.exit("Duplicate entry")
-                    # print(conn.execute(sql.text("SELECT * FROM exp_ec")).all())
-
-                    # get id_exp_sfc according to unique columns
-                    # rawdata_path, computer, user, 'id_ML', 'id_ML_technique'
-                    join_columns = [
+                exp_sfc_list_to_sql = exp_ec_list.drop(
+                    columns=[
+                        "exp_ec_technique_table",
+                        "data_ec_tablename",
+                        "executed",
+                    ]
+                ).rename(columns={"name_setup_ec": "name_setup_sfc"})
+                exp_sfc_list_to_sql.loc[
+                    :, "id_exp_sfc"
+                ] = 0  # must be set to 0 to invoke auto_increment
+                exp_sfc_list_to_sql = exp_sfc_list_to_sql.set_index("id_exp_sfc")
+                exp_sfc_list_to_sql = exp_sfc_list_to_sql.loc[
+                    :,
+                    [
                         "name_user",
+                        "name_setup_sfc",
+                        "t_start__timestamp",
                         "rawdata_path",
                         "rawdata_computer",
                         "id_ML",
                         "id_ML_technique",
-                    ]
-                    # Jonas SFC Software instead: 't_start__timestamp', 'rawdata_computer', 'name_user'
-                    # --> but for old IES timestamp not available (although this is already solved!)
-                    updated_exp_ec = pd.DataFrame(
-                        conn.execute(
-                            sql.text(
-                                "SELECT `id_exp_sfc`, "
-                                + ",".join(join_columns)
-                                + " FROM exp_sfc;"
-                            )
-                        ).all(),
-                        columns=["id_exp_sfc"] + join_columns,
-                    ).set_index(join_columns)
-                    # print(updated_exp_ec)
-                    # print(exp_ec_list.loc[:, join_columns])
-                    exp_ec_list = exp_ec_list.join(
-                        updated_exp_ec, on=join_columns, how="left"
-                    )
-
-
-                    # write exp_ec
-                    exp_ec_list_to_sql = exp_ec_list.set_index("id_exp_sfc").loc[
-                        :,
-                        [
-                            "name_technique",
-                            "R_u__ohm",
-                            "iR_corr_in_situ__percent",
-                            "E_RE__VvsRHE",
-                            "name_RE",
-                            "name_CE",
-                            "name_device",
-                            "id_control_mode",
-                            "id_ie_range",
-                            "id_vch_range",
-                            "id_ich_range",
-                            "id_vch_filter",
-                            "id_ich_filter",
-                            "id_ca_speed",
-                            "id_ie_stability",
-                            "id_sampling_mode",
-                            "ie_range_auto",
-                            "vch_range_auto",
-                            "ich_range_auto",
-                        ],
-                    ]
-                    exp_ec_list_to_sql.to_sql("exp_ec", con=conn, if_exists="append")
+                        "id_sample",
+                        "id_spot",
+                        "force__N",
+                        "T_stage__degC",
+                        "labview_sfc_version",
+                        "comment",
+                    ],
+                ]
+                # timestamps converted once into the format of the database
+                exp_sfc_list_to_sql.loc[:, "t_start__timestamp"] = db.timestamps_to_sql(
+                    exp_sfc_list_to_sql.loc[:, "t_start__timestamp"]
+                )
 
-                    # write exp_ec_technique_tables
-                    for index, row in exp_ec_list.iterrows():
-                        # print(row, row.loc['exp_ec_technique_table'])
-                        exp_ec_technique_table_tosql = pd.DataFrame(
-                            row.loc["exp_ec_technique_table"], index=[row["id_exp_sfc"]]
-                        )
-                        exp_ec_technique_table_tosql.index = (
-                            exp_ec_technique_table_tosql.index.rename("id_exp_sfc")
-                        )
-                        # print(exp_ec_technique_table_tosql.index)
-                        exp_ec_technique_table_tosql.to_sql(
-                            row["name_technique"], con=conn, if_exists="append"
-                        )
-                        # print(exp_ec_technique_table_tosql, row['name_technique'])
-
-                    # data_ec table
-                    if not data_ec.empty:
-                        data_ec_tosql = (
-                            data_ec.join(
-                                exp_ec_list.loc[
-                                    :, ("id_exp_sfc", "data_ec_tablename")
-                                ].set_index(["data_ec_tablename"]),
-                                on=["data_ec_tablename"],
-                            )
-                            .reset_index()
-                            .rename(columns={"index": "id_data_ec"})
-                            .set_index(["id_exp_sfc", "id_data_ec"])
-                            .drop(columns="data_ec_tablename")
-                        )
-                        data_ec_tosql.to_sql(
-                            "data_ec", con=conn, if_exists="append", chunksize=1000
-                        )
+                # print(exp_sfc_list_to_sql)
 
-                    # data_eis table
-                    if not data_eis.empty:
-                        # print(data_eis, exp_ec_list.loc[:, ('id_exp_sfc', 'data_ec_tablename')])
-                        data_eis_tosql = (
-                            data_eis.join(
-                                exp_ec_list.loc[
-                                    :, ("id_exp_sfc", "data_ec_tablename")
-                                ].set_index(["data_ec_tablename"]),
-                                on=["data_ec_tablename"],
-                            )
-                            .reset_index()
-                            .rename(columns={"index": "id_data_eis"})
-                            .set_index(["id_exp_sfc", "id_data_eis"])
-                            .drop(columns="data_ec_tablename")
+                # print(exp_sfc_list_to_sql)#.loc[:, 't_start__timestamp'])
+                try:
+                    exp_sfc_list_to_sql.to_sql(
+                        "exp_sfc", con=conn, if_exists="append"
+                    )
+                except sql.exc.IntegrityError as error:
+                    print(str(error.orig), type(error.orig))
+                    if "Duplicate entry" in str(error.orig) and "UNIQUE" in str(
+                        error.orig
+                    ):
+                        warnings.warn(
+                            "\nFile "
+                            + tdms_file.name
+                            + " is already added to db and will be skipped. \n"
+                              "If this is not intended check uniqueness of couples: \n "
+                              "1) rawdata_computer - rawdata_path - id_ML_technique \n "
+                              "2) timestamp - name_setup_ec"
                         )
-                        data_eis_tosql.to_sql(
-                            "data_eis", con=conn, if_exists="append", chunksize=1000
+                        conn.execute(sql.text("UNLOCK TABLES"))
+                        continue
+                    else:
+                        warnings.warn(error.orig)
+                        sys.exit("Duplicate entry")
+                # print(conn.execute(sql.text("SELECT * FROM exp_ec")).all())
+
+                # get id_exp_sfc according to unique columns
+                # rawdata_path, computer, user, 'id_ML', 'id_ML_technique'
+                join_columns = [
+                    "name_user",
+                    "rawdata_path",
+                    "rawdata_computer",
+                    "id_ML",
+                    "id_ML_technique",
+                ]
+                # Jonas SFC Software instead: 't_start__timestamp', 'rawdata_computer', 'name_user'
+                # --> but for old IES timestamp not available (although this is already solved!)
+                updated_exp_ec = pd.DataFrame(
+                    conn.execute(
+                        sql.text(
+                            "SELECT `id_exp_sfc`, "
+                            + ",".join(join_columns)
+                            + " FROM exp_sfc;"
                         )
+                    ).all(),
+                    columns=["id_exp_sfc"] + join_columns,
+                ).set_index(join_columns)
+                # print(updated_exp_ec)
+                # print(exp_ec_list.loc[:, join_columns])
+                exp_ec_list = exp_ec_list.join(
+                    updated_exp_ec, on=join_columns, how="left"
+                )
 
-                    # flow_cell_assemblies
-                    if not flow_cell_assemblies_list.empty:
-                        flow_cell_assemblies_list_tosql = (
-                            flow_cell_assemblies_list.reset_index()
-                            .join(exp_ec_list.loc[:, ("id_exp_sfc")], on=["index"])
-                            .drop(columns=["index"])
-                            .set_index(["id_exp_sfc", "location"])
-                        )
-                        # print(flow_cell_assemblies_list_tosql)
-                        flow_cell_assemblies_list_tosql.to_sql(
-                            "flow_cell_assemblies", con=conn, if_exists="append"
-                        )  # , method='multi')
-
-                    # flow_electrolyte table
-                    if not electrolyte_flow_list.empty:
-                        electrolyte_flow_list_tosql = (
-                            electrolyte_flow_list.reset_index()
-                            .join(exp_ec_list.loc[:, ("id_exp_sfc")], on=["index"])
-                            .drop(columns=["index"])
-                            .set_index(["id_exp_sfc", "location"])
-                        )
-                        electrolyte_flow_list_tosql.to_sql(
-                            "flow_electrolyte", con=conn, if_exists="append"
-                        )
 
-                    # flow_gas table
-                    if not gas_flow_list.empty:
-                        gas_flow_list_tosql = (
-                            gas_flow_list.reset_index()
-                            .join(exp_ec_list.loc[:, ("id_exp_sfc")], on=["index"])
-                            .drop(columns=["index"])
-                            .set_index(["id_exp_sfc", "location", "function"])
-                        )
-                        gas_flow_list_tosql.to_sql(
-                            "flow_gas", con=conn, if_exists="append"
+                # write exp_ec
+                exp_ec_list_to_sql = exp_ec_list.set_index("id_exp_sfc").loc[
+                    :,
+                    [
+                        "name_technique",
+                        "R_u__ohm",
+                        "iR_corr_in_situ__percent",
+                        "E_RE__VvsRHE",
+                        "name_RE",
+                        "name_CE",
+                        "name_device",
+                        "id_control_mode",
+                        "id_ie_range",
+                        "id_vch_range",
+                        "id_ich_range",
+                        "id_vch_filter",
+                        "id_ich_filter",
+                        "id_ca_speed",
+                        "id_ie_stability",
+                        "id_sampling_mode",
+                        "ie_range_auto",
+                        "vch_range_auto",
+                        "ich_range_auto",
+                    ],
+                ]
+                exp_ec_list_to_sql.to_sql("exp_ec", con=conn, if_exists="append")
+
+                # write exp_ec_technique_tables
+                for index, row in exp_ec_list.iterrows():
+                    # print(row, row.loc['exp_ec_technique_table'])
+                    exp_ec_technique_table_tosql = pd.DataFrame(
+                        row.loc["exp_ec_technique_table"], index=[row["id_exp_sfc"]]
+                    )
+                    exp_ec_technique_table_tosql.index = (
+                        exp_ec_technique_table_tosql.index.rename("id_exp_sfc")
+                    )
+                    # print(exp_ec_technique_table_tosql.index)
+                    exp_ec_technique_table_tosql.to_sql(
+                        row["name_technique"], con=conn, if_exists="append"
+                    )
+                    # print(exp_ec_technique_table_tosql, row['name_technique'])
+
+                # data_ec and data_eis table, streamed chunk by chunk from tdms file to keep memory bounded
+                n_datapoints = 0
+                for data_ec_tablename, data_chunk in (
+                    iter_tdms(tdms_file, n_skip=tdms_techniques.n_skip)
+                    if tdms_file_read["data"] is None
+                    else tdms_file_read["data"]
+                ):
+                    if data_ec_tablename not in exp_ec_list.data_ec_tablename.values:
+                        continue  # technique skipped
+                    n_datapoints += len(data_chunk.index)
+                    name_table, name_index = (
+                        ("data_eis", "id_data_eis")
+                        if tdms_techniques.loc[data_ec_tablename, "is_eis"]
+                        else ("data_ec", "id_data_ec")
+                    )
+                    data_chunk_tosql = (
+                        data_chunk.join(
+                            exp_ec_list.loc[
+                                :, ("id_exp_sfc", "data_ec_tablename")
+                            ].set_index(["data_ec_tablename"]),
+                            on=["data_ec_tablename"],
                         )
+                        .reset_index()
+                        .rename(columns={"index": name_index})
+                        .set_index(["id_exp_sfc", name_index])
+                        .drop(columns="data_ec_tablename")
+                    )
+                    db.bulk_append(name_table, data_chunk_tosql, conn)
+
+                # flow_cell_assemblies
+                if not flow_cell_assemblies_list.empty:
+                    flow_cell_assemblies_list_tosql = (
+                        flow_cell_assemblies_list.reset_index()
+                        .join(exp_ec_list.loc[:, ("id_exp_sfc")], on=["index"])
+                        .drop(columns=["index"])
+                        .set_index(["id_exp_sfc", "location"])
+                    )
+                    # print(flow_cell_assemblies_list_tosql)
+                    flow_cell_assemblies_list_tosql.to_sql(
+                        "flow_cell_assemblies", con=conn, if_exists="append"
+                    )  # , method='multi')
+
+                # flow_electrolyte table
+                if not electrolyte_flow_list.empty:
+                    electrolyte_flow_list_tosql = (
+                        electrolyte_flow_list.reset_index()
+                        .join(exp_ec_list.loc[:, ("id_exp_sfc")], on=["index"])
+                        .drop(columns=["index"])
+                        .set_index(["id_exp_sfc", "location"])
+                    )
+                    electrolyte_flow_list_tosql.to_sql(
+                        "flow_electrolyte", con=conn, if_exists="append"
+                    )
 
-                    # Check constraints on exp_ec parent-child relationship
-                    conn.execute(sql.text("CALL CheckConstraints_exp_ec_techniques;"))
-                    conn.execute(sql.text("UNLOCK TABLES"))
+                # flow_gas table
+                if not gas_flow_list.empty:
+                    gas_flow_list_tosql = (
+                        gas_flow_list.reset_index()
+                        .join(exp_ec_list.loc[:, ("id_exp_sfc")], on=["index"])
+                        .drop(columns=["index"])
+                        .set_index(["id_exp_sfc", "location", "function"])
+                    )
+                    gas_flow_list_tosql.to_sql(
+                        "flow_gas", con=conn, if_exists="append"
+                    )
 
-                    print(
-                        "\x1b[32m",
-                        "Successfully inserted data belonging to ",
-                        tdms_file.name,
-                        "\x1b[0m",
-                        "\n\n",
+                # experiment tables are written via to_sql, record them for refresh of materialized views and caches
+                for name_table in [
+                    "exp_sfc",
+                    "exp_ec",
+                    "flow_cell_assemblies",
+                    "flow_electrolyte",
+                    "flow_gas",
+                ] + exp_ec_list.name_technique.unique().tolist():
+                    db.notify_written(
+                        name_table, exp_ec_list.loc[:, ["id_exp_sfc"]], con=conn
                     )
 
+                # Check constraints on exp_ec parent-child relationship
+                conn.execute(sql.text("CALL CheckConstraints_exp_ec_techniques;"))
+                conn.execute(sql.text("UNLOCK TABLES"))
+
+                print(
+                    "\x1b[32m",
+                    "Successfully inserted data belonging to ",
+                    tdms_file.name,
+                    "\x1b[0m",
+                    "\n\n",
+                )
+            timing_files.append(
+                {
+                    "file": tdms_file.name,
+                    "n_datapoints": n_datapoints,
+                    "t_read__s": tdms_file_read["t_read__s"],
+                    "t_write__s": (
+                        datetime.datetime.now() - t_0_write
+                    ).total_seconds(),
+                }
+            )
+            print(timing_files[-1])
+
     """
     Throw warning for overload error != 8191 with translation --> build function for that
     """
@@ -1114,5 +1336,15 @@ def insert_ec_tdms(path_to_files, manual_info):
         t_1_read_folder - t_0_read_folder,
         " s",
     )
+    timing_files = pd.DataFrame(
+        timing_files, columns=["file", "n_datapoints", "t_read__s", "t_write__s"]
+    ).set_index("file")
+    print(
+        "Throughput: ",
+        timing_files.n_datapoints.sum()
+        / (t_1_read_folder - t_0_read_folder).total_seconds(),
+        " datapoints/s",
+    )
+    return timing_files
 
 
@@ -9,6 +9,7 @@ import numpy as np
 
 from pathlib import Path  # file paths
 import sqlalchemy as sql
+import io
 
 # install package mysqlclient!
 
@@ -432,7 +433,9 @@ def insert_AgilentBatch(
         try:
             display(exp_icpms)
             # print([type(val) for val in exp_icpms.iloc[0].to_numpy()])
-            exp_icpms = db.insert_into(conn, "exp_icpms", exp_icpms).rename(
+            exp_icpms = db.insert_into(
+                conn, "exp_icpms", exp_icpms, method="bulk"
+            ).rename(
                 columns={"inserted_primary_key": "id_exp_icpms"}
             )  # [0]
             print("\x1b[32m", "Successfully inserted to exp_icpms", "\x1b[0m")
@@ -460,6 +463,9 @@ def insert_AgilentBatch(
         ).to_sql(
             "exp_icpms_analyte_internalstandard", con=conn, if_exists="append"
         )
+        db.notify_written(
+            "exp_icpms_analyte_internalstandard", exp_icpms.loc[:, ["id_exp_icpms"]], con=conn
+        )
         print(
             "\x1b[32m",
             "Successfully inserted to exp_icpms_analyte_internalstandard",
@@ -473,6 +479,9 @@ def insert_AgilentBatch(
             ).set_index(["id_exp_icpms"]).drop(columns="id_sample_in_batch").to_sql(
                 "exp_icpms_sfc", con=conn, if_exists="append"
             )
+            db.notify_written(
+                "exp_icpms_sfc", exp_icpms.loc[:, ["id_exp_icpms"]], con=conn
+            )
             print("\x1b[32m", "Successfully inserted to exp_icpms_sfc", "\x1b[0m")
 
         # exp_icpms_sfc_batch
@@ -482,20 +491,28 @@ def insert_AgilentBatch(
             ).set_index(["id_exp_icpms"]).drop(columns="id_sample_in_batch").to_sql(
                 "exp_icpms_sfc_batch", con=conn, if_exists="append"
             )
+            db.notify_written(
+                "exp_icpms_sfc_batch", exp_icpms.loc[:, ["id_exp_icpms"]], con=conn
+            )
             print("\x1b[32m", "Successfully inserted to exp_icpms_sfc_batch", "\x1b[0m")
 
         # data_icpms
         print(
             "Start inserting time-resolved data. This can take some time please wait."
         )
-        data_icpms.reset_index().join(
-            exp_icpms.loc[:, ["id_exp_icpms"]], on="id_sample_in_batch"
-        ).set_index(
-            ["id_exp_icpms", "name_isotope_analyte", "name_isotope_internalstandard"]
-        ).drop(
-            columns="id_sample_in_batch"
-        ).to_sql(
-            "data_icpms", con=conn, if_exists="append", chunksize=1000
+        db.bulk_append(
+            "data_icpms",
+            data_icpms.reset_index()
+            .join(exp_icpms.loc[:, ["id_exp_icpms"]], on="id_sample_in_batch")
+            .set_index(
+                [
+                    "id_exp_icpms",
+                    "name_isotope_analyte",
+                    "name_isotope_internalstandard",
+                ]
+            )
+            .drop(columns="id_sample_in_batch"),
+            conn,
         )
         print("\x1b[32m", "Successfully inserted to data_icpms", "\x1b[0m")
 
@@ -575,26 +592,22 @@ def read_AgilentBatch(path_to_files, exp_icpms_init=pd.DataFrame({}), conn=None)
     exp_icpms = exp_icpms.sort_values(by="t_start__timestamp_icpms_pc")
     # display(exp_icpms)
 
-    # Check and remove already inserted experiments
-    for index, row in exp_icpms.iterrows():
-        # print(row.name_setup_icpms, str(row.t_start__timestamp_icpms_pc))
-        if (
-            conn.execute(
-                """SELECT COUNT(*) FROM exp_icpms WHERE name_setup_icpms='"""
-                + row.name_setup_icpms
-                + """' AND t_start__timestamp_icpms_pc = '"""
-                + str(row.t_start__timestamp_icpms_pc)
-                + """';"""
-            ).first()[0]
-            == 1
-        ):
-            exp_icpms = exp_icpms.drop(labels=index, axis="index")
-            print(
-                "\x1b[33m",
-                row.name_sample,
-                " is already inserted into database and will be skipped. Overwriting is not possible."
-                "\x1b[0m",
-            )
+    # Check and remove already inserted experiments, single query for all samples
+    is_inserted = db.keys_exist(
+        "exp_icpms",
+        exp_icpms.loc[
+            :, ["name_setup_icpms", "t_start__timestamp_icpms_pc"]
+        ].astype({"t_start__timestamp_icpms_pc": str}),
+        con=conn,
+    )
+    for index, row in exp_icpms.loc[is_inserted, :].iterrows():
+        print(
+            "\x1b[33m",
+            row.name_sample,
+            " is already inserted into database and will be skipped. Overwriting is not possible."
+            "\x1b[0m",
+        )
+    exp_icpms = exp_icpms.loc[~is_inserted, :]
 
     # Check if csv exists and read in
     exp_icpms, data_icpms_all_csv = read_datacsv(path_to_files, exp_icpms)
@@ -1497,17 +1510,61 @@ def read_DAMethod(path_to_files):
     return df_calib_Level_conc, df_calib_icpms_elements
 
 
+def read_agilent_csv(file_path):
+    """
+    Read Agilent MassHunter data csv file in a single pass: the header lines are parsed for the acquisition
+    timestamp, the data is parsed by the C engine of pandas. Instead of skipping the last line (skipfooter, only
+    available in the slow python engine), trailing lines not starting with a number (footer) are detected and removed.
+    :param file_path: path of the csv file
+    :return: timestamp_csv, data_icpms_csv
+        timestamp_csv: str, start timestamp of acquisition as given in the file header
+        data_icpms_csv: pd.DataFrame, time-resolved counts of all measured isotopes, rows with missing values dropped
+    """
+    with open(file_path, "r") as f:
+        file_text = f.read()
+    # header: file path, unit, acquisition timestamp, column names
+    file_lines_header = file_text.split("\n", 3)
+    timestamp_csv = (
+        file_lines_header[2].replace("Acquired      : ", "").split("using")[0].strip()
+    )
+    idx_data_start = sum(len(line) + 1 for line in file_lines_header[:3])
+
+    # footer detection, data lines start with the time of the datapoint
+    idx_data_end = len(file_text.rstrip())
+    while idx_data_end > idx_data_start:
+        idx_line_start = file_text.rfind("\n", idx_data_start, idx_data_end) + 1
+        if _is_number(file_text[idx_line_start:idx_data_end].split(",")[0]):
+            break
+        idx_data_end = max(idx_line_start - 1, idx_data_start)
+
+    data_icpms_csv = pd.read_csv(
+        io.StringIO(file_text[idx_data_start:idx_data_end]), engine="c"
+    ).dropna()
+    return timestamp_csv, data_icpms_csv
+
+
+def _is_number(value):
+    """
+    Check whether a string can be converted to float
+    :param value: str
+    :return: bool
+    """
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
 def read_datacsv(path_to_files, exp_icpms):
-    data_icpms_all_csv = pd.DataFrame()
+    data_icpms_csv_list = []
     # print(exp_icpms)
     for index, row in exp_icpms.iterrows():
         file_path = Path(row.file_path_rawdata)
+        print("read ../" + str(file_path.parent.name) + "/" + str(file_path.name))
+        timestamp_csv, data_icpms_single_csv = read_agilent_csv(file_path)
+
         # Check timestamps
-        with open(file_path, "r") as f:
-            file_lines = f.readlines()
-            timestamp_csv = (
-                file_lines[2].replace("Acquired      : ", "").split("using")[0].strip()
-            )
         if row.t_start__timestamp_icpms_pc != timestamp_csv:
             exp_icpms.loc[index, "t_start__timestamp_icpms_pc"] = timestamp_csv
             display(exp_icpms)
@@ -1522,74 +1579,107 @@ def read_datacsv(path_to_files, exp_icpms):
                 "\x1b[0m",
             )
 
-        print("read ../" + str(file_path.parent.name) + "/" + str(file_path.name))
-        data_icpms_single_csv = (
-            pd.read_csv(file_path, skiprows=3, skipfooter=1, engine="python")
-            .dropna()
-            .reset_index()
-            .rename(columns={"index": "id_data_icpms", "Time [Sec]": "t__s"})
+        data_icpms_single_csv = data_icpms_single_csv.reset_index().rename(
+            columns={"index": "id_data_icpms", "Time [Sec]": "t__s"}
         )
-        # .rename(columns={'Time [Sec]': 't__s'})\
-        # .reset_index(names='id_data_icpms')
         data_icpms_single_csv.loc[:, "id_sample_in_batch"] = row.id_sample_in_batch
-        data_icpms_single_csv = data_icpms_single_csv.set_index("id_sample_in_batch")
-        data_icpms_all_csv = pd.concat([data_icpms_all_csv, data_icpms_single_csv])
-        # print(len(data_icpms_single_csv.index))
+        data_icpms_csv_list.append(
+            data_icpms_single_csv.set_index("id_sample_in_batch")
+        )
 
         exp_icpms.loc[index, "t_duration__s"] = data_icpms_single_csv.loc[
             :, "t__s"
         ].max()
-        # print(data_icpms_single_csv)
-    # print(exp_icpms)
+    # concat once for all samples of the batch
+    data_icpms_all_csv = (
+        pd.concat(data_icpms_csv_list)
+        if len(data_icpms_csv_list) > 0
+        else pd.DataFrame()
+    )
     return exp_icpms, data_icpms_all_csv
 
 
 def restructure_dataicpms(data_icpms_all_csv, exp_icpms_analyte_internalstandard):
-    # restructure to data_icpms with counts analyte and internalstandard sorted as in exp_icpms_analyte_internalstandard
-    data_icpms = pd.DataFrame()
-    for index, row in exp_icpms_analyte_internalstandard.iterrows():
-        # if pd.isna(row.name_isotope_analyte) or pd.isna(row.name_isotope_internalstandard):
-        #    print('Fail')
-        #    continue
-        # else:
-        #    print(row.id_sample_in_batch, row.name_isotope_analyte, row.name_isotope_internalstandard)
-        # if row.name_isotope_analyte
-        data_icpms_single = data_icpms_all_csv.loc[
-            row.id_sample_in_batch,
-            [
-                "id_data_icpms",
-                "t__s",
-                row["name_isotope_analyte"],
-                row["name_isotope_internalstandard"],
-            ],
-        ].copy()
-        # data_icpms_to_sql.loc[:, 'id_exp_icpms'] = id_exp_icpms
-        data_icpms_single.loc[:, "name_isotope_analyte"] = row["name_isotope_analyte"]
-        data_icpms_single.loc[:, "name_isotope_internalstandard"] = row[
-            "name_isotope_internalstandard"
-        ]
-        data_icpms_single = (
-            data_icpms_single.reset_index()
-            .rename(
-                columns={
-                    row["name_isotope_analyte"]: "counts_analyte",
-                    row["name_isotope_internalstandard"]: "counts_internalstandard",
-                }
-            )
-            .set_index(
-                [
-                    "id_sample_in_batch",
-                    "name_isotope_analyte",
-                    "name_isotope_internalstandard",
-                    "id_data_icpms",
-                ]
-            )
-            .loc[:, ["t__s", "counts_analyte", "counts_internalstandard"]]
+    """
+    Restructure the wide isotope matrix of all samples of a batch into the long data_icpms layout with counts of
+    analyte and internalstandard, sorted as in exp_icpms_analyte_internalstandard. All samples and isotope pairs are
+    restructured at once by indexing the isotope matrix with the row and column positions of each pair.
+    :param data_icpms_all_csv: pd.DataFrame
+        indexed by id_sample_in_batch with columns id_data_icpms, t__s and one column per isotope,
+        as returned by read_datacsv()
+    :param exp_icpms_analyte_internalstandard: pd.DataFrame
+        with columns id_sample_in_batch, name_isotope_analyte, name_isotope_internalstandard
+    :return: pd.DataFrame
+        indexed by id_sample_in_batch, name_isotope_analyte, name_isotope_internalstandard, id_data_icpms
+        with columns t__s, counts_analyte, counts_internalstandard
+    """
+    index_cols = [
+        "id_sample_in_batch",
+        "name_isotope_analyte",
+        "name_isotope_internalstandard",
+        "id_data_icpms",
+    ]
+    data_cols = ["t__s", "counts_analyte", "counts_internalstandard"]
+    isotope_pairs = exp_icpms_analyte_internalstandard.loc[:, index_cols[:3]]
+    if isotope_pairs.empty:
+        return pd.DataFrame(columns=index_cols + data_cols).set_index(index_cols)
+    name_isotopes = list(
+        pd.unique(isotope_pairs.loc[:, index_cols[1:3]].to_numpy().ravel())
+    )
+    name_isotopes_missing = [
+        name_isotope
+        for name_isotope in name_isotopes
+        if name_isotope not in data_icpms_all_csv.columns
+    ]
+    if len(name_isotopes_missing) > 0:
+        raise KeyError(
+            "Isotopes not found in data csv files: "
+            + ", ".join(map(str, name_isotopes_missing))
         )
-        # display(data_icpms_single)
-        data_icpms = pd.concat([data_icpms, data_icpms_single])
 
-    return data_icpms
+    # row positions of each sample in the isotope matrix, repeated for each isotope pair of the sample
+    data_icpms_all_csv = data_icpms_all_csv.reset_index()
+    idx_rows_sample = data_icpms_all_csv.groupby(
+        "id_sample_in_batch", sort=False
+    ).indices
+    idx_rows_pair = [
+        idx_rows_sample.get(id_sample_in_batch, np.array([], dtype=int))
+        for id_sample_in_batch in isotope_pairs.id_sample_in_batch
+    ]
+    idx_pair = np.repeat(
+        np.arange(len(isotope_pairs.index)), [len(idx) for idx in idx_rows_pair]
+    )
+    idx_rows = np.concatenate(idx_rows_pair)
+
+    # column positions of analyte and internalstandard in the isotope matrix
+    isotope_matrix = data_icpms_all_csv.loc[:, name_isotopes].to_numpy()
+    idx_col_analyte = pd.Index(name_isotopes).get_indexer(
+        isotope_pairs.name_isotope_analyte
+    )
+    idx_col_internalstandard = pd.Index(name_isotopes).get_indexer(
+        isotope_pairs.name_isotope_internalstandard
+    )
+
+    data_icpms = pd.DataFrame(
+        {
+            "id_sample_in_batch": isotope_pairs.id_sample_in_batch.to_numpy()[
+                idx_pair
+            ],
+            "name_isotope_analyte": isotope_pairs.name_isotope_analyte.to_numpy()[
+                idx_pair
+            ],
+            "name_isotope_internalstandard": isotope_pairs.name_isotope_internalstandard.to_numpy()[
+                idx_pair
+            ],
+            "id_data_icpms": data_icpms_all_csv.id_data_icpms.to_numpy()[idx_rows],
+            "t__s": data_icpms_all_csv.t__s.to_numpy()[idx_rows],
+            "counts_analyte": isotope_matrix[idx_rows, idx_col_analyte[idx_pair]],
+            "counts_internalstandard": isotope_matrix[
+                idx_rows, idx_col_internalstandard[idx_pair]
+            ],
+        }
+    )
+    return data_icpms.set_index(index_cols)
 
 
 def check_Agilent_data_csv(file_path):
@@ -1688,9 +1778,9 @@ def insert_icpms(
             manual_info, id_exp_icpms_calibration_sets = _insert_single_datafile(
                 file_path,
                 manual_info,
-                data_icpms=pd.read_csv(file_path, skiprows=3, skipfooter=1)
-                .dropna()
-                .rename(columns={"Time [Sec]": "t__s"}),
+                data_icpms=read_agilent_csv(file_path)[1].rename(
+                    columns={"Time [Sec]": "t__s"}
+                ),
                 counts_analyte_as_ratio=False,
                 id_exp_icpms_calibration_sets=id_exp_icpms_calibration_sets,
             )
@@ -2055,6 +2145,11 @@ def _insert_single_datafile(
         exp_icpms_analyte_internalstandard.set_index(
             ["id_exp_icpms", "name_isotope_analyte", "name_isotope_internalstandard"]
         ).to_sql("exp_icpms_analyte_internalstandard", con=conn, if_exists="append")
+        db.notify_written(
+            "exp_icpms_analyte_internalstandard",
+            exp_icpms_analyte_internalstandard,
+            con=conn,
+        )
 
         # exp_icpms_sfc
         if exp_icpms.loc[0, "type_experiment"] == "sfc-icpms":
@@ -2062,6 +2157,7 @@ def _insert_single_datafile(
             exp_icpms_sfc.set_index(["id_exp_icpms"]).to_sql(
                 "exp_icpms_sfc", con=conn, if_exists="append"
             )
+            db.notify_written("exp_icpms_sfc", exp_icpms_sfc, con=conn)
 
         # data_icpms
         for index, row in exp_icpms_analyte_internalstandard.iterrows():
@@ -2085,20 +2181,24 @@ def _insert_single_datafile(
                     data_icpms_to_sql.loc[:, row["name_isotope_analyte"]]
                     * data_icpms_to_sql.loc[:, row["name_isotope_internalstandard"]]
                 )  # recalculate actual counts of analyte rather than ratio
-            data_icpms_to_sql.reset_index().rename(
-                columns={
-                    "index": "id_data_icpms",
-                    row["name_isotope_analyte"]: "counts_analyte",
-                    row["name_isotope_internalstandard"]: "counts_internalstandard",
-                }
-            ).set_index(
-                [
-                    "id_exp_icpms",
-                    "name_isotope_analyte",
-                    "name_isotope_internalstandard",
-                ]
-            ).to_sql(
-                "data_icpms", con=conn, if_exists="append", chunksize=1000
+            db.bulk_append(
+                "data_icpms",
+                data_icpms_to_sql.reset_index()
+                .rename(
+                    columns={
+                        "index": "id_data_icpms",
+                        row["name_isotope_analyte"]: "counts_analyte",
+                        row["name_isotope_internalstandard"]: "counts_internalstandard",
+                    }
+                )
+                .set_index(
+                    [
+                        "id_exp_icpms",
+                        "name_isotope_analyte",
+                        "name_isotope_internalstandard",
+                    ]
+                ),
+                conn,
             )
         print(
             "\x1b[32m",
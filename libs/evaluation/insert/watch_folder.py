@@ -0,0 +1,463 @@
+"""
+Scripts for the incremental insertion of raw data files from instrument export folders (watch-folder ingestion)
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import copy
+import datetime
+import hashlib
+import os
+import time
+import traceback
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sql
+
+from evaluation.insert import ec_tdms, icpms
+from evaluation.utils import db
+
+# name of the manifest database, created in the watched folder by default
+MANIFEST_FILE_NAME = ".insertmanifest.db"
+# batches containing this file are not inserted (same as in evaluation.insert.icpms.auto_insert_AgilentBatch)
+IGNORE_FILE_NAME = ".insertignore"
+
+# status of files in the manifest
+STATUS_PENDING = "pending"  # waiting for insertion
+STATUS_INSERTED = "inserted"  # inserted by the watch folder
+STATUS_IN_DATABASE = "in_database"  # already in database before it was found by the watch folder
+STATUS_IGNORED = "ignored"  # not a data file or in ignored batch
+STATUS_FAILED = "failed"  # insertion failed, retried if file changes
+
+# per kind of raw data: pattern of data files, database table and column to identify already inserted files
+WATCH_FOLDER_KINDS = {
+    "icpms": {
+        "pattern": "*.csv",
+        "name_table": "exp_icpms",
+        "name_column": "file_path_rawdata",
+    },
+    "ec": {
+        "pattern": "*.tdms",
+        "name_table": "exp_sfc",
+        "name_column": "rawdata_path",
+    },
+}
+
+
+class WatchFolder:
+    """
+    Class to watch an instrument export folder by polling and insert new or changed raw data into the database.
+    Processed files are recorded in a persistent manifest (SQLite database) with path, size, modification time and
+    content hash, so that after a restart only new or changed files are inserted. Files are grouped into units which
+    are inserted at once: the batch folder for ICP-MS (see evaluation.insert.icpms.insert_AgilentBatch()) or the tdms
+    file for EC (see evaluation.insert.ec_tdms.insert_ec_tdms()).
+
+    Insertion runs unattended only if all information usually asked from the user is given in kwargs_ingest,
+    for EC a complete manual_info including use_for_whole_dataset=True.
+    """
+
+    def __init__(
+        self,
+        path_to_data,
+        kind="icpms",
+        path_manifest=None,
+        ingest=None,
+        poll_interval__s=60,
+        t_settle__s=60,
+        con=None,
+        **kwargs_ingest,
+    ):
+        """
+        Initialize watch folder and manifest
+        :param path_to_data: str or Path
+            folder to be watched, including subdirectories
+        :param kind: one of ['icpms', 'ec']
+            kind of raw data, see WATCH_FOLDER_KINDS
+        :param path_manifest: str or Path or None, optional, Default None
+            path of the manifest database, if None MANIFEST_FILE_NAME in path_to_data
+        :param ingest: callable or None, optional, Default None
+            function inserting a unit (Path of batch folder or tdms file), called with the unit and kwargs_ingest.
+            If None, evaluation.insert.icpms.insert_AgilentBatch or evaluation.insert.ec_tdms.insert_ec_tdms
+        :param poll_interval__s: float, optional, Default 60
+            time between two scans of the folder in s
+        :param t_settle__s: float, optional, Default 60
+            files modified within the last t_settle__s are assumed to be still written by the instrument
+            and are considered in a later scan
+        :param con: sqlalchemy.engine or sqlalchemy.connection or None, optional, Default None
+            connection to the database used to check for already inserted files, if None a new will be initialized
+        :param kwargs_ingest:
+            keyword arguments of ingest
+        """
+        if kind not in WATCH_FOLDER_KINDS.keys():
+            raise ValueError(
+                "kind must be one of " + ", ".join(WATCH_FOLDER_KINDS.keys())
+            )
+        self.path_to_data = Path(path_to_data)
+        self.kind = kind
+        self.path_manifest = (
+            self.path_to_data / MANIFEST_FILE_NAME
+            if path_manifest is None
+            else Path(path_manifest)
+        )
+        self.ingest = ingest if ingest is not None else self._ingest_default
+        self.poll_interval__s = poll_interval__s
+        self.t_settle__s = t_settle__s
+        self.con = con
+        self.kwargs_ingest = kwargs_ingest
+
+        self.engine_manifest = sql.create_engine(
+            "sqlite+pysqlite:///" + str(self.path_manifest)
+        )
+        with self.engine_manifest.begin() as conn:
+            conn.execute(
+                sql.text(
+                    """CREATE TABLE IF NOT EXISTS manifest_files (
+                            path TEXT PRIMARY KEY,
+                            kind TEXT,
+                            unit TEXT,
+                            size INTEGER,
+                            mtime DOUBLE,
+                            hash TEXT,
+                            status TEXT,
+                            t_first_seen DOUBLE,
+                            t_processed DOUBLE,
+                            error TEXT
+                       );"""
+                )
+            )
+        self.processed = []
+
+    def manifest(self):
+        """
+        Get the manifest of all files of the watched kind
+        :return: pd.DataFrame indexed by path
+        """
+        with self.engine_manifest.begin() as conn:
+            return pd.read_sql(
+                sql.text("SELECT * FROM manifest_files WHERE kind = :kind;"),
+                con=conn,
+                params={"kind": self.kind},
+                index_col="path",
+            )
+
+    def scan(self):
+        """
+        Scan the watched folder for new or changed files, identify files already inserted into the database by a
+        single set-based query and add all others as pending to the manifest.
+        :return: pd.DataFrame of new or changed files indexed by path with the columns unit, size, mtime, hash, status
+        """
+        files = self._list_files()
+        manifest = self.manifest()
+        t_now = time.time()
+
+        # new or changed in size or modification time
+        files = files.join(
+            manifest.loc[:, ["size", "mtime", "hash"]].add_suffix("_manifest")
+        )
+        files = files.loc[
+            (files.mtime < t_now - self.t_settle__s)
+            & (
+                (files["size"] != files.size_manifest)
+                | (files.mtime != files.mtime_manifest)
+            ),
+            :,
+        ].copy()
+        files.loc[:, "hash"] = [file_hash(path) for path in files.index]
+        # only touched but content unchanged, update modification time only
+        touched = files.hash == files.hash_manifest
+        self._update_manifest(files.loc[touched, ["size", "mtime"]])
+        files = files.loc[~touched, ["unit", "size", "mtime", "hash"]]
+        if files.empty:
+            return files.assign(status=pd.Series(dtype=str))
+
+        files.loc[:, "status"] = STATUS_PENDING
+        files.loc[~self._is_data_file(files), "status"] = STATUS_IGNORED
+        files.loc[
+            (files.status == STATUS_PENDING) & self._in_database(files), "status"
+        ] = STATUS_IN_DATABASE
+        files.loc[:, "t_first_seen"] = t_now
+        files.loc[:, "t_processed"] = np.where(
+            files.status == STATUS_PENDING, np.nan, t_now
+        )
+        files.loc[:, "error"] = None
+        self._update_manifest(files)
+        return files.loc[:, ["unit", "size", "mtime", "hash", "status"]]
+
+    def queue(self):
+        """
+        Get units waiting for insertion, in order of detection
+        :return: pd.DataFrame indexed by unit with the number of pending files and the time of first detection
+        """
+        manifest = self.manifest()
+        return (
+            manifest.loc[manifest.status == STATUS_PENDING, :]
+            .groupby("unit")
+            .agg(n_files=("size", "count"), t_first_seen=("t_first_seen", "min"))
+            .sort_values("t_first_seen")
+        )
+
+    def run_once(self):
+        """
+        Scan the watched folder once and insert all pending units
+        :return: pd.DataFrame of processed units with status, latency and runtime of insertion
+        """
+        self.scan()
+        processed = []
+        for unit, row in self.queue().iterrows():
+            t_start = time.time()
+            try:
+                self.ingest(Path(unit), **copy.deepcopy(self.kwargs_ingest))
+                status, error = STATUS_INSERTED, None
+            except (Exception, SystemExit) as err:
+                # inserters call sys.exit on invalid files, should not stop the watch folder
+                status, error = STATUS_FAILED, "".join(
+                    traceback.format_exception_only(type(err), err)
+                ).strip()
+                warnings.warn("Insertion of " + str(unit) + " failed: " + error)
+            t_end = time.time()
+            with self.engine_manifest.begin() as conn:
+                conn.execute(
+                    sql.text(
+                        """UPDATE manifest_files
+                           SET status = :status, t_processed = :t_processed, error = :error
+                           WHERE kind = :kind AND unit = :unit AND status = :status_pending;"""
+                    ),
+                    {
+                        "status": status,
+                        "t_processed": t_end,
+                        "error": error,
+                        "kind": self.kind,
+                        "unit": unit,
+                        "status_pending": STATUS_PENDING,
+                    },
+                )
+            processed.append(
+                {
+                    "unit": unit,
+                    "status": status,
+                    "n_files": int(row.n_files),
+                    "latency__s": t_end - row.t_first_seen,
+                    "runtime__s": t_end - t_start,
+                    "t_processed": datetime.datetime.fromtimestamp(t_end),
+                }
+            )
+            print(processed[-1])
+        self.processed += processed
+        return pd.DataFrame(
+            processed,
+            columns=[
+                "unit",
+                "status",
+                "n_files",
+                "latency__s",
+                "runtime__s",
+                "t_processed",
+            ],
+        )
+
+    def run(self, n_scans=None):
+        """
+        Watch the folder: scan and insert every poll_interval__s until interrupted (KeyboardInterrupt)
+        :param n_scans: int or None, optional, Default None
+            number of scans, if None run until interrupted
+        :return: None
+        """
+        i_scan = 0
+        try:
+            while n_scans is None or i_scan < n_scans:
+                t_start = time.time()
+                self.run_once()
+                i_scan += 1
+                if n_scans is None or i_scan < n_scans:
+                    time.sleep(
+                        max(0, self.poll_interval__s - (time.time() - t_start))
+                    )
+        except KeyboardInterrupt:
+            print("Watch folder stopped.")
+
+    def metrics(self):
+        """
+        Metrics of the watch folder to monitor the ingestion
+        :return: dict
+            queue_depth: number of units waiting for insertion
+            n_inserted, n_failed: number of units inserted or failed since start of the watch folder
+            latency_last__s, latency_mean__s, latency_max__s: time between detection and insertion of a unit
+        """
+        processed = pd.DataFrame(
+            self.processed, columns=["unit", "status", "latency__s"]
+        )
+        latency = processed.loc[processed.status == STATUS_INSERTED, "latency__s"]
+        return {
+            "queue_depth": len(self.queue().index),
+            "n_inserted": int((processed.status == STATUS_INSERTED).sum()),
+            "n_failed": int((processed.status == STATUS_FAILED).sum()),
+            "latency_last__s": latency.iloc[-1] if len(latency) > 0 else np.nan,
+            "latency_mean__s": latency.mean(),
+            "latency_max__s": latency.max(),
+        }
+
+    def _list_files(self):
+        """
+        List all data files of the watched kind with size and modification time
+        :return: pd.DataFrame indexed by path with columns unit, size, mtime
+        """
+        files = []
+        for path, subdirs, file_names in os.walk(self.path_to_data):
+            for file_path in Path(path).glob(
+                WATCH_FOLDER_KINDS[self.kind]["pattern"]
+            ):
+                stat = file_path.stat()
+                files.append(
+                    {
+                        "path": str(file_path),
+                        "unit": str(self._unit(file_path)),
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                    }
+                )
+        return pd.DataFrame(
+            files, columns=["path", "unit", "size", "mtime"]
+        ).set_index("path")
+
+    def _unit(self, file_path):
+        """
+        Get the unit which is inserted at once for a file
+        :param file_path: Path
+        :return: Path
+            icpms: batch folder, data is stored as batchname/dataname/data.csv
+            ec: tdms file
+        """
+        if self.kind == "icpms":
+            return file_path.parent.parent
+        return file_path
+
+    def _is_data_file(self, files):
+        """
+        Check which files are data files to be inserted
+        :param files: pd.DataFrame indexed by path
+        :return: pd.Series of bool
+        """
+        if self.kind == "icpms":
+
+            def is_data_file(path):
+                # Data is stored at least two subdirs below path: path_username/../batchname/dataname/data.csv
+                if len(Path(path).relative_to(self.path_to_data).parts) <= 2:
+                    return False
+                if (Path(path).parent.parent / IGNORE_FILE_NAME).is_file():
+                    return False
+                try:
+                    return icpms.check_Agilent_data_csv(path)
+                except (Exception, SystemExit):
+                    return False
+
+        else:
+
+            def is_data_file(path):
+                return (
+                    Path(path).parent / ("Info_" + Path(path).with_suffix(".txt").name)
+                ).is_file()
+
+        return pd.Series(
+            [is_data_file(path) for path in files.index],
+            index=files.index,
+            dtype=bool,
+        )
+
+    def _in_database(self, files):
+        """
+        Check which files are already inserted into the database with a single set-based query
+        :param files: pd.DataFrame indexed by path
+        :return: pd.Series of bool
+        """
+        key_values = pd.DataFrame(
+            {
+                WATCH_FOLDER_KINDS[self.kind]["name_column"]: [
+                    self._key_value(path) for path in files.index
+                ]
+            },
+            index=files.index,
+        )
+        is_in_database = pd.Series(False, index=files.index)
+        key_values = key_values.dropna()
+        if not key_values.empty:
+            is_in_database.loc[key_values.index] = db.keys_exist(
+                WATCH_FOLDER_KINDS[self.kind]["name_table"], key_values, con=self.con
+            )
+        return is_in_database
+
+    def _key_value(self, path):
+        """
+        Get the value identifying the file in the database
+        :param path: str
+        :return: str or None
+            icpms: path of the csv file as stored in exp_icpms.file_path_rawdata
+            ec: path of the tdms file as given in the info file and stored in exp_sfc.rawdata_path
+        """
+        if self.kind == "icpms":
+            return str(path)
+        info_file = Path(path).parent / ("Info_" + Path(path).with_suffix(".txt").name)
+        try:
+            rawdata_path = ec_tdms.read_infotxt(info_file).loc[:, "rawdata_path"]
+        except (Exception, SystemExit):
+            return None
+        return rawdata_path.iloc[0] if len(rawdata_path.index) > 0 else None
+
+    def _update_manifest(self, files):
+        """
+        Insert or update files in the manifest
+        :param files: pd.DataFrame indexed by path with columns of manifest_files
+        :return: None
+        """
+        if files.empty:
+            return
+        files = files.assign(kind=self.kind).reset_index()
+        columns = list(files.columns)
+        with self.engine_manifest.begin() as conn:
+            conn.execute(
+                sql.text(
+                    "INSERT INTO manifest_files ("
+                    + ", ".join(columns)
+                    + ") VALUES ("
+                    + ", ".join([":" + col for col in columns])
+                    + ") ON CONFLICT(path) DO UPDATE SET "
+                    + ", ".join(
+                        [col + " = excluded." + col for col in columns if col != "path"]
+                    )
+                    + ";"
+                ),
+                files.astype(object).where(files.notna(), None).to_dict("records"),
+            )
+
+    def _ingest_default(self, unit, **kwargs_ingest):
+        """
+        Insert a unit with the inserter of the watched kind
+        :param unit: Path
+            batch folder (icpms) or tdms file (ec)
+        :param kwargs_ingest:
+            keyword arguments of the inserter
+        :return: None
+        """
+        if self.kind == "icpms":
+            icpms.insert_AgilentBatch(path_to_files=unit, **kwargs_ingest)
+        else:
+            ec_tdms.insert_ec_tdms(unit, **kwargs_ingest)
+
+
+def file_hash(file_path, chunk_size=2**20):
+    """
+    Calculate the content hash of a file, read chunk-wise
+    :param file_path: str or Path
+        path of the file
+    :param chunk_size: int, optional, Default 1 MiB
+        number of bytes read at once
+    :return: str
+        sha256 hex digest
+    """
+    file_hash_sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash_sha256.update(chunk)
+    return file_hash_sha256.hexdigest()
@@ -9,6 +9,9 @@ Created on Wed Jul  5 09:23:21 2023
 This script is based on https://github.com/BirkFritsch/SFC-ICPMS-Fitting
 """
 
+import concurrent.futures
+import datetime
+import importlib.util
 import os
 import re
 import numpy as np
@@ -20,6 +23,42 @@ from scipy.ndimage import gaussian_filter1d
 from scipy.interpolate import interp1d
 from itertools import zip_longest
 
+# maximum number of function evaluations of the fit of the sum of lognormal functions
+MAXFEV_MULTI_LOGNORMAL = int(1e4)
+# relative spread of the random perturbations of the initial guesses for multi-start fitting (area, ln_std, xc)
+MULTISTART_SPREAD = (0.5, 0.3, 0.01)
+# numba is optional, if installed a compiled kernel of multi_lognormal_fit is available
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+# evaluate multi_lognormal_fit by the compiled kernel, opt-in as the broadcasted numpy evaluation was as fast in
+# evaluation.benchmarks.lognormal_fitting.benchmark_multi_lognormal_evaluation()
+USE_NUMBA = False
+
+
+class FitTimeoutError(RuntimeError):
+    """
+    Raised if a fit exceeds its wall-clock budget
+    """
+
+
+if NUMBA_AVAILABLE:
+    import numba
+
+    @numba.njit(cache=True, error_model="numpy")
+    def _multi_lognormal_kernel(xdat, log_xdat, area, ln_std, xc):
+        """
+        Compiled loop of 'multi_lognormal_fit' without temporary arrays.
+        """
+        amplitude = area / (np.sqrt(2 * np.pi) * ln_std)
+        log_xc = np.log(xc)
+        factor = -1 / (2 * ln_std**2)
+        y = np.empty(xdat.shape[0])
+        for i in range(xdat.shape[0]):
+            y_i = 0.0
+            for k in range(area.shape[0]):
+                y_i += amplitude[k] * np.exp(factor[k] * (log_xdat[i] - log_xc[k]) ** 2)
+            y[i] = y_i / xdat[i]
+        return y
+
 
 # read data
 def read_data(pattern, path="."):
@@ -160,9 +199,33 @@ def grouper(iterable, n, fillvalue=None):
     return zip_longest(*args, fillvalue=fillvalue)
 
 
-def multi_lognormal_fit(xdat, *params):
+def _split_params(params):
     """
-    Computes overlapping lognormal peaks using 'lognormal'.
+    Split parameters of 'multi_lognormal_fit' into arrays of area, ln_std and xc of each lognormal function.
+    As by 'grouper', params are appended by zeros to a multiple of three.
+
+    Parameters
+    ----------
+    params : list
+        [area, ln_std, xc, area, ...]
+
+    Returns
+    -------
+    area, ln_std, xc : np.array
+        Each of length len(params) / 3, rounded up.
+
+    """
+    params = np.asarray(params, dtype=float).ravel()
+    params = np.concatenate((params, np.zeros(-len(params) % 3)))
+
+    return params.reshape(-1, 3).T
+
+
+def multi_lognormal_fit(xdat, *params, log_xdat=None):
+    """
+    Computes overlapping lognormal peaks as given by 'lognormal'. All peaks are evaluated
+    in one broadcasted operation of shape (n_peaks, n_points), or by a compiled kernel if
+    USE_NUMBA and numba is installed.
 
     Parameters
     ----------
@@ -176,6 +239,8 @@ def multi_lognormal_fit(xdat, *params):
         full pair of three is reached.
         Thus, the len(params) / 3 determines the amount of lognormal functions to
         be computed.
+    log_xdat : np.array, optional
+        Precomputed np.log(xdat), see 'multi_lognormal_model'. The default is None.
 
     Returns
     -------
@@ -184,12 +249,242 @@ def multi_lognormal_fit(xdat, *params):
         Its shape matches xdat.
 
     """
-    y = np.zeros(xdat.shape)
+    xdat = np.asarray(xdat, dtype=float)
+    log_xdat = np.log(xdat) if log_xdat is None else np.asarray(log_xdat)
+    area, ln_std, xc = _split_params(params)
+
+    if USE_NUMBA and NUMBA_AVAILABLE:
+        y = _multi_lognormal_kernel(xdat.ravel(), log_xdat.ravel(), area, ln_std, xc)
+    else:
+        log_ratio = log_xdat.ravel() - np.log(xc)[:, np.newaxis]
+        amplitude = area / (np.sqrt(2 * np.pi) * ln_std)
+        y = amplitude @ np.exp(-(log_ratio**2) / (2 * ln_std[:, np.newaxis] ** 2))
+        y /= xdat.ravel()
+
+    return y.reshape(xdat.shape)
+
+
+def lognormal_jacobian(xdat, area, ln_std, xc):
+    """
+    Analytic Jacobian of 'lognormal' with respect to its parameters. Passed to curve_fit as jac
+    instead of approximating the derivatives by finite differences.
+
+    Parameters
+    ----------
+    xdat : np.array
+        x axis data.
+    area : float
+        Integrated area under curve.
+    ln_std : float
+        natural logarithm of the population standard deviation.
+    xc : float
+        Center (median) of the curve.
+
+    Returns
+    -------
+    np.array
+        Partial derivatives with respect to area, ln_std and xc. Its shape is (len(xdat), 3).
+
+    """
+    return multi_lognormal_jacobian(xdat, area, ln_std, xc)
+
+
+def multi_lognormal_jacobian(xdat, *params, log_xdat=None):
+    """
+    Analytic Jacobian of 'multi_lognormal_fit' with respect to its parameters.
+
+    Parameters
+    ----------
+    xdat : np.array or similar
+        Data of the independent variable.
+    *params : list
+        Parameters as given to 'multi_lognormal_fit'.
+    log_xdat : np.array, optional
+        Precomputed np.log(xdat), see 'multi_lognormal_model'. The default is None.
+
+    Returns
+    -------
+    np.array
+        Partial derivatives with respect to params. Its shape is (len(xdat), len(params)).
+
+    """
+    xdat = np.asarray(xdat, dtype=float).ravel()
+    log_xdat = np.log(xdat) if log_xdat is None else np.asarray(log_xdat).ravel()
+    area, ln_std, xc = (arr[:, np.newaxis] for arr in _split_params(params))
+
+    # derivatives of all lognormal functions, shape (n_peaks, n_points)
+    log_ratio = log_xdat - np.log(xc)
+    d_area = np.exp(-(log_ratio**2) / (2 * ln_std**2)) / (
+        np.sqrt(2 * np.pi) * ln_std * xdat
+    )
+    y = area * d_area
+    d_ln_std = y * (log_ratio**2 / ln_std**3 - 1 / ln_std)
+    d_xc = y * log_ratio / (ln_std**2 * xc)
+    jacobian = np.stack((d_area, d_ln_std, d_xc), axis=1).reshape(-1, len(xdat)).T
+
+    return jacobian[:, : len(params)]
+
+
+def multi_lognormal_model(xdat):
+    """
+    Fit function and Jacobian of 'multi_lognormal_fit' with np.log(xdat) computed once. curve_fit evaluates
+    both many times on the same xdat, pass the returned xdat as xdata to make use of the precomputed logarithm.
+
+    Parameters
+    ----------
+    xdat : np.array or similar
+        Data of the independent variable.
+
+    Returns
+    -------
+    xdat : np.array
+        xdat as float array.
+    fit_function : callable
+        Drop-in replacement of 'multi_lognormal_fit'.
+    jacobian : callable
+        Drop-in replacement of 'multi_lognormal_jacobian'.
+
+    """
+    xdat = np.asarray(xdat, dtype=float)
+    log_xdat = np.log(xdat)
+
+    def fit_function(xdat_eval, *params):
+        return multi_lognormal_fit(
+            xdat_eval, *params, log_xdat=log_xdat if xdat_eval is xdat else None
+        )
+
+    def jacobian(xdat_eval, *params):
+        return multi_lognormal_jacobian(
+            xdat_eval, *params, log_xdat=log_xdat if xdat_eval is xdat else None
+        )
+
+    return xdat, fit_function, jacobian
+
+
+def _with_deadline(func, deadline):
+    """
+    Wrap a fit function or its Jacobian to raise FitTimeoutError once the deadline is exceeded,
+    which aborts the running curve_fit.
+
+    Parameters
+    ----------
+    func : callable
+        Function with signature func(xdat, *params).
+    deadline : datetime.datetime or None
+        Wall-clock time after which the fit is aborted. If None, func is returned unchanged.
+
+    Returns
+    -------
+    callable
+
+    """
+    if deadline is None:
+        return func
+
+    def func_with_deadline(xdat, *params):
+        if datetime.datetime.now() > deadline:
+            raise FitTimeoutError("Wall-clock budget of the fit exceeded.")
+        return func(xdat, *params)
+
+    return func_with_deadline
+
+
+def multistart_initial_guesses(p0, n_starts=1, seed=0):
+    """
+    Derive initial guesses for multi-start fitting of 'multi_lognormal_fit'. The first guess is p0,
+    further guesses randomly perturb area, ln_std and xc of each lognormal function in p0 by
+    MULTISTART_SPREAD.
+
+    Parameters
+    ----------
+    p0 : list
+        Initial guess ordered as [area, ln_std, xc, area, ...].
+    n_starts : int, optional
+        Number of initial guesses. The default is 1.
+    seed : int, optional
+        Seed of the random number generator. The default is 0.
+
+    Returns
+    -------
+    list of np.array
+        n_starts initial guesses.
+
+    """
+    p0 = np.asarray(p0, dtype=float)
+    rng = np.random.default_rng(seed)
+    spread_area, spread_ln_std, spread_xc = MULTISTART_SPREAD
+    initial_guesses = [p0]
+    for n in range(1, n_starts):
+        area, ln_std, xc = np.reshape(p0, (-1, 3)).T
+        initial_guesses.append(
+            np.column_stack(
+                (
+                    area * rng.uniform(1 - spread_area, 1 + spread_area, len(area)),
+                    ln_std * np.exp(rng.normal(0, spread_ln_std, len(ln_std))),
+                    xc * (1 + rng.normal(0, spread_xc, len(xc))).clip(min=0),
+                )
+            ).flatten()
+        )
+
+    return initial_guesses
+
+
+def fit_multi_lognormal_start(
+    time, icpms_data, p0, analytic_jacobian=False, deadline=None
+):
+    """
+    Fits the sum of lognormal functions ('multi_lognormal_fit') starting from a single initial guess.
+    The fit is performed twice: Once with p0, once with the determined optimal parameters as start.
+
+    Parameters
+    ----------
+    time : pd.Series or np.array
+        Temporal information.
+    icpms_data : pd.Series or np.array
+        Measurement signal.
+    p0 : list
+        Initial guess, see 'multi_lognormal_fit'.
+    analytic_jacobian : bool, optional
+        If truthy, derivatives are given by 'multi_lognormal_jacobian', otherwise approximated by
+        finite differences. The default is False.
+    deadline : datetime.datetime or None, optional
+        Wall-clock time after which the fit is aborted by FitTimeoutError. If the second fit
+        is aborted, the result of the first one is kept. The default is None.
+
+    Returns
+    -------
+    list of tuple
+        (popt, pcov, yfit, errors, r2adj) of each performed fit.
 
-    for area, ln_std, xc in grouper(params, 3, 0):
-        y += lognormal(xdat, area, ln_std, xc)
+    """
+    # numpy arrays avoid the overhead of pandas arithmetics in each function evaluation
+    time, model_function, model_jacobian = multi_lognormal_model(time)
+    icpms_data = np.asarray(icpms_data, dtype=float)
+    fit_function = _with_deadline(model_function, deadline)
+    jac = _with_deadline(model_jacobian, deadline) if analytic_jacobian else None
+    results = []
+    for i in range(2):
+        try:
+            popt, pcov = curve_fit(
+                fit_function,
+                time,
+                icpms_data,
+                p0=p0,
+                bounds=(0, np.inf),
+                jac=jac,
+                maxfev=MAXFEV_MULTI_LOGNORMAL,
+            )
+        except FitTimeoutError:
+            if len(results) > 0:
+                break
+            raise
+        yfit = model_function(time, *popt)
+        errors, r2adj = get_errors(popt, pcov, time, icpms_data, yfit)
+        results.append((popt, pcov, yfit, errors, r2adj))
+        # overwrite p0 for next run
+        p0 = popt
 
-    return y
+    return results
 
 
 def get_errors(p_opt, p_cov, x_dat, y_dat, y_fit):
@@ -254,6 +549,8 @@ def peak_detection_routine(
     title="test",
     maximum_peak_number=np.inf,
     manual_peak_detect=False,
+    display_plot=True,
+    analytic_jacobian=False,
 ):
     """
     Detects peaks in 'icpms_data' as a function of 'time'
@@ -285,6 +582,12 @@ def peak_detection_routine(
         If truthy, additional peak positions can be provided on the fly.
         If falsy, the algorithm will automatically try to detect peaks.
         The default is True.
+    display_plot : bool, optional
+        If falsy and external_ax is None, no figure is created, for example when fitting
+        in a separate process. The default is True.
+    analytic_jacobian : bool, optional
+        If truthy, derivatives are given by 'multi_lognormal_jacobian', otherwise approximated by
+        finite differences. The default is False.
 
     Returns
     -------
@@ -389,7 +692,7 @@ def peak_detection_routine(
             except ValueError:
                 print("I did not understand {}. Please try again.".format(question))
 
-    if external_ax is None:
+    if external_ax is None and display_plot:
         f, ax = plt.subplots(
             layout="constrained",
             dpi=300,
@@ -419,16 +722,17 @@ def peak_detection_routine(
     if len(peak_idx) > maximum_peak_number:
         peak_idx = peak_idx[:maximum_peak_number]
 
-    ax.plot(time, icpms_filtered, "-.", label="SavGol filtered", color="silver")
+    if ax is not None:
+        ax.plot(time, icpms_filtered, "-.", label="SavGol filtered", color="silver")
 
-    ax.plot(
-        np.array(time)[peak_idx],
-        np.array(icpms_filtered)[peak_idx],
-        "x",
-        markersize=8,
-        label=f"{len(peak_idx)} Peaks found",
-        zorder=3,
-    )
+        ax.plot(
+            np.array(time)[peak_idx],
+            np.array(icpms_filtered)[peak_idx],
+            "x",
+            markersize=8,
+            label=f"{len(peak_idx)} Peaks found",
+            zorder=3,
+        )
 
     # create output containers
     initially_fitted_params = []
@@ -488,25 +792,27 @@ def peak_detection_routine(
         upper_bounds = [area_max, np.inf, 1.1 * time_fit.max()]
         bounds = (lower_bounds, upper_bounds)
 
+        time_fit, model_function, model_jacobian = multi_lognormal_model(time_fit)
         try:
             popt, pcov = curve_fit(
-                lognormal,
+                model_function,
                 time_fit,
                 icpms_filtered_fit,
                 p0=p0,
                 bounds=bounds,
+                jac=model_jacobian if analytic_jacobian else None,
                 maxfev=int(1e4),
             )
         except Exception as e:
             print(e)
             continue
 
-        yfit = lognormal(time_fit, *popt)
+        yfit = model_function(time_fit, *popt)
         yfit_full = lognormal(time, *popt)
         # errors:
         errors, r2adj = get_errors(popt, pcov, time_fit, icpms_filtered_fit, yfit)
 
-        if external_ax is None:
+        if external_ax is None and display_plot:
             ax.plot(
                 time_fit,
                 icpms_filtered_fit,
@@ -529,7 +835,7 @@ def peak_detection_routine(
         initially_fitted_params_errors.extend(errors)
         initially_fitted_params_r2adj.append(r2adj)
 
-    if external_ax is None:
+    if external_ax is None and display_plot:
         legend_columns = round(used_n / 8)
         if legend_columns == 0:
             legend_columns = 1
@@ -553,7 +859,15 @@ def peak_detection_routine(
     )
 
 
-def model_background(time, icpms_data, fit_params, title="test"):
+def model_background(
+    time,
+    icpms_data,
+    fit_params,
+    title="test",
+    display_plot=True,
+    analytic_jacobian=False,
+    deadline=None,
+):
     """
     Fits a residual backround after peak_detection_routine with another
     lognormal distribution.
@@ -570,6 +884,14 @@ def model_background(time, icpms_data, fit_params, title="test"):
         provided by peak_detection_routine via 'initially_fitted_params'.
     title : str, optional
         A string to be used for data storage and figure title. The default is 'test'.
+    display_plot : bool, optional
+        If falsy, no figure is created. The default is True.
+    analytic_jacobian : bool, optional
+        If truthy, derivatives are given by 'multi_lognormal_jacobian', otherwise approximated by
+        finite differences. The default is False.
+    deadline : datetime.datetime or None, optional
+        Wall-clock time after which the fit is aborted and the initial guesses are used.
+        The default is None.
 
     Returns
     -------
@@ -578,9 +900,7 @@ def model_background(time, icpms_data, fit_params, title="test"):
 
     """
     # first: retreive fit parameters:
-    yfit_guess = np.zeros(time.shape)
-    for n, (area, ln_std, xc) in enumerate(grouper(fit_params, 3, 0), 1):
-        yfit_guess += lognormal(time, area, ln_std, xc)
+    yfit_guess = multi_lognormal_fit(time, *fit_params)
     # calculate residuals
     residuals = icpms_data - yfit_guess
     # clip data to 0:
@@ -591,17 +911,18 @@ def model_background(time, icpms_data, fit_params, title="test"):
 
     # curve fitting
     # start displaying
-    f, ax = plt.subplots(dpi=300)
+    if display_plot:
+        f, ax = plt.subplots(dpi=300)
 
-    ax.plot(time, icpms_data, ".", label="Data")
-    ax.plot(time_fit, residuals, "d", label="Residuals", markersize=3)
+        ax.plot(time, icpms_data, ".", label="Data")
+        ax.plot(time_fit, residuals, "d", label="Residuals", markersize=3)
 
-    ax.set(
-        xlabel="$t$ / s",
-        ylabel="d$M$ d$t^{-1} S^{-1}_\\mathrm{geo}$ / ng s$^{-1}$ cm$^{-2}$",
-        title=title,
-    )
-    ax.tick_params(direction="in", which="both")
+        ax.set(
+            xlabel="$t$ / s",
+            ylabel="d$M$ d$t^{-1} S^{-1}_\\mathrm{geo}$ / ng s$^{-1}$ cm$^{-2}$",
+            title=title,
+        )
+        ax.tick_params(direction="in", which="both")
 
     # guess p0:
     area0 = np.trapz(residuals)
@@ -613,21 +934,32 @@ def model_background(time, icpms_data, fit_params, title="test"):
         xc0,
     ]
 
+    time_fit, model_function, model_jacobian = multi_lognormal_model(time_fit)
     try:
-        popt, pcov = curve_fit(lognormal, time_fit, residuals, p0=p0, maxfev=int(5e5))
+        popt, pcov = curve_fit(
+            _with_deadline(model_function, deadline),
+            time_fit,
+            residuals,
+            p0=p0,
+            jac=_with_deadline(model_jacobian, deadline)
+            if analytic_jacobian
+            else None,
+            maxfev=int(5e5),
+        )
     except RuntimeError:
         print("Background fit failed. Use initial guesses instead.")
         popt = p0
     # display background guess:
-    yfit = lognormal(time, *popt)
-    ax.plot(time, yfit, ":", label="Background guess")
-    ax.legend(loc=0)
+    if display_plot:
+        yfit = lognormal(time, *popt)
+        ax.plot(time, yfit, ":", label="Background guess")
+        ax.legend(loc=0)
 
-    # for end in ['png', 'pdf', 'svg']:
-    #    f.savefig(f'{title}.{end}', dpi=300)
+        # for end in ['png', 'pdf', 'svg']:
+        #    f.savefig(f'{title}.{end}', dpi=300)
 
-    plt.show()
-    plt.close("all")
+        plt.show()
+        plt.close("all")
 
     return popt
 
@@ -649,7 +981,7 @@ def match_potential(filename, file_extension="_EC.csv"):
 
 
     """
-    file_pure = file.split(".")[0]
+    file_pure = filename.split(".")[0]
     # add EC ending
     file_ec = file_pure + file_extension
     # load file_ec
@@ -678,6 +1010,13 @@ def fit_data(
     time_potential=None,
     potential=None,
     id_fit=0,
+    maximum_peak_number=np.inf,
+    savename="",
+    n_starts=1,
+    n_processes=1,
+    time_budget__s=None,
+    analytic_jacobian=False,
+    display_plot=True,
 ):
     """
     main function to perform sfc icpms peak fitting
@@ -698,6 +1037,17 @@ def fit_data(
     :param time_potential: array of electrochemical time, only if correlate_with_potential=True
     :param potential: array of electrochemical potential, only if correlate_with_potential=True
     :param id_fit: id of the fit, default 0.
+    :param maximum_peak_number: maximum number of peaks, passed to peak_detection_routine. The default is np.inf.
+    :param savename: name prefixed to the figure titles. The default is ''.
+    :param n_starts: number of initial guesses of the full fit, see multistart_initial_guesses.
+        The fit with the best corrected R² is kept. The default is 1.
+    :param n_processes: number of processes the initial guesses are fitted in parallel. The default is 1.
+    :param time_budget__s: wall-clock budget in s of the background and the full fit, starting with the background fit.
+        Starts not finished within the budget are discarded. If None, not limited. The default is None.
+    :param analytic_jacobian: bool, whether to fit using analytic Jacobians or finite difference approximations.
+        The analytic Jacobian is slightly faster but may converge to different local minima, thus changing the fitted
+        areas, see evaluation.benchmarks.lognormal_fitting.benchmark_lognormal_fitting(). The default is False.
+    :param display_plot: bool, whether to display figures of peak detection and background fit. The default is True.
     :return: overview_df, individual_fits_df, output_dct, plot_dct
         two versions of output: Dataframe and Dict shaped
     """
@@ -721,6 +1071,8 @@ def fit_data(
                 print(
                     f"Unable to determine the potential for peak {n+1} at {mode} +/- {mode_error} s."
                 )
+        else:
+            potential_mode = potential_mode_error = np.nan
 
         return potential_mode, potential_mode_error
 
@@ -746,6 +1098,8 @@ def fit_data(
         datapoints_peak_distance=datapoints_peak_distance,
         prominence=prominence,
         manual_peak_detect=manual_peak_detect,
+        display_plot=display_plot,
+        analytic_jacobian=analytic_jacobian,
     )
 
     (
@@ -755,6 +1109,11 @@ def fit_data(
         peak_id_data_icpms,
     ) = out
 
+    deadline = (
+        None
+        if time_budget__s is None
+        else datetime.datetime.now() + datetime.timedelta(seconds=time_budget__s)
+    )
     # model background:
     if background_correction:
         print("Deriving background fit, this may take a while...")
@@ -763,6 +1122,9 @@ def fit_data(
             icpms_data,
             initially_fitted_params,
             title=f"{savename} {material} {meas} background",
+            display_plot=display_plot,
+            analytic_jacobian=analytic_jacobian,
+            deadline=deadline,
         )
         # purposly underestimate background size
         background_popt[0] /= 2
@@ -774,27 +1136,50 @@ def fit_data(
     # fit full function
     successful_fit = False
     try:
-        # fit twice: Once with starting parameters, once with determined optimal parameters as start
-        result_storage = {}
-        p0 = initially_fitted_params
-
-        for i in range(2):
-
-            popt, pcov = curve_fit(
-                multi_lognormal_fit,
-                time,
-                icpms_data,
-                p0=p0,
-                bounds=(0, np.inf),
-                maxfev=int(1e4),
-            )
-            yfit = multi_lognormal_fit(time, *popt)
-            errors, r2adj = get_errors(popt, pcov, time, icpms_data, yfit)
-            result_storage[r2adj] = popt, pcov, yfit, errors, r2adj
-            # overwrite p0 for next run
-            p0 = popt
-        # now, select better fit
-        popt, pcov, yfit, errors, r2adj = result_storage[max(result_storage)]
+        # fit each initial guess twice: Once with starting parameters, once with determined optimal parameters as start
+        initial_guesses = multistart_initial_guesses(
+            initially_fitted_params, n_starts=n_starts
+        )
+        results, exceptions = [], []
+        if n_processes <= 1 or len(initial_guesses) <= 1:
+            for p0 in initial_guesses:
+                try:
+                    results.extend(
+                        fit_multi_lognormal_start(
+                            time, icpms_data, p0, analytic_jacobian, deadline
+                        )
+                    )
+                except Exception as e:
+                    exceptions.append(e)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=n_processes
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        fit_multi_lognormal_start,
+                        time,
+                        icpms_data,
+                        p0,
+                        analytic_jacobian,
+                        deadline,
+                    )
+                    for p0 in initial_guesses
+                ]
+                for future in futures:
+                    try:
+                        results.extend(future.result())
+                    except Exception as e:
+                        exceptions.append(e)
+        if len(results) == 0:
+            raise exceptions[0]
+        if len(exceptions) > 0:
+            print(f"{len(exceptions)} of {len(initial_guesses)} starts failed.")
+        # now, select best fit, on equal R2adj the later one
+        popt, pcov, yfit, errors, r2adj = results[0]
+        for result in results[1:]:
+            if result[4] >= r2adj:
+                popt, pcov, yfit, errors, r2adj = result
 
         label = r"fit $R^2_\mathrm{adj}=$" + f"{round(r2adj*100, 2)}%"
         successful_fit = True
@@ -983,6 +1368,44 @@ def fit_data(
     return overview_df, individual_fits_df, output_dct, plot_dct
 
 
+def fit_data_batch(kwargs_fits, n_processes=1, **kwargs_fit_data):
+    """
+    Perform independent fits via fit_data, for example of several runs and materials.
+    If n_processes > 1, the fits are distributed over a process pool, their initial guesses are fitted serially
+    within each process and no figures are displayed.
+    :param kwargs_fits: list of dict, keyword arguments of fit_data for each fit
+    :param n_processes: number of processes the fits are performed in parallel. The default is 1.
+    :param kwargs_fit_data: keyword arguments of fit_data common to all fits
+    :return: list of the outputs of fit_data (overview_df, individual_fits_df, output_dct, plot_dct)
+        in the order of kwargs_fits
+    """
+    kwargs_fits = [{**kwargs_fit_data, **kwargs_fit} for kwargs_fit in kwargs_fits]
+    if n_processes <= 1 or len(kwargs_fits) <= 1:
+        return [fit_data(**kwargs_fit) for kwargs_fit in kwargs_fits]
+
+    if any(kwargs_fit.get("manual_peak_detect", False) for kwargs_fit in kwargs_fits):
+        raise ValueError("manual_peak_detect is not possible for n_processes > 1.")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_processes) as executor:
+        return list(
+            executor.map(
+                _fit_data_kwargs,
+                [
+                    {**kwargs_fit, "n_processes": 1, "display_plot": False}
+                    for kwargs_fit in kwargs_fits
+                ],
+            )
+        )
+
+
+def _fit_data_kwargs(kwargs_fit):
+    """
+    Call fit_data with a dict of keyword arguments, used by fit_data_batch in the process pool.
+    :param kwargs_fit: dict, keyword arguments of fit_data
+    :return: output of fit_data
+    """
+    return fit_data(**kwargs_fit)
+
+
 def correlate_potential_with_measurement(time, time_potential, potential, time_error=0):
     """
     Returns a potential value at a given time value including an uncertainty using linear interpolation.
@@ -1098,6 +1521,9 @@ def fit_icpms_evolution(
     background_correction=True,
     manual_peak_detect=False,
     analyze_materials="all",
+    n_processes=1,
+    n_starts=1,
+    time_budget__s=None,
 ):
     """
     Main function
@@ -1128,6 +1554,13 @@ def fit_icpms_evolution(
         'all' or list of strings matching entries in the name_isotope_analyte
         column of df to analyze only those. if 'all', no selection is performed.
         The default is 'all'.
+    n_processes : int, optional
+        Number of processes the fits of all runs and materials are performed in parallel,
+        see fit_data_batch. The default is 1.
+    n_starts : int, optional
+        passed to fit_data. The default is 1.
+    time_budget__s : float or None, optional
+        passed to fit_data. The default is None.
 
     Returns
     -------
@@ -1151,45 +1584,57 @@ def fit_icpms_evolution(
     if analyze_materials == "all":
         material_list = sorted(set([mat for run, mat, num in df.index]))
 
-    for material in material_list:
-
-        # fit
-        for meas in runs:
-
-            print()
-            print(f"\t\t Starting with {material} {meas} on {file}")
-            print()
-
-            # get fit data
-            time = df.loc[
-                (
-                    meas,
-                    material,
-                ),
-                "t_delaycorrected__timestamp_sfc_pc_synchronized__s",
-            ]
-            icpms_data = df.loc[
-                (
-                    meas,
-                    material,
-                ),
-                "dm_dt_S__ng_s_cm2geo_fc_top_cell_Aideal",
-            ]
-            # correlated potential
-            interpolated_potential = match_potential(savename)
-
-            df_overview, df_individual_peak, indivdual_output_dct, individual_plot_dct = fit_data(
-                time,
-                icpms_data,
-                interpolated_potential,
-                meas,
-                material,
-                background_correction,
-                manual_peak_detect,
+    # correlated potential
+    time_potential, potential, __ = match_potential(savename)
+
+    # fit all runs and materials
+    fit_keys = [(material, meas) for material in material_list for meas in runs]
+    fit_outputs = fit_data_batch(
+        [
+            dict(
+                time=df.loc[
+                    (
+                        meas,
+                        material,
+                    ),
+                    "t_delaycorrected__timestamp_sfc_pc_synchronized__s",
+                ],
+                icpms_data=df.loc[
+                    (
+                        meas,
+                        material,
+                    ),
+                    "dm_dt_S__ng_s_cm2geo_fc_top_cell_Aideal",
+                ],
+                meas=meas,
+                material=material,
+                id_fit=id_fit,
             )
+            for id_fit, (material, meas) in enumerate(fit_keys)
+        ],
+        n_processes=n_processes,
+        background_correction=background_correction,
+        manual_peak_detect=manual_peak_detect,
+        time_potential=time_potential,
+        potential=potential,
+        maximum_peak_number=maximum_peak_number,
+        savename=savename,
+        n_starts=n_starts,
+        time_budget__s=time_budget__s,
+    )
+    for (material, meas), fit_output in zip(fit_keys, fit_outputs):
+        print(f"\t\t Finished {material} {meas} on {savename}")
+        (
+            df_overview,
+            df_individual_peak,
+            indivdual_output_dct,
+            individual_plot_dct,
+        ) = fit_output
+
+        output_dct = {**output_dct, **indivdual_output_dct}
+        plot_dct = {**plot_dct, **individual_plot_dct}
 
-            output_dct = {**output_dct, **indivdual_output_dct}
-            plot_dct = {**plot_dct, **individual_plot_dct}
+    for material in material_list:
 
         # plot
         f, axes = plt.subplots(
@@ -1204,7 +1649,7 @@ def fit_icpms_evolution(
         if len_runs == 1:
             axes = np.array([axes])
 
-        f.suptitle(file)
+        f.suptitle(savename)
 
         axes[0].set_title(material)
         axes[-1].set_xlabel("$t$ / s")
@@ -1321,6 +1766,8 @@ if __name__ == "__main__":
             time_potential=time_potential,
             potential=potential,
             id_fit=1,
+            maximum_peak_number=maximum_peak_number,
+            savename=savename,
         )  # additional peaks bei 180 450 727
 
         overview_df, individual_fit_df, output_dct, plot_dct = fit_output
@@ -0,0 +1,236 @@
+"""
+Scripts for linear least squares fitting of many groups of datapoints at once in closed form, as replacement of one
+scipy.optimize.curve_fit per group, used for fitting the internal standard counts of ICP-MS experiments
+(see evaluation.processing.icpms_update_exp)
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from evaluation.visualization import plot
+
+# fit method stored in column fit_method, as by plot.datasetAccessor.fit()
+FIT_METHOD = "closed_form_grouped"
+# fit parameter columns as stored by plot.datasetAccessor.fit() for plot.linear_func, without exp_col_label
+FIT_COLUMNS = [
+    "linear_fit_m",
+    "linear_fit_m_sd",
+    "linear_fit_b",
+    "linear_fit_b_sd",
+    "linear_fit_ResVar",
+    "linear_fit_Rsquared",
+    "fit_method",
+]
+
+
+def fit_linear_grouped(x, y, groups, confidence_interval=1):
+    """
+    Fit y = m*x + b for each group of datapoints. Slope, intercept and their covariance are derived from sums per
+    group (np.add.reduceat over datapoints sorted by group), thus all groups are fitted in a few vectorized passes.
+    Parameters and their standard deviation equal the ones of plot.datasetAccessor.fit(model=plot.linear_func,
+    method='scipy.optimize.curve_fit') without uncertainties, which reports the covariance unscaled by the residuals
+    (absolute_sigma=True).
+    :param x: np.array or pd.Series
+        x-data
+    :param y: np.array or pd.Series
+        y-data
+    :param groups: np.array or pd.Series or pd.Index or pd.MultiIndex
+        group of each datapoint, for example the index of the data DataFrame without the data id level
+    :param confidence_interval: float 0<confidence_interval<=1, optional, Default 1
+        if <1, datapoints of which the residual of a first fit is outside the given confidence interval are removed
+        and a second fit is performed, as in plot.datasetAccessor.fit().
+        Groups with less than two remaining datapoints keep the first fit.
+    :return: fits, y_fitted, selected
+        fits: pd.DataFrame indexed by group with columns FIT_COLUMNS, linear_fit_mb_cov, n_points, n_points_removed
+        y_fitted: np.array, fitted y of each datapoint
+        selected: np.array of bool, whether the datapoint is considered in the (second) fit
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    codes, index_groups = pd.factorize(groups, sort=True)
+    if isinstance(groups, pd.MultiIndex):
+        index_groups = pd.MultiIndex.from_tuples(index_groups, names=groups.names)
+    else:
+        index_groups = pd.Index(index_groups, name=getattr(groups, "name", None))
+
+    # datapoints sorted by group, segment starts for np.add.reduceat
+    order = np.argsort(codes, kind="stable")
+    codes_sorted = codes[order]
+    starts = np.flatnonzero(np.diff(codes_sorted, prepend=-1) != 0)
+    x_sorted = x[order]
+    y_sorted = y[order]
+
+    selected_sorted = np.ones(len(order), dtype=bool)
+    params = _fit_linear_segments(x_sorted, y_sorted, selected_sorted, codes_sorted, starts)
+    if confidence_interval < 1:
+        residuals = params["m"][codes_sorted] * x_sorted + params["b"][codes_sorted] - y_sorted
+        n_selected = np.add.reduceat(np.ones(len(order)), starts)
+        residuals_mean = np.add.reduceat(residuals, starts) / n_selected
+        residuals_std = np.sqrt(
+            np.add.reduceat((residuals - residuals_mean[codes_sorted]) ** 2, starts) / n_selected
+        )
+        sigmas = norm.ppf(np.sqrt(confidence_interval))
+        selected_sorted = (residuals < sigmas * residuals_std[codes_sorted]) & (
+            residuals > -sigmas * residuals_std[codes_sorted]
+        )
+        refit = np.add.reduceat(selected_sorted.astype(float), starts) >= 2
+        selected_sorted = selected_sorted | ~refit[codes_sorted]
+        params = _fit_linear_segments(x_sorted, y_sorted, selected_sorted, codes_sorted, starts)
+
+    y_fitted_sorted = params["m"][codes_sorted] * x_sorted + params["b"][codes_sorted]
+    weights = selected_sorted.astype(float)
+    y_mean = params["y_mean"]
+    ss_res = np.add.reduceat(weights * (y_sorted - y_fitted_sorted) ** 2, starts)
+    ss_tot = np.add.reduceat(weights * (y_sorted - y_mean[codes_sorted]) ** 2, starts)
+    n_points = np.add.reduceat(np.ones(len(order), dtype=int), starts)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fits = pd.DataFrame(
+            {
+                "linear_fit_m": params["m"],
+                "linear_fit_m_sd": np.sqrt(params["var_m"]),
+                "linear_fit_b": params["b"],
+                "linear_fit_b_sd": np.sqrt(params["var_b"]),
+                "linear_fit_ResVar": np.nan,
+                "linear_fit_Rsquared": np.where(ss_tot != 0, 1 - ss_res / ss_tot, 1),
+                "fit_method": FIT_METHOD,
+                "linear_fit_mb_cov": params["cov_mb"],
+                "n_points": n_points,
+                "n_points_removed": n_points - params["n"].astype(int),
+            },
+            index=index_groups,
+        )
+
+    y_fitted = np.empty(len(order))
+    y_fitted[order] = y_fitted_sorted
+    selected = np.empty(len(order), dtype=bool)
+    selected[order] = selected_sorted
+    return fits, y_fitted, selected
+
+
+def _fit_linear_segments(x, y, selected, codes, starts):
+    """
+    Single pass of fit_linear_grouped() considering only selected datapoints. x and y are centered per group to keep
+    the sums numerically stable for large x (such as timestamps).
+    :param x: np.array of float, sorted by group
+    :param y: np.array of float, sorted by group
+    :param selected: np.array of bool
+    :param codes: np.array of int, sorted group codes
+    :param starts: np.array of int, position of the first datapoint of each group
+    :return: dict of np.array per group: m, b, var_m, var_b, cov_mb, n, y_mean
+    """
+    weights = selected.astype(float)
+    n = np.add.reduceat(weights, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.add.reduceat(weights * x, starts) / n
+        y_mean = np.add.reduceat(weights * y, starts) / n
+        x_centered = x - x_mean[codes]
+        s_xx = np.add.reduceat(weights * x_centered**2, starts)
+        s_xy = np.add.reduceat(weights * x_centered * (y - y_mean[codes]), starts)
+        m = s_xy / s_xx
+        # inverse of the normal matrix [[sum(x^2), sum(x)], [sum(x), n]]
+        return {
+            "m": m,
+            "b": y_mean - m * x_mean,
+            "var_m": 1 / s_xx,
+            "var_b": 1 / n + x_mean**2 / s_xx,
+            "cov_mb": -x_mean / s_xx,
+            "n": n,
+            "y_mean": y_mean,
+        }
+
+
+def fit_linear_dataset(
+    exp,
+    data,
+    x_col,
+    y_col,
+    y_col_fitted=None,
+    confidence_interval=1,
+    exp_col_label="",
+    print_removed=True,
+):
+    """
+    Closed form replacement of plot.datasetAccessor.fit(model=plot.linear_func) for all experiments at once,
+    without plotting. Fit parameters are stored in the columns of exp and fitted data in data as done by
+    plot.datasetAccessor.fit(). Plot the fit via exp.dataset.plot(y_col=y_col_fitted, data=data).
+    :param exp: pd.DataFrame
+        experimental dataset, its index levels are the leading index levels of data
+    :param data: pd.DataFrame
+        data of the experiments, index has one additional level to the index of exp
+    :param x_col: str
+        column name of the x data in data
+    :param y_col: str
+        column name of the y data in data
+    :param y_col_fitted: str or None, optional, Default None
+        name of the column in data where the fitted data will be stored, if None y_col + '_fitted'
+    :param confidence_interval: float 0<confidence_interval<=1, optional, Default 1
+        see fit_linear_grouped()
+    :param exp_col_label: str, optional, Default ''
+        prefix label for the columns added for the fit parameters to exp
+    :param print_removed: bool, optional, Default True
+        print the share of datapoints removed by the confidence interval for each experiment
+    :return: exp, data
+        both modified in place
+    """
+    if y_col_fitted is None:
+        y_col_fitted = y_col + "_fitted"
+    exp_col_label = exp_col_label + "_" if exp_col_label != "" else ""
+    groups = data.index.droplevel(list(range(exp.index.nlevels, data.index.nlevels)))
+    in_exp = groups.isin(exp.index)
+
+    fits, y_fitted, selected = fit_linear_grouped(
+        data.loc[in_exp, x_col],
+        data.loc[in_exp, y_col],
+        groups[in_exp],
+        confidence_interval=confidence_interval,
+    )
+    data.loc[:, y_col_fitted] = np.nan
+    data.loc[in_exp, y_col_fitted] = y_fitted
+
+    fits_exp = fits.reindex(exp.index)
+    if confidence_interval < 1 and print_removed:
+        for index, row in fits_exp.loc[fits_exp.n_points > 0].iterrows():
+            percent_removed = row.n_points_removed / row.n_points * 100
+            print(
+                "\x1b[" + ("31" if percent_removed > 10 else "33") + "m",
+                "Removed ",
+                percent_removed,
+                "% of data for ",
+                index,
+                "\x1b[0m",
+            )
+    for col in FIT_COLUMNS:
+        exp.loc[:, exp_col_label + col] = fits_exp.loc[:, col].to_numpy()
+    return exp, data
+
+
+def fit_linear_dataset_curve_fit(exp, data, x_col, y_col, y_col_fitted=None, confidence_interval=1):
+    """
+    Previous fitting path of one scipy.optimize.curve_fit per experiment via plot.datasetAccessor.fit(),
+    kept for comparison, see evaluation.benchmarks.grouped_regression
+    :param exp: pd.DataFrame
+    :param data: pd.DataFrame
+    :param x_col: str
+    :param y_col: str
+    :param y_col_fitted: str or None, optional, Default None
+    :param confidence_interval: float, optional, Default 1
+    :return: exp, data
+        data as sorted copy with fitted column, as stored by plot.datasetAccessor.fit()
+    """
+    accessor = exp.dataset.fit(
+        model=plot.linear_func,
+        x_col=x_col,
+        y_col=y_col,
+        y_col_fitted=y_col_fitted,
+        data=data,
+        beta0=[0, 0],
+        confidence_interval=confidence_interval,
+        method="scipy.optimize.curve_fit",
+        label_fit=False,
+        display_fit=False,
+    )
+    return exp, accessor.data
@@ -499,6 +499,10 @@ def calibrate(
                     calibration_a_is_pair.to_sql(
                         "exp_icpms_calibration_params", con=con, if_exists="append"
                     )
+                    # calibration parameters affect all experiments, refresh materialized views completely
+                    db.notify_written(
+                        "exp_icpms_calibration_params", con=con, full_refresh=True
+                    )
                     print(
                         "\x1b[32m",
                         "Successfully inserted calibration data for id_calibration_set = "
@@ -20,12 +20,12 @@ from matplotlib.dates import DateFormatter, num2date, AutoDateLocator  # SecondL
 # from evaluation.utils import db, db_config
 import evaluation.utils.db as db
 import evaluation.utils.db_config as db_config
-from evaluation.utils import user_input
+from evaluation.utils import user_input, tools
 import datetime
 
 from evaluation.visualization import plot
 from evaluation.visualization import extra_widgets
-from evaluation.processing import tools_ec, Fit_SFC_ICP_MS_Dissolution
+from evaluation.processing import tools_ec, Fit_SFC_ICP_MS_Dissolution, grouped_regression
 
 # from importlib import reload
 # reload(plot)
@@ -952,45 +952,49 @@ def update_counts_internalstandard_fitted(
                 color=color_behind_cmap,
                 axlabel_auto=False,
             )
-            .fit(
+            .return_dataset()
+        )
+
+        # linear fits of all EC batches at once, see evaluation.processing.grouped_regression
+        grouped_regression.fit_linear_dataset(
+            exp_icpms_ML,
+            data_icpms_ML,
+            x_col="t_delaycorrected__timestamp_sfc_pc_synchronized__s",
+            y_col="counts_internalstandard",
+            y_col_fitted="counts_internalstandard_fitted",
+            confidence_interval=1,
+        )
+        exp_icpms_ML = (
+            exp_icpms_ML.dataset.plot(
                 x_col="t_delaycorrected__timestamp_sfc_pc_synchronized__s",
-                y_col="counts_internalstandard",
-                y_col_fitted="counts_internalstandard_fitted",
+                y_col="counts_internalstandard_fitted",
                 ax="ax_raw",
                 data=data_icpms_ML,
+                axlabel_auto=False,
                 **{"color": color_ISTD_fit_complete_data}
                 if confidence_interval < 1
-                else {},  # color='black',
-                model=plot.linear_func,  # plot.
-                beta0=[0, 0],
-                # ifixb=[1, 1],
-                confidence_interval=1,
-                method="scipy.optimize.curve_fit",  # 'scipy.odr',#
-                # label='dummy',
-                # label_fit_style=fit_label(description=False, params=False),
-                display_fit=True,
+                else {},
             )
             .return_dataset()
         )
 
         if confidence_interval < 1:
+            grouped_regression.fit_linear_dataset(
+                exp_icpms_ML,
+                data_icpms_ML,
+                x_col="t_delaycorrected__timestamp_sfc_pc_synchronized__s",
+                y_col="counts_internalstandard",
+                y_col_fitted="counts_internalstandard_fitted",
+                confidence_interval=confidence_interval,
+            )
             exp_icpms_ML = (
                 exp_icpms_ML.dataset.add_column("color", values=cmap)
-                .fit(
+                .plot(
                     x_col="t_delaycorrected__timestamp_sfc_pc_synchronized__s",
-                    y_col="counts_internalstandard",  # 'dm_dt__ng_s',#'dm_dt_S__ng_s_cm2geo_fc_top_cell_Aideal',
-                    y_col_fitted="counts_internalstandard_fitted",
+                    y_col="counts_internalstandard_fitted",
                     ax="ax_raw",
                     data=data_icpms_ML,
-                    # color='black',
-                    model=plot.linear_func,  # plot.
-                    beta0=[0, 0],
-                    # ifixb=[1, 1],
-                    confidence_interval=confidence_interval,
-                    method="scipy.optimize.curve_fit",  # 'scipy.odr',#
-                    # label='dummy',
-                    # label_fit_style=fit_label(description=False, params=False),
-                    display_fit=True,
+                    axlabel_auto=False,
                 )
                 .return_dataset()
             )
@@ -1268,6 +1272,11 @@ def update_counts_internalstandard_fitted(
                         con=con_update,
                         if_exists="append",
                     )
+                    db.notify_written(
+                        "data_icpms_internalstandard_fitting",
+                        data_icpms_ML.reset_index().loc[:, ["id_exp_icpms"]],
+                        con=con_update,
+                    )
                     print(
                         "\x1b[32m"
                         + "Successfully inserted "
@@ -1275,7 +1284,6 @@ def update_counts_internalstandard_fitted(
                         + " datapoints"
                         + "\x1b[0m"
                     )
-                engine.dispose()
                 button_upload.disabled = True
                 if export_plotdata:
                     plot_storage.export(
@@ -1293,6 +1301,498 @@ def update_counts_internalstandard_fitted(
     return plot_storage
 
 
+def update_counts_internalstandard_fitted_batch(
+    id_exp_icpms=None,
+    sql_icpms=None,
+    params=None,
+    t_start_shift__s=0,
+    t_end_shift__s=0,
+    confidence_interval=1,
+    ignore_id_exp_sfc=None,
+    n_processes=1,
+    update_database=True,
+    plot_fits=False,
+    figure_dpi=150,
+    export_path=db_config.DIR_REPORTS() / Path("04_ICPMS_ISTD_fitting/"),
+):
+    """
+    Headless version of update_counts_internalstandard_fitted() for many icpms experiments at once, for example to
+    refit the internal standard of all experiments after a change of the calibration.
+    Data of all icpms experiments is requested by a single call of evaluation.utils.db.get_data(). Datapoints are
+    assigned to the EC batches (id_ML, overlapping batches combined) as in update_counts_internalstandard_fitted().
+    Linear fits are calculated in closed form for all EC batches and isotope pairs at once (see
+    evaluation.processing.grouped_regression), optionally distributed over a pool of worker processes. The fitted
+    counts of all experiments are written to the database within one transaction. Plots are not created during
+    fitting, use plot_fits or plot_counts_internalstandard_fitted_batch().
+    Fits are performed on t__s of the icpms data, thus fitted counts are identical to the interactive routine while
+    the intercept linear_fit_b refers to the start of the icpms experiment.
+    :param id_exp_icpms: int or list of int or None, optional, Default None
+        icpms experiments to be fitted
+    :param sql_icpms: str or None, optional, Default None
+        SQL query selecting the icpms experiments to be fitted by a column id_exp_icpms, used if id_exp_icpms is None
+    :param params: list or None, optional, Default None
+        parameters of sql_icpms
+    :param t_start_shift__s: see update_counts_internalstandard_fitted()
+    :param t_end_shift__s: see update_counts_internalstandard_fitted()
+    :param confidence_interval: see update_counts_internalstandard_fitted()
+    :param ignore_id_exp_sfc: optional, default [], list of id_exp_sfcs which should be ignored
+    :param n_processes: int, optional, Default 1
+        number of worker processes the icpms experiments are fitted in, if 1 all are fitted in the current process
+        (see evaluation.utils.tools.process_pool_executor())
+    :param update_database: bool, optional, Default True
+        whether to write the fitted counts into data_icpms_internalstandard_fitting. Only experiments of the current
+        user are updated.
+    :param plot_fits: bool, optional, Default False
+        whether to plot the fits of each icpms experiment after the database is updated,
+        see plot_counts_internalstandard_fitted_batch()
+    :param figure_dpi: dpi of the figures, only relevant if plot_fits
+    :param export_path: optional, str
+        path where the plots are stored, only relevant if plot_fits
+    :return: exp_icpms_ML, data_icpms_ML
+        exp_icpms_ML: pd.DataFrame with the fit parameters of each icpms experiment, isotope pair and EC batch
+        data_icpms_ML: pd.DataFrame with the fitted internal standard counts of each datapoint
+    """
+    if ignore_id_exp_sfc is None:
+        ignore_id_exp_sfc = []
+    if id_exp_icpms is None:
+        if sql_icpms is None:
+            raise ValueError("Either id_exp_icpms or sql_icpms must be given")
+        id_exp_icpms = db.query_sql(sql_icpms, params=params, method="pandas").id_exp_icpms
+    ids_exp_icpms = [int(id_exp) for id_exp in pd.unique(pd.Series(np.atleast_1d(id_exp_icpms)))]
+
+    exp_icpms = db.query_sql_keyset(
+        "SELECT * FROM exp_icpms_sfc_expanded WHERE " + db.KEYSET_PLACEHOLDER + ";",
+        key_names="id_exp_icpms",
+        key_values=ids_exp_icpms,
+    ).set_index(["id_exp_icpms", "name_isotope_analyte", "name_isotope_internalstandard"])
+    if len(exp_icpms.index) == 0:
+        print("\x1b[31m", "No icpms experiments found", "\x1b[0m")
+        return None, None
+    exp_runs = exp_icpms.groupby(level="id_exp_icpms").first()
+    if (exp_runs.t_delay__s == 0).any():
+        print(
+            "\x1b[31m",
+            "The delay time is set to 0 s for id_exp_icpms ",
+            exp_runs.loc[exp_runs.t_delay__s == 0].index.tolist(),
+            ". Adjust the delay time before performing integration analysis!",
+            "\x1b[0m",
+        )
+
+    match_ec_icpms = db.match_exp_sfc_exp_icpms(
+        exp_icpms,
+        A_geo_cols="fc_top_name_flow_cell_A_opening_ideal__mm2",
+        add_cols=["id_ML"],
+    )
+    match_ec_icpms = match_ec_icpms.loc[~match_ec_icpms.id_exp_sfc.isin(ignore_id_exp_sfc), :]
+    windows = _istd_fit_windows(match_ec_icpms, t_start_shift__s, t_end_shift__s)
+
+    data_icpms = db.get_data(
+        match_ec_icpms,
+        "data_icpms_sfc_analysis",
+        join_cols=["id_exp_icpms"],
+        index_cols=[
+            "id_exp_icpms",
+            "name_isotope_analyte",
+            "name_isotope_internalstandard",
+            "id_data_icpms",
+        ],
+        columns=["t__s", "counts_internalstandard"],
+    ).sort_index().loc[:, ["t__s", "t_delaycorrected__timestamp_sfc_pc", "counts_internalstandard"]]
+
+    # fit icpms experiments in chunks, each chunk within one worker process
+    ids_exp_icpms = windows.index.get_level_values("id_exp_icpms").unique()
+    chunks = [
+        ids_chunk
+        for ids_chunk in np.array_split(ids_exp_icpms.to_numpy(), max(min(n_processes, len(ids_exp_icpms)), 1))
+        if len(ids_chunk) > 0
+    ]
+    ids_data = data_icpms.index.get_level_values("id_exp_icpms")
+    ids_windows = windows.index.get_level_values("id_exp_icpms")
+    chunk_args = [
+        (data_icpms.loc[ids_data.isin(ids_chunk)], windows.loc[ids_windows.isin(ids_chunk)], confidence_interval)
+        for ids_chunk in chunks
+    ]
+    executor = tools.process_pool_executor(n_processes) if n_processes > 1 and len(chunk_args) > 1 else None
+    if executor is None:
+        results = [_fit_istd_chunk(*args) for args in chunk_args]
+    else:
+        with executor:
+            results = list(executor.map(_fit_istd_chunk, *zip(*chunk_args)))
+    index_exp_icpms_ML = [
+        "id_exp_icpms",
+        "name_isotope_analyte",
+        "name_isotope_internalstandard",
+        "id_ML_datesafe_overlapsafe",
+    ]
+    exp_fits = (
+        pd.concat([result[0] for result in results])
+        if len(results) > 0
+        else pd.DataFrame(columns=index_exp_icpms_ML).set_index(index_exp_icpms_ML)
+    )
+    data_icpms_ML = (
+        pd.concat([result[1] for result in results])
+        if len(results) > 0
+        else pd.DataFrame(columns=index_exp_icpms_ML + ["id_data_icpms"]).set_index(
+            index_exp_icpms_ML + ["id_data_icpms"]
+        )
+    )
+
+    # all combinations of isotope pairs and EC batches, as in update_counts_internalstandard_fitted()
+    exp_icpms_ML = (
+        exp_icpms.index.to_frame(index=False)
+        .merge(windows.reset_index(), on="id_exp_icpms")
+        .set_index(index_exp_icpms_ML)
+        .join(exp_fits)
+    )
+    exp_icpms_ML.loc[:, "n_points"] = exp_icpms_ML.n_points.fillna(0).astype(int)
+
+    # Handling very short EC experiments which just match with one ICPMS datapoint --> remove these experiments
+    exp_too_short = exp_icpms_ML.loc[exp_icpms_ML.n_points <= 1, :]
+    for index, row in exp_too_short.groupby(["id_exp_icpms", "id_ML_datesafe_overlapsafe"]).first().iterrows():
+        print(
+            "\x1b[31m",
+            "For id_exp_icpms ",
+            index[0],
+            " and id_ML ",
+            row.id_ML,
+            " (",
+            row.Date,
+            ") at most a single ICPMS datapoint is found. Linear fitting is impossible, the ML is neglected.",
+            "\x1b[0m",
+        )
+    exp_icpms_ML = exp_icpms_ML.loc[exp_icpms_ML.n_points > 1, :]
+    data_icpms_ML = data_icpms_ML.loc[
+        data_icpms_ML.reset_index(level="id_data_icpms", drop=True).index.isin(exp_icpms_ML.index)
+    ]
+
+    if confidence_interval < 1:
+        percent_removed = exp_icpms_ML.n_points_removed / exp_icpms_ML.n_points * 100
+        if (percent_removed > 10).any():
+            print(
+                "\x1b[31m",
+                "More than 10 % of data removed for ",
+                percent_removed.loc[percent_removed > 10].round(1).to_dict(),
+                "\x1b[0m",
+            )
+
+    file_paths_plot = pd.Series(
+        [
+            str(export_path / ("ISTD_fit__id_exp_icpms_" + str(id_exp) + ".svg")) if plot_fits else None
+            for id_exp in exp_runs.index
+        ],
+        index=exp_runs.index,
+    )
+    if update_database:
+        is_owner = exp_runs.name_user == db.current_user()
+        if not is_owner.all():
+            print(
+                "\x1b[31m",
+                "You better not change data of other users. Not updated: id_exp_icpms ",
+                exp_runs.loc[~is_owner].index.tolist(),
+                "\x1b[0m",
+            )
+        ids_exp_icpms_update = exp_runs.loc[is_owner].index.tolist()
+        _update_counts_internalstandard_fitted_db(
+            exp_icpms_sfc=pd.DataFrame(
+                {
+                    "t_start_shift__s": t_start_shift__s,
+                    "t_end_shift__s": t_end_shift__s,
+                    "ISTD_fit_confidence_interval": confidence_interval,
+                    "t_updated_ISTD_fit__timestamp": datetime.datetime.now(),
+                    "file_path_plot_update_ISTD_fit": file_paths_plot.loc[ids_exp_icpms_update],
+                },
+                index=pd.Index(ids_exp_icpms_update, name="id_exp_icpms"),
+            ),
+            data_icpms_ML=data_icpms_ML.loc[
+                data_icpms_ML.index.get_level_values("id_exp_icpms").isin(ids_exp_icpms_update)
+            ],
+        )
+
+    if plot_fits:
+        plot_counts_internalstandard_fitted_batch(
+            exp_icpms_ML,
+            data_icpms_ML,
+            figure_dpi=figure_dpi,
+            export_path=export_path,
+        )
+    return exp_icpms_ML, data_icpms_ML
+
+
+def _istd_fit_windows(match_ec_icpms, t_start_shift__s=0, t_end_shift__s=0):
+    """
+    Time windows of the ISTD fits of each icpms experiment. As in update_counts_internalstandard_fitted(), ec
+    experiments are grouped to EC batches by date and id_ML, shifted by t_start_shift__s and t_end_shift__s,
+    and overlapping EC batches are combined.
+    :param match_ec_icpms: pd.DataFrame
+        matched sfc and icpms experiments as returned by evaluation.utils.db.match_exp_sfc_exp_icpms()
+        with additional column id_ML
+    :param t_start_shift__s: see update_counts_internalstandard_fitted()
+    :param t_end_shift__s: see update_counts_internalstandard_fitted()
+    :return: pd.DataFrame indexed by id_exp_icpms, id_ML_datesafe_overlapsafe
+        with columns Date, id_ML, t_start__timestamp_shifted, t_end__timestamp_shifted
+    """
+    exp_ec = match_ec_icpms.reset_index().sort_values(["id_exp_icpms", "id_exp_sfc"])
+    exp_ec.loc[:, "t_start__timestamp"] = pd.to_datetime(exp_ec.t_start__timestamp)
+    exp_ec.loc[:, "t_end__timestamp"] = pd.to_datetime(exp_ec.t_end__timestamp)
+    exp_ec.loc[:, "Date"] = exp_ec.t_start__timestamp.dt.date
+    exp_ec_ML = (
+        exp_ec.groupby(["id_exp_icpms", "Date", "id_ML"])
+        .agg(
+            t_start__timestamp=("t_start__timestamp", "first"),
+            t_end__timestamp=("t_end__timestamp", "last"),
+        )
+        .reset_index()
+    )
+    exp_ec_ML.loc[:, "t_start__timestamp_shifted"] = exp_ec_ML.t_start__timestamp + pd.Timedelta(
+        seconds=t_start_shift__s
+    )
+    exp_ec_ML.loc[:, "t_end__timestamp_shifted"] = exp_ec_ML.t_end__timestamp + pd.Timedelta(
+        seconds=t_end_shift__s
+    )
+
+    # an EC batch overlapping with any previous EC batch of the icpms experiment is combined with it
+    t_end_previous = exp_ec_ML.groupby("id_exp_icpms").t_end__timestamp_shifted.cummax()
+    t_end_previous = t_end_previous.groupby(exp_ec_ML.id_exp_icpms).shift()
+    exp_ec_ML.loc[:, "id_ML_datesafe_overlapsafe"] = (
+        ~(t_end_previous > exp_ec_ML.t_start__timestamp_shifted)
+    ).groupby(exp_ec_ML.id_exp_icpms).cumsum() - 1
+
+    windows = exp_ec_ML.groupby(["id_exp_icpms", "id_ML_datesafe_overlapsafe"]).agg(
+        Date=("Date", "first"),
+        id_ML=("id_ML", lambda ids_ML: "/".join(str(int(id_ML)) for id_ML in ids_ML)),
+        t_start__timestamp_shifted=("t_start__timestamp_shifted", "first"),
+        t_end__timestamp_shifted=("t_end__timestamp_shifted", "max"),
+    )
+    windows_overlapping = windows.loc[windows.id_ML.str.contains("/"), :]
+    if len(windows_overlapping.index) > 0:
+        print(
+            "\x1b[33m"
+            + "Some id_ML overlapped: "
+            + ", ".join(
+                windows_overlapping.id_ML
+                + " (id_exp_icpms "
+                + windows_overlapping.index.get_level_values("id_exp_icpms").astype(str)
+                + ")"
+            )
+            + ". The id_MLs will be treated as one experiment and their ISTD fits will be combined."
+            + "\x1b[0m"
+        )
+    return windows
+
+
+def _fit_istd_chunk(data_icpms, windows, confidence_interval=1):
+    """
+    Assign icpms datapoints to the time windows of the ISTD fits and fit counts_internalstandard linearly per window
+    and isotope pair. Executed in a worker process by update_counts_internalstandard_fitted_batch().
+    :param data_icpms: pd.DataFrame
+        icpms data indexed by id_exp_icpms, name_isotope_analyte, name_isotope_internalstandard, id_data_icpms (sorted)
+        with columns t__s, t_delaycorrected__timestamp_sfc_pc, counts_internalstandard
+    :param windows: pd.DataFrame
+        time windows of the same icpms experiments as returned by _istd_fit_windows()
+    :param confidence_interval: see update_counts_internalstandard_fitted()
+    :return: exp_fits, data_icpms_ML
+        exp_fits: pd.DataFrame with fit parameters indexed by id_exp_icpms, name_isotope_analyte,
+            name_isotope_internalstandard, id_ML_datesafe_overlapsafe
+        data_icpms_ML: data_icpms of the assigned datapoints with column counts_internalstandard_fitted
+    """
+    windows = windows.sort_index()
+    windows_ids_exp_icpms = windows.index.get_level_values("id_exp_icpms").to_numpy()
+    windows_t_start = windows.t_start__timestamp_shifted.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    windows_t_end = windows.t_end__timestamp_shifted.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    nat = np.datetime64("NaT").astype(np.int64)
+
+    data_icpms = data_icpms.sort_index()
+    timestamps = data_icpms.t_delaycorrected__timestamp_sfc_pc.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    # each isotope pair of an icpms experiment is a contiguous block of rows
+    group_codes = data_icpms.groupby(
+        level=["id_exp_icpms", "name_isotope_analyte", "name_isotope_internalstandard"], sort=False
+    ).ngroup().to_numpy()
+    group_begin = np.flatnonzero(np.diff(group_codes, prepend=-1) != 0)
+    group_end = np.append(group_begin[1:], len(group_codes))
+    ids_exp_icpms = data_icpms.index.get_level_values("id_exp_icpms").to_numpy()
+
+    # the window listed last is assigned to datapoints shared by windows, as in update_counts_internalstandard_fitted()
+    owner = np.full(len(data_icpms.index), -1, dtype=np.int64)
+    for begin, end in zip(group_begin, group_end):
+        idx_windows = np.flatnonzero(windows_ids_exp_icpms == ids_exp_icpms[begin])
+        group_timestamps = timestamps[begin:end]
+        idx_valid = np.flatnonzero(group_timestamps != nat)
+        if len(idx_windows) == 0 or len(idx_valid) == 0:
+            continue
+        position_start = db._nearest_position(group_timestamps, idx_valid, windows_t_start[idx_windows])
+        position_end = db._nearest_position(group_timestamps, idx_valid, windows_t_end[idx_windows])
+        lengths = np.clip(position_end - position_start + 1, 0, None)
+        rows = begin + np.repeat(position_start - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        np.maximum.at(owner, rows, np.repeat(idx_windows, lengths))
+
+    assigned = owner >= 0
+    data_icpms_ML = data_icpms.loc[assigned].copy()
+    data_icpms_ML.loc[:, "id_ML_datesafe_overlapsafe"] = windows.index.get_level_values(
+        "id_ML_datesafe_overlapsafe"
+    ).to_numpy()[owner[assigned]]
+    data_icpms_ML = data_icpms_ML.reset_index().set_index(
+        [
+            "id_exp_icpms",
+            "name_isotope_analyte",
+            "name_isotope_internalstandard",
+            "id_ML_datesafe_overlapsafe",
+            "id_data_icpms",
+        ]
+    ).sort_index()
+
+    # fit group of each datapoint: isotope pair and window
+    exp_fits, counts_fitted, selected = grouped_regression.fit_linear_grouped(
+        data_icpms_ML.t__s,
+        data_icpms_ML.counts_internalstandard,
+        data_icpms_ML.index.droplevel("id_data_icpms"),
+        confidence_interval=confidence_interval,
+    )
+    data_icpms_ML.loc[:, "counts_internalstandard_fitted"] = counts_fitted
+    data_icpms_ML.loc[:, "ISTD_fit_selected"] = selected
+    return exp_fits, data_icpms_ML
+
+
+def _update_counts_internalstandard_fitted_db(exp_icpms_sfc, data_icpms_ML):
+    """
+    Write fitted internal standard counts of many icpms experiments into the database within one transaction:
+    fit settings are updated set-based in exp_icpms_sfc, previous fits are deleted and all fitted counts are inserted
+    by evaluation.utils.db.bulk_append().
+    :param exp_icpms_sfc: pd.DataFrame
+        fit settings indexed by id_exp_icpms
+    :param data_icpms_ML: pd.DataFrame
+        fitted counts as returned by update_counts_internalstandard_fitted_batch()
+    :return: None
+    """
+    ids_exp_icpms = [int(id_exp) for id_exp in exp_icpms_sfc.index]
+    if len(ids_exp_icpms) == 0:
+        return
+    print("Update. This can take some seconds...")
+    engine = db.connect("hte_processor")
+    with engine.begin() as con_update:
+        db.sql_update(
+            exp_icpms_sfc,
+            table_name="exp_icpms_sfc",
+            con=con_update,
+            method="set",
+            print_statements=False,
+        )
+        n_deleted = 0
+        for idx in range(0, len(ids_exp_icpms), db.KEYSET_MAX_PARAMS):
+            ids_chunk = ids_exp_icpms[idx: idx + db.KEYSET_MAX_PARAMS]
+            n_deleted += db.query_sql(
+                "DELETE FROM data_icpms_internalstandard_fitting WHERE id_exp_icpms IN ("
+                + ", ".join(["%s"] * len(ids_chunk))
+                + ");",
+                con=con_update,
+                params=ids_chunk,
+                method="sqlalchemy",
+            ).rowcount
+        db.notify_written(
+            "data_icpms_internalstandard_fitting",
+            pd.DataFrame({"id_exp_icpms": ids_exp_icpms}),
+            con=con_update,
+        )
+        n_inserted = db.bulk_append(
+            "data_icpms_internalstandard_fitting",
+            data_icpms_ML.reset_index()
+            .set_index(
+                [
+                    "id_exp_icpms",
+                    "name_isotope_analyte",
+                    "name_isotope_internalstandard",
+                    "id_data_icpms",
+                ]
+            )
+            .loc[:, ["counts_internalstandard_fitted"]],
+            con_update,
+        )
+    print(
+        "\x1b[32m"
+        + "Successfully deleted "
+        + str(n_deleted)
+        + " and inserted "
+        + str(n_inserted)
+        + " datapoints of "
+        + str(len(ids_exp_icpms))
+        + " icpms experiments"
+        + "\x1b[0m"
+    )
+
+
+def plot_counts_internalstandard_fitted_batch(
+    exp_icpms_ML,
+    data_icpms_ML,
+    id_exp_icpms=None,
+    figure_dpi=150,
+    export_path=None,
+):
+    """
+    Plot the ISTD fits of update_counts_internalstandard_fitted_batch(), one figure per icpms experiment with one
+    axis per isotope pair. Datapoints removed by the confidence interval are marked.
+    :param exp_icpms_ML: pd.DataFrame
+        fit parameters as returned by update_counts_internalstandard_fitted_batch()
+    :param data_icpms_ML: pd.DataFrame
+        fitted counts as returned by update_counts_internalstandard_fitted_batch()
+    :param id_exp_icpms: int or list of int or None, optional, Default None
+        icpms experiments to plot, if None all
+    :param figure_dpi: dpi of the figures
+    :param export_path: str or Path or None, optional, Default None
+        if given, figures are stored as svg in this path and closed
+    :return: dict of figures by id_exp_icpms
+    """
+    ids_exp_icpms = (
+        exp_icpms_ML.index.get_level_values("id_exp_icpms").unique().tolist()
+        if id_exp_icpms is None
+        else np.atleast_1d(id_exp_icpms).tolist()
+    )
+    cmap = plt.get_cmap("tab10")
+    figures = {}
+    for id_exp in ids_exp_icpms:
+        data_exp = data_icpms_ML.loc[data_icpms_ML.index.get_level_values("id_exp_icpms") == id_exp]
+        a_is_pairs = data_exp.groupby(level=["name_isotope_analyte", "name_isotope_internalstandard"])
+        with plt.rc_context(
+            plot.get_style(
+                style="singleColumn",
+                increase_fig_height=max(len(a_is_pairs), 1) / 2,
+                add_margins={"left": 0.8},
+                add_margins_and_figsize={"right": 1},
+                fig_margins_between_subplots={"hspace": 0},
+                add_params={"figure.dpi": figure_dpi},
+            )
+        ):
+            fig, axs = plt.subplots(max(len(a_is_pairs), 1), 1, sharex=True, squeeze=False)
+            for ax, (a_is_pair, data_pair) in zip(axs[:, 0], a_is_pairs):
+                for i, (id_ML_window, data_window) in enumerate(
+                    data_pair.groupby(level="id_ML_datesafe_overlapsafe")
+                ):
+                    ax.plot(data_window.t__s, data_window.counts_internalstandard, color="black", alpha=0.5)
+                    ax.plot(
+                        data_window.loc[~data_window.ISTD_fit_selected, "t__s"],
+                        data_window.loc[~data_window.ISTD_fit_selected, "counts_internalstandard"],
+                        color="red",
+                        marker="x",
+                        linestyle="",
+                    )
+                    ax.plot(data_window.t__s, data_window.counts_internalstandard_fitted, color=cmap(i % 10))
+                ax.text(
+                    1.02,
+                    0.95,
+                    "/".join(a_is_pair),
+                    horizontalalignment="left",
+                    verticalalignment="top",
+                    transform=ax.transAxes,
+                )
+                ax.set_ylabel("Counts")
+            axs[-1, 0].set_xlabel("$t$ / s")
+            axs[0, 0].set_title("ISTD fit id_exp_icpms " + str(id_exp))
+        if export_path is not None:
+            Path(export_path).mkdir(parents=True, exist_ok=True)
+            fig.savefig(Path(export_path) / ("ISTD_fit__id_exp_icpms_" + str(id_exp) + ".svg"))
+            plt.close(fig)
+        figures[id_exp] = fig
+    return figures
+
+
 def sfc_icpms_integration_analysis(
     id_exp_icpms=None,
     date=None,
@@ -1786,6 +2286,9 @@ def sfc_icpms_peakfitting(
     datapoints_peak_distance=50,
     prominence=0.04,
     maximum_peak_number=15,
+    n_starts=1,
+    n_processes=1,
+    time_budget__s=None,
     export_path=db_config.DIR_REPORTS() / Path("06_ICPMS_SFC_peakfitting/"),
 ):
     """
@@ -1808,6 +2311,13 @@ def sfc_icpms_peakfitting(
     :param prominence: prominence of the peak to detect it automatically as peak.
         Parameter of scipy.signal._peak_finding. Default 0.04.
     :param maximum_peak_number: maximum number of peaks which should be searche for
+    :param n_starts: int, Default 1
+        number of initial guesses of the full fit, the best fit is kept,
+        see evaluation.processing.Fit_SFC_ICP_MS_Dissolution.fit_data()
+    :param n_processes: int, Default 1
+        number of processes the initial guesses are fitted in parallel
+    :param time_budget__s: float or None, Default None
+        wall-clock budget in s of the background and full fit, if None not limited
     :param export_path: optional, str
         path where the plot should be stored. Default path depends on whether run on institute jupyterhub or in mybinder
         as defined in evaluation.utils.db_config
@@ -1860,9 +2370,6 @@ def sfc_icpms_peakfitting(
             ),
             :,
         ]
-        Fit_SFC_ICP_MS_Dissolution.maximum_peak_number = maximum_peak_number
-        Fit_SFC_ICP_MS_Dissolution.savename = "sfc icpms peakfitting"
-
         fit_output = Fit_SFC_ICP_MS_Dissolution.fit_data(
             data_icpms_selected.t_delaycorrected__timestamp_sfc_pc_synchronized__s,
             data_icpms_selected.dm_dt__ng_s,
@@ -1875,6 +2382,11 @@ def sfc_icpms_peakfitting(
             time_potential=data_ec.Timestamp_synchronized__s,
             potential=data_ec.E_WE_uncompensated__VvsRHE,
             id_fit=0,
+            maximum_peak_number=maximum_peak_number,
+            savename="sfc icpms peakfitting",
+            n_starts=n_starts,
+            n_processes=n_processes,
+            time_budget__s=time_budget__s,
         )  # additional peaks @ 180 450 727
 
         (
@@ -2065,6 +2577,9 @@ def sfc_icpms_peakfitting(
                             ).set_index("id_exp_ec_dataset").to_sql(
                                 "exp_ec_datasets_definer", con=con, if_exists="append"
                             )
+                            db.notify_written(
+                                "exp_ec_datasets_definer", exp_ec.index.to_frame(), con=con
+                            )
 
                             # insert new id_exp_ec_dataset value into fitting dataframes
                             for df in [
@@ -2172,6 +2687,11 @@ def sfc_icpms_peakfitting(
                     df_ana_icpms_sfc_fitting_peaks.to_sql(
                         name="ana_icpms_sfc_fitting_peaks", con=con, if_exists="append"
                     )
+                    for name_table, df in [
+                        ("ana_icpms_sfc_fitting", df_ana_icpms_sfc_fitting),
+                        ("ana_icpms_sfc_fitting_peaks", df_ana_icpms_sfc_fitting_peaks),
+                    ]:
+                        db.notify_written(name_table, df, con=con)
                     print(
                         "\x1b[32m",
                         "Successfully inserted fit data",
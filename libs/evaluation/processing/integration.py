@@ -12,8 +12,8 @@ import warnings
 
 from ipywidgets import *
 from IPython.display import clear_output
-import scipy.integrate
 
+from evaluation.processing import integration_engine
 from evaluation.utils import db
 from evaluation.visualization import plot
 from evaluation.visualization import extra_widgets
@@ -305,6 +305,9 @@ class CreateDataset:
                     df_dataset_definer.to_sql(
                         self.name_table_dataset_definer, con=engine, if_exists="append"
                     )
+                    db.notify_written(
+                        self.name_table_dataset_definer, df_dataset_definer, con=engine
+                    )
 
                     print(
                         "\x1b[32m",
@@ -1801,17 +1804,10 @@ class Integrate:  # IntegrateContainer:
         self.active = True
         self.widget_fires_update = True
 
-        self.no_of_datapoints_rolling = (
-            200
-            if len(self.data_zoom.index) / 4 > 200
-            else int(len(self.data_zoom.index) / 4)
+        self.no_of_datapoints_rolling = integration_engine.default_no_of_datapoints_rolling(
+            len(self.data_zoom.index)
         )
-        self.no_of_datapoints_avg = 20
-
-        # dum y set left and right data to left and right edges
-        self.data_left = self.data.reset_index().iloc[:self.no_of_datapoints_rolling]
-        self.data_right = self.data.reset_index().iloc[-self.no_of_datapoints_rolling:]
-        # print(self.data_left.index)
+        self.no_of_datapoints_avg = integration_engine.NO_OF_DATAPOINTS_AVG
 
         self.auto_integration = False
         # calculating data_zoom is required if auto baseline detection fails,
@@ -2075,43 +2071,25 @@ class Integrate:  # IntegrateContainer:
         print("send to db", self.integrate_container.y_col)
         # con = db.connect(user='hte_integrater')
 
+        data = self.data.reset_index()
         df_ana_integration = pd.DataFrame(
-            {
-                "id_ana_integration": self.id_ana_integration,
-                "id_data_integration_baseline": self.data.reset_index()
-                .iloc[self.idx_baseline]
-                .loc[self.integrate_container.to_database_name_id_data],
-                "id_data_integration_begin": self.data.reset_index()
-                .iloc[self.idx_integrate_begin]
-                .loc[self.integrate_container.to_database_name_id_data],
-                "id_data_integration_end": self.data.reset_index()
-                .iloc[self.idx_integrate_end]
-                .loc[self.integrate_container.to_database_name_id_data],
-                "t_integration_baseline__timestamp": self.data.reset_index()
-                .iloc[self.idx_baseline]
-                .loc[self.integrate_container.to_database_name_timestamp],
-                "t_integration_begin__timestamp": self.data.reset_index()
-                .iloc[self.idx_integrate_begin]
-                .loc[self.integrate_container.to_database_name_timestamp],
-                "t_integration_end__timestamp": self.data.reset_index()
-                .iloc[self.idx_integrate_end]
-                .loc[self.integrate_container.to_database_name_timestamp],
-                "area_integrated_simps": self.area_integrated_simps,  # _simps
-                "area_integrated_trapz": self.area_integrated_trapz,
-                "y_offset": self.endavg_offset,
-                "no_of_datapoints_avg": self.no_of_datapoints_avg,
-                "no_of_datapoints_rolling": self.no_of_datapoints_rolling,
-                "auto_integration": self.auto_integration,
-            },
+            integration_engine.to_database_ana_integration(
+                id_data=data.loc[:, self.integrate_container.to_database_name_id_data],
+                timestamp=data.loc[:, self.integrate_container.to_database_name_timestamp],
+                integration={
+                    "idx_baseline": self.idx_baseline,
+                    "idx_integrate_begin": self.idx_integrate_begin,
+                    "idx_integrate_end": self.idx_integrate_end,
+                    "area_integrated_simps": self.area_integrated_simps,
+                    "area_integrated_trapz": self.area_integrated_trapz,
+                    "endavg_offset": self.endavg_offset,
+                },
+                no_of_datapoints_avg=self.no_of_datapoints_avg,
+                no_of_datapoints_rolling=self.no_of_datapoints_rolling,
+                auto_integration=self.auto_integration,
+            ),
             index=[0],
-        ).set_index("id_ana_integration")
-        # display(df_ana_integration)
-
-        if df_ana_integration.drop(columns=["y_offset"]).iloc[0].isna().any():
-            display(df_ana_integration)
-            raise ValueError(
-                "Not allowed NULL values found in df_ana_integration. Please report to Admin"
-            )
+        ).assign(id_ana_integration=self.id_ana_integration)
 
         if self.integrate_container.to_database_table == "exp_ec_integration":
             df_exp_integration = pd.DataFrame(
@@ -2128,7 +2106,6 @@ class Integrate:  # IntegrateContainer:
                 },
                 index=[0],
             )
-            index_insert = ["id_exp_ec_dataset", "name_analysis"]
             index_update = ["id_exp_ec_dataset", "id_ana_integration"]
         elif self.integrate_container.to_database_table == "exp_icpms_integration":
             df_exp_integration = pd.DataFrame(
@@ -2144,13 +2121,6 @@ class Integrate:  # IntegrateContainer:
                 },
                 index=[0],
             )
-            index_insert = [
-                "id_exp_icpms",
-                "name_isotope_analyte",
-                "name_isotope_internalstandard",
-                "name_analysis",
-                "id_exp_ec_dataset",
-            ]
             index_update = [
                 "id_exp_icpms",
                 "name_isotope_analyte",
@@ -2169,37 +2139,14 @@ class Integrate:  # IntegrateContainer:
         if self.id_ana_integration is None:
             # insert
             print("Insert new integration analysis...")
-            # insert without id_ana_integration
-            df_exp_integration = df_exp_integration.set_index(index_insert)
-            df_exp_integration.to_sql(
-                self.integrate_container.to_database_table,
-                con=con,  # cursor,#self.integrate_container.con,
-                if_exists="append",
-            )
-
-            # display(df_ana_integration)
-            df_ana_integration = (
-                db.insert_into(
-                    conn=con,  # cursor,#self.integrate_container.con,
-                    tb_name="ana_integrations",
-                    df=df_ana_integration,
-                )
-                .reset_index(drop=True)
-                .rename(columns={"inserted_primary_key": "id_ana_integration"})
-                .set_index("id_ana_integration")
-            )
-            self.id_ana_integration = df_ana_integration.index[0]
-            # display(df_exp_integration)
-            # update without id_ana_integratio
-            df_exp_integration.id_ana_integration = self.id_ana_integration
-            db.sql_update(
-                df_update=df_exp_integration,
-                table_name=self.integrate_container.to_database_table,
-                # engine=self.integrate_container.con,
-                # cursor=cursor,
+            df_ana_integration = integration_engine.to_database(
+                df_ana_integration=df_ana_integration,
+                df_exp_integration=df_exp_integration.drop(columns=["id_ana_integration"]),
+                to_database_table=self.integrate_container.to_database_table,
                 con=con,
+                check_username=False,  # already checked by database_constraint_username
             )
-            # display(df_ana_integration)
+            self.id_ana_integration = int(df_ana_integration.id_ana_integration.iloc[0])
 
             # display(self.exp.index)
             self.integrate_container.df_integrate_names_analysis = pd.concat(
@@ -2247,13 +2194,6 @@ class Integrate:  # IntegrateContainer:
             #                                       self.integrate_container.parent_integrate_container.active()
             #                                       .exp_row.id_exp_ec_dataset)
             # display(self.integrate_container.df_integrate_names_analysis)
-
-            print(
-                "\x1b[32m",
-                "Successfully prepared data for insert into database of analysis",
-                self.integrate_container.name_analysis_text.value,
-                "\x1b[0m",
-            )
         else:
             print("Update existing integration analysis...")
             df_exp_integration = df_exp_integration.set_index(index_update)
@@ -2274,18 +2214,12 @@ class Integrate:  # IntegrateContainer:
                 self.exp_index, "name_analysis_init"
             ] = self.integrate_container.name_analysis_text.value
 
-            db.sql_update(
-                df_update=df_ana_integration,
-                table_name="ana_integrations",
-                # engine=self.integrate_container.con,
-                # cursor=cursor,
+            integration_engine.to_database(
+                df_ana_integration=df_ana_integration,
+                df_exp_integration=df_exp_integration,
+                to_database_table=self.integrate_container.to_database_table,
                 con=con,
-            )
-            print(
-                "\x1b[32m",
-                "Successfully prepared data for update database entry of analysis",
-                self.integrate_container.name_analysis_text.value,
-                "\x1b[0m",
+                check_username=False,  # already checked by database_constraint_username
             )
 
         # print("\x1b[32m", 'Successfully updated', self.name_analysis_text.value, "\x1b[0m")
@@ -2370,156 +2304,21 @@ class Integrate:  # IntegrateContainer:
 
     def update_baseline(self):
         with self.integrate_container.output_integration:
-            self.data.loc[:, self.integrate_container.y_col_std] = (
-                self.data.loc[:, self.integrate_container.y_col]
-                .rolling(self.no_of_datapoints_rolling, center=True)
-                .std()
-            )
-            self.data.loc[:, self.integrate_container.y_col_1stderiv] = (
-                self.data.loc[:, self.integrate_container.y_col]
-                .rolling(self.no_of_datapoints_rolling, center=True)
-                .mean()
-                .diff()
-                .rolling(self.no_of_datapoints_rolling, center=True)
-                .mean()
-                .abs()
-            )
-            self.data.loc[:, self.integrate_container.y_col_2ndderiv] = (
-                self.data.loc[:, self.integrate_container.y_col]
-                .rolling(self.no_of_datapoints_rolling, center=True)
-                .mean()
-                .diff()
-                .rolling(self.no_of_datapoints_rolling, center=True)
-                .mean()
-                .diff()
-                .rolling(self.no_of_datapoints_rolling, center=True)
-                .mean()
-                .abs()
-            )
-
-            cut_peakdata_factor_of_max = 0.1
-            try:
-                self.data_left = self.data.reset_index().loc[
-                    (
-                        (self.data.index.isin(self.data_zoom.index))
-                        & (
-                            self.data.index
-                            < self.data_zoom.loc[
-                                :, self.integrate_container.y_col
-                            ].idxmax()
-                        )
-                    ),
-                    :,
-                ]
-                if (
-                    self.data_left.loc[:, self.integrate_container.y_col_std]
-                    .isna()
-                    .all()
-                ):
-                    raise ValueError(
-                        "no_datapoints_rolling too large for that small selected window"
-                    )
-                self.idx_baseline = (
-                    self.data_left.loc[
-                        self.data_left.loc[:, self.integrate_container.y_col]
-                        < self.data_left.loc[:, self.integrate_container.y_col].max()
-                        * cut_peakdata_factor_of_max,
-                        self.integrate_container.y_col_1stderiv,
-                    ].fillna(0)
-                    + self.data_left.loc[
-                        self.data_left.loc[:, self.integrate_container.y_col]
-                        < self.data_left.loc[:, self.integrate_container.y_col].max()
-                        * cut_peakdata_factor_of_max,
-                        self.integrate_container.y_col_2ndderiv,
-                    ].fillna(0)
-                    + self.data_left.loc[
-                        self.data_left.loc[:, self.integrate_container.y_col]
-                        < self.data_left.loc[:, self.integrate_container.y_col].max()
-                        * cut_peakdata_factor_of_max,
-                        self.integrate_container.y_col_std,
-                    ].fillna(0)
-                ).idxmin()
-            except ValueError:
-                # if np.isnan(self.idx_baseline):
-                # warnings.warn('No baseline detected\n Please inform Admin!')
-                self.idx_baseline = (
-                    self.data_left.loc[
-                        ~self.data_left.loc[:, self.integrate_container.y_col].isna(), :
-                    ]
-                    .iloc[0]
-                    .name
-                )
-                print(
-                    "\x1b[33m",
-                    "No baseline detected. Please inform Admin!",
-                    "Instead using:",
-                    self.idx_baseline,
-                    "\x1b[0m",
-                )
-
-            try:
-                self.data_right = self.data.reset_index().loc[
-                    (
-                        (self.data.index.isin(self.data_zoom.index))
-                        & (
-                            self.data.index
-                            > self.data_zoom.loc[
-                                :, self.integrate_container.y_col
-                            ].idxmax()
-                        )
-                    ),
-                    :,
-                ]
-                if (
-                    self.data_right.loc[:, self.integrate_container.y_col_std]
-                    .isna()
-                    .all()
-                ):
-                    raise ValueError(
-                        "no_datapoints_rolling too large for that small selected window"
-                    )
-                self.idx_integrate_end = (
-                    self.data_right.loc[
-                        self.data_right.loc[:, self.integrate_container.y_col]
-                        < self.data_right.loc[:, self.integrate_container.y_col].max()
-                        * cut_peakdata_factor_of_max,
-                        self.integrate_container.y_col_1stderiv,
-                    ].fillna(0)
-                    + self.data_right.loc[
-                        self.data_right.loc[:, self.integrate_container.y_col]
-                        < self.data_right.loc[:, self.integrate_container.y_col].max()
-                        * cut_peakdata_factor_of_max,
-                        self.integrate_container.y_col_2ndderiv,
-                    ].fillna(0)
-                    + self.data_right.loc[
-                        self.data_right.loc[:, self.integrate_container.y_col]
-                        < self.data_right.loc[:, self.integrate_container.y_col].max()
-                        * cut_peakdata_factor_of_max,
-                        self.integrate_container.y_col_std,
-                    ].fillna(0)
-                ).idxmin()
-            except ValueError:
-                # print('integrate_end', self.idx_integrate_end)
-                # if np.isnan(self.idx_integrate_end):
-                # warnings.warn('No end detected\n Please inform Admin!')
-                self.idx_integrate_end = (
-                    self.data_right.loc[
-                        ~self.data_right.loc[:, self.integrate_container.y_col].isna(),
-                        :,
-                    ]
-                    .iloc[-1]
-                    .name
-                )
-                print(
-                    "\x1b[33m",
-                    "No end detected. Please inform Admin!",
-                    "Instead using:",
-                    self.idx_integrate_end,
-                    "\x1b[0m",
-                )
-
-            # display(self.data_right)
-            self.idx_integrate_begin = self.idx_baseline
+            integration = integration_engine.update_baseline(
+                self.data.loc[:, self.integrate_container.y_col],
+                self.no_of_datapoints_rolling,
+                zoom=self.data.index.isin(self.data_zoom.index),
+            )
+            self.data.loc[:, self.integrate_container.y_col_std] = integration["y_std"]
+            self.data.loc[:, self.integrate_container.y_col_1stderiv] = integration[
+                "y_1stderiv"
+            ]
+            self.data.loc[:, self.integrate_container.y_col_2ndderiv] = integration[
+                "y_2ndderiv"
+            ]
+            self.idx_baseline = integration["idx_baseline"]
+            self.idx_integrate_end = integration["idx_integrate_end"]
+            self.idx_integrate_begin = integration["idx_integrate_begin"]
 
     def update_integration_data(self):
         with self.integrate_container.output_integration:
@@ -2533,165 +2332,52 @@ class Integrate:  # IntegrateContainer:
                 print(
                     "\x1b[35m" + "Integration parameter manually adjusted" + "\x1b[0m"
                 )
-            #    clear_output()
-            # print('ll', self.idx_integrate_begin, self.idx_integrate_end)
-            self.idx_fitted = self.data.iloc[
-                self.idx_integrate_begin : self.idx_integrate_end + 1
-            ].index
-            self.endavg_offset = None
-
-            print(
-                "integration limits: ",
-                self.data.loc[:, self.integrate_container.x_col].iloc[
-                    self.idx_integrate_begin
-                ],
-                self.integrate_container.x_col.split("__")[-1],
-                self.data.loc[:, self.integrate_container.x_col].iloc[
-                    self.idx_integrate_end
-                ],
-                self.integrate_container.x_col.split("__")[-1],
-            )
-
-            # baseline derivation, y_col_baselineavg
-            if (
+            set_baseline_avg = (
                 "auto" in self.integrate_container.set_baseline
                 or "manual" in self.integrate_container.set_baseline
-            ):
-                self.data.loc[:, self.integrate_container.y_col_baselineavg] = np.nan
-                """
-                if 'fixed' in self.integrate_container.set_baseline:
-                    self.idx_baseline_datapoints = slice(self.idx_baseline, self.idx_baseline+1)
-                    #print(self.data.iloc[self.idx_baseline_datapoints].index, self.data.columns)
-                    self.data.loc[self.data.iloc[self.idx_baseline_datapoints].index,
-                                  self.integrate_container.y_col_baselineavg] 
-                                  = self.data.iloc[self.idx_baseline_datapoints].loc[:, self.integrate_container.y2_col]
-
-                else:
-                """
-                self.idx_baseline_datapoints = slice(
-                    int(self.idx_baseline - (self.no_of_datapoints_avg / 2))
-                    if (
-                        int(self.idx_baseline - (self.no_of_datapoints_avg / 2))
-                        > self.idx_integrate_min
-                    )
-                    # if self.idx_baseline > (self.no_of_datapoints_avg / 2)
-                    else self.idx_integrate_min,  # 0,
-                    int(self.idx_baseline + (self.no_of_datapoints_avg / 2)),
-                )
-                # (self.idx_baseline_datapoints)
-                self.data.loc[
-                    self.data.iloc[self.idx_baseline_datapoints].index,
-                    self.integrate_container.y_col_baselineavg,
-                ] = self.data.iloc[self.idx_baseline_datapoints].loc[
-                    :, self.integrate_container.y_col
-                ]
-
-                self.baselineavg = (
-                    self.data.iloc[self.idx_baseline_datapoints]
-                    .loc[:, self.integrate_container.y_col_baselineavg]
-                    .mean()
-                )
-                if np.isnan(self.baselineavg):
-                    print(
-                        "\x1b[31m",
-                        "Baseline y-value is nan, possibly an error in calculation. "
-                        "Baseline is set to 0. Please inform Admin.",
-                        "\x1b[0m",
-                    )
-                    self.baselineavg = 0
-
-                # end derivation, integrate_container
-                self.idx_integrate_end_datapoints = slice(
-                    int(self.idx_integrate_end - (self.no_of_datapoints_avg / 2)),
-                    int(self.idx_integrate_end + (self.no_of_datapoints_avg / 2)) + 1
-                    if (
-                        int(self.idx_integrate_end + (self.no_of_datapoints_avg / 2))
-                        + 1
-                        < self.idx_integrate_max + 1
-                    )
-                    else self.idx_integrate_max + 1,
-                )
-                self.data.loc[:, self.integrate_container.y_col_endavg] = np.nan
-                self.data.loc[
-                    self.data.iloc[self.idx_integrate_end_datapoints].index,
-                    self.integrate_container.y_col_endavg,
-                ] = self.data.iloc[self.idx_integrate_end_datapoints].loc[
-                    :, self.integrate_container.y_col
-                ]
-                self.endavg = (
-                    self.data.iloc[self.idx_integrate_end_datapoints]
-                    .loc[:, self.integrate_container.y_col_endavg]
-                    .mean()
-                )
-                if np.isnan(self.endavg):
-                    print(
-                        "\x1b[31m",
-                        "End y-value is nan, possibly an error in calculation. "
-                        "End y-value is set to 0. Please inform Admin.",
-                        "\x1b[0m",
-                    )
-                    self.endavg = 0
-
-                self.endavg_offset = self.endavg - self.baselineavg
-
-                print(
-                    "baseline:",
-                    self.baselineavg,
-                    self.integrate_container.y_col.split("__")[-1],
-                )
-                # print('end:', self.endavg, self.integrate_container.y_col.split('__')[-1])
-                # self.beginavg_offset = self.endavg - self.baselineavg
-                # print('offset begin:', self.endavg_offset, self.integrate_container.y_col.split('__')[-1])#, 'ng_s')
-                print(
-                    "offset end:",
-                    self.endavg_offset,
-                    self.integrate_container.y_col.split("__")[-1],
-                )  # , 'ng_s')
-
-                # baseline
-                # self.idx_fitted = self.data.iloc[self.idx_integrate_begin:self.idx_integrate_end+1].index
-                self.data.loc[:, self.integrate_container.y2_col] = np.nan
-                self.data.loc[
-                    self.idx_fitted, self.integrate_container.y2_col
-                ] = self.baselineavg
-
-            if (
-                self.data.loc[self.idx_fitted, self.integrate_container.y_col]
-                .isna()
-                .any()
-            ):
-                print(
-                    "\x1b[33m",
-                    "There are nan values in your data. This is not possible to integrate.",
-                    "\x1b[0m",
-                )
-
-            # integrate
-            self.area_integrated_simps = scipy.integrate.simps(
-                y=self.data.loc[self.idx_fitted, self.integrate_container.y_col]
-                - self.data.loc[self.idx_fitted, self.integrate_container.y2_col],  #
-                x=self.data.loc[self.idx_fitted, self.integrate_container.x_col],
-            )
-            self.area_integrated_trapz = np.trapz(
-                y=self.data.loc[self.idx_fitted, self.integrate_container.y_col]
-                - self.data.loc[self.idx_fitted, self.integrate_container.y2_col],  #
-                x=self.data.loc[self.idx_fitted, self.integrate_container.x_col],
             )
-
-            print("integrated area (simps):", self.area_integrated_simps)  # , 'ng')
-            print("integrated area (trapz):", self.area_integrated_trapz)  # , 'ng')
-
-            # quality indicator
-            if (
-                self.area_integrated_simps / self.area_integrated_trapz < 0.95
-                or self.area_integrated_simps / self.area_integrated_trapz > 1.05
-            ):
-                print(
-                    "\x1b[33m",
-                    "Significant deviation between trapezoidal and integration following Simpson's rule.\n",
-                    "Be aware of which result your are going to use for analysis. Both values stored in database.",
-                    "\x1b[0m",
-                )
+            integration = integration_engine.update_integration_data(
+                x=self.data.loc[:, self.integrate_container.x_col],
+                y=self.data.loc[:, self.integrate_container.y_col],
+                idx_baseline=self.idx_baseline,
+                idx_integrate_begin=self.idx_integrate_begin,
+                idx_integrate_end=self.idx_integrate_end,
+                no_of_datapoints_avg=self.no_of_datapoints_avg,
+                idx_integrate_min=self.idx_integrate_min,
+                idx_integrate_max=self.idx_integrate_max,
+                y2=None
+                if set_baseline_avg
+                else self.data.loc[:, self.integrate_container.y2_col],
+            )
+            self.idx_fitted = self.data.iloc[integration["idx_fitted"]].index
+            self.endavg_offset = integration["endavg_offset"]
+            self.area_integrated_simps = integration["area_integrated_simps"]
+            self.area_integrated_trapz = integration["area_integrated_trapz"]
+
+            if set_baseline_avg:
+                self.idx_baseline_datapoints = integration["idx_baseline_datapoints"]
+                self.idx_integrate_end_datapoints = integration[
+                    "idx_integrate_end_datapoints"
+                ]
+                self.baselineavg = integration["baselineavg"]
+                self.endavg = integration["endavg"]
+                for y_col_avg, idx_datapoints in [
+                    (
+                        self.integrate_container.y_col_baselineavg,
+                        self.idx_baseline_datapoints,
+                    ),
+                    (
+                        self.integrate_container.y_col_endavg,
+                        self.idx_integrate_end_datapoints,
+                    ),
+                ]:
+                    self.data.loc[:, y_col_avg] = np.nan
+                    self.data.loc[
+                        self.data.iloc[idx_datapoints].index, y_col_avg
+                    ] = self.data.iloc[idx_datapoints].loc[
+                        :, self.integrate_container.y_col
+                    ]
+                self.data.loc[:, self.integrate_container.y2_col] = integration["y2"]
 
     def update_integration_plot(self):
         self.plot_y2.set_data(
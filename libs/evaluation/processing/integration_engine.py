@@ -0,0 +1,625 @@
+"""
+Scripts for the integration of EC and ICP-MS peaks on plain arrays, without widgets and plots. Used by the
+interactive evaluation.processing.integration.Integrate and for re-integrating many experiments at once via
+integrate_batch() and to_database().
+Positional indices (idx_*) refer to the position in the arrays, as the sliders of the interactive integration.
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.integrate
+from numpy.lib.stride_tricks import sliding_window_view
+
+from evaluation.utils import db, tools
+
+# maximum number of datapoints of the rolling window for auto baseline detection, limited to 1/4 of the datapoints
+NO_OF_DATAPOINTS_ROLLING_MAX = 200
+# number of datapoints averaged to derive baseline and end value
+NO_OF_DATAPOINTS_AVG = 20
+# baseline and end are searched only for datapoints below this factor times the maximum left or right of the peak
+CUT_PEAKDATA_FACTOR_OF_MAX = 0.1
+# relative deviation between Simpson's rule and trapezoidal integration above which a warning is printed
+MAX_DEVIATION_SIMPS_TRAPZ = 0.05
+# columns of ana_integrations, as written by to_database()
+ANA_INTEGRATIONS_COLUMNS = [
+    "id_data_integration_baseline",
+    "id_data_integration_begin",
+    "id_data_integration_end",
+    "t_integration_baseline__timestamp",
+    "t_integration_begin__timestamp",
+    "t_integration_end__timestamp",
+    "area_integrated_simps",
+    "area_integrated_trapz",
+    "y_offset",
+    "no_of_datapoints_avg",
+    "no_of_datapoints_rolling",
+    "auto_integration",
+]
+
+
+def default_no_of_datapoints_rolling(n_datapoints):
+    """
+    Default size of the rolling window for auto baseline detection as used by integration.Integrate
+    :param n_datapoints: int
+        number of datapoints in the integration window
+    :return: int
+    """
+    return (
+        NO_OF_DATAPOINTS_ROLLING_MAX
+        if n_datapoints / 4 > NO_OF_DATAPOINTS_ROLLING_MAX
+        else int(n_datapoints / 4)
+    )
+
+
+def rolling(y, window, method="mean"):
+    """
+    Centered rolling mean or standard deviation, equal to pd.Series(y).rolling(window, center=True).mean() or .std().
+    Windows not completely within the data or containing nan result in nan.
+    :param y: np.array
+    :param window: int
+        number of datapoints of the rolling window
+    :param method: one of ['mean', 'std']
+    :return: np.array of same length as y
+    """
+    y = np.asarray(y, dtype=float)
+    y_rolled = np.full(len(y), np.nan)
+    if window < 1 or window > len(y):
+        return y_rolled
+    windows = sliding_window_view(y, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if method == "mean":
+            values = windows.mean(axis=1)
+        elif method == "std":
+            values = windows.std(axis=1, ddof=1) if window > 1 else np.full(len(windows), np.nan)
+        else:
+            raise NotImplementedError("Method not implemented")
+    y_rolled[window // 2 : window // 2 + len(values)] = values
+    return y_rolled
+
+
+def _diff(y):
+    """
+    First discrete difference with nan as first value, equal to pd.Series(y).diff()
+    :param y: np.array
+    :return: np.array of same length as y
+    """
+    return np.concatenate(([np.nan], np.diff(y)))
+
+
+def baseline_features(y, no_of_datapoints_rolling):
+    """
+    Smoothed features of the curve used for the auto detection of baseline and end of the peak
+    :param y: np.array
+        y-data
+    :param no_of_datapoints_rolling: int
+        number of datapoints of the rolling window
+    :return: y_std, y_1stderiv, y_2ndderiv
+        rolling standard deviation and absolute value of the smoothed first and second derivative
+    """
+    y_smoothed = rolling(y, no_of_datapoints_rolling)
+    y_1stderiv = rolling(_diff(y_smoothed), no_of_datapoints_rolling)
+    y_2ndderiv = rolling(_diff(y_1stderiv), no_of_datapoints_rolling)
+    return (
+        rolling(y, no_of_datapoints_rolling, method="std"),
+        np.abs(y_1stderiv),
+        np.abs(y_2ndderiv),
+    )
+
+
+def _find_flattest(y, features, selected):
+    """
+    Position of the flattest datapoint among the selected ones which are below CUT_PEAKDATA_FACTOR_OF_MAX
+    times the maximum of the selected datapoints
+    :param y: np.array
+        y-data
+    :param features: tuple of np.array
+        see baseline_features()
+    :param selected: np.array of bool
+    :return: int
+    """
+    if np.isnan(features[0][selected]).all():
+        raise ValueError("no_datapoints_rolling too large for that small selected window")
+    positions = np.flatnonzero(selected)
+    positions = positions[y[positions] < np.nanmax(y[positions]) * CUT_PEAKDATA_FACTOR_OF_MAX]
+    if len(positions) == 0:
+        raise ValueError("No datapoints below cut off")
+    return positions[np.argmin(np.sum([np.nan_to_num(feature[positions]) for feature in features], axis=0))]
+
+
+def update_baseline(y, no_of_datapoints_rolling=None, zoom=None, verbose=True):
+    """
+    Auto detection of baseline and end of a peak. Left and right of the maximum of y within the zoomed window,
+    the datapoint with minimum sum of rolling standard deviation and absolute smoothed first and second derivative
+    is chosen, considering only datapoints below CUT_PEAKDATA_FACTOR_OF_MAX times the maximum on that side.
+    If detection fails, the first (baseline) or last (end) datapoint on that side is used.
+    :param y: np.array or pd.Series
+        y-data sorted by the data index
+    :param no_of_datapoints_rolling: int or None, optional, Default None
+        number of datapoints of the rolling window, if None see default_no_of_datapoints_rolling()
+    :param zoom: np.array of bool or None, optional, Default None
+        datapoints within the integration window, if None all datapoints
+    :param verbose: bool, optional, Default True
+        print a warning if detection fails
+    :return: dict with idx_baseline, idx_integrate_begin, idx_integrate_end, no_of_datapoints_rolling,
+        y_std, y_1stderiv, y_2ndderiv
+    """
+    y = np.asarray(y, dtype=float)
+    positions = np.arange(len(y))
+    zoom = np.ones(len(y), dtype=bool) if zoom is None else np.asarray(zoom, dtype=bool)
+    if no_of_datapoints_rolling is None:
+        no_of_datapoints_rolling = default_no_of_datapoints_rolling(zoom.sum())
+    features = baseline_features(y, no_of_datapoints_rolling)
+
+    zoom_valid = zoom & ~np.isnan(y)
+    if zoom_valid.any():
+        idx_max = positions[zoom_valid][np.argmax(y[zoom_valid])]
+        selected_left = zoom & (positions < idx_max)
+        selected_right = zoom & (positions > idx_max)
+    else:
+        selected_left = positions < no_of_datapoints_rolling
+        selected_right = positions >= len(y) - no_of_datapoints_rolling
+
+    integration = {"no_of_datapoints_rolling": no_of_datapoints_rolling}
+    for name_idx, selected, fallback, name_point in [
+        ("idx_baseline", selected_left, 0, "baseline"),
+        ("idx_integrate_end", selected_right, -1, "end"),
+    ]:
+        try:
+            integration[name_idx] = int(_find_flattest(y, features, selected))
+        except ValueError:
+            integration[name_idx] = int(np.flatnonzero(selected & ~np.isnan(y))[fallback])
+            if verbose:
+                print(
+                    "\x1b[33m",
+                    "No %s detected. Please inform Admin!" % name_point,
+                    "Instead using:",
+                    integration[name_idx],
+                    "\x1b[0m",
+                )
+    integration["idx_integrate_begin"] = integration["idx_baseline"]
+    integration["y_std"], integration["y_1stderiv"], integration["y_2ndderiv"] = features
+    return integration
+
+
+def update_integration_data(
+    x,
+    y,
+    idx_baseline,
+    idx_integrate_begin,
+    idx_integrate_end,
+    no_of_datapoints_avg=NO_OF_DATAPOINTS_AVG,
+    idx_integrate_min=0,
+    idx_integrate_max=None,
+    y2=None,
+    verbose=True,
+):
+    """
+    Integrate y between idx_integrate_begin and idx_integrate_end (both included) by Simpson's rule and
+    trapezoidal rule. The baseline is the average of no_of_datapoints_avg datapoints around idx_baseline, the offset
+    is the difference of the average of no_of_datapoints_avg datapoints around idx_integrate_end to the baseline.
+    :param x: np.array or pd.Series
+        x-data
+    :param y: np.array or pd.Series
+        y-data
+    :param idx_baseline: int
+        position of the baseline point
+    :param idx_integrate_begin: int
+        position of the beginning of the integration
+    :param idx_integrate_end: int
+        position of the end of the integration
+    :param no_of_datapoints_avg: int, optional, Default NO_OF_DATAPOINTS_AVG
+        number of datapoints averaged for baseline and end value
+    :param idx_integrate_min: int, optional, Default 0
+        first position of the integration window, limits the baseline average
+    :param idx_integrate_max: int or None, optional, Default None
+        last position of the integration window, limits the end average, if None the last datapoint
+    :param y2: np.array or pd.Series or None, optional, Default None
+        fixed baseline (set_baseline='fixed'), if None baseline is derived from the baseline average
+    :param verbose: bool, optional, Default True
+        print integration results and warnings
+    :return: dict with area_integrated_simps, area_integrated_trapz, baselineavg, endavg, endavg_offset,
+        idx_baseline_datapoints, idx_integrate_end_datapoints, idx_fitted (all slices), and y2 (np.array)
+    """
+    # units for printing derived from column names of pd.Series
+    x_unit = str(getattr(x, "name", None) or "").split("__")[-1]
+    y_unit = str(getattr(y, "name", None) or "").split("__")[-1]
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if idx_integrate_max is None:
+        idx_integrate_max = len(y) - 1
+    integration = {
+        "idx_fitted": slice(idx_integrate_begin, idx_integrate_end + 1),
+        "idx_baseline_datapoints": None,
+        "idx_integrate_end_datapoints": None,
+        "baselineavg": None,
+        "endavg": None,
+        "endavg_offset": None,
+    }
+    if verbose:
+        print("integration limits: ", x[idx_integrate_begin], x_unit, x[idx_integrate_end], x_unit)
+
+    if y2 is None:
+        integration["idx_baseline_datapoints"] = slice(
+            max(int(idx_baseline - (no_of_datapoints_avg / 2)), idx_integrate_min),
+            int(idx_baseline + (no_of_datapoints_avg / 2)),
+        )
+        integration["idx_integrate_end_datapoints"] = slice(
+            int(idx_integrate_end - (no_of_datapoints_avg / 2)),
+            min(int(idx_integrate_end + (no_of_datapoints_avg / 2)) + 1, idx_integrate_max + 1),
+        )
+        for name_avg, name_slice, name_point in [
+            ("baselineavg", "idx_baseline_datapoints", "Baseline"),
+            ("endavg", "idx_integrate_end_datapoints", "End"),
+        ]:
+            y_avg = y[integration[name_slice]]
+            integration[name_avg] = np.nanmean(y_avg) if (~np.isnan(y_avg)).any() else np.nan
+            if np.isnan(integration[name_avg]):
+                print(
+                    "\x1b[31m",
+                    "%s y-value is nan, possibly an error in calculation. "
+                    "%s y-value is set to 0. Please inform Admin." % (name_point, name_point),
+                    "\x1b[0m",
+                )
+                integration[name_avg] = 0
+        integration["endavg_offset"] = integration["endavg"] - integration["baselineavg"]
+        if verbose:
+            print("baseline:", integration["baselineavg"], y_unit)
+            print("offset end:", integration["endavg_offset"], y_unit)
+
+        y2 = np.full(len(y), np.nan)
+        y2[integration["idx_fitted"]] = integration["baselineavg"]
+    integration["y2"] = np.asarray(y2, dtype=float)
+
+    y_fitted = y[integration["idx_fitted"]] - integration["y2"][integration["idx_fitted"]]
+    x_fitted = x[integration["idx_fitted"]]
+    if np.isnan(y[integration["idx_fitted"]]).any() and verbose:
+        print(
+            "\x1b[33m",
+            "There are nan values in your data. This is not possible to integrate.",
+            "\x1b[0m",
+        )
+    integration["area_integrated_simps"] = scipy.integrate.simps(y=y_fitted, x=x_fitted)
+    integration["area_integrated_trapz"] = np.trapz(y=y_fitted, x=x_fitted)
+
+    if verbose:
+        print("integrated area (simps):", integration["area_integrated_simps"])
+        print("integrated area (trapz):", integration["area_integrated_trapz"])
+        # quality indicator
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = integration["area_integrated_simps"] / integration["area_integrated_trapz"]
+        if ratio < 1 - MAX_DEVIATION_SIMPS_TRAPZ or ratio > 1 + MAX_DEVIATION_SIMPS_TRAPZ:
+            print(
+                "\x1b[33m",
+                "Significant deviation between trapezoidal and integration following Simpson's rule.\n",
+                "Be aware of which result your are going to use for analysis. Both values stored in database.",
+                "\x1b[0m",
+            )
+    return integration
+
+
+def to_database_ana_integration(
+    id_data,
+    timestamp,
+    integration,
+    no_of_datapoints_avg,
+    no_of_datapoints_rolling,
+    auto_integration,
+):
+    """
+    Derive the values of a row in ana_integrations from the results of update_baseline/update_integration_data
+    :param id_data: np.array or pd.Series
+        id_data_icpms (ICP-MS) or id_data of the dataset (EC) of each datapoint
+    :param timestamp: np.array or pd.Series
+        timestamp of each datapoint
+    :param integration: dict
+        with idx_baseline, idx_integrate_begin, idx_integrate_end, area_integrated_simps, area_integrated_trapz,
+        endavg_offset
+    :param no_of_datapoints_avg: int
+    :param no_of_datapoints_rolling: int
+    :param auto_integration: bool
+        whether integration points are derived by update_baseline() or manually adjusted
+    :return: dict with ANA_INTEGRATIONS_COLUMNS as keys
+    """
+    id_data = np.asarray(id_data)
+    timestamp = pd.Series(timestamp).reset_index(drop=True)
+    return {
+        "id_data_integration_baseline": id_data[integration["idx_baseline"]],
+        "id_data_integration_begin": id_data[integration["idx_integrate_begin"]],
+        "id_data_integration_end": id_data[integration["idx_integrate_end"]],
+        "t_integration_baseline__timestamp": timestamp.iloc[integration["idx_baseline"]],
+        "t_integration_begin__timestamp": timestamp.iloc[integration["idx_integrate_begin"]],
+        "t_integration_end__timestamp": timestamp.iloc[integration["idx_integrate_end"]],
+        "area_integrated_simps": integration["area_integrated_simps"],
+        "area_integrated_trapz": integration["area_integrated_trapz"],
+        "y_offset": integration["endavg_offset"],
+        "no_of_datapoints_avg": no_of_datapoints_avg,
+        "no_of_datapoints_rolling": no_of_datapoints_rolling,
+        "auto_integration": auto_integration,
+    }
+
+
+def integrate(
+    x,
+    y,
+    id_data,
+    timestamp,
+    zoom=None,
+    no_of_datapoints_rolling=None,
+    no_of_datapoints_avg=NO_OF_DATAPOINTS_AVG,
+    idx_baseline=None,
+    idx_integrate_begin=None,
+    idx_integrate_end=None,
+    y2=None,
+    verbose=False,
+):
+    """
+    Integrate a single experiment. Integration points not given are derived by update_baseline().
+    :param x: np.array or pd.Series
+        x-data, sorted by the data index
+    :param y: np.array or pd.Series
+        y-data
+    :param id_data: np.array or pd.Series
+        id_data_icpms (ICP-MS) or id_data of the dataset (EC) of each datapoint
+    :param timestamp: np.array or pd.Series
+        timestamp of each datapoint
+    :param zoom: np.array of bool or None, optional, Default None
+        datapoints within the integration window, if None all datapoints
+    :param no_of_datapoints_rolling: int or None, optional, Default None
+        see update_baseline()
+    :param no_of_datapoints_avg: int, optional, Default NO_OF_DATAPOINTS_AVG
+        see update_integration_data()
+    :param idx_baseline: int or None, optional, Default None
+        manual position of the baseline point
+    :param idx_integrate_begin: int or None, optional, Default None
+        manual position of the beginning of the integration, if None idx_baseline
+    :param idx_integrate_end: int or None, optional, Default None
+        manual position of the end of the integration
+    :param y2: np.array or pd.Series or None, optional, Default None
+        fixed baseline, see update_integration_data()
+    :param verbose: bool, optional, Default False
+        print integration results and warnings
+    :return: dict with ANA_INTEGRATIONS_COLUMNS as keys
+    """
+    zoom = np.ones(len(y), dtype=bool) if zoom is None else np.asarray(zoom, dtype=bool)
+    if no_of_datapoints_rolling is None:
+        no_of_datapoints_rolling = default_no_of_datapoints_rolling(zoom.sum())
+    auto_integration = idx_baseline is None or idx_integrate_end is None
+    integration = (
+        update_baseline(y, no_of_datapoints_rolling, zoom=zoom, verbose=verbose)
+        if auto_integration
+        else {}
+    )
+    if idx_baseline is not None:
+        integration["idx_baseline"] = idx_baseline
+        integration["idx_integrate_begin"] = idx_baseline
+    if idx_integrate_begin is not None:
+        integration["idx_integrate_begin"] = idx_integrate_begin
+    if idx_integrate_end is not None:
+        integration["idx_integrate_end"] = idx_integrate_end
+    auto_integration = auto_integration and idx_integrate_begin is None
+
+    positions_zoom = np.flatnonzero(zoom)
+    integration.update(
+        update_integration_data(
+            x,
+            y,
+            integration["idx_baseline"],
+            integration["idx_integrate_begin"],
+            integration["idx_integrate_end"],
+            no_of_datapoints_avg=no_of_datapoints_avg,
+            idx_integrate_min=positions_zoom.min() if len(positions_zoom) > 0 else 0,
+            idx_integrate_max=positions_zoom.max() if len(positions_zoom) > 0 else None,
+            y2=y2,
+            verbose=verbose,
+        )
+    )
+    return to_database_ana_integration(
+        id_data,
+        timestamp,
+        integration,
+        no_of_datapoints_avg=no_of_datapoints_avg,
+        no_of_datapoints_rolling=no_of_datapoints_rolling,
+        auto_integration=auto_integration,
+    )
+
+
+def integrate_batch(kwargs_integrations, n_processes=1, index=None, **kwargs_integrate):
+    """
+    Perform independent integrations via integrate(), for example of all experiments of a campaign.
+    :param kwargs_integrations: list of dict, keyword arguments of integrate() for each integration
+    :param n_processes: int, optional, Default 1
+        number of processes the integrations are performed in parallel, see evaluation.utils.tools.process_pool_executor()
+    :param index: pd.Index or None, optional, Default None
+        index of the returned DataFrame, for example the index of the experiments
+    :param kwargs_integrate: keyword arguments of integrate() common to all integrations
+    :return: pd.DataFrame with ANA_INTEGRATIONS_COLUMNS and one row per integration in the order of
+        kwargs_integrations, to be written by to_database()
+    """
+    kwargs_integrations = [
+        {**kwargs_integrate, **kwargs_integration} for kwargs_integration in kwargs_integrations
+    ]
+    executor = (
+        tools.process_pool_executor(n_processes) if n_processes > 1 and len(kwargs_integrations) > 1 else None
+    )
+    if executor is None:
+        rows = [_integrate_kwargs(kwargs_integration) for kwargs_integration in kwargs_integrations]
+    else:
+        with executor:
+            rows = list(executor.map(_integrate_kwargs, kwargs_integrations))
+    return pd.DataFrame(rows, columns=ANA_INTEGRATIONS_COLUMNS, index=index)
+
+
+def _integrate_kwargs(kwargs_integration):
+    """
+    Call integrate with a dict of keyword arguments, used by integrate_batch in the process pool.
+    :param kwargs_integration: dict, keyword arguments of integrate
+    :return: output of integrate
+    """
+    return integrate(**kwargs_integration)
+
+
+def integrate_dataset(
+    exp,
+    data,
+    x_col,
+    y_col,
+    name_id_data,
+    name_timestamp,
+    n_processes=1,
+    **kwargs_integrate,
+):
+    """
+    Auto integration of all experiments of a dataset, as performed by integration.Integrate without any
+    manual adjustment
+    :param exp: pd.DataFrame
+        experimental dataset, its index levels are the leading index levels of data
+    :param data: pd.DataFrame
+        data of the experiments, index has one additional level to the index of exp
+    :param x_col: str
+        column name of the x data in data
+    :param y_col: str
+        column name of the y data in data
+    :param name_id_data: str
+        name of the data index level or column stored as id_data_integration_*, for example id_data_icpms
+    :param name_timestamp: str
+        name of the timestamp column stored as t_integration_*__timestamp,
+        for example t_delaycorrected__timestamp_sfc_pc
+    :param n_processes: int, optional, Default 1
+        number of processes the integrations are performed in parallel
+    :param kwargs_integrate: keyword arguments of integrate() common to all integrations
+    :return: pd.DataFrame with ANA_INTEGRATIONS_COLUMNS indexed as exp
+    """
+    data_grouped = data.loc[
+        data.index.droplevel(list(range(exp.index.nlevels, data.index.nlevels))).isin(exp.index)
+    ].groupby(level=list(range(exp.index.nlevels)))
+    kwargs_integrations = []
+    for index in exp.index:
+        data_exp = data_grouped.get_group(index).sort_index().reset_index()
+        kwargs_integrations.append(
+            dict(
+                x=data_exp.loc[:, x_col].to_numpy(),
+                y=data_exp.loc[:, y_col].to_numpy(),
+                id_data=data_exp.loc[:, name_id_data].to_numpy(),
+                timestamp=data_exp.loc[:, name_timestamp],
+            )
+        )
+    return integrate_batch(kwargs_integrations, n_processes=n_processes, index=exp.index, **kwargs_integrate)
+
+
+def database_constraint_username(df_exp_integration, to_database_table, con):
+    """
+    Verify that the current user owns all experiments of which integrations are written
+    :param df_exp_integration: pd.DataFrame
+        rows of exp_ec_integration or exp_icpms_integration as columns
+    :param to_database_table: one of ['exp_ec_integration', 'exp_icpms_integration']
+    :param con: sqlalchemy.connection
+    :return: True, raises PermissionError otherwise
+    """
+    if to_database_table == "exp_icpms_integration":
+        index_col = "id_exp_icpms"
+        index_values = df_exp_integration.id_exp_icpms.unique().tolist()
+    elif to_database_table == "exp_ec_integration":
+        ids_exp_ec_dataset = df_exp_integration.id_exp_ec_dataset.unique().tolist()
+        index_col = "id_exp_sfc"
+        index_values = (
+            db.query_sql(
+                """SELECT DISTINCT id_exp_sfc FROM exp_ec_datasets_definer
+                   WHERE id_exp_ec_dataset IN (%s);"""
+                % ", ".join(["%s"] * len(ids_exp_ec_dataset)),
+                params=[int(val) for val in ids_exp_ec_dataset],
+                method="pandas",
+                con=con,
+            )
+            .id_exp_sfc.tolist()
+        )
+    else:
+        raise ValueError("integration of " + str(to_database_table) + " not yet implemented")
+
+    for index_value in index_values:
+        if not db.user_is_owner(index_col, index_value=int(index_value)):
+            raise PermissionError(
+                "You better not change data of " + index_col + " " + str(index_value)
+            )
+    return True
+
+
+def to_database(
+    df_ana_integration,
+    df_exp_integration,
+    to_database_table,
+    con,
+    check_username=True,
+):
+    """
+    Write integrations to the database within the transaction of con. Rows without id_ana_integration are
+    inserted into ana_integrations by a single bulk insert and linked to the new rows of
+    df_exp_integration. Rows with id_ana_integration update the existing ana_integrations entry by a single
+    UPDATE statement, the corresponding row in df_exp_integration is not changed.
+    EC integrations (exp_ec_integration) need to be written before linked ICP-MS integrations.
+    :param df_ana_integration: pd.DataFrame
+        with ANA_INTEGRATIONS_COLUMNS, optionally with column id_ana_integration, see integrate_batch()
+    :param df_exp_integration: pd.DataFrame
+        with one row per row of df_ana_integration in the same order and all primary key columns of
+        to_database_table as columns, additional columns of the table (name_reaction, faradaic_efficiency__percent)
+        are written for inserted rows
+    :param to_database_table: one of ['exp_ec_integration', 'exp_icpms_integration']
+    :param con: sqlalchemy.connection
+        connection with an open transaction, everything is rolled back on error
+    :param check_username: bool, optional, Default True
+        verify ownership of all experiments via database_constraint_username()
+    :return: df_ana_integration with column id_ana_integration of all rows
+    """
+    if len(df_ana_integration.index) != len(df_exp_integration.index):
+        raise ValueError("df_ana_integration and df_exp_integration require the same number of rows")
+    if df_ana_integration.loc[:, ANA_INTEGRATIONS_COLUMNS].drop(columns=["y_offset"]).isna().any().any():
+        raise ValueError("Not allowed NULL values found in df_ana_integration. Please report to Admin")
+    if check_username:
+        database_constraint_username(df_exp_integration, to_database_table, con)
+
+    df_ana_integration = df_ana_integration.copy()
+    if "id_ana_integration" not in df_ana_integration.columns:
+        df_ana_integration.loc[:, "id_ana_integration"] = None
+    to_insert = df_ana_integration.id_ana_integration.isna().to_numpy()
+
+    if to_insert.any():
+        ids_inserted = db.insert_into(
+            conn=con,
+            tb_name="ana_integrations",
+            df=df_ana_integration.loc[to_insert, ANA_INTEGRATIONS_COLUMNS].reset_index(drop=True),
+            method="bulk",
+        ).inserted_primary_key.to_numpy()
+        df_ana_integration.loc[to_insert, "id_ana_integration"] = [
+            int(np.ravel(id_inserted)[0]) for id_inserted in ids_inserted
+        ]
+        df_exp_integration_insert = df_exp_integration.loc[to_insert, :].reset_index(drop=True).assign(
+            id_ana_integration=df_ana_integration.loc[to_insert, "id_ana_integration"].to_numpy()
+        )
+        df_exp_integration_insert.to_sql(to_database_table, con=con, if_exists="append", index=False)
+        db.notify_written(to_database_table, df_exp_integration_insert, con=con)
+        print(
+            "\x1b[32m",
+            "Successfully prepared data for insert into database of",
+            to_insert.sum(),
+            "integration analyses",
+            "\x1b[0m",
+        )
+
+    if (~to_insert).any():
+        db.sql_update(
+            df_update=df_ana_integration.loc[~to_insert, ["id_ana_integration"] + ANA_INTEGRATIONS_COLUMNS]
+            .set_index("id_ana_integration"),
+            table_name="ana_integrations",
+            con=con,
+            method="set",
+            print_statements=False,
+        )
+        print(
+            "\x1b[32m",
+            "Successfully prepared data for update database entry of",
+            (~to_insert).sum(),
+            "integration analyses",
+            "\x1b[0m",
+        )
+    return df_ana_integration
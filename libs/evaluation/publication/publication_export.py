@@ -358,8 +358,7 @@ class Publication:
         # self.transfer_views_mysql2sqlite(exclude_views)
         print("\x1b[32m", "Successfully exported publication for upload!", "\x1b[0m")
 
-        # dispose database connections
-        self.engine_mysql.dispose()  # doesn't have to be disposed
+        # dispose database connections, mysql engine is shared via evaluation.utils.db.get_engine()
         self.engine_sqlite.dispose()
 
     def display_linked_experiments(self):
@@ -554,12 +553,8 @@ class Publication:
             ]
         print(recursive_level, table_name) if self.debug else ""
 
-        index_name_str = ", ".join(index_name)
-        index_values_str, index_values_params = values2sqlstring(
-            index_values
-        )  # str(list(index_values))[1:-1]#', '.join(index_values)#
-        # print(index_values)
-        # print(index_values_str, index_values_params)# == '', len(index_values_str) > 0)
+        index_name = [index_name] if isinstance(index_name, str) else list(index_name)
+        index_values = values2keyset(index_values)
         """
         if len(index_values_str) > 0 and not all([val == 'None' for val in index_values_params]):
             index_values, index_values_str, index_values_params = self._remove_existing_index(table_name, index_name,
@@ -568,20 +563,14 @@ class Publication:
                                                                                               index_values_str,
                                                                                               index_values_params)
         """
-        # print(index_values_str, index_values_params)
         with self.engine_mysql.begin() as con_mysql:
-            table_data = pd.read_sql(
+            table_data = db.query_sql_keyset(
                 """SELECT * 
-                                        FROM %s 
-                                        WHERE (%s) IN """
-                % (table_name, index_name_str)
-                + "("
-                + index_values_str
-                + ")"
-                + ";"
-                if True
-                else """;""",
-                params=index_values_params,
+                   FROM %s 
+                   WHERE {keyset};"""
+                % table_name,
+                key_names=index_name,
+                key_values=index_values,
                 con=con_mysql,
                 index_col=index_name,
             )
@@ -873,6 +862,8 @@ def transfer_views_mysql2sqlite(exclude_views=None, debug=False):
     if exclude_views is None:
         exclude_views = ["data_icpms_sfc_analysis_old"]
     if os.path.isfile(DIR_EMPTY_SQLITE):
+        # close pooled connections (used by verify_sql) to the file before replacing it
+        db_config_binder.connect(path_to_sqlite=DIR_EMPTY_SQLITE).dispose()
         os.remove(DIR_EMPTY_SQLITE)
         print("Deleted previous file: ", DIR_EMPTY_SQLITE)
     shutil.copy2(src=DIR_EMPTY_SQLITE_NO_VIEWS, dst=DIR_EMPTY_SQLITE)
@@ -1053,6 +1044,23 @@ def values2sqlstring(values):
     return sqlstring, params
 
 
+def values2keyset(values):
+    """
+    used in _transfer_tables_mysql2df, transform values to keys as accepted by evaluation.utils.db.query_sql_keyset
+    :param values: index values, either 1, [1,2,3] for single index or [['a', 1, 2], ['b', 2,2]] for multiindex
+    :return: list of index values or list of tuples of index values
+    """
+    multivalues_types = [list, np.ndarray]
+
+    if type(values) not in multivalues_types:
+        return [values]
+    if len(values) > 0 and type(values[0]) in multivalues_types:
+        if len(values[0]) == 1:  # singleindex in brakets reduce dimension
+            return [val[0] for val in values]
+        return [tuple(row) for row in values]
+    return list(values)
+
+
 def copy_and_replace(src, dst, function, str_prepend_file='', **kwargs):
     """
     Copy a file to another location while replacing lines according to separate function
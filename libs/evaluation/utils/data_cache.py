@@ -0,0 +1,281 @@
+"""
+Scripts for caching results of evaluation.utils.db.get_data() in columnar files on local disk
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# folder of the cache, one subfolder per database, requested table, add_cond and schema version
+DATA_CACHE_DIR = Path(
+    os.environ.get("HTE_DATA_CACHE_DIR", Path.home() / ".cache" / "hte_data_cache")
+)
+# cache entries are removed after this time, to consider changes not made via evaluation.utils.db
+# (for example by LabView or other users)
+DATA_CACHE_TTL__s = 3600
+# least recently used partitions are removed if the cache exceeds this size
+DATA_CACHE_MAX_SIZE__MB = 2000
+# parquet requires pyarrow, which is optional, otherwise pickle is used
+DATA_CACHE_FORMAT = (
+    "parquet" if importlib.util.find_spec("pyarrow") is not None else "pickle"
+)
+
+_cache_lock = threading.RLock()
+
+
+def get(name_table, col_names, col_values, add_cond, load, base_tables, version, database, columns=None):
+    """
+    Get data from cache or load it from database. Data is stored in one partition (file) per experiment (value of
+    col_names), thus only the experiments missing in the cache are loaded.
+    :param name_table: str
+        name of the requested table or view
+    :param col_names: list of str
+        name of the experiment id column(s)
+    :param col_values: list
+        requested experiment ids, scalars or tuples for multiple columns
+    :param add_cond: str or None
+        additional condition of the request
+    :param load: callable
+        function loading data from database called with col_values of the missing experiments,
+        returning a pd.DataFrame including the col_names columns
+    :param base_tables: list of str
+        tables the requested table depends on, used to invalidate the cache, see invalidate()
+    :param version: hashable
+        schema version of the database, cache is not reused after the schema changed
+    :param database: str
+        identifier of the database, see evaluation.utils.db.database_identity()
+    :param columns: list of str or None, optional, Default None
+        selected columns of the request, if None all columns
+    :return: pd.DataFrame
+    """
+    col_names = list(col_names)
+    dir_entry = _dir_entry(name_table, col_names, add_cond, version, database, columns=columns)
+    key_names = {_key_name(key): key for key in col_values}
+
+    with _cache_lock:
+        if dir_entry.is_dir() and _is_expired(dir_entry):
+            shutil.rmtree(dir_entry, ignore_errors=True)
+        if not dir_entry.is_dir():
+            dir_entry.mkdir(parents=True)
+            with open(dir_entry / "meta.json", "w") as f:
+                json.dump(
+                    {
+                        "database": database,
+                        "name_table": name_table,
+                        "col_names": col_names,
+                        "add_cond": add_cond,
+                        "columns": columns,
+                        "base_tables": sorted(set(base_tables) | {name_table}),
+                        "t_created": time.time(),
+                    },
+                    f,
+                )
+        files = {key_name: _file(dir_entry, key_name) for key_name in key_names}
+        keys_cached = [key_name for key_name, file in files.items() if file.is_file()]
+    keys_missing = [key_name for key_name in key_names if key_name not in keys_cached]
+
+    data_list = []
+    if len(keys_missing) > 0:
+        data_missing = load([key_names[key_name] for key_name in keys_missing])
+        if not _write_partitions(data_missing, col_names, keys_missing, files):
+            # experiment ids in data not matching requested ids, data is returned but not cached
+            return data_missing
+        data_list.append(data_missing)
+    for key_name in keys_cached:
+        try:
+            data_list.append(_read(files[key_name]))
+        except FileNotFoundError:
+            # evicted or invalidated meanwhile
+            return get(
+                name_table, col_names, col_values, add_cond, load, base_tables, version, database, columns=columns
+            )
+    _evict()
+    # empty partitions would change the dtypes of the concatenated data
+    data_list = [data for data in data_list if len(data.index) > 0] or data_list[:1]
+    return pd.concat(data_list, ignore_index=True)
+
+
+def invalidate(name_table):
+    """
+    Remove all cached data of tables or views depending on the given table, of all databases.
+    Called by evaluation.utils.db.notify_written() when writing to a table.
+    :param name_table: str
+        name of the inserted or updated table
+    :return: None
+    """
+    if not DATA_CACHE_DIR.is_dir():
+        return
+    with _cache_lock:
+        for file_meta in DATA_CACHE_DIR.glob("*/meta.json"):
+            try:
+                with open(file_meta, "r") as f:
+                    base_tables = json.load(f)["base_tables"]
+            except (OSError, ValueError, KeyError):
+                base_tables = [name_table]  # corrupted entry, remove
+            if name_table in base_tables:
+                shutil.rmtree(file_meta.parent, ignore_errors=True)
+
+
+def clear():
+    """
+    Remove all cached data
+    :return: None
+    """
+    with _cache_lock:
+        shutil.rmtree(DATA_CACHE_DIR, ignore_errors=True)
+
+
+def size():
+    """
+    Get the size of all cached data
+    :return: size in MB
+    """
+    return sum(file.stat().st_size for file in _partition_files()) / 2**20
+
+
+def _evict():
+    """
+    Remove least recently used partitions until the cache is smaller than DATA_CACHE_MAX_SIZE__MB
+    :return: None
+    """
+    with _cache_lock:
+        files = [(file, file.stat()) for file in _partition_files()]
+        size_total = sum(stat.st_size for file, stat in files)
+        if size_total <= DATA_CACHE_MAX_SIZE__MB * 2**20:
+            return
+        for file, stat in sorted(files, key=lambda file_stat: file_stat[1].st_mtime):
+            file.unlink()
+            size_total -= stat.st_size
+            if size_total <= DATA_CACHE_MAX_SIZE__MB * 2**20:
+                break
+
+
+def _partition_files():
+    """
+    List all partition files in the cache
+    :return: list of Path
+    """
+    if not DATA_CACHE_DIR.is_dir():
+        return []
+    return [
+        file
+        for file in DATA_CACHE_DIR.glob("*/*")
+        if file.suffix in [".parquet", ".pickle"]
+    ]
+
+
+def _write_partitions(data, col_names, key_names, files):
+    """
+    Write data into one partition per experiment, including empty partitions for experiments without data
+    :param data: pd.DataFrame
+    :param col_names: list of str
+        name of the experiment id column(s)
+    :param key_names: list of str
+        names of the requested experiments, see _key_name()
+    :param files: dict
+        file of each experiment
+    :return: bool, False if data contains experiments which were not requested (not written)
+    """
+    if any(col_name not in data.columns for col_name in col_names):
+        return False
+    idx_rows_key = {
+        _key_name(key): idx_rows
+        for key, idx_rows in data.groupby(
+            col_names if len(col_names) > 1 else col_names[0], sort=False
+        ).indices.items()
+    }
+    if any(key_name not in key_names for key_name in idx_rows_key):
+        return False
+    with _cache_lock:
+        for key_name in key_names:
+            _write(
+                data.iloc[idx_rows_key.get(key_name, np.array([], dtype=int)), :],
+                files[key_name],
+            )
+    return True
+
+
+def _write(data, file):
+    """
+    Write data of a partition
+    :param data: pd.DataFrame
+    :param file: Path
+    :return: None
+    """
+    file.parent.mkdir(parents=True, exist_ok=True)
+    data = data.reset_index(drop=True)
+    if DATA_CACHE_FORMAT == "parquet":
+        data.to_parquet(file)
+    else:
+        data.to_pickle(file)
+
+
+def _read(file):
+    """
+    Read data of a partition and mark it as recently used
+    :param file: Path
+    :return: pd.DataFrame
+    """
+    data = (
+        pd.read_parquet(file) if file.suffix == ".parquet" else pd.read_pickle(file)
+    )
+    os.utime(file)
+    return data
+
+
+def _is_expired(dir_entry):
+    """
+    Check whether a cache entry is older than DATA_CACHE_TTL__s or its meta data is not readable
+    :param dir_entry: Path
+    :return: bool
+    """
+    try:
+        with open(dir_entry / "meta.json", "r") as f:
+            t_created = json.load(f)["t_created"]
+    except (OSError, ValueError, KeyError):
+        return True
+    return time.time() - t_created > DATA_CACHE_TTL__s
+
+
+def _dir_entry(name_table, col_names, add_cond, version, database, columns=None):
+    """
+    Get folder of a cache entry
+    :return: Path
+    """
+    return DATA_CACHE_DIR / (
+        name_table
+        + "_"
+        + hashlib.sha1(
+            repr((database, name_table, col_names, add_cond, str(version))
+                 + (() if columns is None else (list(columns),))).encode()
+        ).hexdigest()[:16]
+    )
+
+
+def _file(dir_entry, key_name):
+    """
+    Get file of a partition
+    :return: Path
+    """
+    return dir_entry / (key_name + "." + DATA_CACHE_FORMAT)
+
+
+def _key_name(key):
+    """
+    Get a file name of an experiment id, independent of the type (numpy or python) of the id values
+    :param key: scalar or tuple
+    :return: str
+    """
+    key = key if isinstance(key, tuple) else (key,)
+    key = tuple(value.item() if isinstance(value, np.generic) else value for value in key)
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:20]
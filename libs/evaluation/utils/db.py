@@ -4,7 +4,14 @@ Created in 2023
 @author: Forschungszentrum Jülich GmbH, Nico Röttcher
 """
 
+import csv
 import os.path
+import re
+import tempfile
+import threading
+import time
+import weakref
+from pathlib import Path
 
 import sqlalchemy as sql
 import pandas as pd
@@ -15,20 +22,115 @@ import warnings
 import datetime
 from IPython.display import SVG
 
-from evaluation.utils import db_config, tools
+from evaluation.utils import (
+    data_cache,
+    db_config,
+    exp_matching,
+    materialized_views,
+    schema_cache,
+    sfc_icpms_dataset,
+    time_intervals,
+    tools,
+)
 from evaluation.processing import tools_ec
 from evaluation.visualization import plot
 
 MYSQL = db_config.MYSQL
 
+_engine_registry = {}
+_engine_registry_stats = {}
+_engine_registry_pid = os.getpid()
+_engine_registry_lock = threading.RLock()
+
 
 def connect(*args, **kwargs):
     """
     method to connect to database either Mysql or Sqlite as defined in evaluation.utils.db_config
+    Engines are cached process-wide, see evaluation.utils.db.get_engine()
     """
     return db_config.connect(*args, **kwargs)
 
 
+def get_engine(key, create_engine):
+    """
+    Process-wide registry of sqlalchemy engines used by db_config.connect(). Instead of creating a new engine
+    (and thereby new database connections) on every call of connect(), the engine is created once per key and its
+    connection pool is reused afterwards. In a forked worker process, the inherited connections are not reused
+    but the pools are reset to open new connections.
+    :param key: tuple
+        identifier of the engine, (user, database, host, path, echo)
+    :param create_engine: callable
+        function without parameters returning a new sqlalchemy engine, only called if key not yet registered
+    :return: sqlalchemy.engine
+    """
+    global _engine_registry_pid
+    with _engine_registry_lock:
+        if os.getpid() != _engine_registry_pid:
+            # forked process: drop connections of parent process without closing them
+            for engine in _engine_registry.values():
+                engine.dispose(close=False)
+            for stats in _engine_registry_stats.values():
+                stats.update(n_connect=0, n_checkout=0)
+            _engine_registry_pid = os.getpid()
+
+        if key not in _engine_registry:
+            engine = create_engine()
+            stats = {"n_connect": 0, "n_checkout": 0}
+
+            def count_connect(dbapi_connection, connection_record):
+                stats["n_connect"] += 1
+
+            def count_checkout(dbapi_connection, connection_record, connection_proxy):
+                stats["n_checkout"] += 1
+
+            sql.event.listen(engine, "connect", count_connect)
+            sql.event.listen(engine, "checkout", count_checkout)
+            _engine_registry[key] = engine
+            _engine_registry_stats[key] = stats
+        return _engine_registry[key]
+
+
+def pool_status():
+    """
+    Statistics of the connection pools of all engines in the registry, see evaluation.utils.db.get_engine().
+    n_connect counts newly opened database connections, n_checkout counts connections handed out of the pool.
+    A n_checkout much larger than n_connect indicates that connections are reused.
+    :return: pd.DataFrame with one row per engine
+    """
+    with _engine_registry_lock:
+        return pd.DataFrame(
+            [
+                {
+                    "user": key[0],
+                    "database": key[1],
+                    "host": key[2],
+                    "path": key[3],
+                    "pool": type(engine.pool).__name__,
+                    "size": engine.pool.size() if hasattr(engine.pool, "size") else None,
+                    "checkedin": engine.pool.checkedin() if hasattr(engine.pool, "checkedin") else None,
+                    "checkedout": engine.pool.checkedout() if hasattr(engine.pool, "checkedout") else None,
+                    **_engine_registry_stats[key],
+                }
+                for key, engine in _engine_registry.items()
+            ],
+            columns=["user", "database", "host", "path", "pool", "size", "checkedin", "checkedout",
+                     "n_connect", "n_checkout"],
+        )
+
+
+def dispose_engines():
+    """
+    Close all pooled connections of all engines in the registry and empty the registry.
+    Required for example before replacing a sqlite database file.
+    :return: None
+    """
+    with _engine_registry_lock:
+        for engine in _engine_registry.values():
+            engine.dispose()
+        _engine_registry.clear()
+        _engine_registry_stats.clear()
+
+
 def query_sql(query, params=None, con=None, method="pandas", debug=False, **kwargs):
     """
     Standard command to run a SQL query. If run with MySQL: The SQL query will be verified to be compatible
@@ -90,7 +192,324 @@ def query_sql_execute_method(
         raise NotImplementedError("Method not implemented")
 
 
-def insert_into(conn, tb_name, df=None):
+KEYSET_PLACEHOLDER = "{keyset}"
+KEYSET_MAX_PARAMS = 999  # default SQLITE_MAX_VARIABLE_NUMBER of older sqlite versions
+KEYSET_TEMP_TABLE_MIN_KEYS = 20000
+
+
+def query_sql_keyset(
+    query,
+    key_names,
+    key_values,
+    params=None,
+    con=None,
+    method="auto",
+    debug=False,
+    **kwargs
+):
+    """
+    Run a SELECT query restricted to a set of keys, such as a list of id_exp_sfc or a list of
+    (id_exp_icpms, id_data_icpms) tuples. Keys are handed over as bound parameters instead of being pasted into the
+    query. Large key sets are split into chunks, each chunk is queried separately and the results are concatenated
+    in the order of the key set. For very large key sets, keys are written into a temporary table which is joined
+    in a single query.
+    :param query: str
+        SELECT query in MySQL syntax with '{keyset}' marking the condition on the key columns, for example
+        "SELECT * FROM data_ec WHERE {keyset} AND cycle = %s;"
+    :param key_names: str or list of str
+        name of the key column(s)
+    :param key_values: list or np.ndarray or pd.Index
+        values of the key column(s), scalars for a single key column or tuples for multiple key columns
+    :param params: list of Any or None, optional, Default None
+        parameters marked in query with '%s' besides the keys
+    :param con: sql.Connection or None, optional, default None
+        database connection object, if None a new will be initialized
+    :param method: one of ['auto', 'chunks', 'temp_table']
+        'chunks': query keys chunk-wise as 'IN (%s, ...)' list of bound parameters
+        'temp_table': insert keys into temporary table and select 'IN (SELECT ... FROM temp_keyset)'
+        'auto': 'temp_table' if number of keys exceeds KEYSET_TEMP_TABLE_MIN_KEYS, else 'chunks'
+    :param debug: bool, optional, Default False
+        print additional debug info
+    :param kwargs:
+        kwargs of pandas.read_sql()
+    :return: pd.DataFrame
+    """
+    if method not in ["auto", "chunks", "temp_table"]:
+        raise NotImplementedError("Method not implemented")
+    if query.count(KEYSET_PLACEHOLDER) != 1:
+        raise ValueError("query must contain " + KEYSET_PLACEHOLDER + " exactly once")
+    key_names = [key_names] if isinstance(key_names, str) else list(key_names)
+    key_values = _keyset_values(key_values, len(key_names))
+    params = [] if params is None else list(params)
+
+    if con is None:
+        with connect().begin() as con:
+            return query_sql_keyset(
+                query, key_names, key_values, params=params, con=con, method=method, debug=debug, **kwargs
+            )
+    if isinstance(con, sql.engine.Engine):
+        # temporary table and chunks require the same connection
+        with con.begin() as con_engine:
+            return query_sql_keyset(
+                query, key_names, key_values, params=params, con=con_engine, method=method, debug=debug, **kwargs
+            )
+
+    query_before, query_after = query.split(KEYSET_PLACEHOLDER)
+    n_params_before = query_before.count("%s")
+    key_names_str = "(" + ", ".join(["`" + name + "`" for name in key_names]) + ")"
+
+    if len(key_values) == 0:
+        # empty key set, still query to receive the columns of the result
+        return query_sql(
+            query_before + "1 = 0" + query_after, params=params, con=con, method="pandas", debug=debug, **kwargs
+        )
+
+    if method == "auto":
+        method = "temp_table" if len(key_values) >= KEYSET_TEMP_TABLE_MIN_KEYS else "chunks"
+
+    if method == "temp_table":
+        return _query_sql_keyset_temp_table(
+            query_before, query_after, key_names, key_values, params, con, debug=debug, **kwargs
+        )
+
+    # chunks
+    n_keys_chunk = max(1, (KEYSET_MAX_PARAMS - len(params)) // len(key_names))
+    placeholder_key = (
+        "%s" if len(key_names) == 1 else "(" + ", ".join(["%s"] * len(key_names)) + ")"
+    )
+    data_chunks = []
+    for idx_chunk in range(0, len(key_values), n_keys_chunk):
+        key_values_chunk = key_values[idx_chunk: idx_chunk + n_keys_chunk]
+        data_chunks.append(
+            query_sql(
+                query_before
+                + key_names_str
+                + " IN ("
+                + ", ".join([placeholder_key] * len(key_values_chunk))
+                + ")"
+                + query_after,
+                params=params[:n_params_before]
+                + [value for key in key_values_chunk for value in key]
+                + params[n_params_before:],
+                con=con,
+                method="pandas",
+                debug=debug,
+                **kwargs
+            )
+        )
+    if len(data_chunks) == 1:
+        return data_chunks[0]
+    return pd.concat(data_chunks, ignore_index=kwargs.get("index_col") is None)
+
+
+def keys_exist(name_table, keys, con=None, method="auto", debug=False):
+    """
+    Check which rows of natural keys already exist in a database table with a single parameterized query
+    (chunked tuple-IN or temporary table, see evaluation.utils.db.query_sql_keyset()).
+    :param name_table: str
+        name of the database table
+    :param keys: pd.DataFrame
+        one column per key column of the table, named as in the table, one row per key to be checked
+    :param con: sql.Connection or None, optional, default None
+        database connection object, if None a new will be initialized
+    :param method: one of ['auto', 'chunks', 'temp_table']
+        see evaluation.utils.db.query_sql_keyset()
+    :param debug: bool, optional, Default False
+        print additional debug info
+    :return: pd.Series of bool with the index of keys, True if the key exists in the table
+    """
+    key_names = list(keys.columns)
+    keys_db = query_sql_keyset(
+        "SELECT DISTINCT "
+        + ", ".join(["`" + name + "`" for name in key_names])
+        + " FROM "
+        + name_table
+        + " WHERE {keyset};",
+        key_names=key_names,
+        key_values=keys.to_numpy(dtype=object)
+        if len(key_names) > 1
+        else keys.iloc[:, 0].to_numpy(dtype=object),
+        con=con,
+        method=method,
+        debug=debug,
+    )
+    # compare keys with equal types, as types returned from database depend on database and driver
+    keys_compare, keys_db_compare = [], []
+    for name in key_names:
+        key_column, key_db_column = _keys_comparable(
+            keys.loc[:, name], keys_db.loc[:, name]
+        )
+        keys_compare.append(key_column)
+        keys_db_compare.append(key_db_column)
+    return pd.Series(
+        pd.MultiIndex.from_arrays(keys_compare).isin(
+            pd.MultiIndex.from_arrays(keys_db_compare)
+        ),
+        index=keys.index,
+        dtype=bool,
+    )
+
+
+def _keys_comparable(key_column, key_db_column):
+    """
+    Transform a key column and the corresponding column returned from database into comparable types,
+    see evaluation.utils.db.keys_exist()
+    :param key_column: pd.Series
+    :param key_db_column: pd.Series
+    :return: key_column, key_db_column
+    """
+    if pd.api.types.is_datetime64_any_dtype(
+        key_column
+    ) or pd.api.types.is_datetime64_any_dtype(key_db_column):
+        return pd.to_datetime(key_column), pd.to_datetime(key_db_column)
+    if pd.api.types.is_numeric_dtype(key_column) and (
+        pd.api.types.is_numeric_dtype(key_db_column) or key_db_column.empty
+    ):
+        return key_column.astype(float), key_db_column.astype(float)
+    return key_column.astype(str), key_db_column.astype(str)
+
+
+def _keyset_values(key_values, n_key_names):
+    """
+    Transform key values into a list of unique tuples of native python types, keeping the order of first occurrence.
+    :param key_values: list or np.ndarray or pd.Index or scalar
+        values of the key column(s)
+    :param n_key_names: int
+        number of key columns
+    :return: list of tuples
+    """
+    if np.ndim(key_values) == 0:
+        key_values = [key_values]
+
+    def to_native(value):
+        if isinstance(value, pd.Timestamp):
+            return value.to_pydatetime()
+        return value.item() if isinstance(value, np.generic) else value
+
+    key_tuples = []
+    for key in key_values:
+        key = tuple(key) if isinstance(key, (tuple, list, np.ndarray)) else (key,)
+        if len(key) != n_key_names:
+            raise ValueError(
+                "Number of key values " + str(key) + " does not match number of key columns"
+            )
+        key_tuples.append(tuple(to_native(value) for value in key))
+    return list(dict.fromkeys(key_tuples))
+
+
+def _query_sql_keyset_temp_table(
+    query_before, query_after, key_names, key_values, params, con, debug=False, **kwargs
+):
+    """
+    Part of evaluation.utils.db.query_sql_keyset() for very large key sets. Keys are inserted into a temporary table
+    which is used as subselect in the key condition.
+    :param query_before: str
+        part of the query before the key condition
+    :param query_after: str
+        part of the query after the key condition
+    :param key_names: list of str
+        name of the key columns
+    :param key_values: list of tuples
+        values of the key columns
+    :param params: list of Any
+        parameters marked in query with '%s' besides the keys
+    :param con: sql.Connection
+        database connection object
+    :param debug: bool, optional, Default False
+        print additional debug info
+    :param kwargs:
+        kwargs of pandas.read_sql()
+    :return: pd.DataFrame
+    """
+    name_temp_table = "temp_keyset"
+    key_types = []
+    for values in zip(*key_values):
+        if all(isinstance(value, (int, np.integer)) for value in values):
+            key_types.append("BIGINT")
+        elif all(isinstance(value, (int, float, np.number)) for value in values):
+            key_types.append("DOUBLE")
+        else:
+            key_types.append("VARCHAR(255)")
+    key_names_str = ", ".join(["`" + name + "`" for name in key_names])
+    placeholder = "%s" if MYSQL else "?"
+
+    con.execute(
+        "CREATE TEMPORARY TABLE "
+        + name_temp_table
+        + " ("
+        + ", ".join(["`" + name + "` " + key_type for name, key_type in zip(key_names, key_types)])
+        + ");"
+    )
+    try:
+        con.execute(
+            "INSERT INTO "
+            + name_temp_table
+            + " ("
+            + key_names_str
+            + ") VALUES ("
+            + ", ".join([placeholder] * len(key_names))
+            + ");",
+            key_values,
+        )
+        query = (
+            query_before
+            + "("
+            + key_names_str
+            + ") IN (SELECT "
+            + key_names_str
+            + " FROM "
+            + name_temp_table
+            + ")"
+            + query_after
+        )
+        # Verification on empty sqlite database is not possible as it does not contain the temporary table
+        if not MYSQL:
+            query = db_config.verify_sql(query, params=params, method="pandas", debug=debug)
+        return query_sql_execute_method(
+            query, params=params, con=con, method="pandas", debug=debug, **kwargs
+        )
+    finally:
+        con.execute(
+            ("DROP TEMPORARY TABLE " if MYSQL else "DROP TABLE temp.") + name_temp_table + ";"
+        )
+
+
+def notify_written(name_table, df=None, con=None, full_refresh=False):
+    """
+    Record rows written to a table: journal them for materialized views (evaluation.utils.materialized_views.journal())
+    and invalidate the local data cache (evaluation.utils.data_cache), the time intervals
+    (evaluation.utils.time_intervals) and the matched experiments (evaluation.utils.exp_matching).
+    Called by insert_into(), bulk_append() and sql_update(), call it directly after writing to the database via
+    df.to_sql() or a DELETE statement.
+    :param name_table: str
+        name of the written table
+    :param df: pd.DataFrame or None, optional, Default None
+        written rows, with the experiment id in columns or index. If None, all experiments of the table are considered
+        changed.
+    :param con: sql.Connection, sql.engine or None, optional, Default None
+        connection of the transaction the rows are written in, if None a new will be initialized
+    :param full_refresh: bool, optional, Default False
+        see evaluation.utils.materialized_views.journal()
+    :return: None
+    """
+    df_ids = pd.DataFrame() if df is None or full_refresh else df
+    data_cache.invalidate(name_table)
+    materialized_views.journal(name_table, df, con=con, full_refresh=full_refresh)
+    time_intervals.invalidate(name_table, df_ids, con=con)
+    exp_matching.invalidate(name_table, df_ids)
+
+
+def database_identity(engine):
+    """
+    Identify the database of an engine independent of the user: path of the sqlite file, or host and database name
+    of MySQL. Used to separate the local data cache of different databases, see evaluation.utils.data_cache.
+    :param engine: sqlalchemy.engine or sqlalchemy.connection
+    :return: str
+    """
+    return engine.engine.url.set(username=None, password=None).render_as_string()
+
+
+def insert_into(conn, tb_name, df=None, method="row"):
     """
     Run an 'INSERT INTO' query for data from df into database table with Auto Increment index column. Returns the
     auto increment index in the column inserted_primary_key
@@ -99,24 +518,323 @@ def insert_into(conn, tb_name, df=None):
     :param df: pd.DataFrame or None, optional, Default None
         values to be inserted as dataframe
         if None, current auto increment value is returned
+    :param method: one of ['row', 'bulk'], optional, Default 'row'
+        'row': one INSERT statement per row, the auto increment index is read for each row
+        'bulk': all rows are inserted in a single executemany, the auto increment indices are derived from the first
+                (MySQL) or last (SQLite) inserted index and the number of rows. Only possible for tables with a single
+                auto increment primary key column, which is not given in df. Otherwise, or if MySQL does not guarantee
+                consecutive auto increment values (innodb_autoinc_lock_mode = 2), falls back to 'row'.
     :return:
         if df is None, current auto increment value of the table is returned
         else: df is returned with the auto increment index added in the column inserted_primary_key
     """
+    table = get_table(conn, tb_name)
     if df is None:
-        stmt = sql.Table(tb_name, sql.MetaData(), autoload_with=conn).insert().values()
+        stmt = table.insert().values()
         return conn.execute(stmt).inserted_primary_key
-    else:
+    notify_written(tb_name, df, con=conn)
+    if method == "bulk" and _insert_into_bulk_possible(conn, table, df):
+        return _insert_into_bulk(conn, table, df)
+    elif method in ["row", "bulk"]:
         for index, row in df.iterrows():
-            stmt = (
-                sql.Table(tb_name, sql.MetaData(), autoload_with=conn)
-                .insert()
-                .values(**row.to_dict())
-            )
+            stmt = table.insert().values(**row.to_dict())
             df.loc[index, "inserted_primary_key"] = conn.execute(
                 stmt
             ).inserted_primary_key
         return df
+    else:
+        raise NotImplementedError("Method not implemented")
+
+
+# reflected sqlalchemy tables per engine with the schema version and time they were reflected at, see get_table()
+_reflected_tables = weakref.WeakKeyDictionary()
+
+
+def get_table(conn, tb_name):
+    """
+    Get the sqlalchemy table object of a database table. The table is reflected from the database only once
+    per engine and cached afterwards. As evaluation.utils.schema_cache, the cache is cleared after the schema changed
+    or after schema_cache.SCHEMA_CACHE_TTL__s.
+    :param conn: sqlalchemy.engine or sqlalchemy.connection
+        database connection
+    :param tb_name: str
+        name of the table
+    :return: sqlalchemy.Table
+    """
+    version = schema_cache.schema_version()
+    version_cached, t_reflected, tables = _reflected_tables.get(conn.engine, (None, None, {}))
+    if version_cached != version or time.monotonic() - t_reflected >= schema_cache.SCHEMA_CACHE_TTL__s:
+        tables = {}
+        _reflected_tables[conn.engine] = (version, time.monotonic(), tables)
+    if tb_name not in tables:
+        tables[tb_name] = sql.Table(tb_name, sql.MetaData(), autoload_with=conn)
+    return tables[tb_name]
+
+
+def _insert_into_bulk_possible(conn, table, df):
+    """
+    Check whether auto increment indices can be derived for a bulk insert, see evaluation.utils.db.insert_into()
+    :param conn: db connection
+    :param table: sqlalchemy.Table
+        table to insert into
+    :param df: pd.DataFrame
+        values to be inserted
+    :return: bool
+    """
+    primary_key_columns = list(table.primary_key.columns)
+    if (
+        len(primary_key_columns) != 1
+        or primary_key_columns[0].autoincrement not in [True, "auto"]
+        or not isinstance(primary_key_columns[0].type, sql.Integer)
+        or primary_key_columns[0].name in df.columns
+    ):
+        return False
+    if conn.engine.dialect.name == "mysql":
+        # interleaved lock mode does not guarantee consecutive values for a multi-row insert
+        return conn.execute(sql.text("SELECT @@innodb_autoinc_lock_mode;")).scalar() != 2
+    return True
+
+
+def _insert_into_bulk(conn, table, df):
+    """
+    Insert all rows of df within a single executemany, see evaluation.utils.db.insert_into()
+    :param conn: db connection
+    :param table: sqlalchemy.Table
+        table to insert into
+    :param df: pd.DataFrame
+        values to be inserted
+    :return: df with the auto increment index added in the column inserted_primary_key
+    """
+    if len(df.index) == 0:
+        df.loc[:, "inserted_primary_key"] = pd.Series(dtype="int64")
+        return df
+    conn.execute(table.insert(), df.to_dict("records"))
+    if conn.engine.dialect.name == "mysql":
+        # last_insert_id() is the index of the first row inserted by the last statement
+        id_first = conn.execute(sql.text("SELECT LAST_INSERT_ID();")).scalar()
+    else:
+        # last_insert_rowid() is the index of the last row inserted
+        id_first = (
+            conn.execute(sql.text("SELECT last_insert_rowid();")).scalar()
+            - len(df.index)
+            + 1
+        )
+    df.loc[:, "inserted_primary_key"] = np.arange(id_first, id_first + len(df.index))
+    return df
+
+
+# large data tables for which evaluation.utils.db.bulk_append() is intended
+BULK_APPEND_TABLES = ["data_ec", "data_eis", "data_icpms", "data_compression"]
+
+
+def bulk_append(table, df, engine):
+    """
+    Append rows of a large data table (see BULK_APPEND_TABLES) as drop-in for
+    df.to_sql(table, con=engine, if_exists="append"). Named index levels are written as columns as in to_sql.
+    SQLite: all rows are inserted by a single executemany of pre-built tuples. If an engine is given, this is done
+        in one transaction with synchronous=OFF and journal_mode=MEMORY, which are restored afterwards.
+    MySQL: rows are written to a temporary tab-separated file and loaded via LOAD DATA LOCAL INFILE. Falls back to
+        executemany if the server or client does not allow local infile.
+    :param table: str
+        name of the database table
+    :param df: pd.DataFrame
+        data to be appended
+    :param engine: sqlalchemy.engine or sqlalchemy.connection
+        if a connection is given, rows are inserted within the current transaction of the connection
+    :return: number of inserted rows
+    """
+    df = _bulk_append_frame(df)
+    if len(df.index) == 0:
+        return 0
+    if engine.dialect.name == "mysql":
+        insert_method = _bulk_append_mysql
+    elif engine.dialect.name == "sqlite":
+        insert_method = _bulk_append_sqlite
+    else:
+        raise NotImplementedError("bulk_append not implemented for " + engine.dialect.name)
+
+    if isinstance(engine, sql.engine.Connection):
+        insert_method(engine, table, df)
+        notify_written(table, df, con=engine)
+    elif engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            synchronous = conn.exec_driver_sql("PRAGMA synchronous;").scalar()
+            journal_mode = conn.exec_driver_sql("PRAGMA journal_mode;").scalar()
+            conn.exec_driver_sql("PRAGMA synchronous = OFF;")
+            conn.exec_driver_sql("PRAGMA journal_mode = MEMORY;")
+            try:
+                with conn.begin():
+                    insert_method(conn, table, df)
+                    notify_written(table, df, con=conn)
+            finally:
+                conn.exec_driver_sql("PRAGMA journal_mode = %s;" % journal_mode)
+                conn.exec_driver_sql("PRAGMA synchronous = %s;" % synchronous)
+    else:
+        with engine.begin() as conn:
+            insert_method(conn, table, df)
+            notify_written(table, df, con=conn)
+    return len(df.index)
+
+
+def _bulk_append_frame(df):
+    """
+    Prepare DataFrame for evaluation.utils.db.bulk_append(): write named index levels as columns,
+    timezone-aware timestamps as local wall time (as done by to_sql) and booleans as integers.
+    :param df: pd.DataFrame
+    :return: pd.DataFrame with default index
+    """
+    df = (
+        df.reset_index()
+        if any(name is not None for name in df.index.names)
+        else df.reset_index(drop=True)
+    )
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+            df[col] = df[col].dt.tz_localize(None)
+        elif df[col].dtype == bool:
+            df[col] = df[col].astype(int)
+    return df
+
+
+def _bulk_append_values(df):
+    """
+    Convert DataFrame into list of tuples of native python types, missing values as None, for executemany
+    :param df: pd.DataFrame
+        prepared by evaluation.utils.db._bulk_append_frame()
+    :return: list of tuple
+    """
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if values.dtype.kind == "M":
+            values = values.dt.strftime(TIMESTAMP_SQL_FORMAT)
+        if values.isna().any():
+            columns.append(values.astype(object).where(values.notna(), None).tolist())
+        else:
+            columns.append(values.to_numpy().tolist())
+    return list(zip(*columns))
+
+
+def _bulk_append_statement(table, columns, placeholder):
+    """
+    Build INSERT statement for executemany
+    :param table: str
+        name of the database table
+    :param columns: list of str
+        names of the columns
+    :param placeholder: str
+        parameter placeholder of the database driver
+    :return: str
+    """
+    return "INSERT INTO `%s` (%s) VALUES (%s);" % (
+        table,
+        ", ".join(["`" + str(col) + "`" for col in columns]),
+        ", ".join([placeholder] * len(columns)),
+    )
+
+
+def _bulk_append_sqlite(conn, table, df):
+    """
+    Insert all rows of df by a single executemany, see evaluation.utils.db.bulk_append()
+    :param conn: sqlalchemy.connection
+    :param table: str
+        name of the database table
+    :param df: pd.DataFrame
+        prepared by evaluation.utils.db._bulk_append_frame()
+    :return: None
+    """
+    conn.exec_driver_sql(
+        _bulk_append_statement(table, df.columns, "?"), _bulk_append_values(df)
+    )
+
+
+def _bulk_append_mysql(conn, table, df):
+    """
+    Load rows of df from a temporary tab-separated file via LOAD DATA LOCAL INFILE,
+    see evaluation.utils.db.bulk_append(). Falls back to executemany if local infile is disabled or the values cannot
+    be written to the file. As LOAD DATA LOCAL skips duplicate rows like INSERT IGNORE, the number of loaded rows is
+    compared to the length of df.
+    :param conn: sqlalchemy.connection
+    :param table: str
+        name of the database table
+    :param df: pd.DataFrame
+        prepared by evaluation.utils.db._bulk_append_frame()
+    :return: None
+    """
+    file = tempfile.NamedTemporaryFile(
+        mode="w", suffix=".tsv", delete=False, newline=""
+    )
+    try:
+        try:
+            with file:
+                df.to_csv(
+                    file,
+                    sep="\t",
+                    na_rep="\\N",
+                    header=False,
+                    index=False,
+                    date_format=TIMESTAMP_SQL_FORMAT,
+                    quoting=csv.QUOTE_NONE,
+                )
+        except csv.Error as error:
+            _bulk_append_mysql_executemany(conn, table, df, error)
+            return
+        try:
+            result = conn.exec_driver_sql(
+                "LOAD DATA LOCAL INFILE '%s' INTO TABLE `%s` "
+                "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (%s);"
+                % (
+                    Path(file.name).as_posix(),
+                    table,
+                    ", ".join(["`" + str(col) + "`" for col in df.columns]),
+                )
+            )
+        except sql.exc.DBAPIError as error:
+            if _mysql_errno(error) not in MYSQL_ERRNO_LOCAL_INFILE_DISABLED:
+                raise
+            _bulk_append_mysql_executemany(conn, table, df, error)
+            return
+        if result.rowcount != len(df.index):
+            warnings_sql = conn.exec_driver_sql("SHOW WARNINGS LIMIT 10;").fetchall()
+            raise ValueError(
+                "Only %s of %s rows loaded into %s, rows are skipped by LOAD DATA LOCAL INFILE "
+                "for example for duplicate keys: %s"
+                % (result.rowcount, len(df.index), table, "; ".join([str(row[-1]) for row in warnings_sql]))
+            )
+    finally:
+        os.remove(file.name)
+
+
+def _bulk_append_mysql_executemany(conn, table, df, error):
+    """
+    Fallback of evaluation.utils.db._bulk_append_mysql() inserting rows of df via executemany
+    :param conn: sqlalchemy.connection
+    :param table: str
+        name of the database table
+    :param df: pd.DataFrame
+        prepared by evaluation.utils.db._bulk_append_frame()
+    :param error: Exception
+        reason why LOAD DATA LOCAL INFILE is not possible
+    :return: None
+    """
+    warnings.warn(
+        "LOAD DATA LOCAL INFILE not possible, use executemany instead: " + str(error)
+    )
+    conn.exec_driver_sql(
+        _bulk_append_statement(table, df.columns, "%s"), _bulk_append_values(df)
+    )
+
+
+def _mysql_errno(error):
+    """
+    Get the MySQL error number of a DBAPI error raised by mysql-connector-python or PyMySQL
+    :param error: sqlalchemy.exc.DBAPIError
+    :return: int or None
+    """
+    errno = getattr(error.orig, "errno", None)
+    if errno is None and len(getattr(error.orig, "args", ())) > 0:
+        errno = error.orig.args[0]
+    return errno
 
 
 def call_procedure(engine, name, params=None):
@@ -149,7 +867,15 @@ def db_constraints_update():
     }
 
 
-def sql_update(df_update, table_name, engine=None, con=None, add_cond=None):
+def sql_update(
+    df_update,
+    table_name,
+    engine=None,
+    con=None,
+    add_cond=None,
+    method="row",
+    print_statements=True,
+):
     """
     Update database by values given in DataFrame df_update. If error occurs, transaction is rolled back.
     :param df_update: pd.DataFrame
@@ -163,11 +889,24 @@ def sql_update(df_update, table_name, engine=None, con=None, add_cond=None):
         Sqlalchemy connection to perform the update, instead of engine
     :param add_cond: str
         additional condition to subselect rows in the table meant to be updated
+    :param method: one of ['row', 'set'], optional, Default 'row'
+        'row': one UPDATE statement per row of df_update
+        'set': df_update is staged in a temporary table and applied by a single UPDATE statement,
+                recommended for many rows
+    :param print_statements: bool, optional, Default True
+        whether to print the executed UPDATE statements
     :return: None
     """
-    return db_config.sql_update(
-        df_update, table_name, engine=engine, con=con, add_cond=add_cond
+    db_config.sql_update(
+        df_update,
+        table_name,
+        engine=engine,
+        con=con,
+        add_cond=add_cond,
+        method=method,
+        print_statements=print_statements,
     )
+    notify_written(table_name, df_update, con=con if con is not None else engine)
 
 
 def get_exp(
@@ -261,7 +1000,7 @@ def get_exp(
     return df_exp
 
 
-def get_data_raw(name_table, col_names, col_values, add_cond):
+def get_data_raw(name_table, col_names, col_values, add_cond, columns=None):
     """
     Core part of the get_data defined in evaluation.utils.db in which the database query is built and executed.
     Here, query is built in sqlite syntax.
@@ -270,9 +1009,11 @@ def get_data_raw(name_table, col_names, col_values, add_cond):
     :param col_values: values of the index columns
     :param add_cond: str, optional Default None
         additional condition to subselect only part of the data
+    :param columns: list of str or None, optional Default None
+        columns to select, if None all columns are selected
     :return: data as pd.DataFrame
     """
-    return db_config.get_data_raw(name_table, col_names, col_values, add_cond)
+    return db_config.get_data_raw(name_table, col_names, col_values, add_cond, columns=columns)
 
 
 def get_data(
@@ -287,6 +1028,9 @@ def get_data(
     t_start_shift__s=0,
     t_end_shift__s=0,
     add_data_without_corresponding_ec=True,
+    matching_engine="searchsorted",
+    cache=False,
+    columns=None,
 ):
     """
     Convenient way to get data tables from database, without formulating sql queries.
@@ -319,6 +1063,22 @@ def get_data(
             and when the df_exp is match_exp_sfc_exp_icpms,
             True will select also data which has no corresponding ec experiment
             False ignores that data, lower performance
+    :param matching_engine: one of ['searchsorted', 'loop'], optional, default 'searchsorted'
+            only applies for data_table_name == 'data_icpms_sfc_analysis'
+            and when the df_exp is match_exp_sfc_exp_icpms,
+            algorithm used to match id_exp_sfc to each icpms datapoint,
+            see evaluation.utils.db.assign_id_exp_sfc_to_data_icpms()
+    :param cache: bool, optional, default False
+            whether to use the local cache of requested data, see evaluation.utils.data_cache.
+            Only data of experiments not already cached is requested from the database. The cache is invalidated
+            when tables the requested table depends on are updated via evaluation.utils.db
+            (insert_into, bulk_append, sql_update), changes by other users are not recognized.
+            Independent of cache, analysis views are read from their materialized copy if it is up to date,
+            see evaluation.utils.materialized_views.
+    :param columns: list of str or None, optional, default None
+            columns of the data table to be selected, if None all columns are selected.
+            Join columns, index columns not given by df_exp and columns required for the timestamp matching
+            are added automatically. If index_cols is None, include the id column of the data.
     :return: experimental data DataFrame
     """
     if join_overlay_cols is None:
@@ -375,12 +1135,53 @@ def get_data(
         return pd.DataFrame({}, index=col_names + ["id_data"])
         # sys.exit('No rows found to get data from')
 
-    data = get_data_raw(
-        name_table=name_table,
-        col_names=col_names,
-        col_values=col_values,
-        add_cond=add_cond,
-    )
+    # column projection, columns required to join, index and match the data are always selected
+    match_data_icpms = df_exp.reset_index().columns.isin(
+        ["id_exp_sfc", "id_exp_icpms"]
+    ).sum() == 2 and name_table in [
+        "data_icpms_sfc_analysis",
+        "data_icpms_sfc_analysis_no_ISTD_fitting",
+    ]
+    if columns is not None:
+        columns_required = list(col_names) + [
+            index_col
+            for index_col in (index_cols if index_cols is not None else [])
+            if index_col not in df_exp.reset_index().columns
+        ]
+        if match_data_icpms:
+            columns_required += ["id_exp_icpms", "id_data_icpms", "t_delaycorrected__timestamp_sfc_pc"]
+            if df_exp.columns.isin(plot.geo_columns.A_geo).any():
+                columns_required += ["dm_dt__ng_s"]
+        columns = list(dict.fromkeys(columns_required + list(columns)))
+
+    # read from materialized copy of analysis views if up to date, see evaluation.utils.materialized_views
+    name_table_read = materialized_views.name_table_read(name_table)
+
+    def load_data(col_values_load):
+        return _timestamp_columns_to_datetime(
+            get_data_raw(
+                name_table=name_table_read,
+                col_names=col_names,
+                col_values=col_values_load,
+                add_cond=add_cond,
+                columns=columns,
+            )
+        )
+
+    if cache:
+        data = data_cache.get(
+            name_table=name_table,
+            col_names=col_names,
+            col_values=col_values,
+            add_cond=add_cond,
+            load=load_data,
+            base_tables=get_base_tables(name_table),
+            version=schema_cache.schema_version(),
+            database=database_identity(connect()),
+            columns=columns,
+        )
+    else:
+        data = load_data(col_values)
 
     if len(data.index) == 0:
         print(
@@ -391,100 +1192,17 @@ def get_data(
         return pd.DataFrame({}, index=col_names + ["id_data"])
         # sys.exit('No data found in database, for the requested query.')
 
-    # transform VARCHAR(45) timestamp columns to datetime64[ns]
-    # (necessary as LabView is unable to insert into Datetime columns)
-    for timestamp_col in [
-        col
-        for col in data.columns
-        if "timestamp" in col.lower() and data[col].dtypes == "O"
-    ]:
-        data.loc[:, timestamp_col] = data.loc[:, timestamp_col].astype("datetime64[ns]")
-
     # special timestamp matching for data_icpms_sfc_analysis and when df_exp is match_exp_sfc_exp_icpms
-    if df_exp.reset_index().columns.isin(
-        ["id_exp_sfc", "id_exp_icpms"]
-    ).sum() == 2 and name_table in [
-        "data_icpms_sfc_analysis",
-        "data_icpms_sfc_analysis_no_ISTD_fitting",
-    ]:
+    if match_data_icpms:
         t_3 = datetime.datetime.now()
         data = data.set_index(["id_exp_icpms", "id_data_icpms"]).sort_index()
-        start_shift = pd.Timedelta(seconds=t_start_shift__s)
-        end_shift = pd.Timedelta(seconds=t_end_shift__s)
-        for index, row in df_exp.reset_index().iterrows():
-            # old (=slower) versions for time matching
-            # v1 - not correct exp_icpms and exp_ec matching
-            # data_icpms.loc[(row.id_exp_icpms,
-            #                slice((data_icpms.t_delaycorrected__timestamp_sfc_pc
-            #                - (pd.to_datetime(row.t_start__timestamp)-pd.Timedelta(seconds=0))).abs().idxmin()[1],
-            #                    (data_icpms.t_delaycorrected__timestamp_sfc_pc
-            #                    - (pd.to_datetime(row.t_end__timestamp)+pd.Timedelta(seconds=0))).abs().idxmin()[1]
-            #                 )), 'id_exp_sfc'] = row.id_exp_sfc
-
-            # v2  - not correct exp_icpms and exp_ec matching, problems when two icpms measurements simultaneously
-            # data_icpms2.loc[(data_icpms2.t_delaycorrected__timestamp_sfc_pc
-            #                   - (pd.to_datetime(row.t_start__timestamp)-pd.Timedelta(seconds=0))).abs().idxmin():\
-            #                    (data_icpms2.t_delaycorrected__timestamp_sfc_pc
-            #                    - (pd.to_datetime(row.t_end__timestamp)+pd.Timedelta(seconds=0))).abs().idxmin()
-            #                 , 'id_exp_sfc'] = row.id_exp_sfc
-
-            # v3 select all icpms experiments belonging to the looped exp_ec from these compare timestamps
-            # - faster and correct matching
-            # data_icpms.loc[(row.id_exp_icpms, (data_icpms.loc[row.id_exp_icpms].t_delaycorrected__timestamp_sfc_pc
-            #               - (pd.to_datetime(row.t_start__timestamp)-pd.Timedelta(seconds=0))).abs().idxmin()):\
-            #       (row.id_exp_icpms, (data_icpms.loc[row.id_exp_icpms].t_delaycorrected__timestamp_sfc_pc
-            #           - (pd.to_datetime(row.t_end__timestamp)+pd.Timedelta(seconds=0))).abs().idxmin())
-            #       , 'id_exp_sfc'] = row.id_exp_sfc
-
-            # v3.2 with grab lines with matching id_exp_icpms only once
-            # and calculate timedelta for start and end_shift before for loop - even a bit faster
-            a = data.loc[row.id_exp_icpms]
-            data.loc[
-                (
-                    row.id_exp_icpms,
-                    (
-                        a.t_delaycorrected__timestamp_sfc_pc
-                        - (pd.to_datetime(row.t_start__timestamp) + start_shift)
-                    )
-                    .abs()
-                    .idxmin(),
-                ): (
-                    row.id_exp_icpms,
-                    (
-                        a.t_delaycorrected__timestamp_sfc_pc
-                        - (pd.to_datetime(row.t_end__timestamp) + end_shift)
-                    )
-                    .abs()
-                    .idxmin(),
-                ),
-                "id_exp_sfc",
-            ] = row.id_exp_sfc
-
-            # v3.3 placing correction of start and end time before for loop --> slower
-            # df_match.loc[:,'t_start__timestamp'] = pd.to_datetime(df_match.t_start__timestamp)
-            #                                       - pd.Timedelta(seconds=500)
-            # df_match.loc[:,'t_end__timestamp'] = pd.to_datetime(df_match.t_start__timestamp)
-            #                                       + pd.Timedelta(seconds=500)
-
-            # v4.1 with grouping index, reduce redudndat time columns appear with multiple measured analyte elements,
-            # but slower
-            # data_icpms.loc[(row.id_exp_icpms, (data_icpms.loc[row.id_exp_icpms].groupby(level=0)
-            # .t_delaycorrected__timestamp_sfc_pc.first() - (pd.to_datetime(row.t_start__timestamp)
-            # -pd.Timedelta(seconds=0))).abs().idxmin()):\
-            #               (row.id_exp_icpms, (data_icpms.loc[row.id_exp_icpms].groupby(level=0)
-            #               .t_delaycorrected__timestamp_sfc_pc.first() - (pd.to_datetime(row.t_end__timestamp)
-            #               +pd.Timedelta(seconds=0))).abs().idxmin())
-            #               , 'id_exp_sfc'] = row.id_exp_sfc
-
-            # v4.2 similar but with .index.duplicated instead
-            # a=data_icpms.loc[row.id_exp_icpms]
-            # data_icpms.loc[(row.id_exp_icpms,
-            #               (a.loc[~a.index.duplicated(keep='first')].t_delaycorrected__timestamp_sfc_pc
-            #               - (pd.to_datetime(row.t_start__timestamp)-pd.Timedelta(seconds=0))).abs().idxmin()):\
-            #               (row.id_exp_icpms,
-            #               (a.loc[~a.index.duplicated(keep='first')].t_delaycorrected__timestamp_sfc_pc
-            #               - (pd.to_datetime(row.t_end__timestamp)+pd.Timedelta(seconds=0))).abs().idxmin())
-            #               , 'id_exp_sfc'] = row.id_exp_sfc
+        data = assign_id_exp_sfc_to_data_icpms(
+            data,
+            df_exp,
+            t_start_shift__s=t_start_shift__s,
+            t_end_shift__s=t_end_shift__s,
+            matching_engine=matching_engine,
+        )
 
         # remove unmmatched data if requested by add_data_without_corresponding_ec
         if not add_data_without_corresponding_ec:
@@ -562,8 +1280,394 @@ def get_data(
     return data_indexed
 
 
+# MySQL error numbers raised by LOAD DATA LOCAL INFILE if local infile is disabled on server or client side:
+# ER_NOT_ALLOWED_COMMAND, ER_CLIENT_LOCAL_FILES_DISABLED, CR_LOAD_DATA_LOCAL_INFILE_REJECTED
+MYSQL_ERRNO_LOCAL_INFILE_DISABLED = (1148, 3948, 2068)
+
+# format of timestamps written to the database, accepted by MySQL DATETIME(6) columns and by the sqlite date functions
+TIMESTAMP_SQL_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def timestamps_to_sql(values):
+    """
+    Convert timestamps once at ingest into strings of TIMESTAMP_SQL_FORMAT. Timezone-aware timestamps are written
+    as local wall time (as done by to_sql). Works for VARCHAR(45) and migrated DATETIME(6) timestamp columns,
+    see evaluation.utils.timestamp_migration.
+    :param values: pd.Series
+        timestamps as datetime64, pd.Timestamp or str, or mixed
+    :return: pd.Series of str, missing values as None
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.DatetimeTZDtype):
+        values = values.dt.tz_localize(None)
+    if values.dtype.kind != "M":
+        values = values.map(
+            lambda value: pd.NaT
+            if pd.isna(value)
+            else pd.Timestamp(value).tz_localize(None)
+            if pd.Timestamp(value).tz is not None
+            else pd.Timestamp(value)
+        ).astype("datetime64[ns]")
+    return values.dt.strftime(TIMESTAMP_SQL_FORMAT).astype(object).where(values.notna(), None)
+
+
+def get_data_by_time(
+    name_table, t_start, t_end, setup=None, add_cond=None, update_intervals=True
+):
+    """
+    Get all datapoints of a data table within a time window, without resolving experiment ids first.
+    Experiments are pruned by the precomputed interval table (see evaluation.utils.time_intervals), data rows are
+    selected via the index on (id_exp, t__s). Time refers to the clock of the sfc computer, ICP-MS data is
+    delay-corrected, thus EC and ICP-MS data of the same time window can be compared directly.
+    Requires evaluation.utils.time_intervals.create() to be run once on the database.
+    :param name_table: str
+        one of evaluation.utils.time_intervals.TIME_QUERY_TABLES, for example data_ec or data_icpms_sfc_analysis
+    :param t_start: str or datetime-like
+        start of the time window
+    :param t_end: str or datetime-like
+        end of the time window
+    :param setup: str or list of str or None, optional, Default None
+        name_setup_sfc of the experiments, if None all setups
+    :param add_cond: str or None, optional, Default None
+        additional condition to subselect only part of the data
+    :param update_intervals: bool, optional, Default True
+        compute intervals of experiments inserted since the last call before the query
+    :return: pd.DataFrame indexed by experiment id and datapoint id
+    """
+    if name_table not in time_intervals.TIME_QUERY_TABLES:
+        raise ValueError(
+            "Query by time not available for "
+            + name_table
+            + ", choose one of "
+            + ", ".join(time_intervals.TIME_QUERY_TABLES.keys())
+        )
+    print('Read data from "' + name_table + '" between ' + str(t_start) + " and " + str(t_end) + " ...")
+    t_query_start = datetime.datetime.now()
+    t_start, t_end = pd.Timestamp(t_start), pd.Timestamp(t_end)
+    name_table_exp = time_intervals.TIME_QUERY_TABLES[name_table]
+    name_id_exp = time_intervals.TIME_INTERVAL_SOURCES[name_table_exp]["name_id_exp"]
+
+    if update_intervals:
+        try:
+            time_intervals.update()
+        except sql.exc.DBAPIError as error:
+            # for example, user not allowed to write the interval table
+            warnings.warn("Intervals of new experiments could not be computed: " + str(error))
+    intervals = time_intervals.get_intervals(name_table_exp, t_start, t_end, setup=setup)
+
+    # experiments completely within the time window, all datapoints are selected
+    inside = (intervals.t_start__timestamp >= t_start) & (intervals.t_end__timestamp <= t_end)
+    data_list = [
+        query_sql_keyset(
+            "SELECT * FROM " + name_table + " WHERE {keyset}"
+            + (" AND " + str(add_cond) if add_cond is not None else "") + ";",
+            key_names=name_id_exp,
+            key_values=intervals.loc[inside, "id_exp"].tolist(),
+        )
+    ]
+    # experiments overlapping the boundaries of the time window, datapoints selected by relative time t__s
+    intervals_boundary = intervals.loc[~inside]
+    n_exp_chunk = KEYSET_MAX_PARAMS // 3
+    for idx in range(0, len(intervals_boundary.index), n_exp_chunk):
+        intervals_chunk = intervals_boundary.iloc[idx: idx + n_exp_chunk]
+        data_list.append(
+            query_sql(
+                "SELECT * FROM " + name_table + " WHERE ("
+                + " OR ".join(
+                    ["(`" + name_id_exp + "` = %s AND t__s >= %s AND t__s <= %s)"]
+                    * len(intervals_chunk.index)
+                )
+                + ")" + (" AND " + str(add_cond) if add_cond is not None else "") + ";",
+                params=[
+                    value
+                    for row in intervals_chunk.itertuples()
+                    for value in [
+                        int(row.id_exp),
+                        (t_start - row.t_start__timestamp).total_seconds(),
+                        (t_end - row.t_start__timestamp).total_seconds(),
+                    ]
+                ],
+                method="pandas",
+            )
+        )
+    data = pd.concat(
+        [data for data in data_list if len(data.index) > 0] or data_list[:1],
+        ignore_index=True,
+    )
+    data = _timestamp_columns_to_datetime(data)
+
+    id_cols = [col for col in data.columns if "id_" in col and col != name_id_exp]
+    data = data.set_index([name_id_exp] + id_cols[:1]).sort_index()
+    print(
+        "Done in ",
+        datetime.datetime.now() - t_query_start,
+        "(" + str(len(intervals.index)) + " experiments, " + str(len(data.index)) + " datapoints)",
+    )
+    return data
+
+
+def _timestamp_columns_to_datetime(data):
+    """
+    Transform VARCHAR(45) timestamp columns to datetime64[ns]
+    (necessary as LabView is unable to insert into Datetime columns).
+    Timestamp columns migrated to DATETIME(6) (see evaluation.utils.timestamp_migration) are already read as
+    datetime64[ns] and not touched. Text in TIMESTAMP_SQL_FORMAT is parsed by the fast exact format parser.
+    :param data: pd.DataFrame
+    :return: data with transformed timestamp columns
+    """
+    for timestamp_col in [
+        col
+        for col in data.columns
+        if "timestamp" in col.lower() and data[col].dtypes == "O"
+    ]:
+        try:
+            data[timestamp_col] = pd.to_datetime(
+                data[timestamp_col], format=TIMESTAMP_SQL_FORMAT
+            )
+        except (ValueError, TypeError):
+            data[timestamp_col] = data[timestamp_col].astype("datetime64[ns]")
+    return data
+
+
+def assign_id_exp_sfc_to_data_icpms(
+    data,
+    df_match,
+    t_start_shift__s=0,
+    t_end_shift__s=0,
+    matching_engine="searchsorted",
+):
+    """
+    Match an sfc experiment to each icpms datapoint (column id_exp_sfc). For each row of df_match the icpms datapoints
+    nearest to the (shifted) start and end timestamp of the ec experiment are searched and all datapoints in between are
+    assigned to that ec experiment. If ec experiments share a datapoint, the one listed later in df_match is assigned.
+    :param data: pd.DataFrame
+        icpms data indexed by id_exp_icpms, id_data_icpms (sorted) with column t_delaycorrected__timestamp_sfc_pc
+    :param df_match: pd.DataFrame
+        matched sfc and icpms experiments as returned by evaluation.utils.db.match_exp_sfc_exp_icpms()
+    :param t_start_shift__s: float
+        will match n seconds before or after the start timestamp of the icpms experiment to th ec experiment
+    :param t_end_shift__s: float
+        will match n seconds before or after the end timestamp of the icpms experiment to th ec experiment
+    :param matching_engine: one of ['searchsorted', 'loop'], optional, default 'searchsorted'
+        'searchsorted': nearest datapoints are searched in the sorted timestamps of each icpms experiment
+                        and all ec experiments are assigned at once
+        'loop': previous implementation looping over each ec experiment, kept for comparison
+    :return: data with added column id_exp_sfc
+    """
+    start_shift = pd.Timedelta(seconds=t_start_shift__s)
+    end_shift = pd.Timedelta(seconds=t_end_shift__s)
+    if matching_engine == "searchsorted":
+        return _assign_id_exp_sfc_searchsorted(data, df_match, start_shift, end_shift)
+    elif matching_engine == "loop":
+        return _assign_id_exp_sfc_loop(data, df_match, start_shift, end_shift)
+    else:
+        raise NotImplementedError("Matching engine " + str(matching_engine) + " not implemented")
+
+
+def _assign_id_exp_sfc_loop(data, df_exp, start_shift, end_shift):
+    """
+    Loop-based matching of id_exp_sfc to icpms datapoints, see evaluation.utils.db.assign_id_exp_sfc_to_data_icpms()
+    :param data: pd.DataFrame
+        icpms data indexed by id_exp_icpms, id_data_icpms (sorted)
+    :param df_exp: pd.DataFrame
+        matched sfc and icpms experiments
+    :param start_shift: pd.Timedelta
+        shift of the start timestamp of the ec experiment
+    :param end_shift: pd.Timedelta
+        shift of the end timestamp of the ec experiment
+    :return: data with added column id_exp_sfc
+    """
+    for index, row in df_exp.reset_index().iterrows():
+        # old (=slower) versions for time matching
+        # v1 - not correct exp_icpms and exp_ec matching
+        # data_icpms.loc[(row.id_exp_icpms,
+        #                slice((data_icpms.t_delaycorrected__timestamp_sfc_pc
+        #                - (pd.to_datetime(row.t_start__timestamp)-pd.Timedelta(seconds=0))).abs().idxmin()[1],
+        #                    (data_icpms.t_delaycorrected__timestamp_sfc_pc
+        #                    - (pd.to_datetime(row.t_end__timestamp)+pd.Timedelta(seconds=0))).abs().idxmin()[1]
+        #                 )), 'id_exp_sfc'] = row.id_exp_sfc
+
+        # v2  - not correct exp_icpms and exp_ec matching, problems when two icpms measurements simultaneously
+        # data_icpms2.loc[(data_icpms2.t_delaycorrected__timestamp_sfc_pc
+        #                   - (pd.to_datetime(row.t_start__timestamp)-pd.Timedelta(seconds=0))).abs().idxmin():\
+        #                    (data_icpms2.t_delaycorrected__timestamp_sfc_pc
+        #                    - (pd.to_datetime(row.t_end__timestamp)+pd.Timedelta(seconds=0))).abs().idxmin()
+        #                 , 'id_exp_sfc'] = row.id_exp_sfc
+
+        # v3 select all icpms experiments belonging to the looped exp_ec from these compare timestamps
+        # - faster and correct matching
+        # data_icpms.loc[(row.id_exp_icpms, (data_icpms.loc[row.id_exp_icpms].t_delaycorrected__timestamp_sfc_pc
+        #               - (pd.to_datetime(row.t_start__timestamp)-pd.Timedelta(seconds=0))).abs().idxmin()):\
+        #       (row.id_exp_icpms, (data_icpms.loc[row.id_exp_icpms].t_delaycorrected__timestamp_sfc_pc
+        #           - (pd.to_datetime(row.t_end__timestamp)+pd.Timedelta(seconds=0))).abs().idxmin())
+        #       , 'id_exp_sfc'] = row.id_exp_sfc
+
+        # v3.2 with grab lines with matching id_exp_icpms only once
+        # and calculate timedelta for start and end_shift before for loop - even a bit faster
+        a = data.loc[row.id_exp_icpms]
+        data.loc[
+            (
+                row.id_exp_icpms,
+                (
+                    a.t_delaycorrected__timestamp_sfc_pc
+                    - (pd.to_datetime(row.t_start__timestamp) + start_shift)
+                )
+                .abs()
+                .idxmin(),
+            ): (
+                row.id_exp_icpms,
+                (
+                    a.t_delaycorrected__timestamp_sfc_pc
+                    - (pd.to_datetime(row.t_end__timestamp) + end_shift)
+                )
+                .abs()
+                .idxmin(),
+            ),
+            "id_exp_sfc",
+        ] = row.id_exp_sfc
+
+        # v3.3 placing correction of start and end time before for loop --> slower
+        # df_match.loc[:,'t_start__timestamp'] = pd.to_datetime(df_match.t_start__timestamp)
+        #                                       - pd.Timedelta(seconds=500)
+        # df_match.loc[:,'t_end__timestamp'] = pd.to_datetime(df_match.t_start__timestamp)
+        #                                       + pd.Timedelta(seconds=500)
+
+        # v4.1 with grouping index, reduce redudndat time columns appear with multiple measured analyte elements,
+        # but slower
+        # data_icpms.loc[(row.id_exp_icpms, (data_icpms.loc[row.id_exp_icpms].groupby(level=0)
+        # .t_delaycorrected__timestamp_sfc_pc.first() - (pd.to_datetime(row.t_start__timestamp)
+        # -pd.Timedelta(seconds=0))).abs().idxmin()):\
+        #               (row.id_exp_icpms, (data_icpms.loc[row.id_exp_icpms].groupby(level=0)
+        #               .t_delaycorrected__timestamp_sfc_pc.first() - (pd.to_datetime(row.t_end__timestamp)
+        #               +pd.Timedelta(seconds=0))).abs().idxmin())
+        #               , 'id_exp_sfc'] = row.id_exp_sfc
+
+        # v4.2 similar but with .index.duplicated instead
+        # a=data_icpms.loc[row.id_exp_icpms]
+        # data_icpms.loc[(row.id_exp_icpms,
+        #               (a.loc[~a.index.duplicated(keep='first')].t_delaycorrected__timestamp_sfc_pc
+        #               - (pd.to_datetime(row.t_start__timestamp)-pd.Timedelta(seconds=0))).abs().idxmin()):\
+        #               (row.id_exp_icpms,
+        #               (a.loc[~a.index.duplicated(keep='first')].t_delaycorrected__timestamp_sfc_pc
+        #               - (pd.to_datetime(row.t_end__timestamp)+pd.Timedelta(seconds=0))).abs().idxmin())
+        #               , 'id_exp_sfc'] = row.id_exp_sfc
+    return data
+
+
+def _assign_id_exp_sfc_searchsorted(data, df_match, start_shift, end_shift):
+    """
+    Sorted-array matching of id_exp_sfc to icpms datapoints, see evaluation.utils.db.assign_id_exp_sfc_to_data_icpms().
+    Per icpms experiment, the nearest datapoints to all start and end timestamps are searched at once. The resulting
+    ranges of datapoints are assigned in a single step, ec experiments listed later in df_match overrule earlier ones.
+    :param data: pd.DataFrame
+        icpms data indexed by id_exp_icpms, id_data_icpms (sorted)
+    :param df_match: pd.DataFrame
+        matched sfc and icpms experiments
+    :param start_shift: pd.Timedelta
+        shift of the start timestamp of the ec experiment
+    :param end_shift: pd.Timedelta
+        shift of the end timestamp of the ec experiment
+    :return: data with added column id_exp_sfc
+    """
+    df_match = df_match.reset_index()
+    match_ids_exp_icpms = df_match.id_exp_icpms.to_numpy()
+    match_t_start = (
+        pd.to_datetime(df_match.t_start__timestamp) + start_shift
+    ).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    match_t_end = (
+        pd.to_datetime(df_match.t_end__timestamp) + end_shift
+    ).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    nat = np.datetime64("NaT").astype(np.int64)
+
+    ids_exp_icpms = data.index.get_level_values("id_exp_icpms").to_numpy()
+    ids_data_icpms = data.index.get_level_values("id_data_icpms").to_numpy()
+    timestamps = data.t_delaycorrected__timestamp_sfc_pc.to_numpy(
+        dtype="datetime64[ns]"
+    ).astype(np.int64)
+
+    # data is sorted by index, thus each icpms experiment is a contiguous block of rows
+    group_ids, group_begin = np.unique(ids_exp_icpms, return_index=True)
+    group_end = np.append(group_begin[1:], len(ids_exp_icpms))
+
+    rows_begin, rows_end, match_order = [], [], []
+    for id_exp_icpms, begin, end in zip(group_ids, group_begin, group_end):
+        idx_match = np.flatnonzero(
+            (match_ids_exp_icpms == id_exp_icpms)
+            & (match_t_start != nat)
+            & (match_t_end != nat)
+        )
+        group_timestamps = timestamps[begin:end]
+        idx_valid = np.flatnonzero(group_timestamps != nat)
+        if len(idx_match) == 0 or len(idx_valid) == 0:
+            continue
+        group_ids_data = ids_data_icpms[begin:end]
+
+        # id_data_icpms of the nearest datapoints to start and end of the ec experiments
+        id_data_start = group_ids_data[
+            _nearest_position(group_timestamps, idx_valid, match_t_start[idx_match])
+        ]
+        id_data_end = group_ids_data[
+            _nearest_position(group_timestamps, idx_valid, match_t_end[idx_match])
+        ]
+        # rows in between (all isotopes of these datapoints), equivalent to .loc slicing of the sorted index
+        rows_begin.append(begin + np.searchsorted(group_ids_data, id_data_start, side="left"))
+        rows_end.append(begin + np.searchsorted(group_ids_data, id_data_end, side="right"))
+        match_order.append(idx_match)
+
+    id_exp_sfc = np.full(len(data.index), np.nan)
+    if len(match_order) > 0:
+        rows_begin = np.concatenate(rows_begin)
+        rows_end = np.concatenate(rows_end)
+        match_order = np.concatenate(match_order)
+        lengths = np.clip(rows_end - rows_begin, 0, None)
+
+        # expand ranges to row positions, the last matching ec experiment (in order of df_match) is assigned
+        rows = np.repeat(rows_begin - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        owner = np.full(len(data.index), -1, dtype=np.int64)
+        np.maximum.at(owner, rows, np.repeat(match_order, lengths))
+        id_exp_sfc[owner >= 0] = df_match.id_exp_sfc.to_numpy()[owner[owner >= 0]]
+
+    data.loc[:, "id_exp_sfc"] = id_exp_sfc
+    return data
+
+
+def _nearest_position(timestamps, idx_valid, targets):
+    """
+    Search the position of the datapoint nearest to each target timestamp. Equivalent to
+    (timestamps - target).abs().idxmin() per target, thus on ties the first datapoint is returned.
+    :param timestamps: np.array of int64
+        timestamps of the datapoints in ns
+    :param idx_valid: np.array of int
+        positions of the datapoints with a valid (not NaT) timestamp
+    :param targets: np.array of int64
+        target timestamps in ns
+    :return: np.array of int, positions of the nearest datapoints in timestamps
+    """
+    order = idx_valid[np.argsort(timestamps[idx_valid], kind="stable")]
+    timestamps_sorted = timestamps[order]
+    idx_right = np.searchsorted(timestamps_sorted, targets, side="left")
+    idx_left = np.clip(idx_right - 1, 0, len(order) - 1)
+    idx_right = np.clip(idx_right, 0, len(order) - 1)
+    # first datapoint of a sequence of datapoints with identical timestamps
+    idx_left = np.searchsorted(timestamps_sorted, timestamps_sorted[idx_left], side="left")
+
+    distance_left = np.abs(targets - timestamps_sorted[idx_left])
+    distance_right = np.abs(timestamps_sorted[idx_right] - targets)
+    position_left = order[idx_left]
+    position_right = order[idx_right]
+    take_left = (distance_left < distance_right) | (
+        (distance_left == distance_right) & (position_left < position_right)
+    )
+    return np.where(take_left, position_left, position_right)
+
+
 def match_exp_sfc_exp_icpms(
-    df_exp, overlay_cols=None, add_cond=None, A_geo_cols=None, add_cols=None
+    df_exp,
+    overlay_cols=None,
+    add_cond=None,
+    A_geo_cols=None,
+    add_cols=None,
+    matching_engine=None,
 ):
     """
     Get a DataFrame which matches sfc and icpms experiments. Matching on experiment level is required to
@@ -580,6 +1684,13 @@ def match_exp_sfc_exp_icpms(
         (to calculate geometric corrected icpms mass transfer rates)
     :param add_cols:
         additonal columns which shoul dbe handed over from icpms or ec to the other
+    :param matching_engine: one of [None, 'interval', 'view'], optional, default None
+        None: 'interval' if evaluation.utils.exp_matching.is_supported() for add_cond and add_cols, else 'view'
+        'interval': time windows of all experiments are held in memory and matched by binary search,
+                    only experiments inserted or updated since the last call are loaded from the database,
+                    see evaluation.utils.exp_matching. add_cond is evaluated on exp_ec_expanded.
+        'view': select from the view match_exp_sfc_exp_icpms, missing end timestamps of ec experiments are
+                calculated before on every call, see evaluation.processing.tools_ec.update_exp_sfc_t_end__timestamp()
     :return: pd.DataFrame matching sfc and icpms experiment
     """
     if overlay_cols is None:
@@ -604,29 +1715,34 @@ def match_exp_sfc_exp_icpms(
     index_names = index_names[0]
     index_values = df_exp.reset_index().loc[:, str(index_names)].unique()  # .to_list()
 
-    # engine = db.connect('hte_write')
-    # db.call_procedure(engine, 'update_exp_sfc_t_end__timestamp')
-    tools_ec.update_exp_sfc_t_end__timestamp()
-
-    sql_query = (
-        """SELECT id_exp_sfc, t_start__timestamp,t_end__timestamp, id_exp_icpms"""
-        + ((", " + ", ".join(A_geo_cols)) if A_geo_cols is not None else "")
-        + ((", " + ", ".join(add_cols)) if add_cols is not None else "")
-        + """  FROM match_exp_sfc_exp_icpms m   
-           WHERE ("""
-        + str(index_names).replace("'", "`")
-        + """)   IN ("""
-        + str(list(index_values))[1:-1]
-        + ")"
-        + (" AND " + str(add_cond) if add_cond is not None else "")
-        + ";"
-    )
-    print(sql_query)
-    with connect().begin() as con:
-        df = pd.read_sql(
-            sql_query,
-            con=con,
+    if matching_engine is None:
+        matching_engine = "interval" if exp_matching.is_supported(add_cond=add_cond, add_cols=add_cols) else "view"
+    if matching_engine == "interval":
+        df = exp_matching.match(
+            index_names,
+            index_values,
+            add_cond=add_cond,
+            A_geo_cols=A_geo_cols,
+            add_cols=add_cols,
+        )
+    elif matching_engine == "view":
+        # engine = db.connect('hte_write')
+        # db.call_procedure(engine, 'update_exp_sfc_t_end__timestamp')
+        tools_ec.update_exp_sfc_t_end__timestamp()
+
+        sql_query = (
+            """SELECT id_exp_sfc, t_start__timestamp,t_end__timestamp, id_exp_icpms"""
+            + ((", " + ", ".join(A_geo_cols)) if A_geo_cols is not None else "")
+            + ((", " + ", ".join(add_cols)) if add_cols is not None else "")
+            + """  FROM match_exp_sfc_exp_icpms m   
+               WHERE """
+            + KEYSET_PLACEHOLDER
+            + (" AND " + str(add_cond) if add_cond is not None else "")
+            + ";"
         )
+        df = query_sql_keyset(sql_query, key_names=index_names, key_values=index_values)
+    else:
+        raise NotImplementedError("Matching engine " + str(matching_engine) + " not implemented")
 
     if len(overlay_cols) > 0:
         df = df.join(
@@ -646,27 +1762,29 @@ def get_exp_ec_dataset(exp_ec, con=None):
         if None a new will be initialized
     :return: exp_ec_dataset_definer
     """
-    if con is None:
-        con = connect()
     ids_exp_sfc = exp_ec.reset_index().id_exp_sfc.tolist()
-    ids_exp_sfc_str = ", ".join(["%s"] * len(ids_exp_sfc))
 
-    exp_ec_datasets_definer = query_sql(
+    # All entries of datasets containing any of the selected id_exp_sfc
+    exp_ec_datasets_definer = query_sql_keyset(
         """SELECT *
            FROM exp_ec_datasets_definer
            WHERE  id_exp_ec_dataset IN (SELECT id_exp_ec_dataset FROM exp_ec_datasets_definer
-                                        GROUP BY id_exp_ec_dataset
-                                        HAVING COUNT(*)= %s)
-                                        # Exclude datasets with more or less id_exp_sfc than selected                
-               AND  id_exp_ec_dataset NOT IN (SELECT id_exp_ec_dataset FROM exp_ec_datasets_definer
-                                              WHERE id_exp_sfc NOT IN (""" + ids_exp_sfc_str + """))
-                                        # Exclude datasets with other id_exp_sfc than selected
+                                        WHERE {keyset})
         ; """,
-        params=[len(ids_exp_sfc)] + ids_exp_sfc,
-        method="pandas",
+        key_names="id_exp_sfc",
+        key_values=ids_exp_sfc,
         con=con,
+    ).drop_duplicates(ignore_index=True)
+
+    # Exclude datasets with more or less id_exp_sfc than selected
+    # and exclude datasets with other id_exp_sfc than selected
+    dataset_groups = exp_ec_datasets_definer.groupby("id_exp_ec_dataset").id_exp_sfc
+    datasets_selected = (dataset_groups.transform("count") == len(ids_exp_sfc)) & (
+        exp_ec_datasets_definer.id_exp_sfc.isin(ids_exp_sfc).groupby(
+            exp_ec_datasets_definer.id_exp_ec_dataset
+        ).transform("all")
     )
-    return exp_ec_datasets_definer
+    return exp_ec_datasets_definer.loc[datasets_selected].reset_index(drop=True)
 
 
 def get_ana_icpms_sfc_fitting(exp_ec, exp_icpms, id_fit=0, show_result_svg=True):
@@ -704,6 +1822,80 @@ def get_ana_icpms_sfc_fitting(exp_ec, exp_icpms, id_fit=0, show_result_svg=True)
     return ana_icpms_sfc_fitting
 
 
+def select_exp_ec_sfc_icpms(
+    sql_ec=None,
+    id_exp_sfc=None,
+    id_exp_ec_dataset=None,
+    overlay_cols=None,
+    join_exp_ec_dataset_to_exp_ec=True,
+):
+    """
+    Select the ec experiments of an sfc icpms dataset, see evaluation.utils.db.get_exp_sfc_icpms()
+    :param sql_ec: str or None, default None
+        SQL query for ec experiments
+    :param id_exp_sfc: list of int or None
+        indices of sfc experiments
+    :param id_exp_ec_dataset: list of int or None
+        indices of ec experiment datasets
+    :param overlay_cols: list of str or None
+        SFC experiment columns on which the experiments should be overlayed when time-synced
+    :param join_exp_ec_dataset_to_exp_ec: bool, Default True
+        whether to join id_exp_ec_dataset into exp_ec
+    :return: exp_ec, exp_ec_datasets_definer
+    """
+    if overlay_cols is None:
+        overlay_cols = []
+    # Init with None
+    exp_ec_datasets_definer = None
+
+    if sql_ec is not None:
+        exp_ec = get_exp(sql_ec, index_col=["id_exp_sfc"])
+
+    elif id_exp_ec_dataset is not None:
+        exp_ec_datasets_definer = get_exp(
+            pd.DataFrame(
+                id_exp_ec_dataset, columns=["id_exp_ec_dataset"]
+            ).set_index("id_exp_ec_dataset"),
+            name_table="exp_ec_datasets_definer",
+            join_col=["id_exp_ec_dataset"],
+            index_col=["id_exp_ec_dataset"],
+        )
+        exp_ec = get_exp(
+            exp_ec_datasets_definer,
+            name_table="exp_ec_expanded",
+            join_col=["id_exp_sfc"],
+            index_col=["id_exp_sfc"],
+        )
+
+    elif id_exp_sfc is not None:
+        exp_ec = get_exp(
+            pd.DataFrame(id_exp_sfc, columns=["id_exp_sfc"]).set_index(
+                "id_exp_sfc"
+            ),
+            name_table="exp_ec_expanded",
+            join_col=["id_exp_sfc"],
+            index_col=["id_exp_sfc"],
+        )
+    else:
+        raise ValueError("Not enough parameters to get sfc icpms data!")
+
+    if exp_ec_datasets_definer is None:
+        exp_ec_datasets_definer = get_exp_ec_dataset(exp_ec)
+    if join_exp_ec_dataset_to_exp_ec:
+        exp_ec = pd.concat(
+            [  # experiments with id_exp_ec_dataset already initiated
+                exp_ec_datasets_definer.reset_index()
+                .join(exp_ec, on="id_exp_sfc")
+                .set_index("id_exp_sfc"),
+                # experiments with id_exp_ec_dataset = NaN
+                exp_ec.loc[~exp_ec.index.isin(exp_ec_datasets_definer.id_exp_sfc)],
+            ]
+        )
+
+    exp_ec = exp_ec.reset_index().set_index(overlay_cols + ["id_exp_sfc"])
+    return exp_ec, exp_ec_datasets_definer
+
+
 def get_exp_sfc_icpms(
     sql_ec=None,
     sql_icpms=None,
@@ -719,6 +1911,7 @@ def get_exp_sfc_icpms(
     multiple_exp_icpms_isotopes=True,
     join_exp_ec_dataset_to_exp_ec=True,
     add_data_without_corresponding_ec=False,
+    lazy=False,
 ):
     """
     Shorthand function to retrieve sfc icpms datasets by SQL query for ec experiments or icpms experiments
@@ -752,8 +1945,13 @@ def get_exp_sfc_icpms(
         whether to join id_exp_ec_dataset into exp_ec
     :param add_data_without_corresponding_ec: bool, Default False
         whether to add icpms data during which no ec experiment was performed
+    :param lazy: bool, Default False
+        return a lazy dataset instead, which requests experiments and data only when accessed and supports
+        selecting columns and isotope pairs (name_isotope_analyte, name_isotope_internalstandard) in the database
+        query, see evaluation.utils.sfc_icpms_dataset.SfcIcpmsDataset. The multiple_* checks are not applied.
     :return: exp_ec, data_ec, exp_icpms, data_icpms
         each as pd.DataFrame
+        or SfcIcpmsDataset if lazy
     """
     if overlay_cols is None:
         overlay_cols = []
@@ -787,55 +1985,28 @@ def get_exp_sfc_icpms(
         allowed_None=False,
     )
 
-    if any([param is not None for param in [sql_ec, id_exp_ec_dataset, id_exp_sfc]]):
-        # Init with None
-        exp_ec_datasets_definer = None
-
-        if sql_ec is not None:
-            exp_ec = get_exp(sql_ec, index_col=["id_exp_sfc"])
-
-        elif id_exp_ec_dataset is not None:
-            exp_ec_datasets_definer = get_exp(
-                pd.DataFrame(
-                    id_exp_ec_dataset, columns=["id_exp_ec_dataset"]
-                ).set_index("id_exp_ec_dataset"),
-                name_table="exp_ec_datasets_definer",
-                join_col=["id_exp_ec_dataset"],
-                index_col=["id_exp_ec_dataset"],
-            )
-            exp_ec = get_exp(
-                exp_ec_datasets_definer,
-                name_table="exp_ec_expanded",
-                join_col=["id_exp_sfc"],
-                index_col=["id_exp_sfc"],
-            )
-
-        elif id_exp_sfc is not None:
-            exp_ec = get_exp(
-                pd.DataFrame(id_exp_sfc, columns=["id_exp_sfc"]).set_index(
-                    "id_exp_sfc"
-                ),
-                name_table="exp_ec_expanded",
-                join_col=["id_exp_sfc"],
-                index_col=["id_exp_sfc"],
-            )
-        else:
-            raise ValueError("Not enough parameters to get sfc icpms data!")
-
-        if exp_ec_datasets_definer is None:
-            exp_ec_datasets_definer = get_exp_ec_dataset(exp_ec)
-        if join_exp_ec_dataset_to_exp_ec:
-            exp_ec = pd.concat(
-                [  # experiments with id_exp_ec_dataset already initiated
-                    exp_ec_datasets_definer.reset_index()
-                    .join(exp_ec, on="id_exp_sfc")
-                    .set_index("id_exp_sfc"),
-                    # experiments with id_exp_ec_dataset = NaN
-                    exp_ec.loc[~exp_ec.index.isin(exp_ec_datasets_definer.id_exp_sfc)],
-                ]
-            )
+    if lazy:
+        if any([param is not None for param in [sql_icpms, id_exp_icpms]]):
+            raise Exception("Not developed yet!")
+        return sfc_icpms_dataset.SfcIcpmsDataset(
+            sql_ec=sql_ec,
+            id_exp_sfc=id_exp_sfc,
+            id_exp_ec_dataset=id_exp_ec_dataset,
+            name_isotope_analyte=name_isotope_analyte,
+            name_isotope_internalstandard=name_isotope_internalstandard,
+            overlay_cols=overlay_cols,
+            join_exp_ec_dataset_to_exp_ec=join_exp_ec_dataset_to_exp_ec,
+            add_data_without_corresponding_ec=add_data_without_corresponding_ec,
+        )
 
-        exp_ec = exp_ec.reset_index().set_index(overlay_cols + ["id_exp_sfc"])
+    if any([param is not None for param in [sql_ec, id_exp_ec_dataset, id_exp_sfc]]):
+        exp_ec, exp_ec_datasets_definer = select_exp_ec_sfc_icpms(
+            sql_ec=sql_ec,
+            id_exp_sfc=id_exp_sfc,
+            id_exp_ec_dataset=id_exp_ec_dataset,
+            overlay_cols=overlay_cols,
+            join_exp_ec_dataset_to_exp_ec=join_exp_ec_dataset_to_exp_ec,
+        )
 
         # Check multiple exp_ec and exp_ec_dataset
         if not multiple_exp_ec:
@@ -919,7 +2090,7 @@ def get_exp_sfc_icpms(
         data_icpms=data_icpms,
         timestamp_col_ec="Timestamp",
         timestamp_col_icpms="t_delaycorrected__timestamp_sfc_pc",
-        overlay_index_cols=overlay_cols,
+        overlay_index_cols=overlay_cols if len(overlay_cols) > 0 else None,
     )
 
     if not (exp_ec.name_user == current_user()).all():
@@ -965,15 +2136,7 @@ def derive_name_base_table(name_table, debug=False):
     """
     primary_keys = get_primarykeys()
     if name_table not in primary_keys.index:
-        with connect().begin() as con:
-            df_view_information = pd.read_sql(
-                """SELECT name_table, name_base_table
-                             FROM documentation_tables
-                             WHERE table_type = 'VIEW'
-                            """,
-                con=con,
-                index_col="name_table",
-            )
+        df_view_information = get_view_base_tables()
         if name_table not in df_view_information.index:
             raise Exception(
                 name_table
@@ -1004,9 +2167,99 @@ def get_primarykeys(name_table=None, table_schema="hte_data"):
         name of the database schema of the table
     :return: primary_keys_grouped
     """
+    primary_keys = schema_cache.get(
+        "primary_keys", db_config.get_primarykeys, table_schema=table_schema
+    )
+    if name_table is None:
+        return primary_keys
+    elif name_table in primary_keys.index:
+        return list(primary_keys.loc[name_table])
+    # let db_config handle unknown tables
     return db_config.get_primarykeys(name_table=name_table, table_schema=table_schema)
 
 
+def get_view_base_tables(table_schema="hte_data"):
+    """
+    Get the base table of each view as defined in documentation_tables
+    :param table_schema: str, default='hte_data'
+        name of the database schema
+    :return: pd.DataFrame indexed by name_table with column name_base_table
+    """
+    return schema_cache.get(
+        "view_base_tables", _get_view_base_tables, table_schema=table_schema
+    )
+
+
+def _get_view_base_tables(table_schema="hte_data"):
+    """
+    Read the base table of each view from documentation_tables, use cached evaluation.utils.db.get_view_base_tables()
+    :param table_schema: dummy, required for compatibility with evaluation.utils.schema_cache.get()
+    :return: pd.DataFrame indexed by name_table with column name_base_table
+    """
+    return query_sql(
+        """SELECT name_table, name_base_table
+           FROM documentation_tables
+           WHERE table_type = 'VIEW'
+        """,
+        method="pandas",
+        index_col="name_table",
+    )
+
+
+def get_base_tables(name_table, table_schema="hte_data"):
+    """
+    Get all tables a table or view depends on, including tables referenced by referenced views
+    :param name_table: str
+        name of the table or view
+    :param table_schema: str, default='hte_data'
+        name of the database schema
+    :return: list of str, for a table only the table itself
+    """
+    view_dependencies = schema_cache.get(
+        "view_dependencies", _get_view_dependencies, table_schema=table_schema
+    )
+    return view_dependencies.get(name_table, [name_table])
+
+
+def _get_view_dependencies(table_schema="hte_data"):
+    """
+    Derive the tables each view depends on from the create view statements, use cached
+    evaluation.utils.db.get_base_tables()
+    :param table_schema: str, default='hte_data'
+        name of the database schema
+    :return: dict with name of view as key and list of names of tables as value
+    """
+    name_tables = list(get_primarykeys(table_schema=table_schema).index)
+    name_views = get_views(table_schema=table_schema)
+    references = {}
+    for name_view in name_views:
+        create_view_statement = get_create_view(name_view=name_view)
+        references[name_view] = [
+            name_reference
+            for name_reference in name_tables + name_views
+            if name_reference != name_view
+            and re.search(
+                r"(?<!\w)" + re.escape(name_reference) + r"(?!\w)",
+                create_view_statement,
+            )
+        ]
+
+    def base_tables(name_view, visited):
+        tables = set()
+        for name_reference in references[name_view]:
+            if name_reference in references:
+                if name_reference not in visited:
+                    tables |= base_tables(name_reference, visited | {name_reference})
+            else:
+                tables.add(name_reference)
+        return tables
+
+    return {
+        name_view: sorted(base_tables(name_view, {name_view}))
+        for name_view in name_views
+    }
+
+
 def get_foreignkey_links(
     table_schema="hte_data",
     referenced_table_schema="hte_data",
@@ -1019,7 +2272,9 @@ def get_foreignkey_links(
         name of the database schema of the referenced table
     :return: foreign_key table as pd.DataFrame
     """
-    return db_config.get_foreignkey_links(
+    return schema_cache.get(
+        "foreignkey_links",
+        db_config.get_foreignkey_links,
         table_schema=table_schema,
         referenced_table_schema=referenced_table_schema,
     )
@@ -1056,6 +2311,18 @@ def get_views_sorted(table_schema="hte_data", debug=False):
         print additional debug info
     :return: list of all views in database
     """
+    return schema_cache.get("views_sorted", _get_views_sorted, table_schema=table_schema, debug=debug)
+
+
+def _get_views_sorted(table_schema="hte_data", debug=False):
+    """
+    Read and sort views in the database, use cached evaluation.utils.db.get_views_sorted()
+    :param table_schema: table_schema: str, default='hte_data'
+        name of the database schema of the table
+    :param debug: bool
+        print additional debug info
+    :return: list of all views in database
+    """
     view_tables_list = get_views(table_schema=table_schema, debug=debug)
 
     view_references = {}
@@ -83,11 +83,12 @@ def connect(
     :param echo: dummy, required for compatibility with mysql connect
     :param database: dummy, required for compatibility with mysql connect
     :param host: dummy, required for compatibility with mysql connect
-    :return: sqlalchemy engine
+    :return: sqlalchemy engine, cached per path_to_sqlite with pooled connections
     """
 
     def sqlite_engine_creator():
-        con_sqlite_raw = sqlite3.connect(path_to_sqlite)
+        # connections are handed between threads by the pool, but only used by one thread at a time
+        con_sqlite_raw = sqlite3.connect(path_to_sqlite, check_same_thread=False)
         con_sqlite_raw.create_aggregate(
             "stdv", 1, StdevFunc
         )  # add customized stdev function to sqlite
@@ -96,22 +97,39 @@ def connect(
         )  # add customized power function
         return con_sqlite_raw
 
-    return sql.create_engine("sqlite+pysqlite://", creator=sqlite_engine_creator)
+    return db.get_engine(
+        (user, database, host, str(Path(path_to_sqlite).resolve()), echo),
+        lambda: sql.create_engine(
+            # the path identifies the database only, connections are opened by sqlite_engine_creator
+            "sqlite+pysqlite:///" + Path(path_to_sqlite).resolve().as_posix(),
+            creator=sqlite_engine_creator,
+            poolclass=sql.pool.QueuePool,
+            echo=echo,
+        ),
+    )
 
 
-def translate_mysql2sqlite(query, debug=False):
+def translate_mysql2sqlite(query, debug=False, method="tokenizer"):
     """
     translates syntax from mysql to sqlite
     :param query: query in mysql syntax
     :param debug: whether to print debug information
+    :param method: one of ['tokenizer', 'passes']
+        'tokenizer': cached single pass translation by evaluation.utils.mysql_to_sqlite.translate()
+        'passes': apply each translation of evaluation.utils.mysql_to_sqlite one after another
     :return: query in sqlite syntax
     """
-    query = mysql_to_sqlite.time_intervals(query, debug)
-    query = mysql_to_sqlite.timestampdiff(query, debug)
-    query = mysql_to_sqlite.functions(query)
-    query = mysql_to_sqlite.query_params(query)
-    query = mysql_to_sqlite.database_name(query, debug)
-    query = mysql_to_sqlite.comments(query, debug)
+    if method == "tokenizer":
+        query = mysql_to_sqlite.translate(query)
+    elif method == "passes":
+        query = mysql_to_sqlite.time_intervals(query, debug)
+        query = mysql_to_sqlite.timestampdiff(query, debug)
+        query = mysql_to_sqlite.functions(query)
+        query = mysql_to_sqlite.query_params(query)
+        query = mysql_to_sqlite.database_name(query, debug)
+        query = mysql_to_sqlite.comments(query, debug)
+    else:
+        raise NotImplementedError("Method not implemented")
     print("sqlite query: ", query) if debug else ""
     return query
 
@@ -175,7 +193,15 @@ def call_procedure(engine, name, params=None):
     return True
 
 
-def sql_update(df_update, table_name, engine=None, con=None, add_cond=None):
+def sql_update(
+    df_update,
+    table_name,
+    engine=None,
+    con=None,
+    add_cond=None,
+    method="row",
+    print_statements=True,
+):
     """
     Update sqlite database by values given in DataFrame df_update. If error occurs, transaction is rolled back.
     :param df_update: pd.DataFrame
@@ -189,6 +215,11 @@ def sql_update(df_update, table_name, engine=None, con=None, add_cond=None):
         Sqlalchemy connection to perform the update, instead of engine
     :param add_cond: str
         additional condition to subselect rows in the table meant to be updated
+    :param method: one of ['row', 'set'], optional, Default 'row'
+        'row': one UPDATE statement per row of df_update
+        'set': df_update is inserted into a temporary table and applied by a single UPDATE ... FROM statement
+    :param print_statements: bool, optional, Default True
+        whether to print the executed UPDATE statements
     :return: None
     """
     con_init = con
@@ -209,51 +240,158 @@ def sql_update(df_update, table_name, engine=None, con=None, add_cond=None):
     ):  # ['exp_icpms_sfc', 'exp_icpms_integration', 'exp_ec_integration', 'ana_integrations', 'exp_sfc']:
         raise Exception("Udating " + table_name + " not implemented yet")
 
-    for index, row in df_update.iterrows():
-        # print(len(row.index))
-        sql_query = "UPDATE  `" + table_name + "` SET "
-        vals = []
-        for iteration, (col, val) in enumerate(row.to_dict().items()):
-            if db_constraints[table_name] is not None:
-                if col not in db_constraints[table_name]:
-                    raise ConnectionRefusedError(
-                        "Update column " + col + " is not allowed."
-                    )
-            if (
-                type(val) == pd.Timestamp
-            ):  # sqlite cannot handle pd.timestamp type values
-                val = str(val)
-            sql_query += (
-                "`" + col + "` = ?" + (" " if iteration == len(row.index) - 1 else ", ")
-            )
-            vals += [val]
-        if type(index) == tuple:
-            # multiindex
-            sql_query += (
-                " WHERE (("
-                + ", ".join(df_update.index.names)
-                + ") = ("
-                + ("?, " * len(index))[:-2]
-                + "))"
-            )
-            vals += list(index)
-        else:
-            sql_query += " WHERE (" + df_update.index.name + " = ?)"
-            vals += [index]
-        sql_query += ";" if add_cond is None else "AND " + add_cond + ";"
-
-        # print(sql_query, vals)
-        print(
-            " ".join(
-                [query + str(vals) for query, vals in zip(sql_query.split("%s"), vals + [""])]
-            )
+    if method == "set":
+        _sql_update_set(
+            df_update,
+            table_name,
+            con=con,
+            add_cond=add_cond,
+            allowed_cols=db_constraints[table_name],
+            print_statements=print_statements,
         )
-        con.execute(sql_query, vals)
+    elif method == "row":
+        for index, row in df_update.iterrows():
+            # print(len(row.index))
+            sql_query = "UPDATE  `" + table_name + "` SET "
+            vals = []
+            for iteration, (col, val) in enumerate(row.to_dict().items()):
+                if db_constraints[table_name] is not None:
+                    if col not in db_constraints[table_name]:
+                        raise ConnectionRefusedError(
+                            "Update column " + col + " is not allowed."
+                        )
+                if (
+                    type(val) == pd.Timestamp
+                ):  # sqlite cannot handle pd.timestamp type values
+                    val = str(val)
+                sql_query += (
+                    "`" + col + "` = ?" + (" " if iteration == len(row.index) - 1 else ", ")
+                )
+                vals += [val]
+            if type(index) == tuple:
+                # multiindex
+                sql_query += (
+                    " WHERE (("
+                    + ", ".join(df_update.index.names)
+                    + ") = ("
+                    + ("?, " * len(index))[:-2]
+                    + "))"
+                )
+                vals += list(index)
+            else:
+                sql_query += " WHERE (" + df_update.index.name + " = ?)"
+                vals += [index]
+            sql_query += ";" if add_cond is None else "AND " + add_cond + ";"
+
+            # print(sql_query, vals)
+            if print_statements:
+                print(
+                    " ".join(
+                        [query + str(vals) for query, vals in zip(sql_query.split("%s"), vals + [""])]
+                    )
+                )
+            con.execute(sql_query, vals)
+    else:
+        raise NotImplementedError("Method not implemented")
     if con_init is None:  # cursor is None
         connection.commit()
 
 
-def get_data_raw(name_table, col_names, col_values, add_cond=None):
+def _sql_update_set(
+    df_update, table_name, con, add_cond=None, allowed_cols=None, print_statements=True
+):
+    """
+    Set-based update, see sql_update(method='set'). The rows of df_update are inserted into a temporary table and
+    applied to the table by a single UPDATE ... FROM statement (SQLite >= 3.33) or a correlated subquery (older SQLite).
+    Columns of the temporary table are prefixed to keep column names in add_cond unique.
+    :param df_update: pd.DataFrame
+        DataFrame with rows and columns which should be updated in the database, indexed by the columns to match
+    :param table_name: str
+        Name of the table in sqlite database
+    :param con: sql.connection or DBAPI cursor
+        connection to perform the update
+    :param add_cond: str
+        additional condition to subselect rows in the table meant to be updated
+    :param allowed_cols: list of str or None
+        columns to which an update is allowed, None if all columns are allowed
+    :param print_statements: bool
+        whether to print the executed statements
+    :return: None
+    """
+    index_cols = list(df_update.index.names)
+    update_cols = list(df_update.columns)
+    if allowed_cols is not None:
+        for col in update_cols:
+            if col not in allowed_cols:
+                raise ConnectionRefusedError("Update column " + col + " is not allowed.")
+    if len(df_update.index) == 0 or len(update_cols) == 0:
+        return
+
+    name_table_temp = "temp_update_" + table_name
+    prefix = "update_"
+    sql_queries = [
+        "DROP TABLE IF EXISTS temp.`" + name_table_temp + "`;",
+        "CREATE TEMPORARY TABLE `"
+        + name_table_temp
+        + "` AS SELECT "
+        + ", ".join(["`" + col + "` AS `" + prefix + col + "`" for col in index_cols + update_cols])
+        + " FROM `"
+        + table_name
+        + "` WHERE 0;",
+    ]
+    sql_insert = (
+        "INSERT INTO temp.`"
+        + name_table_temp
+        + "` VALUES ("
+        + ", ".join(["?"] * len(index_cols + update_cols))
+        + ");"
+    )
+    on_cond = " AND ".join(
+        ["`" + table_name + "`.`" + col + "` = temp_update.`" + prefix + col + "`" for col in index_cols]
+    )
+    if sqlite3.sqlite_version_info >= (3, 33, 0):
+        sql_update_query = (
+            "UPDATE `"
+            + table_name
+            + "` SET "
+            + ", ".join(["`" + col + "` = temp_update.`" + prefix + col + "`" for col in update_cols])
+            + " FROM temp.`"
+            + name_table_temp
+            + "` AS temp_update WHERE "
+            + on_cond
+        )
+    else:
+        sql_from = " FROM temp.`" + name_table_temp + "` AS temp_update WHERE " + on_cond
+        sql_update_query = (
+            "UPDATE `"
+            + table_name
+            + "` SET "
+            + ", ".join(
+                ["`" + col + "` = (SELECT temp_update.`" + prefix + col + "`" + sql_from + ")" for col in update_cols]
+            )
+            + " WHERE EXISTS (SELECT 1"
+            + sql_from
+            + ")"
+        )
+    sql_update_query += ";" if add_cond is None else " AND " + add_cond + ";"
+
+    rows = [
+        tuple(str(val) if type(val) == pd.Timestamp else val for val in row)  # sqlite cannot handle pd.timestamp
+        for row in df_update.reset_index().loc[:, index_cols + update_cols].itertuples(index=False, name=None)
+    ]
+    for sql_query in sql_queries:
+        con.execute(sql_query)
+    if hasattr(con, "executemany"):  # DBAPI cursor
+        con.executemany(sql_insert, rows)
+    else:  # sqlalchemy connection
+        con.execute(sql_insert, rows)
+    if print_statements:
+        print(sql_update_query, "(" + str(len(rows)) + " rows)")
+    con.execute(sql_update_query)
+    con.execute("DROP TABLE temp.`" + name_table_temp + "`;")
+
+
+def get_data_raw(name_table, col_names, col_values, add_cond=None, columns=None):
     """
     Core part of the get_data defined in evaluation.utils.db in which the database query is built and executed.
     Here, query is built in sqlite syntax.
@@ -262,52 +400,22 @@ def get_data_raw(name_table, col_names, col_values, add_cond=None):
     :param col_values: values of the index columns
     :param add_cond: str, optional Default None
         additional condition to subselect only part of the data
+    :param columns: list of str or None, optional Default None
+        columns to select, if None all columns are selected
     :return: data as pd.DataFrame
     """
-    if len(col_names) == 1:
-        # print('Multiindex get_data_raw for sqlite not yet developed. This probably won\'t work...')
-
-        col_names_str = "(" + str(list(col_names))[1:-1].replace("'", "`") + ")"
-        col_values_str = "(" + str(list(col_values))[1:-1] + ")"
-
-        sql_query = (
-            "SELECT * FROM "
-            + name_table
-            + " WHERE "
-            + col_names_str  # str(tuple(self._obj.index.names)).replace('\'', '`')
-            + " IN "
-            + col_values_str
-            + (" AND " + str(add_cond) if add_cond is not None else "")
-            + ";"
-        )
-        col_values_params = []
-    else:
-        #  multindex
-
-        col_values_params = list(sum(col_values, ()))
-        sql_query = (
-            "SELECT data.*"
-            + "\n\t FROM "
-            + name_table
-            + " AS data"
-            + "\n\t INNER JOIN ("
-            + " UNION ALL ".join(
-                ["SELECT " + ", ".join(["? AS " + name for name in col_names])]
-                * int(len(col_values))
-            )  # / len(index_name)
-            + ") AS multiindex"
-            + "\n\t ON "
-            + " AND ".join(
-                ["multiindex." + name + " = " + "data." + name for name in col_names]
-            )
-            + ";"
-        )
-
+    sql_query = (
+        "SELECT "
+        + ("*" if columns is None else ", ".join(["`" + column + "`" for column in columns]))
+        + " FROM "
+        + name_table
+        + " WHERE "
+        + db.KEYSET_PLACEHOLDER
+        + (" AND " + str(add_cond) if add_cond is not None else "")
+        + ";"
+    )
     print(sql_query)
-    with connect().begin() as con:
-        data = pd.read_sql(sql_query, params=col_values_params, con=con)
-    # display(data)
-    return data
+    return db.query_sql_keyset(sql_query, key_names=col_names, key_values=col_values)
 
 
 def get_primarykeys(name_table=None, table_schema="hte_data"):
@@ -395,3 +503,14 @@ def get_create_view(name_view, debug=False):
     print(sql_query) if debug else ""
     with connect().begin() as con:
         return pd.read_sql(sql_query, con=con).sql.loc[0]
+
+
+def get_schema_version(table_schema="hte_data"):
+    """
+    Get the schema version of the sqlite database, which is incremented by sqlite on every change of the schema.
+    Used to invalidate evaluation.utils.schema_cache
+    :param table_schema: dummy, required for compatibility with mysql
+    :return: int, schema version
+    """
+    with connect().begin() as con:
+        return con.execute("PRAGMA schema_version;").fetchall()[0][0]
@@ -4,7 +4,12 @@ Created in 2023
 @author: Forschungszentrum Jülich GmbH, Nico Röttcher
 """
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 from pathlib import Path
+import re
+import threading
 import sqlalchemy as sql
 import pandas as pd
 from mysql.connector import Error
@@ -20,6 +25,16 @@ import evaluation.publication.db_config_binder as db_config_binder
 
 MYSQL = True
 
+# Mode of the sqlite compatibility check in verify_sql, one of ['always', 'once', 'off', 'async']
+VERIFY_SQL_MODE = "async"
+
+_verify_sql_fingerprints = set()
+_verify_sql_calls = Counter()
+_verify_sql_failures = {}
+_verify_sql_futures = []
+_verify_sql_lock = threading.Lock()
+_verify_sql_executor = None
+
 
 def DIR_REPORTS():
     """
@@ -49,6 +64,19 @@ def connect(user="hte_read", echo=False, database=None, host=None):
     :param host: str or None, default None
         host IP-Adress or localhost, forces connection to a different host while keeping other credentials the same
         if None, host from config file will be used
+    :return: sqlalchemy.engine, cached per user, database and host with pooled connections
+    """
+    return db.get_engine(
+        (user, database, host, None, echo),
+        lambda: create_engine(user=user, echo=echo, database=database, host=host),
+    )
+
+
+def create_engine(user="hte_read", echo=False, database=None, host=None):
+    """
+    Create a new engine to the MySQL database reading database credential from file located up in the system.
+    Use evaluation.utils.db.connect() instead, which reuses the engine and its connection pool.
+    For parameters see evaluation.utils.db_config_mysql.connect()
     :return: sqlalchemy.engine
     """
     # style of config file:
@@ -72,6 +100,10 @@ def connect(user="hte_read", echo=False, database=None, host=None):
         "mysql+mysqlconnector://%s:%s@%s/%s"
         % (config["user"], config["password"], config["host"], config["database"]),
         echo=echo,
+        poolclass=sql.pool.QueuePool,
+        pool_pre_ping=True,  # reconnect if connection was closed by server (wait_timeout)
+        pool_recycle=3600,
+        connect_args={"allow_local_infile": True},  # see evaluation.utils.db.bulk_append()
     )
 
 
@@ -81,6 +113,12 @@ def verify_sql(query, params=None, method="pandas", debug=False):
     evaluation.utils.mysql_to_sqlite. If the query still fails to run an error is thrown. In this case, execution of the
     SQL query in SQLite database won't be possible, which should be avoided when intended to upload the code with a
     publication.
+    Depending on VERIFY_SQL_MODE, the query is verified
+        'always': every time before the query is run
+        'once': once per query fingerprint (see sql_fingerprint) before the query is run
+        'async': once per query fingerprint in a worker thread, the query is run without waiting
+        'off': never
+    Failed verifications are collected, see verify_sql_report().
     :param query: str
         query in mysql syntax
     :param params: list of Any (any supported types) or None
@@ -92,9 +130,58 @@ def verify_sql(query, params=None, method="pandas", debug=False):
     :return: str
         query in mysql syntax
     """
+    global _verify_sql_executor
+    if VERIFY_SQL_MODE not in ["always", "once", "off", "async"]:
+        raise NotImplementedError("VERIFY_SQL_MODE not implemented")
+    if VERIFY_SQL_MODE == "off":
+        return query
+
+    fingerprint = sql_fingerprint(query)
+    with _verify_sql_lock:
+        _verify_sql_calls[fingerprint] += 1
+        already_verified = fingerprint in _verify_sql_fingerprints
+        _verify_sql_fingerprints.add(fingerprint)
+
+    if VERIFY_SQL_MODE == "always" or (
+        VERIFY_SQL_MODE == "once" and not already_verified
+    ):
+        _verify_sql_sqlite(query, fingerprint, params=params, method=method, debug=debug)
+    elif VERIFY_SQL_MODE == "async" and not already_verified:
+        with _verify_sql_lock:
+            if _verify_sql_executor is None:
+                _verify_sql_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="verify_sql"
+                )
+            _verify_sql_futures[:] = [
+                future for future in _verify_sql_futures if not future.done()
+            ]
+            _verify_sql_futures.append(
+                _verify_sql_executor.submit(
+                    _verify_sql_sqlite, query, fingerprint, params=params, method=method, debug=debug
+                )
+            )
+    return query
+
+
+def _verify_sql_sqlite(query, fingerprint, params=None, method="pandas", debug=False):
+    """
+    Run query on the empty sqlite database to check compatibility, part of verify_sql()
+    :param query: str
+        query in mysql syntax
+    :param fingerprint: str
+        fingerprint of the query, see sql_fingerprint()
+    :param params: list of Any (any supported types) or None
+        list of the parameters marked in query with '%s'
+    :param method: one of ['pandas', 'sqlalchemy']
+        choose with which module to run the query: sqlalchemy.connection.execute() or pandas.read_sql()
+    :param debug: bool, optional, Default False
+        print additional debug info
+    :return: bool, whether the query could be run in sqlite
+    """
     # Check compatibility with sqlite by using the empty sqlite database
-    sql_query_sqlite = db_config_binder.verify_sql(query, debug=debug)
+    sql_query_sqlite = None
     try:
+        sql_query_sqlite = db_config_binder.verify_sql(query, debug=debug)
         with db_config_binder.connect(
             path_to_sqlite=publication_export.DIR_EMPTY_SQLITE
         ).begin() as con_sqlite:
@@ -111,7 +198,56 @@ def verify_sql(query, params=None, method="pandas", debug=False):
             "Please report to admin." + "\x1b[0m"
         )
         print(sql_query_sqlite, "\n", error)
-    return query
+        with _verify_sql_lock:
+            if fingerprint in _verify_sql_failures:
+                _verify_sql_failures[fingerprint]["n_failed"] += 1
+            else:
+                _verify_sql_failures[fingerprint] = {
+                    "query": query,
+                    "query_sqlite": sql_query_sqlite,
+                    "error": str(error),
+                    "n_failed": 1,
+                }
+        return False
+    return True
+
+
+def sql_fingerprint(query):
+    """
+    Fingerprint of the shape of a query: literals and parameters are replaced by placeholders, lists of placeholders
+    (such as IN lists of different length) are collapsed, whitespace is normalized.
+    :param query: str
+        query in mysql syntax
+    :return: str, sha1 hash of the normalized query
+    """
+    query_normalized = re.sub(r"'[^']*'|\"[^\"]*\"|%s|\b\d+(?:\.\d+)?\b", "?", query)
+    query_normalized = re.sub(r"\s+", " ", query_normalized).strip().lower()
+    query_normalized = re.sub(r"\( ?\?(?: ?, ?\?)* ?\)", "(?)", query_normalized)
+    query_normalized = re.sub(r"\( ?\(\?\)(?: ?, ?\(\?\))* ?\)", "((?))", query_normalized)
+    return hashlib.sha1(query_normalized.encode("utf-8")).hexdigest()
+
+
+def verify_sql_report(wait=True):
+    """
+    Report of all queries which failed the sqlite compatibility check of verify_sql()
+    :param wait: bool, optional, Default True
+        wait for verifications still running in the worker thread (VERIFY_SQL_MODE='async')
+    :return: pd.DataFrame indexed by query fingerprint
+        with query, translated query, error message, number of failed verifications and of calls
+    """
+    if wait:
+        with _verify_sql_lock:
+            futures = list(_verify_sql_futures)
+        for future in futures:
+            future.result()
+    with _verify_sql_lock:
+        report = pd.DataFrame.from_dict(
+            _verify_sql_failures,
+            orient="index",
+            columns=["query", "query_sqlite", "error", "n_failed"],
+        ).rename_axis("fingerprint")
+        report["n_calls"] = [_verify_sql_calls[fingerprint] for fingerprint in report.index]
+    return report
 
 
 def user_is_owner(index_col, index_value):
@@ -140,7 +276,6 @@ def user_is_owner(index_col, index_value):
         == current_user()
     )
     # print('is owner? ', is_owner)
-    con.dispose()
     return is_owner
 
 
@@ -210,7 +345,15 @@ def call_procedure(engine, name, params=None):
         #
 
 
-def sql_update(df_update, table_name, engine=None, con=None, add_cond=None):
+def sql_update(
+    df_update,
+    table_name,
+    engine=None,
+    con=None,
+    add_cond=None,
+    method="row",
+    print_statements=True,
+):
     """
     Update sqlite database by values given in DataFrame df_update. If error occurs, transaction is rolled back.
     :param df_update: pd.DataFrame
@@ -224,6 +367,12 @@ def sql_update(df_update, table_name, engine=None, con=None, add_cond=None):
         Sqlalchemy connection to perform the update, instead of engine
     :param add_cond: str
         additional condition to subselect rows in the table meant to be updated
+    :param method: one of ['row', 'set'], optional, Default 'row'
+        'row': one UPDATE statement per row of df_update
+        'set': df_update is inserted into a temporary table and applied by a single multi-table UPDATE ... JOIN.
+                Requires the privilege CREATE TEMPORARY TABLES.
+    :param print_statements: bool, optional, Default True
+        whether to print the executed UPDATE statements
     :return: None
     """
     con_init = con
@@ -244,49 +393,142 @@ def sql_update(df_update, table_name, engine=None, con=None, add_cond=None):
     ):  # ['exp_icpms_sfc', 'exp_icpms_integration', 'exp_ec_integration', 'ana_integrations', 'exp_sfc']:
         raise Exception("Udating " + table_name + " not implemented yet")
 
-    for index, row in df_update.iterrows():
-        # print(len(row.index))
-        sql_query = "UPDATE  hte_data.`" + table_name + "` SET "
-        vals = []
-        for iteration, (col, val) in enumerate(row.to_dict().items()):
-            if db_constraints[table_name] is not None:
-                if col not in db_constraints[table_name]:
-                    raise ConnectionRefusedError(
-                        "Update column " + col + " is not allowed."
-                    )
-            sql_query += (
-                "`"
-                + col
-                + "` = %s"
-                + (" " if iteration == len(row.index) - 1 else ", ")
-            )
-            vals += [val]
-        if type(index) == tuple:
-            sql_query += (
-                " WHERE (("
-                + ", ".join(df_update.index.names)
-                + ") = ("
-                + ("%s, " * len(index))[:-2]
-                + "))"
-            )
-            vals += list(index)
-        else:
-            sql_query += " WHERE (" + df_update.index.name + " = %s)"
-            vals += [index]
-        sql_query += ";" if add_cond is None else "AND " + add_cond + ";"
-
-        # print(sql, vals)
-        print(
-            " ".join(
-                [query + str(vals) for query, vals in zip(sql_query.split("%s"), vals + [""])]
-            )
+    if method == "set":
+        _sql_update_set(
+            df_update,
+            table_name,
+            con=con,
+            add_cond=add_cond,
+            allowed_cols=db_constraints[table_name],
+            print_statements=print_statements,
         )
-        con.execute(sql_query, vals)
+    elif method == "row":
+        for index, row in df_update.iterrows():
+            # print(len(row.index))
+            sql_query = "UPDATE  hte_data.`" + table_name + "` SET "
+            vals = []
+            for iteration, (col, val) in enumerate(row.to_dict().items()):
+                if db_constraints[table_name] is not None:
+                    if col not in db_constraints[table_name]:
+                        raise ConnectionRefusedError(
+                            "Update column " + col + " is not allowed."
+                        )
+                sql_query += (
+                    "`"
+                    + col
+                    + "` = %s"
+                    + (" " if iteration == len(row.index) - 1 else ", ")
+                )
+                vals += [val]
+            if type(index) == tuple:
+                sql_query += (
+                    " WHERE (("
+                    + ", ".join(df_update.index.names)
+                    + ") = ("
+                    + ("%s, " * len(index))[:-2]
+                    + "))"
+                )
+                vals += list(index)
+            else:
+                sql_query += " WHERE (" + df_update.index.name + " = %s)"
+                vals += [index]
+            sql_query += ";" if add_cond is None else "AND " + add_cond + ";"
+
+            # print(sql, vals)
+            if print_statements:
+                print(
+                    " ".join(
+                        [query + str(vals) for query, vals in zip(sql_query.split("%s"), vals + [""])]
+                    )
+                )
+            con.execute(sql_query, vals)
+    else:
+        raise NotImplementedError("Method not implemented")
     if con_init is None:  # cursor is None
         connection.commit()
 
 
-def get_data_raw(name_table, col_names, col_values, add_cond):
+def _sql_update_set(
+    df_update, table_name, con, add_cond=None, allowed_cols=None, print_statements=True
+):
+    """
+    Set-based update, see sql_update(method='set'). The rows of df_update are inserted into a temporary table and
+    applied to the table by a single multi-table UPDATE ... JOIN statement.
+    Columns of the temporary table are prefixed to keep column names in add_cond unique.
+    :param df_update: pd.DataFrame
+        DataFrame with rows and columns which should be updated in the database, indexed by the columns to match
+    :param table_name: str
+        Name of the table in MySQL database
+    :param con: sql.connection or DBAPI cursor
+        connection to perform the update
+    :param add_cond: str
+        additional condition to subselect rows in the table meant to be updated
+    :param allowed_cols: list of str or None
+        columns to which an update is allowed, None if all columns are allowed
+    :param print_statements: bool
+        whether to print the executed statements
+    :return: None
+    """
+    index_cols = list(df_update.index.names)
+    update_cols = list(df_update.columns)
+    if allowed_cols is not None:
+        for col in update_cols:
+            if col not in allowed_cols:
+                raise ConnectionRefusedError("Update column " + col + " is not allowed.")
+    if len(df_update.index) == 0 or len(update_cols) == 0:
+        return
+
+    name_table_temp = "temp_update_" + table_name
+    prefix = "update_"
+    sql_queries = [
+        "DROP TEMPORARY TABLE IF EXISTS `" + name_table_temp + "`;",
+        "CREATE TEMPORARY TABLE `"
+        + name_table_temp
+        + "` SELECT "
+        + ", ".join(["`" + col + "` AS `" + prefix + col + "`" for col in index_cols + update_cols])
+        + " FROM hte_data.`"
+        + table_name
+        + "` LIMIT 0;",
+    ]
+    sql_insert = (
+        "INSERT INTO `"
+        + name_table_temp
+        + "` VALUES ("
+        + ", ".join(["%s"] * len(index_cols + update_cols))
+        + ");"
+    )
+    sql_update_query = (
+        "UPDATE hte_data.`"
+        + table_name
+        + "` INNER JOIN `"
+        + name_table_temp
+        + "` AS temp_update ON "
+        + " AND ".join(
+            ["`" + table_name + "`.`" + col + "` = temp_update.`" + prefix + col + "`" for col in index_cols]
+        )
+        + " SET "
+        + ", ".join(
+            ["`" + table_name + "`.`" + col + "` = temp_update.`" + prefix + col + "`" for col in update_cols]
+        )
+        + (";" if add_cond is None else " WHERE " + add_cond + ";")
+    )
+
+    rows = list(
+        df_update.reset_index().loc[:, index_cols + update_cols].itertuples(index=False, name=None)
+    )
+    for sql_query in sql_queries:
+        con.execute(sql_query)
+    if hasattr(con, "executemany"):  # DBAPI cursor
+        con.executemany(sql_insert, rows)
+    else:  # sqlalchemy connection
+        con.execute(sql_insert, rows)
+    if print_statements:
+        print(sql_update_query, "(" + str(len(rows)) + " rows)")
+    con.execute(sql_update_query)
+    con.execute("DROP TEMPORARY TABLE `" + name_table_temp + "`;")
+
+
+def get_data_raw(name_table, col_names, col_values, add_cond, columns=None):
     """
     Core part of the get_data defined in evaluation.utils.db in which the database query is built and executed.
     Here, query is built in sqlite syntax.
@@ -295,26 +537,22 @@ def get_data_raw(name_table, col_names, col_values, add_cond):
     :param col_values: values of the index columns
     :param add_cond: str, optional Default None
         additional condition to subselect only part of the data
+    :param columns: list of str or None, optional Default None
+        columns to select, if None all columns are selected
     :return: data as pd.DataFrame
     """
-    col_names_str = "(" + str(list(col_names))[1:-1].replace("'", "`") + ")"
-    col_values_str = "(" + str(list(col_values))[1:-1] + ")"
-
     sql_query = (
-        "SELECT * FROM "
+        "SELECT "
+        + ("*" if columns is None else ", ".join(["`" + column + "`" for column in columns]))
+        + " FROM "
         + name_table
         + " WHERE "
-        + col_names_str  # str(tuple(self._obj.index.names)).replace('\'', '`')
-        + " IN "
-        + col_values_str
+        + db.KEYSET_PLACEHOLDER
         + (" AND " + str(add_cond) if add_cond is not None else "")
         + ";"
     )
     print(sql_query)
-    # data = pd.DataFrame(conn.execute(sql.text(sql_query)).fetchall())
-    with connect().begin() as con:
-        data = pd.read_sql(sql_query, con=con)  # similar performance
-    return data
+    return db.query_sql_keyset(sql_query, key_names=col_names, key_values=col_values)
 
 
 def get_primarykeys(name_table=None, table_schema="hte_data"):
@@ -471,3 +709,29 @@ def get_create_view(name_view, debug=False):
     print(sql_query) if debug else ""
     with connect(user="hte_processor").begin() as con:
         return pd.read_sql(sql_query, con=con).loc[:, "Create View"].loc[0]
+
+
+def get_schema_version(table_schema="hte_data"):
+    """
+    Get an identifier of the state of the MySQL database schema, used to invalidate evaluation.utils.schema_cache.
+    Derived from number of tables and views, latest CREATE_TIME of tables in the schema (changes with ALTER TABLE)
+    and latest UPDATE_TIME of hte_data_documentation (holds the base tables of views).
+    Mind that information_schema statistics are cached by MySQL (information_schema_stats_expiry),
+    therefore the cache is additionally invalidated after a time to live.
+    :param table_schema: str, default='hte_data'
+        name of the database schema
+    :return: tuple, schema version
+    """
+    with connect().begin() as con:
+        return tuple(
+            str(value)
+            for value in con.execute(
+                """SELECT COUNT(*),
+                          MAX(CASE WHEN TABLE_SCHEMA = %s THEN CREATE_TIME END),
+                          MAX(CASE WHEN TABLE_SCHEMA = 'hte_data_documentation' THEN UPDATE_TIME END)
+                   FROM information_schema.TABLES
+                   WHERE TABLE_SCHEMA IN (%s, 'hte_data_documentation')
+                ;""",
+                [table_schema, table_schema],
+            ).fetchall()[0]
+        )
@@ -0,0 +1,425 @@
+"""
+Scripts for matching sfc and icpms experiments by overlapping time windows in-process, as alternative to the database
+view match_exp_sfc_exp_icpms, see evaluation.utils.db.match_exp_sfc_exp_icpms()
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sql
+
+from evaluation.utils import db, schema_cache
+from evaluation.processing import tools_ec
+
+# time windows are completely reloaded from the database after this time,
+# to consider changes not made via evaluation.utils.db (for example by LabView or other users)
+EXP_MATCHER_TTL__s = 3600
+# experiments of which the time windows are kept in memory. Conditions are equal to the view match_exp_sfc_exp_icpms:
+# sfc and icpms experiment are matched if they are performed by the same user at the same sfc setup and their time
+# windows overlap, for icpms experiments the window refers to the clock of the sfc computer (delay-corrected).
+EXP_MATCHER_SOURCES = {
+    "exp_sfc": {
+        "name_id_exp": "id_exp_sfc",
+        "name_tables": ["exp_sfc"],
+        "query_exp": """SELECT id_exp_sfc AS id_exp,
+                               name_user,
+                               name_setup_sfc,
+                               t_start__timestamp,
+                               t_end__timestamp
+                        FROM exp_sfc""",
+    },
+    "exp_icpms": {
+        "name_id_exp": "id_exp_icpms",
+        "name_tables": ["exp_icpms", "exp_icpms_sfc", "exp_icpms_calibration_params"],
+        "query_exp": """SELECT exp_icpms.id_exp_icpms AS id_exp,
+                               exp_icpms.name_user,
+                               exp_icpms_sfc.name_setup_sfc,
+                               exp_icpms_sfc.t_start__timestamp_sfc_pc,
+                               exp_icpms_sfc.t_delay__s,
+                               exp_icpms.t_duration__s,
+                               exp_icpms.id_exp_icpms_calibration_set IN (
+                                    SELECT id_exp_icpms_calibration_set FROM exp_icpms_calibration_params
+                               ) AS calibrated
+                        FROM exp_icpms
+                        LEFT JOIN exp_icpms_sfc ON exp_icpms.id_exp_icpms = exp_icpms_sfc.id_exp_icpms
+                        WHERE exp_icpms.type_experiment = 'sfc-icpms'""",
+    },
+}
+# columns of the view match_exp_sfc_exp_icpms derived from the icpms experiment, all other columns are taken from
+# exp_ec_expanded
+MATCH_ICPMS_COLUMNS = [
+    "DATE(t_start_delaycorrected__timestamp_sfc_pc)",
+    "t_start_delaycorrected__timestamp_sfc_pc",
+    "t_end_delaycorrected__timestamp_sfc_pc",
+    "t_duration__s",
+]
+GROUP_COLUMNS = ["name_user", "name_setup_sfc"]
+
+_matchers = {}
+_matchers_lock = threading.RLock()
+
+
+class ExpMatcher:
+    """
+    Time windows of all sfc and icpms experiments held in memory. Per user and sfc setup, windows are sorted by their
+    start, so that the experiments overlapping with a window are found by binary search (sort-sweep) in
+    O(log n + k) instead of joining both experiment tables in the database. Only experiments inserted or updated since
+    the last request are reloaded from the database.
+    """
+
+    def __init__(self, engine):
+        """
+        Initialize an empty matcher, windows are loaded on the first update()
+        :param engine: sqlalchemy.engine
+        """
+        self.engine = engine
+        self._lock = threading.RLock()
+        self._t_loaded = None
+        self._windows = {name_side: None for name_side in EXP_MATCHER_SOURCES}
+        self._index = {name_side: {} for name_side in EXP_MATCHER_SOURCES}
+        self._ids_reload = {name_side: set() for name_side in EXP_MATCHER_SOURCES}
+        self._ids_t_end_requested = set()
+
+    def invalidate(self, name_side, ids_exp=None):
+        """
+        Mark experiments to be reloaded on the next update()
+        :param name_side: str
+            one of EXP_MATCHER_SOURCES
+        :param ids_exp: list of int or None, optional, Default None
+            ids of the changed experiments, if None all windows are reloaded
+        :return: None
+        """
+        with self._lock:
+            if ids_exp is None:
+                self._t_loaded = None
+            else:
+                self._ids_reload[name_side].update(ids_exp)
+
+    def update(self, full=False):
+        """
+        Load windows of experiments inserted since the last update, of experiments marked by invalidate() and of
+        experiments which could not be matched yet due to missing information (for example missing end timestamp).
+        :param full: bool, optional, Default False
+            reload all windows, done anyway if loaded more than EXP_MATCHER_TTL__s ago
+        :return: None
+        """
+        with self._lock:
+            full = (
+                full
+                or self._t_loaded is None
+                or time.monotonic() - self._t_loaded > EXP_MATCHER_TTL__s
+            )
+            if full:
+                t_loaded = time.monotonic()
+                for name_side in EXP_MATCHER_SOURCES:
+                    self._ids_reload[name_side].clear()
+                    self._windows[name_side] = self._load(name_side)
+                    self._index[name_side] = {}
+                    self._build_index(name_side)
+                self._t_loaded = t_loaded
+                return
+
+            for name_side in EXP_MATCHER_SOURCES:
+                windows = self._windows[name_side]
+                ids_reload = self._ids_reload[name_side] | set(windows.index[~windows.valid])
+                self._ids_reload[name_side].clear()
+                windows_new = self._load(name_side, id_exp_after=windows.index.max())
+                windows_reloaded = (
+                    self._load(name_side, ids_exp=list(ids_reload)) if len(ids_reload) > 0 else windows.iloc[0:0]
+                )
+                if len(windows_new.index) == 0 and len(windows_reloaded.index) == 0 and len(ids_reload) == 0:
+                    continue
+                windows_removed = windows.loc[windows.index.isin(ids_reload)]
+                self._windows[name_side] = pd.concat(
+                    [windows.loc[~windows.index.isin(ids_reload)], windows_reloaded, windows_new]
+                )
+                groups = pd.concat([windows_removed, windows_reloaded, windows_new]).loc[:, GROUP_COLUMNS]
+                self._build_index(name_side, groups=list(groups.itertuples(index=False, name=None)))
+
+    def _load(self, name_side, ids_exp=None, id_exp_after=None):
+        """
+        Load time windows of experiments from database
+        :param name_side: str
+            one of EXP_MATCHER_SOURCES
+        :param ids_exp: list of int or None, optional, Default None
+            load only the given experiments
+        :param id_exp_after: int or None, optional, Default None
+            load only experiments with an id greater than id_exp_after
+        :return: pd.DataFrame indexed by id_exp with columns GROUP_COLUMNS, t_start, t_end (np.int64 in ns), valid
+            and the columns of the view match_exp_sfc_exp_icpms derived from the experiment
+        """
+        query = "SELECT * FROM (" + EXP_MATCHER_SOURCES[name_side]["query_exp"] + ") e WHERE "
+        with self.engine.begin() as con:
+            if ids_exp is not None:
+                exp = db.query_sql_keyset(
+                    query + db.KEYSET_PLACEHOLDER + ";", key_names="id_exp", key_values=ids_exp, con=con
+                )
+            else:
+                exp = db.query_sql(
+                    query + ("1 = 1" if id_exp_after is None or pd.isna(id_exp_after) else "id_exp > %s") + ";",
+                    params=[] if id_exp_after is None or pd.isna(id_exp_after) else [int(id_exp_after)],
+                    con=con,
+                    method="pandas",
+                )
+        exp = exp.set_index("id_exp")
+
+        if name_side == "exp_sfc":
+            t_start = pd.to_datetime(exp.t_start__timestamp, errors="coerce")
+            t_end = pd.to_datetime(exp.t_end__timestamp, errors="coerce")
+            exp = self._update_t_end__timestamp(exp, t_end)
+            t_end = pd.to_datetime(exp.t_end__timestamp, errors="coerce")
+            valid = pd.Series(True, index=exp.index)
+        else:
+            t_start = pd.to_datetime(exp.t_start__timestamp_sfc_pc, errors="coerce") - pd.to_timedelta(
+                exp.t_delay__s.astype(float), unit="s"
+            )
+            t_end = t_start + pd.to_timedelta(exp.t_duration__s.astype(float), unit="s")
+            exp = exp.loc[:, GROUP_COLUMNS + ["t_duration__s", "calibrated"]].assign(
+                **{
+                    "DATE(t_start_delaycorrected__timestamp_sfc_pc)": t_start.dt.date,
+                    "t_start_delaycorrected__timestamp_sfc_pc": t_start,
+                    "t_end_delaycorrected__timestamp_sfc_pc": t_end,
+                }
+            )
+            valid = exp.calibrated.fillna(0).astype(bool)
+
+        exp = exp.assign(
+            t_start=t_start.to_numpy(dtype="datetime64[ns]").astype(np.int64),
+            t_end=t_end.to_numpy(dtype="datetime64[ns]").astype(np.int64),
+            valid=valid & t_start.notna() & t_end.notna() & exp.loc[:, GROUP_COLUMNS].notna().all(axis=1),
+        )
+        return exp
+
+    def _update_t_end__timestamp(self, exp, t_end):
+        """
+        Missing end timestamps of ec experiments of the current user (ECat <V4.5) are calculated and uploaded once,
+        see evaluation.processing.tools_ec.update_exp_sfc_t_end__timestamp()
+        :param exp: pd.DataFrame
+            loaded sfc experiments
+        :param t_end: pd.Series
+            end timestamp of the loaded sfc experiments
+        :return: exp with reloaded end timestamps
+        """
+        ids_exp = exp.index[
+            t_end.isna() & (exp.name_user == db.current_user()) & ~exp.index.isin(self._ids_t_end_requested)
+        ]
+        if len(ids_exp) == 0:
+            return exp
+        self._ids_t_end_requested.update(ids_exp)
+        tools_ec.update_exp_sfc_t_end__timestamp()
+        with self.engine.begin() as con:
+            t_end__timestamp = db.query_sql_keyset(
+                "SELECT id_exp_sfc, t_end__timestamp FROM exp_sfc WHERE " + db.KEYSET_PLACEHOLDER + ";",
+                key_names="id_exp_sfc",
+                key_values=list(ids_exp),
+                con=con,
+            ).set_index("id_exp_sfc").t_end__timestamp
+        exp = exp.copy()
+        exp.loc[t_end__timestamp.index, "t_end__timestamp"] = t_end__timestamp
+        return exp
+
+    def _build_index(self, name_side, groups=None):
+        """
+        Sort the valid windows of each group (user and sfc setup) by their start
+        :param name_side: str
+            one of EXP_MATCHER_SOURCES
+        :param groups: list of tuple or None, optional, Default None
+            groups to be rebuilt, if None all groups
+        :return: None
+        """
+        windows = self._windows[name_side]
+        windows = windows.loc[windows.valid]
+        if groups is not None:
+            groups = pd.MultiIndex.from_tuples(set(groups), names=GROUP_COLUMNS)
+            windows = windows.loc[pd.MultiIndex.from_frame(windows.loc[:, GROUP_COLUMNS]).isin(groups)]
+            for group in groups:
+                self._index[name_side].pop(group, None)
+        for group, windows_group in windows.groupby(GROUP_COLUMNS):
+            windows_group = windows_group.sort_values("t_start", kind="stable")
+            t_start = windows_group.t_start.to_numpy()
+            t_end = windows_group.t_end.to_numpy()
+            self._index[name_side][group] = (
+                windows_group.index.to_numpy(),
+                t_start,
+                t_end,
+                (t_end - t_start).max(),
+            )
+
+    def overlaps(self, name_side, ids_exp):
+        """
+        Find the experiments of the other side overlapping with the given experiments
+        :param name_side: str
+            one of EXP_MATCHER_SOURCES, side of the given experiments
+        :param ids_exp: list of int
+            ids of the given experiments
+        :return: pd.DataFrame with columns id_exp_sfc, id_exp_icpms
+        """
+        name_side_other = [name for name in EXP_MATCHER_SOURCES if name != name_side][0]
+        name_id_exp = EXP_MATCHER_SOURCES[name_side]["name_id_exp"]
+        name_id_exp_other = EXP_MATCHER_SOURCES[name_side_other]["name_id_exp"]
+        with self._lock:
+            windows = self._windows[name_side]
+            windows = windows.loc[windows.index.isin(ids_exp) & windows.valid]
+            index_other = self._index[name_side_other]
+
+            ids, ids_other = [], []
+            for group, windows_group in windows.groupby(GROUP_COLUMNS):
+                if group not in index_other:
+                    continue
+                ids_group_other, t_start_other, t_end_other, t_duration_max_other = index_other[group]
+                t_start = windows_group.t_start.to_numpy()
+                t_end = windows_group.t_end.to_numpy()
+                # candidates start before the end of the window but not earlier than the longest window of the
+                # other side before its start, the overlap is finally checked on the candidates only
+                idx_first = np.searchsorted(t_start_other, t_start - t_duration_max_other, side="right")
+                idx_last = np.searchsorted(t_start_other, t_end, side="left")
+                lengths = np.clip(idx_last - idx_first, 0, None)
+                positions = np.repeat(idx_first - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+                overlapping = t_end_other[positions] > np.repeat(t_start, lengths)
+                ids.append(np.repeat(windows_group.index.to_numpy(), lengths)[overlapping])
+                ids_other.append(ids_group_other[positions][overlapping])
+
+        return pd.DataFrame(
+            {
+                name_id_exp: np.concatenate(ids) if len(ids) > 0 else np.array([], dtype=np.int64),
+                name_id_exp_other: np.concatenate(ids_other) if len(ids_other) > 0 else np.array([], dtype=np.int64),
+            }
+        )
+
+    def windows(self, name_side):
+        """
+        Get the loaded time windows
+        :param name_side: str
+            one of EXP_MATCHER_SOURCES
+        :return: pd.DataFrame indexed by id_exp
+        """
+        with self._lock:
+            return self._windows[name_side].copy()
+
+
+def get_matcher(engine=None):
+    """
+    Get the matcher of a database, created once per engine
+    :param engine: sqlalchemy.engine or None, optional, Default None
+        database engine, if None db.connect() is used
+    :return: ExpMatcher
+    """
+    engine = db.connect() if engine is None else engine
+    with _matchers_lock:
+        if engine not in _matchers:
+            _matchers[engine] = ExpMatcher(engine)
+        return _matchers[engine]
+
+
+def invalidate(name_table, df):
+    """
+    Mark updated experiments to be reloaded by all matchers. Called by evaluation.utils.db.sql_update(), inserted
+    experiments are recognized by their id and need not be marked.
+    :param name_table: str
+        name of the updated table
+    :param df: pd.DataFrame
+        updated rows, with the experiment id in columns or index
+    :return: None
+    """
+    name_sides = [
+        name_side for name_side, source in EXP_MATCHER_SOURCES.items() if name_table in source["name_tables"]
+    ]
+    if len(name_sides) == 0:
+        return
+    name_side = name_sides[0]
+    name_id_exp = EXP_MATCHER_SOURCES[name_side]["name_id_exp"]
+    df_ids = df.reset_index() if any(name is not None for name in df.index.names) else df
+    ids_exp = (
+        [int(id_exp) for id_exp in pd.unique(df_ids[name_id_exp].dropna())]
+        if name_id_exp in df_ids.columns
+        else None
+    )
+    with _matchers_lock:
+        for matcher in _matchers.values():
+            matcher.invalidate(name_side, ids_exp=ids_exp)
+
+
+def is_supported(add_cond=None, add_cols=None):
+    """
+    Check whether match() gives the same result as selecting from the view match_exp_sfc_exp_icpms. This is not the
+    case for add_cond, which is evaluated by match() on exp_ec_expanded only, and for add_cols which are neither
+    columns of exp_ec_expanded nor MATCH_ICPMS_COLUMNS.
+    Used by evaluation.utils.db.match_exp_sfc_exp_icpms(matching_engine=None) to choose the matching engine.
+    :param add_cond: str or None, optional, Default None
+        see match()
+    :param add_cols: list of str or None, optional, Default None
+        see match()
+    :return: bool
+    """
+    if add_cond is not None:
+        return False
+    cols_ec = [col for col in (add_cols if add_cols is not None else []) if col not in MATCH_ICPMS_COLUMNS]
+    if len(cols_ec) == 0:
+        return True
+    columns_exp_ec = schema_cache.get("columns_exp_ec_expanded", _get_columns_exp_ec)
+    return all(col in columns_exp_ec for col in cols_ec)
+
+
+def _get_columns_exp_ec(table_schema="hte_data"):
+    """
+    Read the columns of exp_ec_expanded, use cached version via evaluation.utils.exp_matching.is_supported()
+    :param table_schema: dummy, required for compatibility with evaluation.utils.schema_cache.get()
+    :return: list of str
+    """
+    return [column["name"] for column in sql.inspect(db.connect()).get_columns("exp_ec_expanded")]
+
+
+def match(name_id_exp, ids_exp, add_cond=None, A_geo_cols=None, add_cols=None, engine=None):
+    """
+    Match sfc and icpms experiments, result is equal to selecting from the view match_exp_sfc_exp_icpms.
+    Used by evaluation.utils.db.match_exp_sfc_exp_icpms(matching_engine='interval').
+    :param name_id_exp: one of ['id_exp_sfc', 'id_exp_icpms']
+        id column of the given experiments
+    :param ids_exp: list of int
+        ids of the given experiments
+    :param add_cond: str or None, optional, Default None
+        additional condition to subselect specific ec experiments, evaluated on exp_ec_expanded (alias m)
+    :param A_geo_cols: list of str or None, optional, Default None
+        columns of exp_ec_expanded handed over to the icpms experiments
+    :param add_cols: list of str or None, optional, Default None
+        additional columns of the view match_exp_sfc_exp_icpms
+    :param engine: sqlalchemy.engine or None, optional, Default None
+        database engine, if None db.connect() is used
+    :return: pd.DataFrame with columns id_exp_sfc, t_start__timestamp, t_end__timestamp, id_exp_icpms,
+        A_geo_cols, add_cols
+    """
+    name_side = [
+        name_side for name_side, source in EXP_MATCHER_SOURCES.items() if source["name_id_exp"] == name_id_exp
+    ][0]
+    matcher = get_matcher(engine)
+    matcher.update()
+    df = matcher.overlaps(name_side, [int(id_exp) for id_exp in ids_exp])
+
+    windows_sfc = matcher.windows("exp_sfc").loc[:, ["t_start__timestamp", "t_end__timestamp"]]
+    df = df.join(windows_sfc, on="id_exp_sfc").loc[
+        :, ["id_exp_sfc", "t_start__timestamp", "t_end__timestamp", "id_exp_icpms"]
+    ]
+
+    cols = (list(A_geo_cols) if A_geo_cols is not None else []) + (list(add_cols) if add_cols is not None else [])
+    cols_icpms = [col for col in cols if col in MATCH_ICPMS_COLUMNS]
+    cols_ec = [col for col in cols if col not in MATCH_ICPMS_COLUMNS]
+    if len(cols_icpms) > 0:
+        df = df.join(matcher.windows("exp_icpms").loc[:, cols_icpms], on="id_exp_icpms")
+    if len(cols_ec) > 0 or add_cond is not None:
+        exp_ec = db.query_sql_keyset(
+            "SELECT id_exp_sfc" + "".join([", " + col for col in cols_ec])
+            + " FROM exp_ec_expanded m WHERE " + db.KEYSET_PLACEHOLDER
+            + (" AND " + str(add_cond) if add_cond is not None else "")
+            + ";",
+            key_names="id_exp_sfc",
+            key_values=pd.unique(df.id_exp_sfc).tolist(),
+            con=engine,
+        )
+        df = df.merge(exp_ec, on="id_exp_sfc", how="inner")
+    return df.loc[:, ["id_exp_sfc", "t_start__timestamp", "t_end__timestamp", "id_exp_icpms"] + cols].sort_values(
+        ["id_exp_sfc", "id_exp_icpms"], ignore_index=True
+    )
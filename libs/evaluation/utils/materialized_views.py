@@ -0,0 +1,342 @@
+"""
+Scripts for materializing analysis views into shadow tables, which are refreshed incrementally per experiment
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import datetime
+
+import pandas as pd
+import sqlalchemy as sql
+
+from evaluation.utils import db, schema_cache
+
+# views which can be materialized and the experiment id column by which they are refreshed
+MATERIALIZED_VIEWS = {
+    "exp_ec_expanded": "id_exp_sfc",
+    "data_ec_analysis": "id_exp_sfc",
+    "data_icpms_sfc_analysis": "id_exp_icpms",
+}
+# shadow table of a view is named name_view + MATERIALIZED_TABLE_SUFFIX
+MATERIALIZED_TABLE_SUFFIX = "_materialized"
+# journal of inserted or updated experiments, written by evaluation.utils.db when inserting or updating
+JOURNAL_TABLE = "materialized_views_journal"
+# state of each shadow table: last journal entry considered in the refresh
+STATE_TABLE = "materialized_views_state"
+# experiment id columns recorded in the journal
+JOURNAL_ID_COLUMNS = ["id_exp_sfc", "id_exp_icpms"]
+
+
+def _metadata():
+    """
+    Define journal and state table
+    :return: sqlalchemy.MetaData
+    """
+    metadata = sql.MetaData()
+    sql.Table(
+        JOURNAL_TABLE,
+        metadata,
+        sql.Column("id_journal", sql.Integer, primary_key=True, autoincrement=True),
+        sql.Column("name_table", sql.String(64), nullable=False, index=True),
+        sql.Column("name_id_exp", sql.String(64)),
+        sql.Column("id_exp", sql.BigInteger),
+        sql.Column("t_changed__timestamp", sql.DateTime),
+        sqlite_autoincrement=True,
+    )
+    sql.Table(
+        STATE_TABLE,
+        metadata,
+        sql.Column("name_view", sql.String(64), primary_key=True),
+        sql.Column("id_journal_refreshed", sql.Integer, nullable=False),
+        sql.Column("t_refreshed__timestamp", sql.DateTime),
+    )
+    return metadata
+
+
+def name_table_materialized(name_view):
+    """
+    Get name of the shadow table of a view
+    :param name_view: str
+    :return: str
+    """
+    return name_view + MATERIALIZED_TABLE_SUFFIX
+
+
+def is_enabled(con=None):
+    """
+    Check whether the materialization layer is installed in the database, see create(). The result is cached by
+    evaluation.utils.schema_cache, thus it is checked again after a change of the schema or after the time to live,
+    for example if the layer was installed by another session.
+    :param con: sql.Connection or None, optional, Default None
+        database connection to check, if None the cached schema of the default database is checked
+    :return: bool
+    """
+    if con is None:
+        name_tables = db.get_primarykeys().index
+        return JOURNAL_TABLE in name_tables and STATE_TABLE in name_tables
+    return schema_cache.get(
+        "materialized_views_enabled",
+        lambda table_schema, url: all(
+            sql.inspect(con).has_table(name_table) for name_table in [JOURNAL_TABLE, STATE_TABLE]
+        ),
+        url=con.engine.url.render_as_string(hide_password=True),
+    )
+
+
+def create(name_views=None, con=None):
+    """
+    Install the materialization layer: create journal, state and shadow tables and fill the shadow tables.
+    From now on, evaluation.utils.db.insert_into(), bulk_append() and sql_update() write into the journal.
+    Requires a database user allowed to create tables.
+    :param name_views: list of str or None, optional, Default None
+        views to be materialized, if None all MATERIALIZED_VIEWS
+    :param con: sql.Connection or None, optional, Default None
+        database connection, if None a new will be initialized
+    :return: None
+    """
+    if con is None:
+        with db.connect().begin() as con:
+            return create(name_views=name_views, con=con)
+    name_views = list(MATERIALIZED_VIEWS.keys()) if name_views is None else name_views
+    _metadata().create_all(con)
+    name_tables = _db_tables(con)
+    for name_view in name_views:
+        if name_view not in MATERIALIZED_VIEWS:
+            raise ValueError(name_view + " is not a materializable view")
+        name_table = name_table_materialized(name_view)
+        if name_table not in name_tables:
+            db.query_sql(
+                "CREATE TABLE " + name_table + " AS SELECT * FROM " + name_view + " WHERE 1 = 0;",
+                con=con,
+                method="sqlalchemy",
+            )
+            db.query_sql(
+                "CREATE INDEX idx_" + name_table + " ON " + name_table
+                + " (" + MATERIALIZED_VIEWS[name_view] + ");",
+                con=con,
+                method="sqlalchemy",
+            )
+    refresh(name_views=name_views, full=True, con=con)
+
+
+def _db_tables(con):
+    """
+    List tables in the database, not cached as used while creating tables
+    :param con: sql.Connection
+    :return: list of str
+    """
+    return sql.inspect(con).get_table_names()
+
+
+def journal(name_table, df=None, con=None, full_refresh=False):
+    """
+    Record inserted or updated experiments of a table in the journal. Called by evaluation.utils.db.notify_written(),
+    which is to be called after every write to the database.
+    Nothing is recorded if the materialization layer is not installed, see create().
+    :param name_table: str
+        name of the inserted or updated table
+    :param df: pd.DataFrame or None, optional, Default None
+        inserted or updated rows, experiments are derived from the JOURNAL_ID_COLUMNS in columns or index.
+        If none of them is given, all experiments of views depending on the table are refreshed.
+    :param con: sql.Connection, sql.engine or None, optional, Default None
+        connection of the transaction the rows are written in, if None a new will be initialized
+    :param full_refresh: bool, optional, Default False
+        refresh all experiments of views depending on the table, for changes affecting all experiments
+        such as calibration parameters
+    :return: None
+    """
+    if name_table in [JOURNAL_TABLE, STATE_TABLE]:
+        return
+    if not isinstance(con, sql.engine.Connection):
+        with (db.connect() if con is None else con).begin() as con:
+            return journal(name_table, df, con=con, full_refresh=full_refresh)
+    if not is_enabled(con):
+        return
+    t_changed = datetime.datetime.now()
+    rows = []
+    if not full_refresh and df is not None:
+        df_ids = df.reset_index() if any(name is not None for name in df.index.names) else df
+        rows = [
+            {
+                "name_table": name_table,
+                "name_id_exp": name_id_exp,
+                "id_exp": int(id_exp),
+                "t_changed__timestamp": t_changed,
+            }
+            for name_id_exp in JOURNAL_ID_COLUMNS
+            if name_id_exp in df_ids.columns
+            for id_exp in pd.unique(df_ids[name_id_exp].dropna())
+        ]
+    if len(rows) == 0:
+        rows = [
+            {
+                "name_table": name_table,
+                "name_id_exp": None,
+                "id_exp": None,
+                "t_changed__timestamp": t_changed,
+            }
+        ]
+    con.execute(db.get_table(con, JOURNAL_TABLE).insert(), rows)
+
+
+def is_fresh(name_view, con=None):
+    """
+    Check whether the shadow table of a view contains the current state of the view, that means no table the view
+    depends on was changed since the last refresh.
+    :param name_view: str
+    :param con: sql.Connection or None, optional, Default None
+    :return: bool
+    """
+    if name_view not in MATERIALIZED_VIEWS or not is_enabled():
+        return False
+    id_journal_refreshed = _id_journal_refreshed(name_view, con=con)
+    if id_journal_refreshed is None:
+        return False
+    return len(_journal_entries(name_view, id_journal_refreshed, con=con).index) == 0
+
+
+def name_table_read(name_table):
+    """
+    Get the table to read the data of name_table from: the shadow table if it is fresh, else name_table itself.
+    Used by evaluation.utils.db.get_data().
+    :param name_table: str
+    :return: str
+    """
+    if name_table in MATERIALIZED_VIEWS and is_fresh(name_table):
+        return name_table_materialized(name_table)
+    return name_table
+
+
+def refresh(name_views=None, full=False, con=None):
+    """
+    Refresh shadow tables. Only experiments recorded in the journal since the last refresh are recomputed.
+    All experiments are recomputed if full is True, if the view was not yet refreshed or if a table the view depends
+    on was changed without the experiment id of the view being known.
+    :param name_views: list of str or None, optional, Default None
+        views to be refreshed, if None all materialized views
+    :param full: bool, optional, Default False
+        recompute all experiments
+    :param con: sql.Connection or None, optional, Default None
+        database connection, if None a new will be initialized
+    :return: pd.DataFrame indexed by name_view with number of recomputed experiments (NaN for all) and runtime
+    """
+    if con is None:
+        with db.connect().begin() as con:
+            return refresh(name_views=name_views, full=full, con=con)
+    if name_views is None:
+        name_tables = _db_tables(con)
+        name_views = [
+            name_view
+            for name_view in MATERIALIZED_VIEWS
+            if name_table_materialized(name_view) in name_tables
+        ]
+
+    id_journal_max = db.query_sql(
+        "SELECT MAX(id_journal) FROM " + JOURNAL_TABLE + ";", con=con, method="sqlalchemy"
+    ).scalar()
+    id_journal_max = 0 if id_journal_max is None else id_journal_max
+
+    results = []
+    for name_view in name_views:
+        t_start = datetime.datetime.now()
+        name_table = name_table_materialized(name_view)
+        name_id_exp = MATERIALIZED_VIEWS[name_view]
+        id_journal_refreshed = _id_journal_refreshed(name_view, con=con)
+
+        ids_exp = None
+        if not full and id_journal_refreshed is not None:
+            entries = _journal_entries(name_view, id_journal_refreshed, con=con)
+            entries = entries.loc[entries.id_journal <= id_journal_max]
+            if (entries.name_id_exp == name_id_exp).all():
+                ids_exp = [int(id_exp) for id_exp in pd.unique(entries.id_exp)]
+
+        if ids_exp is None:
+            db.query_sql("DELETE FROM " + name_table + ";", con=con, method="sqlalchemy")
+            db.query_sql(
+                "INSERT INTO " + name_table + " SELECT * FROM " + name_view + ";",
+                con=con,
+                method="sqlalchemy",
+            )
+        else:
+            for idx in range(0, len(ids_exp), db.KEYSET_MAX_PARAMS):
+                ids_exp_chunk = ids_exp[idx: idx + db.KEYSET_MAX_PARAMS]
+                cond = name_id_exp + " IN (" + ", ".join(["%s"] * len(ids_exp_chunk)) + ")"
+                db.query_sql(
+                    "DELETE FROM " + name_table + " WHERE " + cond + ";",
+                    params=ids_exp_chunk,
+                    con=con,
+                    method="sqlalchemy",
+                )
+                db.query_sql(
+                    "INSERT INTO " + name_table + " SELECT * FROM " + name_view + " WHERE " + cond + ";",
+                    params=ids_exp_chunk,
+                    con=con,
+                    method="sqlalchemy",
+                )
+
+        table_state = db.get_table(con, STATE_TABLE)
+        con.execute(table_state.delete().where(table_state.c.name_view == name_view))
+        con.execute(
+            table_state.insert(),
+            {
+                "name_view": name_view,
+                "id_journal_refreshed": id_journal_max,
+                "t_refreshed__timestamp": datetime.datetime.now(),
+            },
+        )
+        results.append(
+            {
+                "name_view": name_view,
+                "n_exp_refreshed": float("nan") if ids_exp is None else len(ids_exp),
+                "runtime__s": (datetime.datetime.now() - t_start).total_seconds(),
+            }
+        )
+        print(results[-1])
+
+    # journal entries considered by all shadow tables are no longer required,
+    # the last entry is kept so that journal ids are not reused
+    id_journal_min = db.query_sql(
+        "SELECT MIN(id_journal_refreshed) FROM " + STATE_TABLE + ";", con=con, method="sqlalchemy"
+    ).scalar()
+    if id_journal_min is not None:
+        db.query_sql(
+            "DELETE FROM " + JOURNAL_TABLE + " WHERE id_journal < %s;",
+            params=[id_journal_min],
+            con=con,
+            method="sqlalchemy",
+        )
+    return pd.DataFrame(results, columns=["name_view", "n_exp_refreshed", "runtime__s"]).set_index("name_view")
+
+
+def _id_journal_refreshed(name_view, con=None):
+    """
+    Get the last journal entry considered by the last refresh of a view
+    :param name_view: str
+    :param con: sql.Connection or None, optional, Default None
+    :return: int or None if not yet refreshed
+    """
+    state = db.query_sql(
+        "SELECT id_journal_refreshed FROM " + STATE_TABLE + " WHERE name_view = %s;",
+        params=[name_view],
+        con=con,
+        method="pandas",
+    )
+    return None if len(state.index) == 0 else int(state.id_journal_refreshed.iloc[0])
+
+
+def _journal_entries(name_view, id_journal_refreshed, con=None):
+    """
+    Get journal entries of tables the view depends on, which were recorded after the last refresh of the view
+    :param name_view: str
+    :param id_journal_refreshed: int
+    :param con: sql.Connection or None, optional, Default None
+    :return: pd.DataFrame with columns id_journal, name_id_exp, id_exp
+    """
+    base_tables = db.get_base_tables(name_view)
+    return db.query_sql(
+        "SELECT id_journal, name_id_exp, id_exp FROM " + JOURNAL_TABLE
+        + " WHERE id_journal > %s AND name_table IN (" + ", ".join(["%s"] * len(base_tables)) + ");",
+        params=[id_journal_refreshed] + base_tables,
+        con=con,
+        method="pandas",
+    )
@@ -4,6 +4,8 @@ Created in 2023
 @author: Forschungszentrum Jülich GmbH, Nico Röttcher
 """
 
+import functools
+import re
 from collections import deque
 
 
@@ -444,3 +446,180 @@ def comments(query, debug=False):
         return query_replaced
     else:
         return query
+
+
+# Tokens handled by translate(): quoted strings, comments, parameters, database name, time interval,
+# functions and timestampdiff. Text in between is copied unchanged.
+_TOKENS = re.compile(
+    r"""'[^'\n]*'|"[^"\n]*"|#|%s|hte_data\.| interval |(?<=[ ,])(?:if|std)\(|timestampdiff\("""
+)
+_TOKEN_INTERVAL_CHAINED = re.compile(r"[+\- ]*interval")
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(query):
+    """
+    Translate a query from MySQL to SQLite syntax in a single pass. Gives the same result as applying
+    time_intervals(), timestampdiff(), functions(), query_params(), database_name() and comments() one after another.
+    Quotes, comments and brackets are recognized once while walking through the query. The result is cached by
+    query text.
+    :param query: str
+        query in MySQL syntax
+    :return: str
+        query in SQLite syntax
+    """
+    query_translated = _translate_fragment(query)
+    if "#" in query:
+        # comments() appends a newline to every line
+        query_translated += "\n"
+    return query_translated
+
+
+def _translate_fragment(query):
+    """
+    Walk through query and translate all tokens, see translate()
+    :param query: str
+        query or part of a query in MySQL syntax
+    :return: str
+        query in SQLite syntax
+    """
+    out = []
+    pos = 0
+    while True:
+        match = _TOKENS.search(query, pos)
+        if match is None:
+            out.append(query[pos:])
+            return "".join(out)
+        out.append(query[pos: match.start()])
+        token = match.group()
+        pos = match.end()
+
+        if token[0] in "'\"":
+            out.append(_substitute(token))
+        elif token == "#":
+            idx_end_line = query.find("\n", pos)
+            idx_end_line = len(query) if idx_end_line == -1 else idx_end_line
+            out.append(
+                "/*" + _substitute(query[pos:idx_end_line]).replace("#", "/*") + "*/"
+            )
+            pos = idx_end_line
+        elif token == "%s":
+            out.append("?")
+        elif token == "hte_data.":
+            pass
+        elif token == " interval ":
+            # time interval reaches back to the last comma
+            idx_piece, idx_comma = len(out) - 1, -1
+            while idx_piece >= 0:
+                idx_comma = out[idx_piece].rfind(",")
+                if idx_comma != -1:
+                    break
+                idx_piece -= 1
+            if idx_piece < 0:
+                raise Exception("Error converting time interval, no preceding comma found")
+            str_before_interval = "".join(out[idx_piece:])[idx_comma + 1:]
+            out[idx_piece] = out[idx_piece][: idx_comma + 1]
+            del out[idx_piece + 1:]
+            str_sqlite, pos = _time_interval(str_before_interval, query, match.start())
+            out.append(_substitute(str_sqlite))
+        elif token == "timestampdiff(":
+            idx_end = match.start() + find_closing_bracket(query[match.start():], len(token) - 1)
+            if idx_end < match.start():
+                raise Exception(
+                    "Conversion Error: Can only hanlde difference in seconds! "
+                    "- You would just need to change the multiplicator (days --> desired unit) in code",
+                    query[match.start():],
+                )
+            out.append(_timestampdiff(_translate_fragment(query[pos:idx_end]), query[match.start(): idx_end + 1]))
+            pos = idx_end + 1
+        else:  # if( or std(
+            out.append({"if(": "IIF(", "std(": "stdv("}[token])
+
+
+def _substitute(text):
+    """
+    Apply functions(), query_params() and database_name() to a part of the query which is not walked through
+    by translate(), such as quoted strings and comments.
+    :param text: str
+        part of query in MySQL syntax
+    :return: str
+        part of query in SQLite syntax
+    """
+    return database_name(query_params(functions(text)), debug=False)
+
+
+def _time_interval(str_before_interval, query, idx_find_interval):
+    """
+    Translate the time interval found at idx_find_interval as in time_intervals()
+    :param str_before_interval: str
+        already translated part of the query between the last comma and the interval
+    :param query: str
+        query in MySQL syntax
+    :param idx_find_interval: int
+        position of ' interval ' in query
+    :return: str_sqlite, idx_end
+        translated time interval and position in query after the time interval
+    """
+    str_find_interval = " interval "
+    str_find_second = " second)"
+    idx_end = query.find(str_find_second, idx_find_interval)
+    if idx_end == -1:
+        raise Exception("Error converting time interval, no ' second)' found")
+    idx_end += len(str_find_second)
+    str_mysql = str_before_interval + query[idx_find_interval:idx_end]
+    col_timestamp = str_mysql.split(str_find_interval)[0].strip("( +-")
+    if str_mysql.split(str_find_interval)[1].find("-(") != -1:
+        print(str_mysql)
+        raise Exception(
+            'Error please use simplified syntax for time interval in mysql. "(a - interval b second)"'
+        )
+    plus_minus = str_mysql.split(str_find_interval)[0][-1]
+    if plus_minus not in ["+", "-"]:
+        print(str_mysql)
+        raise Exception("Error converting plus/minus sign for time interval")
+    col_add_seconds = (
+        str_mysql.split(str_find_interval)[1].split(str_find_second)[0].strip("-()")
+    )
+    modifier = ['"%s" || %s || " seconds"' % (plus_minus, col_add_seconds)]
+    while _TOKEN_INTERVAL_CHAINED.match(query, idx_end):
+        idx_end_new = query.find(str_find_second, idx_end) + len(str_find_second)
+        str_mysql_add = query[idx_end:idx_end_new]
+        plus_minus = str_mysql_add.split(str_find_interval)[0][-1]
+        col_add_seconds = (
+            str_mysql_add.split(str_find_interval)[1].split(str_find_second)[0].strip("-()")
+        )
+        modifier.append('"%s" || %s || " seconds"' % (plus_minus, col_add_seconds))
+        idx_end = idx_end_new
+
+    str_sqlite = '(STRFTIME("%%Y-%%m-%%d %%H:%%M:%%f",%s, %s))' % (
+        col_timestamp,
+        ", ".join(modifier),
+    )
+    return str_sqlite, idx_end
+
+
+def _timestampdiff(arguments, str_mysql):
+    """
+    Translate timestampdiff as in timestampdiff()
+    :param arguments: str
+        already translated arguments of timestampdiff
+    :param str_mysql: str
+        complete timestampdiff statement, used for error messages
+    :return: str
+        SQLite syntax
+    """
+    timestampdiff_arguments = arguments.split(",")
+    if len(timestampdiff_arguments) > 3:
+        raise Exception(
+            "Conversion Error: Cannot handle more than 3 arguments", str_mysql
+        )
+    if timestampdiff_arguments[0] != "SECOND":
+        raise Exception(
+            "Conversion Error: Can only hanlde difference in seconds! "
+            "- You would just need to change the multiplicator (days --> desired unit) in code",
+            str_mysql,
+        )
+    return "((julianday(%s) - julianday(%s)) * 86400.0)" % (
+        timestampdiff_arguments[2],
+        timestampdiff_arguments[1],
+    )
@@ -0,0 +1,64 @@
+"""
+Scripts for caching schema information of the database (primary keys, foreign keys, views)
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import copy
+import threading
+import time
+
+from evaluation.utils import db_config
+
+SCHEMA_CACHE_TTL__s = 600
+
+_cache = {}
+_cache_lock = threading.RLock()
+
+
+def schema_version(table_schema="hte_data"):
+    """
+    Get an identifier of the current state of the database schema, see db_config.get_schema_version()
+    :param table_schema: str, default='hte_data'
+        name of the database schema
+    :return: hashable identifier of the schema state
+    """
+    return db_config.get_schema_version(table_schema=table_schema)
+
+
+def get(name, load, table_schema="hte_data", **kwargs):
+    """
+    Get schema information from cache or load it from database. Cached entries are reloaded if the schema version
+    changed (tables or views created, altered, dropped) or if the entry is older than SCHEMA_CACHE_TTL__s.
+    :param name: str
+        name of the cached information, for example 'primary_keys'
+    :param load: callable
+        function loading the information from the database, called with table_schema and kwargs
+    :param table_schema: str, default='hte_data'
+        name of the database schema
+    :param kwargs:
+        further keyword arguments of load, part of the cache key
+    :return: copy of the cached information
+    """
+    key = (name, table_schema, tuple(sorted(kwargs.items())))
+    version = schema_version(table_schema=table_schema)
+    with _cache_lock:
+        if key in _cache:
+            version_cached, t_loaded, value = _cache[key]
+            if (
+                version_cached == version
+                and time.monotonic() - t_loaded < SCHEMA_CACHE_TTL__s
+            ):
+                return copy.deepcopy(value)
+        value = load(table_schema=table_schema, **kwargs)
+        _cache[key] = (version, time.monotonic(), value)
+        return copy.deepcopy(value)
+
+
+def clear():
+    """
+    Remove all cached schema information.
+    :return: None
+    """
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,320 @@
+"""
+Scripts for a lazy sfc icpms dataset, which requests experiments and data only when accessed,
+see evaluation.utils.db.get_exp_sfc_icpms(lazy=True)
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import copy
+
+from evaluation.utils import db
+from evaluation.visualization import plot
+
+# timestamp columns used to synchronize ec and icpms data, see evaluation.visualization.plot.synchronize_timestamps()
+TIMESTAMP_COLUMNS = {
+    "data_ec": "Timestamp",
+    "data_icpms": "t_delaycorrected__timestamp_sfc_pc",
+}
+
+
+class SfcIcpmsDataset:
+    """
+    Lazy sfc icpms dataset. On initialization only the query plan is recorded (selected experiments, requested tables,
+    join and index columns, time shifts, isotope and column selection). Experiments and data are requested from the
+    database when the respective attribute (exp_ec, match_ec_icpms, exp_icpms, data_ec, data_icpms) is accessed for
+    the first time and kept afterwards. Use select() and isotopes() to derive a dataset requesting only some columns
+    or isotope pairs, already loaded experiment lists are shared.
+    """
+
+    def __init__(
+        self,
+        sql_ec=None,
+        id_exp_sfc=None,
+        id_exp_ec_dataset=None,
+        name_isotope_analyte=None,
+        name_isotope_internalstandard=None,
+        overlay_cols=None,
+        join_exp_ec_dataset_to_exp_ec=True,
+        add_data_without_corresponding_ec=False,
+        t_start_shift__s=0,
+        t_end_shift__s=0,
+        columns_data_ec=None,
+        columns_data_icpms=None,
+        synchronize=True,
+    ):
+        """
+        Record the query plan of the dataset, nothing is requested from the database.
+        For parameters see evaluation.utils.db.get_exp_sfc_icpms()
+        :param t_start_shift__s: float, optional, Default 0
+            see evaluation.utils.db.get_data()
+        :param t_end_shift__s: float, optional, Default 0
+            see evaluation.utils.db.get_data()
+        :param columns_data_ec: list of str or None, optional, Default None
+            columns of data_ec_analysis to be requested, if None all columns
+        :param columns_data_icpms: list of str or None, optional, Default None
+            columns of data_icpms_sfc_analysis to be requested, if None all columns
+        :param synchronize: bool, optional, Default True
+            whether to add the synchronized timestamp columns to data_ec and data_icpms
+        """
+        if all(param is None for param in [sql_ec, id_exp_sfc, id_exp_ec_dataset]):
+            raise ValueError("Not enough parameters to get sfc icpms data!")
+        overlay_cols = [] if overlay_cols is None else overlay_cols
+        self.plan = {
+            "exp_ec": {
+                "sql_ec": sql_ec,
+                "id_exp_sfc": id_exp_sfc,
+                "id_exp_ec_dataset": id_exp_ec_dataset,
+                "join_exp_ec_dataset_to_exp_ec": join_exp_ec_dataset_to_exp_ec,
+            },
+            "overlay_cols": list(overlay_cols),
+            "data_ec": {
+                "name_table": "data_ec_analysis",
+                "join_cols": ["id_exp_sfc"],
+                "index_cols": list(overlay_cols) + ["id_exp_sfc", "id_data_ec"],
+                "columns": None if columns_data_ec is None else list(columns_data_ec),
+            },
+            "exp_icpms": {
+                "name_table": "exp_icpms_sfc_expanded",
+                "groupby_col": list(overlay_cols) + ["id_exp_icpms"],
+                "index_col": list(overlay_cols)
+                + ["id_exp_icpms", "name_isotope_analyte", "name_isotope_internalstandard"],
+                "join_col": ["id_exp_icpms"],
+            },
+            "data_icpms": {
+                "name_table": "data_icpms_sfc_analysis",
+                "join_cols": ["id_exp_icpms"],
+                "join_overlay_cols": ["id_exp_sfc"],
+                "index_cols": list(overlay_cols)
+                + ["id_exp_icpms", "name_isotope_analyte", "name_isotope_internalstandard", "id_data_icpms"],
+                "columns": None if columns_data_icpms is None else list(columns_data_icpms),
+                "t_start_shift__s": t_start_shift__s,
+                "t_end_shift__s": t_end_shift__s,
+                "add_data_without_corresponding_ec": add_data_without_corresponding_ec,
+            },
+            "isotopes": {
+                "name_isotope_analyte": _to_list(name_isotope_analyte),
+                "name_isotope_internalstandard": _to_list(name_isotope_internalstandard),
+            },
+            "synchronize": synchronize,
+        }
+        self._loaded = {}
+
+    def __repr__(self):
+        return (
+            "SfcIcpmsDataset(loaded="
+            + str(sorted(name for name in self._loaded if isinstance(name, str)))
+            + ", plan="
+            + repr(self.plan)
+            + ")"
+        )
+
+    def select(self, columns_data_ec=None, columns_data_icpms=None):
+        """
+        Derive a dataset requesting only the given data columns. Columns required to join, index, match and
+        synchronize the data are added automatically.
+        :param columns_data_ec: list of str or None, optional, Default None
+            columns of data_ec_analysis, if None the selection is kept
+        :param columns_data_icpms: list of str or None, optional, Default None
+            columns of data_icpms_sfc_analysis, if None the selection is kept
+        :return: SfcIcpmsDataset
+        """
+        dataset = self._derive()
+        if columns_data_ec is not None:
+            dataset.plan["data_ec"]["columns"] = list(columns_data_ec)
+        if columns_data_icpms is not None:
+            dataset.plan["data_icpms"]["columns"] = list(columns_data_icpms)
+        return dataset
+
+    def isotopes(self, name_isotope_analyte=None, name_isotope_internalstandard=None):
+        """
+        Derive a dataset restricted to the given isotope pairs, the restriction is applied in the database query
+        of exp_icpms and data_icpms.
+        :param name_isotope_analyte: str or list of str or None, optional, Default None
+            analyte isotopes, if None not restricted
+        :param name_isotope_internalstandard: str or list of str or None, optional, Default None
+            internal standard isotopes, if None not restricted
+        :return: SfcIcpmsDataset
+        """
+        dataset = self._derive(keep_icpms=False)
+        dataset.plan["isotopes"] = {
+            "name_isotope_analyte": _to_list(name_isotope_analyte),
+            "name_isotope_internalstandard": _to_list(name_isotope_internalstandard),
+        }
+        return dataset
+
+    def _derive(self, keep_icpms=True):
+        """
+        Copy the dataset, loaded experiment lists are shared, loaded data is not
+        :param keep_icpms: bool, optional, Default True
+            whether to share the loaded exp_icpms
+        :return: SfcIcpmsDataset
+        """
+        dataset = copy.copy(self)
+        dataset.plan = copy.deepcopy(self.plan)
+        dataset._loaded = {
+            name: value
+            for name, value in self._loaded.items()
+            if name in ["exp_ec", "exp_ec_datasets_definer", "match_ec_icpms"]
+            or (keep_icpms and name == "exp_icpms")
+        }
+        return dataset
+
+    def _load(self, name, load):
+        """
+        Get an attribute from the loaded ones or load it
+        :param name: str or tuple
+            name of the attribute
+        :param load: callable
+            function loading the attribute
+        :return: loaded attribute
+        """
+        if name not in self._loaded:
+            self._loaded[name] = load()
+        return self._loaded[name]
+
+    def _load_exp_ec(self):
+        """
+        Request ec experiments and ec experiment datasets
+        :return: None
+        """
+        self._loaded["exp_ec"], self._loaded["exp_ec_datasets_definer"] = db.select_exp_ec_sfc_icpms(
+            overlay_cols=self.plan["overlay_cols"], **self.plan["exp_ec"]
+        )
+        return self._loaded["exp_ec"]
+
+    @property
+    def exp_ec(self):
+        """
+        ec experiments, indexed by overlay_cols and id_exp_sfc
+        :return: pd.DataFrame
+        """
+        return self._load("exp_ec", self._load_exp_ec)
+
+    @property
+    def exp_ec_datasets_definer(self):
+        """
+        ec experiment datasets of the ec experiments
+        :return: pd.DataFrame
+        """
+        self.exp_ec
+        return self._loaded["exp_ec_datasets_definer"]
+
+    @property
+    def match_ec_icpms(self):
+        """
+        matched sfc and icpms experiments, see evaluation.utils.db.match_exp_sfc_exp_icpms()
+        :return: pd.DataFrame
+        """
+        return self._load(
+            "match_ec_icpms",
+            lambda: db.match_exp_sfc_exp_icpms(self.exp_ec, overlay_cols=self.plan["overlay_cols"]),
+        )
+
+    @property
+    def exp_icpms(self):
+        """
+        icpms experiments matched to the ec experiments, restricted to the selected isotope pairs
+        :return: pd.DataFrame
+        """
+        return self._load(
+            "exp_icpms",
+            lambda: db.get_exp(self.match_ec_icpms, add_cond=self._add_cond_isotopes(), **self.plan["exp_icpms"]),
+        )
+
+    @property
+    def data_ec(self):
+        """
+        ec data of all selected columns
+        :return: pd.DataFrame
+        """
+        return self.get_data("data_ec")
+
+    @property
+    def data_icpms(self):
+        """
+        icpms data of all selected columns and isotope pairs
+        :return: pd.DataFrame
+        """
+        return self.get_data("data_icpms")
+
+    def get_data(self, name, columns=None):
+        """
+        Get ec or icpms data, requested from the database on first access. If synchronize, the synchronized timestamp
+        column is added using the timestamps of the other data, of which only the timestamp column is requested
+        if not yet loaded.
+        :param name: one of ['data_ec', 'data_icpms']
+        :param columns: list of str or None, optional, Default None
+            columns to be requested, if None the columns selected in the plan
+        :return: pd.DataFrame
+        """
+        if name not in TIMESTAMP_COLUMNS:
+            raise ValueError("name must be one of " + ", ".join(TIMESTAMP_COLUMNS))
+        columns = self.plan[name]["columns"] if columns is None else list(columns)
+        if columns is not None and self.plan["synchronize"]:
+            columns = columns + [TIMESTAMP_COLUMNS[name]]
+        key = name if columns is None else (name, tuple(columns))
+        data = self._load(key, lambda: self._request_data(name, columns))
+        if not self.plan["synchronize"] or len(data.index) == 0:
+            return data
+
+        name_other = [name_other for name_other in TIMESTAMP_COLUMNS if name_other != name][0]
+        data_other = (
+            self._loaded[name_other]
+            if name_other in self._loaded
+            else self._load(
+                (name_other, (TIMESTAMP_COLUMNS[name_other],)),
+                lambda: self._request_data(name_other, [TIMESTAMP_COLUMNS[name_other]]),
+            )
+        ).copy()
+        list_data = [data, data_other] if name == "data_ec" else [data_other, data]
+        plot.synchronize_timestamps(
+            data_ec=list_data[0],
+            data_icpms=list_data[1],
+            timestamp_col_ec=TIMESTAMP_COLUMNS["data_ec"],
+            timestamp_col_icpms=TIMESTAMP_COLUMNS["data_icpms"],
+            overlay_index_cols=self.plan["overlay_cols"] if len(self.plan["overlay_cols"]) > 0 else None,
+        )
+        return data
+
+    def _request_data(self, name, columns):
+        """
+        Request ec or icpms data from the database
+        :param name: one of ['data_ec', 'data_icpms']
+        :param columns: list of str or None
+        :return: pd.DataFrame
+        """
+        kwargs = {key: value for key, value in self.plan[name].items() if key != "columns"}
+        if name == "data_ec":
+            return db.get_data(self.exp_ec, columns=columns, **kwargs)
+        return db.get_data(self.match_ec_icpms, columns=columns, add_cond=self._add_cond_isotopes(), **kwargs)
+
+    def _add_cond_isotopes(self):
+        """
+        Condition restricting the requested icpms experiments and data to the selected isotope pairs
+        :return: str or None
+        """
+        conditions = [
+            name_col + " IN (" + ", ".join(["'" + str(value).replace("'", "''") + "'" for value in values]) + ")"
+            for name_col, values in self.plan["isotopes"].items()
+            if values is not None
+        ]
+        return " AND ".join(conditions) if len(conditions) > 0 else None
+
+    def load(self):
+        """
+        Request all experiments and data of the dataset
+        :return: exp_ec, data_ec, exp_icpms, data_icpms
+            each as pd.DataFrame, as returned by evaluation.utils.db.get_exp_sfc_icpms()
+        """
+        return self.exp_ec, self.data_ec, self.exp_icpms, self.data_icpms
+
+
+def _to_list(value):
+    """
+    Convert a single value into a list
+    :param value: str or list of str or None
+    :return: list of str or None
+    """
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
@@ -0,0 +1,259 @@
+"""
+Scripts for the precomputed time interval of each experiment, used to query data by time, see db.get_data_by_time()
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import warnings
+
+import pandas as pd
+import sqlalchemy as sql
+from sqlalchemy.dialects import mysql
+
+from evaluation.utils import db
+
+# table holding [t_start__timestamp, t_end__timestamp] of each experiment
+TIME_INTERVALS_TABLE = "exp_time_intervals"
+# experiment tables from which intervals are derived. All intervals refer to the clock of the sfc computer,
+# for sfc-icpms experiments the start is corrected by the delay time between SFC and ICP-MS.
+# The absolute (delay-corrected) timestamp of a datapoint is t_start__timestamp + t__s.
+TIME_INTERVAL_SOURCES = {
+    "exp_sfc": {
+        "name_id_exp": "id_exp_sfc",
+        "name_table_data": "data_ec",
+        "query_exp": """SELECT id_exp_sfc AS id_exp,
+                               name_setup_sfc AS name_setup,
+                               t_start__timestamp,
+                               t_end__timestamp,
+                               0 AS t_delay__s
+                        FROM exp_sfc""",
+        "query_exp_open": "SELECT id_exp_sfc AS id_exp FROM exp_sfc WHERE t_end__timestamp IS NULL",
+    },
+    "exp_icpms_sfc": {
+        "name_id_exp": "id_exp_icpms",
+        "name_table_data": "data_icpms",
+        "query_exp": """SELECT id_exp_icpms AS id_exp,
+                               name_setup_sfc AS name_setup,
+                               t_start__timestamp_sfc_pc AS t_start__timestamp,
+                               NULL AS t_end__timestamp,
+                               t_delay__s
+                        FROM exp_icpms_sfc""",
+    },
+}
+# intervals ending within this period before now are recomputed by each update(), as data of running experiments
+# might be appended without evaluation.utils.db.bulk_append()
+TIME_INTERVALS_RECENT = pd.Timedelta(days=1)
+# data tables and views which can be queried by time and the source of their intervals
+TIME_QUERY_TABLES = {
+    "data_ec": "exp_sfc",
+    "data_ec_analysis": "exp_sfc",
+    "data_icpms": "exp_icpms_sfc",
+    "data_icpms_sfc_analysis": "exp_icpms_sfc",
+}
+
+
+def _metadata():
+    """
+    Define interval table
+    :return: sqlalchemy.MetaData
+    """
+    metadata = sql.MetaData()
+    timestamp_type = sql.DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql")
+    sql.Table(
+        TIME_INTERVALS_TABLE,
+        metadata,
+        sql.Column("name_table_exp", sql.String(45), primary_key=True),
+        sql.Column("id_exp", sql.Integer, primary_key=True, autoincrement=False),
+        sql.Column("name_setup", sql.String(45)),
+        sql.Column("t_start__timestamp", timestamp_type, nullable=False),
+        sql.Column("t_end__timestamp", timestamp_type, nullable=False),
+        sql.Index(
+            "idx_" + TIME_INTERVALS_TABLE + "_setup_time",
+            "name_table_exp",
+            "name_setup",
+            "t_start__timestamp",
+            "t_end__timestamp",
+        ),
+    )
+    return metadata
+
+
+def create(con=None):
+    """
+    Create the interval table and the secondary indexes (id_exp, t__s) on the data tables, then compute all intervals.
+    Requires a database user allowed to create tables and indexes.
+    :param con: sql.Connection or None, optional, Default None
+        database connection, if None a new will be initialized
+    :return: None
+    """
+    if con is None:
+        with db.connect().begin() as con:
+            return create(con=con)
+    _metadata().create_all(con)
+    inspector = sql.inspect(con)
+    for source in TIME_INTERVAL_SOURCES.values():
+        name_table_data = source["name_table_data"]
+        indexed_columns = [
+            index["column_names"] for index in inspector.get_indexes(name_table_data)
+        ]
+        if [source["name_id_exp"], "t__s"] not in indexed_columns:
+            con.exec_driver_sql(
+                "CREATE INDEX `idx_%s_time` ON `%s` (`%s`, `t__s`);"
+                % (name_table_data, name_table_data, source["name_id_exp"])
+            )
+    update(full=True, con=con)
+
+
+def update(full=False, con=None):
+    """
+    Compute the intervals of experiments not yet in the interval table. Intervals of experiments still running
+    (no t_end__timestamp) or ending within TIME_INTERVALS_RECENT are recomputed as well. The interval of an experiment
+    ends with its last datapoint, or with t_end__timestamp if there is no data.
+    :param full: bool, optional, Default False
+        recompute the intervals of all experiments
+    :param con: sql.Connection or None, optional, Default None
+        database connection, if None a new will be initialized
+    :return: number of computed intervals
+    """
+    if con is None:
+        with db.connect().begin() as con:
+            return update(full=full, con=con)
+    table = db.get_table(con, TIME_INTERVALS_TABLE)
+    n_intervals = 0
+    for name_table_exp, source in TIME_INTERVAL_SOURCES.items():
+        if full:
+            con.execute(table.delete().where(table.c.name_table_exp == name_table_exp))
+        else:
+            outdated = table.c.t_end__timestamp >= (pd.Timestamp.now() - TIME_INTERVALS_RECENT).to_pydatetime()
+            if "query_exp_open" in source:
+                outdated = outdated | table.c.id_exp.in_(
+                    sql.text(source["query_exp_open"]).columns(sql.column("id_exp", sql.Integer))
+                )
+            con.execute(table.delete().where((table.c.name_table_exp == name_table_exp) & outdated))
+        exp = db.query_sql(
+            "SELECT * FROM (" + source["query_exp"] + ") e "
+            "WHERE id_exp NOT IN (SELECT id_exp FROM " + TIME_INTERVALS_TABLE + " WHERE name_table_exp = %s);",
+            params=[name_table_exp],
+            con=con,
+            method="pandas",
+        )
+        if len(exp.index) == 0:
+            continue
+        t_max = db.query_sql_keyset(
+            "SELECT `" + source["name_id_exp"] + "` AS id_exp, MAX(t__s) AS t_max__s FROM "
+            + source["name_table_data"] + " WHERE {keyset} GROUP BY `" + source["name_id_exp"] + "`;",
+            key_names=source["name_id_exp"],
+            key_values=exp.id_exp.tolist(),
+            con=con,
+        )
+        exp = exp.join(t_max.set_index("id_exp"), on="id_exp")
+
+        t_start = pd.to_datetime(exp.t_start__timestamp) - pd.to_timedelta(
+            exp.t_delay__s.astype(float).fillna(0), unit="s"
+        )
+        t_end = (t_start + pd.to_timedelta(exp.t_max__s.astype(float), unit="s")).fillna(
+            pd.to_datetime(exp.t_end__timestamp)
+        ).fillna(t_start)
+        intervals = pd.DataFrame(
+            {
+                "name_table_exp": name_table_exp,
+                "id_exp": exp.id_exp.astype(int),
+                "name_setup": exp.name_setup,
+                "t_start__timestamp": t_start,
+                "t_end__timestamp": t_end,
+            }
+        ).dropna(subset=["t_start__timestamp"])
+        if len(intervals.index) < len(exp.index):
+            warnings.warn(
+                str(len(exp.index) - len(intervals.index))
+                + " experiments of "
+                + name_table_exp
+                + " without start timestamp are not considered"
+            )
+        if len(intervals.index) > 0:
+            con.execute(
+                table.insert(),
+                [
+                    {
+                        **row,
+                        "t_start__timestamp": row["t_start__timestamp"].to_pydatetime(),
+                        "t_end__timestamp": row["t_end__timestamp"].to_pydatetime(),
+                    }
+                    for row in intervals.to_dict("records")
+                ],
+            )
+        n_intervals += len(intervals.index)
+    return n_intervals
+
+
+def invalidate(name_table, df, con=None):
+    """
+    Remove intervals of updated experiments or experiments with appended data, they are recomputed by the next
+    update(). Called by evaluation.utils.db.sql_update() and evaluation.utils.db.bulk_append().
+    :param name_table: str
+        name of the updated experiment table or data table
+    :param df: pd.DataFrame
+        updated or appended rows, with the experiment id in columns or index
+    :param con: sql.Connection, sql.engine or None, optional, Default None
+        connection of the transaction the rows are updated in, if None a new will be initialized
+    :return: None
+    """
+    names_table_exp = [
+        name_table_exp
+        for name_table_exp, source in TIME_INTERVAL_SOURCES.items()
+        if name_table in [name_table_exp, source["name_table_data"]]
+    ]
+    if len(names_table_exp) == 0:
+        return
+    name_table_exp = names_table_exp[0]
+    if not isinstance(con, sql.engine.Connection):
+        with (db.connect() if con is None else con).begin() as con:
+            return invalidate(name_table, df, con=con)
+    if not sql.inspect(con).has_table(TIME_INTERVALS_TABLE):
+        return
+    name_id_exp = TIME_INTERVAL_SOURCES[name_table_exp]["name_id_exp"]
+    df_ids = df.reset_index() if any(name is not None for name in df.index.names) else df
+    table = db.get_table(con, TIME_INTERVALS_TABLE)
+    if name_id_exp not in df_ids.columns:
+        con.execute(table.delete().where(table.c.name_table_exp == name_table_exp))
+        return
+    ids_exp = [int(id_exp) for id_exp in pd.unique(df_ids[name_id_exp].dropna())]
+    for idx in range(0, len(ids_exp), db.KEYSET_MAX_PARAMS):
+        con.execute(
+            table.delete().where(
+                (table.c.name_table_exp == name_table_exp)
+                & table.c.id_exp.in_(ids_exp[idx: idx + db.KEYSET_MAX_PARAMS])
+            )
+        )
+
+
+def get_intervals(name_table_exp, t_start, t_end, setup=None, con=None):
+    """
+    Get experiments overlapping with the time window [t_start, t_end], using the interval table
+    :param name_table_exp: str
+        one of TIME_INTERVAL_SOURCES
+    :param t_start: pd.Timestamp
+    :param t_end: pd.Timestamp
+    :param setup: str or list of str or None, optional, Default None
+        restrict to experiments of the given setup(s)
+    :param con: sql.Connection or None, optional, Default None
+    :return: pd.DataFrame with columns id_exp, name_setup, t_start__timestamp, t_end__timestamp
+    """
+    setups = [] if setup is None else [setup] if isinstance(setup, str) else list(setup)
+    intervals = db.query_sql(
+        "SELECT id_exp, name_setup, t_start__timestamp, t_end__timestamp FROM " + TIME_INTERVALS_TABLE
+        + " WHERE name_table_exp = %s AND t_start__timestamp <= %s AND t_end__timestamp >= %s"
+        + (" AND name_setup IN (" + ", ".join(["%s"] * len(setups)) + ")" if len(setups) > 0 else "")
+        + " ORDER BY t_start__timestamp;",
+        params=[
+            name_table_exp,
+            t_end.strftime(db.TIMESTAMP_SQL_FORMAT),
+            t_start.strftime(db.TIMESTAMP_SQL_FORMAT),
+        ]
+        + setups,
+        con=con,
+        method="pandas",
+    )
+    intervals["t_start__timestamp"] = pd.to_datetime(intervals.t_start__timestamp)
+    intervals["t_end__timestamp"] = pd.to_datetime(intervals.t_end__timestamp)
+    return intervals
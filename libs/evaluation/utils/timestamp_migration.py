@@ -0,0 +1,302 @@
+"""
+Scripts for migrating timestamp columns stored as VARCHAR(45) into native DATETIME(6) columns
+Created in 2023
+@author: Forschungszentrum Jülich GmbH, Nico Röttcher
+"""
+
+import datetime
+
+import pandas as pd
+import sqlalchemy as sql
+
+from evaluation.utils import db
+
+# timestamp columns stored as VARCHAR(45), as LabView inserted timestamps as strings
+TIMESTAMP_VARCHAR_COLUMNS = {
+    "data_ec": ["Timestamp"],
+    "data_eis": ["Timestamp"],
+    "data_compression": ["Timestamp"],
+    "exp_sfc": ["t_start__timestamp", "t_end__timestamp"],
+    "exp_icpms": ["t_start__timestamp_icpms_pc"],
+}
+# number of rows converted within one transaction
+TIMESTAMP_MIGRATION_BATCH_SIZE = 100000
+# suffix of the shadow column the converted timestamps are written to (MySQL)
+TIMESTAMP_MIGRATION_SUFFIX = "__migrated"
+
+
+def status(engine=None):
+    """
+    Get the storage type and index of all timestamp columns in TIMESTAMP_VARCHAR_COLUMNS
+    :param engine: sqlalchemy.engine or None, optional, Default None
+        database engine, if None db.connect() is used
+    :return: pd.DataFrame indexed by name_table, name_column with columns type, indexed, migrated
+    """
+    engine = db.connect() if engine is None else engine
+    inspector = sql.inspect(engine)
+    results = []
+    for name_table, name_columns in TIMESTAMP_VARCHAR_COLUMNS.items():
+        if not inspector.has_table(name_table):
+            continue
+        columns = {column["name"]: column for column in inspector.get_columns(name_table)}
+        indexed_columns = [
+            index["column_names"][0] for index in inspector.get_indexes(name_table)
+        ]
+        for name_column in name_columns:
+            results.append(
+                {
+                    "name_table": name_table,
+                    "name_column": name_column,
+                    "type": str(columns[name_column]["type"]),
+                    "indexed": name_column in indexed_columns,
+                    "migrated": _is_migrated(
+                        engine,
+                        columns[name_column],
+                        indexed=name_column in indexed_columns,
+                    ),
+                }
+            )
+    return pd.DataFrame(
+        results, columns=["name_table", "name_column", "type", "indexed", "migrated"]
+    ).set_index(["name_table", "name_column"])
+
+
+def migrate(name_tables=None, batch_size=TIMESTAMP_MIGRATION_BATCH_SIZE, engine=None):
+    """
+    Migrate timestamp columns to native timestamp storage and add an index on each of them. Existing rows are
+    converted in batches of batch_size rows, each within its own transaction, so that the database stays usable.
+    Should be run while no data is inserted, rows inserted during the migration are converted at the end.
+    MySQL: the column is converted into DATETIME(6) (microsecond precision). Converted values are written into a
+        shadow column, which finally replaces the original column by a single online ALTER TABLE
+        (ALGORITHM=INPLACE, LOCK=NONE). This ALTER TABLE rebuilds the table, which takes long for the data tables,
+        but reads and writes are not blocked meanwhile. Indices and unique keys containing the column are recreated.
+        Strings in the format db.TIMESTAMP_SQL_FORMAT are still accepted on insert, thus LabView inserts are not
+        affected.
+    SQLite: there is no datetime storage type in sqlite, timestamps are stored as text and evaluated by the sqlite
+        date functions in the views. Therefore, all values are normalized to db.TIMESTAMP_SQL_FORMAT.
+    Requires a database user allowed to alter tables.
+    :param name_tables: list of str or None, optional, Default None
+        tables to migrate, if None all tables in TIMESTAMP_VARCHAR_COLUMNS
+    :param batch_size: int, optional, Default TIMESTAMP_MIGRATION_BATCH_SIZE
+        number of rows converted within one transaction
+    :param engine: sqlalchemy.engine or None, optional, Default None
+        database engine, if None db.connect() is used
+    :return: pd.DataFrame indexed by name_table, name_column with number of converted rows and runtime
+    """
+    engine = db.connect() if engine is None else engine
+    name_tables = (
+        list(TIMESTAMP_VARCHAR_COLUMNS.keys()) if name_tables is None else name_tables
+    )
+    inspector = sql.inspect(engine)
+    results = []
+    for name_table in name_tables:
+        if name_table not in TIMESTAMP_VARCHAR_COLUMNS:
+            raise ValueError(name_table + " has no timestamp column to migrate")
+        if not inspector.has_table(name_table):
+            continue
+        for name_column in TIMESTAMP_VARCHAR_COLUMNS[name_table]:
+            t_start = datetime.datetime.now()
+            if engine.dialect.name == "mysql":
+                n_rows = _migrate_column_mysql(engine, name_table, name_column, batch_size)
+            elif engine.dialect.name == "sqlite":
+                n_rows = _migrate_column_sqlite(engine, name_table, name_column, batch_size)
+            else:
+                raise NotImplementedError("migrate not implemented for " + engine.dialect.name)
+            _create_index(engine, name_table, name_column)
+            results.append(
+                {
+                    "name_table": name_table,
+                    "name_column": name_column,
+                    "n_rows_converted": n_rows,
+                    "runtime__s": (datetime.datetime.now() - t_start).total_seconds(),
+                }
+            )
+            print(results[-1])
+    return pd.DataFrame(
+        results, columns=["name_table", "name_column", "n_rows_converted", "runtime__s"]
+    ).set_index(["name_table", "name_column"])
+
+
+def _is_migrated(engine, column, indexed=False):
+    """
+    Check whether a timestamp column is already migrated
+    :param engine: sqlalchemy.engine
+    :param column: dict
+        column information as returned by sqlalchemy inspector
+    :param indexed: bool, optional, Default False
+        whether the column is indexed
+    :return: bool
+    """
+    if engine.dialect.name == "mysql":
+        return isinstance(column["type"], sql.types.DateTime)
+    # sqlite: the index is created after normalization, repeating the normalization is harmless
+    return indexed
+
+
+def _batches(engine, name_table, batch_size):
+    """
+    Iterate over the table in batches of rows ordered by primary key
+    :param engine: sqlalchemy.engine
+    :param name_table: str
+    :param batch_size: int
+    :return: generator of (condition, params) selecting the rows of the batch, condition in MySQL syntax
+    """
+    primary_keys = sql.inspect(engine).get_pk_constraint(name_table)["constrained_columns"]
+    keys = "(" + ", ".join(["`" + key + "`" for key in primary_keys]) + ")"
+    placeholders = "(" + ", ".join(["%s"] * len(primary_keys)) + ")"
+    key_last = None
+    while True:
+        with engine.begin() as con:
+            key_next = db.query_sql(
+                "SELECT " + ", ".join(["`" + key + "`" for key in primary_keys])
+                + " FROM `" + name_table + "`"
+                + ("" if key_last is None else " WHERE " + keys + " > " + placeholders)
+                + " ORDER BY " + ", ".join(["`" + key + "`" for key in primary_keys])
+                + " LIMIT 1 OFFSET %s;",
+                params=([] if key_last is None else list(key_last)) + [batch_size - 1],
+                con=con,
+                method="sqlalchemy",
+            ).fetchone()
+        condition = " AND ".join(
+            ([] if key_last is None else [keys + " > " + placeholders])
+            + ([] if key_next is None else [keys + " <= " + placeholders])
+        )
+        params = ([] if key_last is None else list(key_last)) + (
+            [] if key_next is None else list(key_next)
+        )
+        yield ("1 = 1" if condition == "" else condition), params
+        if key_next is None:
+            return
+        key_last = tuple(key_next)
+
+
+def _migrate_column_mysql(engine, name_table, name_column, batch_size):
+    """
+    Convert a VARCHAR timestamp column into DATETIME(6): converted values are written into a shadow column batch by
+    batch, which finally replaces the original column at its position. Values not convertible to DATETIME(6) raise
+    an error before the original column is replaced.
+    :param engine: sqlalchemy.engine
+    :param name_table: str
+    :param name_column: str
+    :param batch_size: int
+    :return: number of converted rows
+    """
+    inspector = sql.inspect(engine)
+    columns = inspector.get_columns(name_table)
+    column = [column for column in columns if column["name"] == name_column][0]
+    if _is_migrated(engine, column):
+        return 0
+    if name_column in inspector.get_pk_constraint(name_table)["constrained_columns"]:
+        raise ValueError(name_table + "." + name_column + " is part of the primary key and cannot be migrated")
+    name_column_migrated = name_column + TIMESTAMP_MIGRATION_SUFFIX
+    if name_column_migrated not in [column["name"] for column in columns]:
+        with engine.begin() as con:
+            con.exec_driver_sql(
+                "ALTER TABLE `%s` ADD COLUMN `%s` DATETIME(6) NULL;"
+                % (name_table, name_column_migrated)
+            )
+
+    update = "UPDATE `%s` SET `%s` = CAST(`%s` AS DATETIME(6)) WHERE `%s` IS NOT NULL AND " % (
+        name_table,
+        name_column_migrated,
+        name_column,
+        name_column,
+    )
+    n_rows = 0
+    for condition, params in _batches(engine, name_table, batch_size):
+        with engine.begin() as con:
+            n_rows += con.exec_driver_sql(update + condition + ";", tuple(params)).rowcount
+
+    with engine.begin() as con:
+        # rows inserted meanwhile
+        n_rows += con.exec_driver_sql(update + "`%s` IS NULL;" % name_column_migrated).rowcount
+        values_invalid = con.exec_driver_sql(
+            "SELECT `%s` FROM `%s` WHERE `%s` IS NOT NULL AND `%s` IS NULL LIMIT 10;"
+            % (name_column, name_table, name_column, name_column_migrated)
+        ).fetchall()
+    if len(values_invalid) > 0:
+        raise ValueError(
+            "Values of %s.%s not convertible to DATETIME(6), for example: %s. Correct them and rerun."
+            % (name_table, name_column, ", ".join([str(row[0]) for row in values_invalid]))
+        )
+
+    # replace original column, indices containing it would be shrunk by DROP COLUMN, thus they are recreated
+    indexes = [index for index in inspector.get_indexes(name_table) if name_column in index["column_names"]]
+    idx_column = [column["name"] for column in columns].index(name_column)
+    with engine.begin() as con:
+        con.exec_driver_sql(
+            "ALTER TABLE `%s` %sDROP COLUMN `%s`, CHANGE COLUMN `%s` `%s` DATETIME(6) %s COMMENT %%s %s%s, "
+            "ALGORITHM=INPLACE, LOCK=NONE;"
+            % (
+                name_table,
+                "".join(["DROP INDEX `%s`, " % index["name"] for index in indexes]),
+                name_column,
+                name_column_migrated,
+                name_column,
+                "NULL" if column["nullable"] else "NOT NULL",
+                "FIRST" if idx_column == 0 else "AFTER `%s`" % columns[idx_column - 1]["name"],
+                "".join(
+                    [
+                        ", ADD %sINDEX `%s` (%s)"
+                        % (
+                            "UNIQUE " if index["unique"] else "",
+                            index["name"],
+                            ", ".join(["`" + name + "`" for name in index["column_names"]]),
+                        )
+                        for index in indexes
+                    ]
+                ),
+            ),
+            (column.get("comment") or "",),
+        )
+    return n_rows
+
+
+def _migrate_column_sqlite(engine, name_table, name_column, batch_size):
+    """
+    Normalize all values of a text timestamp column to db.TIMESTAMP_SQL_FORMAT, batch by batch
+    :param engine: sqlalchemy.engine
+    :param name_table: str
+    :param name_column: str
+    :param batch_size: int
+    :return: number of converted rows
+    """
+    n_rows = 0
+    for condition, params in _batches(engine, name_table, batch_size):
+        with engine.begin() as con:
+            values = db.query_sql(
+                "SELECT rowid AS rowid_migration, `" + name_column + "` FROM `" + name_table + "` WHERE `"
+                + name_column + "` IS NOT NULL AND " + condition + ";",
+                params=params,
+                con=con,
+                method="pandas",
+            )
+            values_sql = db.timestamps_to_sql(values[name_column])
+            changed = values_sql != values[name_column]
+            if changed.any():
+                con.exec_driver_sql(
+                    "UPDATE `%s` SET `%s` = ? WHERE rowid = ?;" % (name_table, name_column),
+                    list(zip(values_sql[changed].tolist(), values.rowid_migration[changed].tolist())),
+                )
+            n_rows += int(changed.sum())
+    return n_rows
+
+
+def _create_index(engine, name_table, name_column):
+    """
+    Create an index on the timestamp column, if not yet existing
+    :param engine: sqlalchemy.engine
+    :param name_table: str
+    :param name_column: str
+    :return: None
+    """
+    indexed_columns = [
+        index["column_names"][0] for index in sql.inspect(engine).get_indexes(name_table)
+    ]
+    if name_column in indexed_columns:
+        return
+    with engine.begin() as con:
+        con.exec_driver_sql(
+            "CREATE INDEX `idx_%s_%s` ON `%s` (`%s`);"
+            % (name_table, name_column, name_table, name_column)
+        )
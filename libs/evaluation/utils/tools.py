@@ -6,6 +6,9 @@ Created in 2023
 
 import pandas as pd
 import itertools
+import concurrent.futures
+import multiprocessing
+import warnings
 
 
 def check_type(
@@ -52,6 +55,27 @@ def check_type(
     return value
 
 
+def process_pool_executor(n_processes):
+    """
+    Create a pool of worker processes started by fork. Workers started by spawn (default on Windows and macOS) would
+    import the evaluation package again, which displays widgets on import of evaluation.visualization.plot and fails
+    outside of the notebook. If fork is not available, None is returned and the caller has to run serially.
+    :param n_processes: int
+        number of worker processes
+    :return: concurrent.futures.ProcessPoolExecutor or None
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        warnings.warn(
+            "Worker processes cannot be started by fork on this platform, run serially instead of in "
+            + str(n_processes)
+            + " processes"
+        )
+        return None
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_processes, mp_context=multiprocessing.get_context("fork")
+    )
+
+
 # pandas related tools
 def singleindex_to_multiindex_list(index):
     """